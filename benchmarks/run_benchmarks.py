@@ -0,0 +1,510 @@
+"""
+timing benchmarks for the reflectometry hot paths, using synthetic data so no
+network access or archive accounts are needed.
+
+Examples
+--------
+python benchmarks/run_benchmarks.py
+    runs every benchmark and adds the timings to benchmarks/history.json
+python benchmarks/run_benchmarks.py -quick T
+    smaller data sets (a few hours of RINEX, 30 second SNR data)
+python benchmarks/run_benchmarks.py -only read_snr strip_compute -repeat 5
+    only some of the benchmarks
+
+Each run is compared with the last run in the history file that used the same
+data settings, and benchmarks that got slower than the tolerance are flagged.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+from gnssrefl.utils import str2bool
+
+STATION = 'bmrk'
+YEAR = 2023
+DOY = 20
+
+# frequencies with synthetic SNR data
+FREQS = [1, 20, 5, 101, 102, 201, 205, 206, 207, 208, 302, 306, 307]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-quick", default=None, type=str, help="Boolean, smaller data sets")
+    parser.add_argument("-repeat", default=None, type=int, help="number of times each benchmark is timed (default 3)")
+    parser.add_argument("-only", default=None, nargs='*', type=str, help="names of the benchmarks to run")
+    parser.add_argument("-history", default=None, type=str, help="json history file (default benchmarks/history.json)")
+    parser.add_argument("-save", default=None, type=str, help="Boolean, add this run to the history (default True)")
+    parser.add_argument("-tolerance", default=None, type=float, help="fractional slowdown that is flagged (default 0.2)")
+    parser.add_argument("-dt", default=None, type=int, help="SNR sample interval, seconds (default 15)")
+    parser.add_argument("-rinex_dt", default=None, type=int, help="RINEX sample interval, seconds (default 30)")
+    parser.add_argument("-constellations", default=None, type=str, help="RINEX letters, default GREC")
+    parser.add_argument("-rh", default=None, type=float, help="reflector height, meters (default 5)")
+    parser.add_argument("-noise", default=None, type=float, help="SNR noise, dB-Hz (default 0.5)")
+    parser.add_argument("-keep", default=None, type=str, help="Boolean, keep the synthetic data directory")
+
+    args = parser.parse_args().__dict__
+
+    boolean_args = ['quick', 'save', 'keep']
+    args = str2bool(args, boolean_args)
+
+    return {key: value for key, value in args.items() if value is not None}
+
+
+def gnssir_settings():
+    """
+    gnssir analysis settings for the synthetic station.  No refraction correction,
+    because the refraction model file would have to be downloaded.
+    """
+    return {'e1': 5.0, 'e2': 25.0, 'freqs': FREQS, 'minH': 0.5, 'maxH': 8.0, 'NReg': [0.5, 8],
+            'azval2': [0, 360], 'delTmax': 75, 'pele': [5, 30], 'polyV': 2, 'PkNoise': 2.7,
+            'ediff': 2, 'reqAmp': [5]*len(FREQS), 'desiredP': 0.005, 'refraction': False,
+            'plt_screen': False, 'onesat': None, 'screenstats': False, 'gzip': False,
+            'nooverwrite': False, 'wantCompression': False, 'mmdd': False, 'dec': 1}
+
+
+def make_data(ctx):
+    """
+    writes the synthetic data sets into the working directory
+
+    Parameters
+    ----------
+    ctx : dict
+        benchmark settings; file names are added to it
+
+    """
+    import gnssrefl.gps as g
+    xdir = os.environ['REFL_CODE']
+    cyyyy, cyy, cdoy = g.ydoych(YEAR, DOY)
+    for d in ['input', 'Files/' + STATION, cyyyy + '/snr/' + STATION, cyyyy + '/phase/' + STATION]:
+        os.makedirs(xdir + '/' + d, exist_ok=True)
+    os.makedirs(os.environ['ORBITS'], exist_ok=True)
+    # station json, as gnssir_input would make it. Hortho is given so that
+    # subdaily does not need to download the EGM96 geoid
+    lsp = gnssir_settings()
+    lsp.update({'station': STATION, 'lat': 40.0, 'lon': -105.0, 'ht': 1600.0, 'Hortho': 1620.0})
+    with open(xdir + '/input/' + STATION + '.json', 'w') as fid:
+        json.dump(lsp, fid, indent=4)
+
+    t1 = time.time()
+    ctx['snrfile'] = xdir + '/' + cyyyy + '/snr/' + STATION + '/' + STATION + cdoy + '0.' + cyy + '.snr66'
+    snrD = synthetic.snr_day(YEAR, DOY, dt=ctx['dt'], rh=ctx['rh'], noise=ctx['noise'])
+    synthetic.write_snr(ctx['snrfile'], snrD)
+    ctx['snr_rows'] = len(snrD)
+
+    kw = {'dt': ctx['rinex_dt'], 'constellations': ctx['constellations'], 'rh': ctx['rh'],
+          'noise': ctx['noise'], 'hours': ctx['hours']}
+    ctx['rinex2'] = ctx['workdir'] + '/synt' + cdoy + '0.' + cyy + 'o'
+    ctx['rinex_epochs'] = synthetic.write_rinex2(ctx['rinex2'], YEAR, DOY, **kw)
+    ctx['rinex3'] = ctx['workdir'] + '/SYNT00USA_R_' + cyyyy + cdoy + '0000_01D_30S_MO.rnx'
+    synthetic.write_rinex3(ctx['rinex3'], YEAR, DOY, **kw)
+    ctx['sp3'] = os.environ['ORBITS'] + '/synt' + cyyyy + cdoy + '.sp3'
+    synthetic.write_sp3(ctx['sp3'], YEAR, DOY, constellations=ctx['constellations'])
+    ctx['nav'] = os.environ['ORBITS'] + '/auto' + cdoy + '0.' + cyy + 'n'
+    synthetic.write_nav(ctx['nav'], YEAR, DOY)
+
+    ctx['rhfile'] = xdir + '/Files/' + STATION + '/' + STATION + '_rh.txt'
+    synthetic.write_rh_results(ctx['rhfile'], synthetic.rh_results(YEAR, DOY, ctx['rh_days'], rh=ctx['rh']))
+    print('Synthetic data written in {0:.1f} seconds to {1:s}'.format(time.time()-t1, ctx['workdir']))
+
+
+def snr_arcs(ctx):
+    """
+    the SNR data, satellite index and the windowed arcs, as gnssir_guts_v2 makes them
+    """
+    if 'arcs' in ctx:
+        return ctx['arcs']
+    import gnssrefl.gnssir_v2 as guts
+    import gnssrefl.read_snr_files as snr
+    lsp = gnssir_settings()
+    allGood, snrD, nrows, ncols = guts.read_snr(ctx['snrfile'])
+    snrD = np.array(snrD)
+    snrI = snr.SNRIndex(snrD)
+    arcs = []
+    for f in FREQS:
+        for satNu in guts.find_mgnss_satlist(f, YEAR, DOY):
+            thissat, thisvalid = snrI.satellite(satNu)
+            if len(thissat) == 0:
+                continue
+            arclist = guts.new_rise_set_again(thissat[:,1], thissat[:,2], thissat[:,3], lsp['e1'], lsp['e2'],
+                                              lsp['ediff'], satNu, False)
+            for a in range(arclist.shape[0]):
+                sind = int(arclist[a,0]); eind = int(arclist[a,1])
+                arcs.append([f, satNu, thissat[sind:eind,:], thisvalid[sind:eind], arclist[a,4], arclist[a,5]])
+    windowed = []
+    for f, satNu, d2, valid, e1, e2 in arcs:
+        x, y, Nv, cf, meanTime, avgAzim, outFact1, Edot2, delT = guts.window_new(d2, f, satNu, ncols,
+            lsp['pele'], lsp['polyV'], e1, e2, guts.rewrite_azel(lsp['azval2']), False, valid)
+        if delT != 0:
+            windowed.append([x, y, cf])
+    ctx['arcs'] = (snrD, snrI, ncols, arcs, windowed)
+
+    return ctx['arcs']
+
+
+# each benchmark returns a function with no arguments that does the timed work,
+# and the number of items that work handles (rows, arcs, epochs ...)
+
+def bench_read_snr_text(ctx):
+    import gnssrefl.read_snr_files as snr
+    return (lambda: snr.read_snr_text(ctx['snrfile'])), ctx['snr_rows']
+
+
+def bench_read_snr_gz(ctx):
+    import gzip
+    import gnssrefl.read_snr_files as snr
+    # a gzipped copy in its own directory, so it is not found instead of the plain file
+    gzfile = os.path.dirname(ctx['snrfile']) + '/gz/' + os.path.basename(ctx['snrfile']) + '.gz'
+    os.makedirs(os.path.dirname(gzfile), exist_ok=True)
+    with open(ctx['snrfile'], 'rb') as fin, gzip.open(gzfile, 'wb') as fout:
+        shutil.copyfileobj(fin, fout)
+    return (lambda: snr.read_snr_text(gzfile)), ctx['snr_rows']
+
+
+def bench_read_snr(ctx):
+    import gnssrefl.gnssir_v2 as guts
+    return (lambda: guts.read_snr(ctx['snrfile'])), ctx['snr_rows']
+
+
+def bench_new_rise_set_again(ctx):
+    import gnssrefl.gnssir_v2 as guts
+    snrD, snrI, ncols, arcs, windowed = snr_arcs(ctx)
+    lsp = gnssir_settings()
+    sats = [snrI.satellite(s)[0] for s in np.unique(snrD[:,0])]
+
+    def run():
+        for thissat in sats:
+            guts.new_rise_set_again(thissat[:,1], thissat[:,2], thissat[:,3], lsp['e1'], lsp['e2'],
+                                    lsp['ediff'], int(thissat[0,0]), False)
+    return run, len(sats)
+
+
+def bench_window_new(ctx):
+    import gnssrefl.gnssir_v2 as guts
+    snrD, snrI, ncols, arcs, windowed = snr_arcs(ctx)
+    lsp = gnssir_settings()
+    azvalues = guts.rewrite_azel(lsp['azval2'])
+
+    def run():
+        for f, satNu, d2, valid, e1, e2 in arcs:
+            guts.window_new(d2, f, satNu, ncols, lsp['pele'], lsp['polyV'], e1, e2, azvalues, False, valid)
+    return run, len(arcs)
+
+
+def bench_strip_compute(ctx):
+    import gnssrefl.gps as g
+    windowed = snr_arcs(ctx)[4]
+    lsp = gnssir_settings()
+
+    def run():
+        for x, y, cf in windowed:
+            g.strip_compute(x, y, cf, lsp['maxH'], lsp['desiredP'], lsp['polyV'], lsp['minH'])
+    return run, len(windowed)
+
+
+def bench_batch_strip_compute(ctx):
+    import gnssrefl.gps as g
+    windowed = snr_arcs(ctx)[4]
+    lsp = gnssir_settings()
+    xlist = [w[0] for w in windowed]; ylist = [w[1] for w in windowed]; cflist = [w[2] for w in windowed]
+
+    def run():
+        g.batch_strip_compute(xlist, ylist, cflist, lsp['maxH'], lsp['desiredP'], lsp['minH'], lsp['NReg'])
+    return run, len(windowed)
+
+
+def bench_gnssir_guts_v2(ctx):
+    import gnssrefl.gnssir_v2 as guts
+    lsp = gnssir_settings()
+    return (lambda: guts.gnssir_guts_v2(STATION, YEAR, DOY, 66, '', lsp)), ctx['snr_rows']
+
+
+def bench_rinpy_rinex2(ctx):
+    import gnssrefl.rinpy as rinpy
+    return (lambda: rinpy.processrinexfile(ctx['rinex2'])), ctx['rinex_epochs']
+
+
+def bench_rinpy_rinex3(ctx):
+    import gnssrefl.rinpy as rinpy
+    return (lambda: rinpy.processrinexfile(ctx['rinex3'])), ctx['rinex_epochs']
+
+
+def bench_rinpy_rinex3_snr(ctx):
+    import gnssrefl.rinpy as rinpy
+    # only the signal strength columns
+    return (lambda: rinpy.processrinexfile(ctx['rinex3'], obscodes=['S'])), ctx['rinex_epochs']
+
+
+def bench_read_sp3file(ctx):
+    import gnssrefl.gps as g
+    # the parser, not the cache
+    return (lambda: g.read_sp3file(ctx['sp3'], usecache=False)), 1
+
+
+def bench_myreadnav(ctx):
+    import gnssrefl.gps as g
+    return (lambda: g.myreadnav(ctx['nav'], usecache=False)), 1
+
+
+def _rnx2snr(ctx, orbfile, snrname):
+    import gnssrefl.rinex2snr as rinex2snr
+    d = synthetic.g.doy2ymd(YEAR, DOY)
+    snrname = ctx['workdir'] + '/' + snrname
+
+    def run():
+        with open(ctx['workdir'] + '/rnx2snr.log', 'w') as log:
+            rinex2snr.rnx2snr(ctx['rinex2'], orbfile, snrname, 66, YEAR, d.month, d.day, 0, log)
+    return run, ctx['rinex_epochs']
+
+
+def bench_rnx2snr_nav(ctx):
+    return _rnx2snr(ctx, ctx['nav'], 'nav.snr66')
+
+
+def bench_rnx2snr_sp3(ctx):
+    return _rnx2snr(ctx, ctx['sp3'], 'sp3.snr66')
+
+
+def bench_rhdot_correction2(ctx):
+    import gnssrefl.subdaily as subdaily
+    txtdir = os.environ['REFL_CODE'] + '/Files/' + STATION
+
+    def run():
+        subdaily.rhdot_correction2(STATION, [ctx['rhfile']], ctx['rhfile'] + '.withrhdot', False, None, None,
+                                   txtdir=txtdir, year=YEAR, hires_figs=False, delta_out=1800)
+        plt.close('all')
+    return run, ctx['rh_days']
+
+
+def bench_phase_tracks(ctx):
+    import gnssrefl.gnssir_v2 as guts
+    import gnssrefl.phase_functions as phase
+    # a priori tracks from the gnssir results of the synthetic day
+    fname = os.environ['REFL_CODE'] + '/' + str(YEAR) + '/results/' + STATION + '/{0:03d}.txt'.format(DOY)
+    if not os.path.isfile(fname):
+        with contextlib.redirect_stdout(io.StringIO()):
+            guts.gnssir_guts_v2(STATION, YEAR, DOY, 66, '', gnssir_settings())
+    results = np.loadtxt(fname, comments='%', ndmin=2)
+    for f, ending in [(20, ''), (1, '_L1')]:
+        tracks = {}
+        for r in results[results[:,10] == f]:
+            quad = int(r[5] // 90)
+            tracks[(int(r[3]), quad)] = [r[2], r[3], r[5], 100, 90*quad, 90*quad+90]
+        apriori = np.array([[i+1] + v for i, v in enumerate(tracks.values())])
+        np.savetxt(os.environ['REFL_CODE'] + '/input/' + STATION + '_phaseRH' + ending + '.txt', apriori,
+                   fmt='%2.0f %6.3f %4.0f %7.2f %6.0f %4.0f %4.0f', comments='%',
+                   header='TrackN  RH   SatNu  MeanAz  Nval  Azim1  Azim2')
+    ntracks = len(apriori)
+
+    return (lambda: phase.phase_tracks(STATION, YEAR, DOY, 66, [1, 20], 5, 25, [5, 30], False, False, True, False)), ntracks
+
+
+BENCHMARKS = [('read_snr_text', bench_read_snr_text),
+              ('read_snr_gz', bench_read_snr_gz),
+              ('read_snr', bench_read_snr),
+              ('new_rise_set_again', bench_new_rise_set_again),
+              ('window_new', bench_window_new),
+              ('strip_compute', bench_strip_compute),
+              ('batch_strip_compute', bench_batch_strip_compute),
+              ('gnssir_guts_v2', bench_gnssir_guts_v2),
+              ('rinpy_rinex2', bench_rinpy_rinex2),
+              ('rinpy_rinex3', bench_rinpy_rinex3),
+              ('rinpy_rinex3_snr', bench_rinpy_rinex3_snr),
+              ('read_sp3file', bench_read_sp3file),
+              ('myreadnav', bench_myreadnav),
+              ('rnx2snr_nav', bench_rnx2snr_nav),
+              ('rnx2snr_sp3', bench_rnx2snr_sp3),
+              ('rhdot_correction2', bench_rhdot_correction2),
+              ('phase_tracks', bench_phase_tracks)]
+
+
+def time_it(run, repeat):
+    """
+    runs a benchmark repeat times, hiding whatever it prints
+
+    Returns
+    -------
+    times : list of float
+        seconds for each run
+
+    """
+    times = []
+    for i in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            t1 = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - t1)
+
+    return times
+
+
+def git_commit():
+    """
+    short hash of the current commit, with + added if there are uncommitted changes
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=cwd, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=cwd,
+                               capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return 'unknown'
+    if len(commit) == 0:
+        return 'unknown'
+    if len(dirty) > 0:
+        commit = commit + '+'
+
+    return commit
+
+
+def read_history(fname):
+    if os.path.isfile(fname):
+        with open(fname, 'r') as fid:
+            return json.load(fid)
+    return []
+
+
+def previous_run(history, config):
+    """
+    the most recent run in the history with the same data settings
+    """
+    for entry in reversed(history):
+        if entry['config'] == config:
+            return entry
+    return None
+
+
+def run_benchmarks(quick: bool = False, repeat: int = 3, only: list = None, history: str = None, save: bool = True,
+                   tolerance: float = 0.2, dt: int = None, rinex_dt: int = 30, constellations: str = 'GREC',
+                   rh: float = 5.0, noise: float = 0.5, keep: bool = False):
+    """
+    makes synthetic data in a temporary directory, times the benchmarks and compares
+    them with the previous run with the same settings
+
+    Parameters
+    ----------
+    quick : bool, optional
+        3 hours of RINEX data and 30 second SNR data instead of a day of 15 second data
+    repeat : int, optional
+        number of times each benchmark is timed. The fastest time is the one compared
+    only : list of str, optional
+        names of the benchmarks to run, default is all of them
+    history : str, optional
+        json file with the previous runs, default is benchmarks/history.json
+    save : bool, optional
+        add this run to the history, default is True
+    tolerance : float, optional
+        fractional slowdown reported as a regression, default is 0.2
+    dt : int, optional
+        SNR sample interval in seconds
+    rinex_dt : int, optional
+        RINEX sample interval in seconds
+    constellations : str, optional
+        RINEX constellation letters, default is GREC
+    rh : float, optional
+        reflector height of the synthetic data, meters
+    noise : float, optional
+        SNR noise, dB-Hz
+    keep : bool, optional
+        keep the synthetic data directory
+
+    Returns
+    -------
+    entry : dict
+        the timings of this run
+
+    """
+    if dt is None:
+        dt = 30 if quick else 15
+    if history is None:
+        history = os.path.dirname(os.path.abspath(__file__)) + '/history.json'
+    names = [b[0] for b in BENCHMARKS]
+    if only is not None:
+        for name in only:
+            if name not in names:
+                print('Unknown benchmark', name, '. Choose from ', names)
+                sys.exit()
+
+    config = {'quick': quick, 'dt': dt, 'rinex_dt': rinex_dt, 'constellations': constellations,
+              'rh': rh, 'noise': noise, 'hours': 3 if quick else 24, 'rh_days': 3 if quick else 10}
+    workdir = tempfile.mkdtemp(prefix='gnssrefl_bench_')
+    # all gnssrefl files go to the temporary directory
+    os.environ['REFL_CODE'] = workdir + '/refl_code'
+    os.environ['ORBITS'] = workdir + '/orbits'
+    os.environ['EXE'] = workdir + '/exe'
+    os.makedirs(os.environ['EXE'], exist_ok=True)
+    ctx = dict(config)
+    ctx['workdir'] = workdir
+    cwd = os.getcwd()
+    os.chdir(workdir)
+
+    results = {}
+    try:
+        make_data(ctx)
+        for name, bench in BENCHMARKS:
+            if (only is not None) and (name not in only):
+                continue
+            try:
+                with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                    run, nitems = bench(ctx)
+                times = time_it(run, repeat)
+            except (Exception, SystemExit) as e:
+                # some of the codes call sys.exit when something is wrong
+                print('{0:>20s} FAILED {1:s}: {2:s}'.format(name, type(e).__name__, str(e)))
+                continue
+            results[name] = {'best': min(times), 'median': statistics.median(times), 'n': nitems}
+            print('{0:>20s} {1:9.3f} s  (median {2:.3f} s, {3:d} items)'.format(name, min(times), statistics.median(times), nitems))
+    finally:
+        os.chdir(cwd)
+        if keep:
+            print('Synthetic data kept in ', workdir)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    entry = {'commit': git_commit(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+             'numpy': np.__version__, 'machine': platform.node(), 'config': config, 'results': results}
+    past = read_history(history)
+    previous = previous_run(past, config)
+    if previous is not None:
+        print('=================================================================================')
+        print('Compared with', previous['commit'], previous['date'])
+        for name, r in results.items():
+            if name not in previous['results']:
+                continue
+            old = previous['results'][name]['best']
+            change = (r['best'] - old)/max(old, 1e-9)
+            flag = '  <<<< SLOWER' if change > tolerance else ''
+            print('{0:>20s} {1:9.3f} s -> {2:9.3f} s {3:+7.1%}{4:s}'.format(name, old, r['best'], change, flag))
+    if save:
+        past.append(entry)
+        with open(history, 'w') as fid:
+            json.dump(past, fid, indent=1)
+        print('Timings added to ', history)
+
+    return entry
+
+
+def main():
+    args = parse_arguments()
+    run_benchmarks(**args)
+
+
+if __name__ == "__main__":
+    main()
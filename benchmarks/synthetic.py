@@ -0,0 +1,612 @@
+"""
+synthetic GNSS data for the benchmarks: SNR files, RINEX 2.11 and 3 observation files,
+sp3 and broadcast navigation files, and gnssir style reflector height files.
+
+The satellites are on circular orbits, so the same elements give the sp3 positions,
+the broadcast ephemeris and the elevation angles used for the SNR data. The SNR data
+are the interference of a direct and a reflected signal for a known reflector height,
+so gnssir should find that reflector height again.
+"""
+import math
+import os
+
+import numpy as np
+
+import gnssrefl.gps as g
+
+# circular orbits: satellite number offset, number of satellites, semi-major axis (m),
+# inclination (deg), number of orbital planes
+ORBITS = {'G': [0, 32, 26559.7e3, 55.0, 6],
+          'R': [100, 24, 25508.0e3, 64.8, 3],
+          'E': [200, 36, 29600.3e3, 56.0, 3],
+          'C': [300, 32, 27906.1e3, 55.0, 3]}
+
+# which frequency is in which column of a SNR file, for each constellation.
+# python columns are 5:S6, 6:S1, 7:S2, 8:S5, 9:S7, 10:S8
+SNR_COLUMNS = {'G': {6: 1, 7: 20, 8: 5},
+               'R': {6: 101, 7: 102},
+               'E': {6: 201, 8: 205, 5: 206, 9: 207, 10: 208},
+               'C': {7: 302, 5: 306, 9: 307}}
+
+# observables written to the RINEX 2.11 files, and the SNR file column of the S observables
+RINEX2_OBS = ['C1', 'L1', 'S1', 'S2', 'S5', 'S6', 'S7', 'S8']
+RINEX2_COLUMN = {'S1': 6, 'S2': 7, 'S5': 8, 'S6': 5, 'S7': 9, 'S8': 10}
+# the python RINEX 2 translator needs S1 for every constellation, so BeiDou B1 is also written as S1
+RINEX2_SNR = {con: dict(cols) for con, cols in SNR_COLUMNS.items()}
+RINEX2_SNR['C'][6] = 302
+
+# observables written to the RINEX 3 files
+RINEX3_OBS = {'G': ['C1C', 'L1C', 'S1C', 'S2X', 'S5X'],
+              'R': ['C1C', 'L1C', 'S1C', 'S2C'],
+              'E': ['C1X', 'L1X', 'S1X', 'S5X', 'S6X', 'S7X', 'S8X'],
+              'C': ['C2I', 'L2I', 'S2I', 'S6I', 'S7I']}
+RINEX3_COLUMN = {'1': 6, '2': 7, '5': 8, '6': 5, '7': 9, '8': 10}
+
+# period of the synthetic tide, seconds
+TIDE_PERIOD = 12.42*3600
+
+
+def orbit_elements(constellations):
+    """
+    elements of the circular orbits
+
+    Parameters
+    ----------
+    constellations : str
+        RINEX constellation letters, e.g. 'GREC'
+
+    Returns
+    -------
+    elements : list of lists
+        constellation letter, prn, satellite number (with 100, 200, 300 added),
+        semi-major axis (m), inclination (rad), right ascension of the node at the
+        start of the GPS week (rad), argument of latitude at the start of the GPS week (rad)
+
+    """
+    elements = []
+    for con in constellations:
+        offset, nsat, a, incl, nplanes = ORBITS[con]
+        perplane = int(math.ceil(nsat/nplanes))
+        for i in range(nsat):
+            plane = i % nplanes
+            slot = i // nplanes
+            node = 2*np.pi*plane/nplanes + 0.3*offset/100
+            u0 = 2*np.pi*slot/perplane + np.pi*plane/(nplanes*perplane)
+            elements.append([con, i+1, offset+i+1, a, np.radians(incl), node, u0])
+
+    return elements
+
+
+def satellite_xyz(element, sow):
+    """
+    Earth fixed satellite positions, with the same equations as the broadcast ephemeris
+    (zero eccentricity and no perturbations)
+
+    Parameters
+    ----------
+    element : list
+        one row of orbit_elements
+    sow : numpy array of floats
+        GPS seconds of the week
+
+    Returns
+    -------
+    xyz : numpy array of floats
+        positions in meters, one row per time
+
+    """
+    con, prn, sat, a, incl, node, u0 = element
+    n = np.sqrt(g.constants.mu/a**3)
+    u = u0 + n*sow
+    omega = node - g.constants.omegaEarth*sow
+    xp = a*np.cos(u); yp = a*np.sin(u)
+    x = xp*np.cos(omega) - yp*np.cos(incl)*np.sin(omega)
+    y = xp*np.sin(omega) + yp*np.cos(incl)*np.cos(omega)
+    z = yp*np.sin(incl)
+
+    return np.vstack((x, y, z)).T
+
+
+def receiver(lat, lon, ht):
+    """
+    receiver position and local unit vectors
+
+    Parameters
+    ----------
+    lat : float
+        latitude, degrees
+    lon : float
+        longitude, degrees
+    ht : float
+        ellipsoidal height, meters
+
+    Returns
+    -------
+    recv : numpy array
+        Cartesian position, meters
+    up : numpy array
+    East : numpy array
+    North : numpy array
+
+    """
+    x, y, z = g.llh2xyz(lat, lon, ht)
+    up, East, North = g.up(np.radians(lat), np.radians(lon))
+
+    return np.array([x, y, z]), up, East, North
+
+
+def day_start(year, doy):
+    """
+    GPS week and second of the week at the start of a day
+
+    Parameters
+    ----------
+    year : int
+        full year
+    doy : int
+        day of year
+
+    Returns
+    -------
+    week : int
+    sow : float
+
+    """
+    d = g.doy2ymd(year, doy)
+    week, sow = g.kgpsweek(year, d.month, d.day, 0, 0, 0)
+
+    return week, float(sow)
+
+
+def geometry(year, doy, dt, constellations='GREC', lat=40.0, lon=-105.0, ht=1600.0, hours=24, emin=0):
+    """
+    elevation and azimuth angles of all satellites above emin
+
+    Parameters
+    ----------
+    year : int
+        full year
+    doy : int
+        day of year
+    dt : float
+        sample interval, seconds
+    constellations : str, optional
+        RINEX constellation letters, default is 'GREC'
+    lat : float, optional
+        latitude, degrees
+    lon : float, optional
+        longitude, degrees
+    ht : float, optional
+        ellipsoidal height, meters
+    hours : float, optional
+        length of the data set, default is a full day
+    emin : float, optional
+        minimum elevation angle, degrees
+
+    Returns
+    -------
+    tracks : dict
+        for each satellite number: element, seconds of the day, elevation angle (deg),
+        azimuth (deg), range (m)
+
+    """
+    week, sow0 = day_start(year, doy)
+    recv, up, East, North = receiver(lat, lon, ht)
+    t = np.arange(0, hours*3600, dt)
+    tracks = {}
+    for element in orbit_elements(constellations):
+        r = satellite_xyz(element, sow0 + t) - recv
+        rho = np.sqrt(np.sum(r*r, axis=1))
+        el = np.degrees(np.arcsin(r @ up / rho))
+        az = np.degrees(np.arctan2(r @ East, r @ North)) % 360
+        i = el > emin
+        if i.sum() > 0:
+            tracks[element[2]] = [element, t[i], el[i], az[i], rho[i]]
+
+    return tracks
+
+
+def snr_model(t, el, freq, sat, rh=5.0, tide=0.0, noise=0.5, rng=None):
+    """
+    SNR for a direct signal plus a reflection from a horizontal surface
+
+    Parameters
+    ----------
+    t : numpy array of floats
+        seconds of the day
+    el : numpy array of floats
+        elevation angles, degrees
+    freq : int
+        gnssrefl frequency code, e.g. 1, 20, 101
+    sat : int
+        satellite number
+    rh : float, optional
+        reflector height, meters
+    tide : float, optional
+        amplitude of a 12.42 hour sinusoid added to the reflector height, meters
+    noise : float, optional
+        standard deviation of the white noise, dB-Hz
+    rng : numpy random generator, optional
+
+    Returns
+    -------
+    snr : numpy array of floats
+        dB-Hz
+
+    """
+    if rng is None:
+        rng = np.random.default_rng(0)
+    cf = g.arc_scaleF(freq, sat)
+    h = rh + tide*np.sin(2*np.pi*t/TIDE_PERIOD)
+    s = np.sin(np.radians(el))
+    direct = np.power(10, (35 + 15*s)/20)
+    reflected = 0.3*direct*np.exp(-3*s)
+    phase = 2*np.pi*h*s/cf + (sat % 7)
+    snr = 20*np.log10(np.abs(direct + reflected*np.exp(1j*phase)))
+
+    return snr + rng.normal(0, noise, len(t))
+
+
+def snr_day(year, doy, dt=15, constellations='GREC', rh=5.0, tide=0.0, noise=0.5, snr_type=66,
+            lat=40.0, lon=-105.0, ht=1600.0, hours=24, seed=0):
+    """
+    contents of a SNR file
+
+    Parameters
+    ----------
+    year : int
+        full year
+    doy : int
+        day of year
+    dt : float, optional
+        sample interval, seconds
+    constellations : str, optional
+        RINEX constellation letters
+    rh : float, optional
+        reflector height, meters
+    tide : float, optional
+        amplitude of the reflector height variation, meters
+    noise : float, optional
+        SNR noise, dB-Hz
+    snr_type : int, optional
+        SNR file type, which sets the elevation angle limits
+    lat, lon, ht : float, optional
+        receiver position, degrees and meters
+    hours : float, optional
+        length of the data set
+    seed : int, optional
+        random seed
+
+    Returns
+    -------
+    snrD : numpy array of floats
+        sat, elev, azim, seconds, edot, S6, S1, S2, S5, S7, S8, sorted by time
+
+    """
+    rng = np.random.default_rng(seed)
+    elimits = {99: [5, 30], 50: [0, 10], 66: [0, 30], 88: [5, 90]}
+    emin, emax = elimits.get(snr_type, [5, 30])
+    tracks = geometry(year, doy, dt, constellations, lat, lon, ht, hours, emin=emin)
+    rows = []
+    for sat, (element, t, el, az, rho) in tracks.items():
+        i = el <= emax
+        if i.sum() < 2:
+            continue
+        t = t[i]; el = el[i]; az = az[i]
+        out = np.zeros((len(t), 11))
+        out[:, 0] = sat; out[:, 1] = el; out[:, 2] = az; out[:, 3] = t
+        out[:, 4] = np.gradient(el, t)
+        for col, freq in SNR_COLUMNS[element[0]].items():
+            out[:, col] = snr_model(t, el, freq, sat, rh, tide, noise, rng)
+        rows.append(out)
+    snrD = np.vstack(rows)
+
+    return snrD[np.lexsort((snrD[:, 0], snrD[:, 3]))]
+
+
+def write_snr(fname, snrD):
+    """
+    writes a SNR file in the format made by rinex2snr
+
+    Parameters
+    ----------
+    fname : str
+        SNR file name
+    snrD : numpy array
+        output of snr_day
+
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    np.savetxt(fname, snrD, fmt='%3.0f %10.4f %10.4f %10.0f %10.6f %7.2f %7.2f %7.2f %7.2f %7.2f %7.2f')
+
+
+def _header_line(text, label):
+    return '{0:<60s}{1:<20s}\n'.format(text[0:60], label)
+
+
+def _obs_values(element, t, el, rho, names, columns, freqs, rh, tide, noise, rng):
+    """
+    observations for one satellite, one column per observable. nan where there are none
+    """
+    values = np.nan*np.zeros((len(t), len(names)))
+    sat = element[2]
+    for k, name in enumerate(names):
+        if name[0] == 'C':
+            values[:, k] = rho
+        elif name[0] == 'L':
+            values[:, k] = rho/g.constants.wL1
+        elif name[0] == 'S':
+            col = columns(name)
+            freq = freqs[element[0]].get(col)
+            if freq is not None:
+                values[:, k] = snr_model(t, el, freq, sat, rh, tide, noise, rng)
+
+    return values
+
+
+def _epochs(tracks, names_for, columns, freqs, rh, tide, noise, seed):
+    """
+    observations ordered by epoch: dict of seconds of the day to a list of (satellite, values)
+    """
+    rng = np.random.default_rng(seed)
+    epochs = {}
+    for sat in sorted(tracks.keys()):
+        element, t, el, az, rho = tracks[sat]
+        values = _obs_values(element, t, el, rho, names_for(element[0]), columns, freqs, rh, tide, noise, rng)
+        name = '{0:1s}{1:02d}'.format(element[0], element[1])
+        for i in range(len(t)):
+            epochs.setdefault(t[i], []).append((name, values[i, :]))
+
+    return epochs
+
+
+def _obs_field(v):
+    if np.isnan(v):
+        return ' '*16
+    return '{0:14.3f}  '.format(v)
+
+
+def write_rinex2(fname, year, doy, dt=30, constellations='GREC', rh=5.0, tide=0.0, noise=0.5,
+                 lat=40.0, lon=-105.0, ht=1600.0, hours=24, seed=0):
+    """
+    writes a RINEX 2.11 observation file
+
+    Parameters are the same as for snr_day
+
+    Returns
+    -------
+    nepochs : int
+        number of epochs in the file
+
+    """
+    recv, up, East, North = receiver(lat, lon, ht)
+    tracks = geometry(year, doy, dt, constellations, lat, lon, ht, hours)
+    epochs = _epochs(tracks, lambda con: RINEX2_OBS, lambda name: RINEX2_COLUMN.get(name), RINEX2_SNR, rh, tide, noise, seed)
+    d = g.doy2ymd(year, doy)
+    mixed = 'M (MIXED)' if len(constellations) > 1 else constellations
+    types = '{0:6d}'.format(len(RINEX2_OBS)) + ''.join(['{0:>6s}'.format(o) for o in RINEX2_OBS])
+    with open(fname, 'w') as fout:
+        fout.write(_header_line('     2.11           OBSERVATION DATA    ' + mixed, 'RINEX VERSION / TYPE'))
+        fout.write(_header_line('gnssrefl benchmarks', 'PGM / RUN BY / DATE'))
+        fout.write(_header_line('SYNT', 'MARKER NAME'))
+        fout.write(_header_line('{0:14.4f}{1:14.4f}{2:14.4f}'.format(*recv), 'APPROX POSITION XYZ'))
+        fout.write(_header_line('        0.0000        0.0000        0.0000', 'ANTENNA: DELTA H/E/N'))
+        fout.write(_header_line(types, '# / TYPES OF OBSERV'))
+        fout.write(_header_line('{0:10.3f}'.format(dt), 'INTERVAL'))
+        fout.write(_header_line('{0:6d}{1:6d}{2:6d}{3:6d}{4:6d}{5:13.7f}     GPS'.format(year, d.month, d.day, 0, 0, 0.0),
+                                'TIME OF FIRST OBS'))
+        fout.write(_header_line('', 'END OF HEADER'))
+        for t in sorted(epochs.keys()):
+            sats = epochs[t]
+            hh = int(t // 3600); mm = int((t % 3600) // 60); ss = t % 60
+            line = ' {0:02d} {1:2d} {2:2d} {3:2d} {4:2d}{5:11.7f}  0{6:3d}'.format(year % 100, d.month, d.day, hh, mm, ss, len(sats))
+            for k, (name, values) in enumerate(sats):
+                if (k > 0) and (k % 12 == 0):
+                    fout.write(line + '\n')
+                    line = ' '*32
+                line = line + name
+            fout.write(line + '\n')
+            for name, values in sats:
+                for k in range(0, len(values), 5):
+                    fout.write(''.join([_obs_field(v) for v in values[k:k+5]]).rstrip() + '\n')
+
+    return len(epochs)
+
+
+def write_rinex3(fname, year, doy, dt=30, constellations='GREC', rh=5.0, tide=0.0, noise=0.5,
+                 lat=40.0, lon=-105.0, ht=1600.0, hours=24, seed=0):
+    """
+    writes a RINEX 3 observation file
+
+    Parameters are the same as for snr_day
+
+    Returns
+    -------
+    nepochs : int
+        number of epochs in the file
+
+    """
+    recv, up, East, North = receiver(lat, lon, ht)
+    tracks = geometry(year, doy, dt, constellations, lat, lon, ht, hours)
+    epochs = _epochs(tracks, lambda con: RINEX3_OBS[con], lambda name: RINEX3_COLUMN.get(name[1]), SNR_COLUMNS, rh, tide, noise, seed)
+    d = g.doy2ymd(year, doy)
+    with open(fname, 'w') as fout:
+        fout.write(_header_line('     3.04           OBSERVATION DATA    M (MIXED)', 'RINEX VERSION / TYPE'))
+        fout.write(_header_line('gnssrefl benchmarks', 'PGM / RUN BY / DATE'))
+        fout.write(_header_line('SYNT', 'MARKER NAME'))
+        fout.write(_header_line('{0:14.4f}{1:14.4f}{2:14.4f}'.format(*recv), 'APPROX POSITION XYZ'))
+        fout.write(_header_line('        0.0000        0.0000        0.0000', 'ANTENNA: DELTA H/E/N'))
+        for con in constellations:
+            obs = RINEX3_OBS[con]
+            for k in range(0, len(obs), 13):
+                start = '{0:1s}  {1:3d}'.format(con, len(obs)) if k == 0 else ' '*6
+                fout.write(_header_line(start + ''.join([' ' + o for o in obs[k:k+13]]), 'SYS / # / OBS TYPES'))
+        fout.write(_header_line('{0:10.3f}'.format(dt), 'INTERVAL'))
+        fout.write(_header_line('{0:6d}{1:6d}{2:6d}{3:6d}{4:6d}{5:13.7f}     GPS'.format(year, d.month, d.day, 0, 0, 0.0),
+                                'TIME OF FIRST OBS'))
+        fout.write(_header_line('', 'END OF HEADER'))
+        for t in sorted(epochs.keys()):
+            sats = epochs[t]
+            hh = int(t // 3600); mm = int((t % 3600) // 60); ss = t % 60
+            fout.write('> {0:4d} {1:02d} {2:02d} {3:02d} {4:02d}{5:11.7f}  0{6:3d}\n'.format(year, d.month, d.day, hh, mm, ss, len(sats)))
+            for name, values in sats:
+                fout.write(name + ''.join([_obs_field(v) for v in values])[0:16*len(values)-2] + '\n')
+
+    return len(epochs)
+
+
+def write_sp3(fname, year, doy, constellations='GREC', interval=900):
+    """
+    writes a sp3 orbit file (positions only, zero clocks)
+
+    Parameters
+    ----------
+    fname : str
+        sp3 file name
+    year : int
+        full year
+    doy : int
+        day of year
+    constellations : str, optional
+        RINEX constellation letters
+    interval : int, optional
+        seconds between epochs
+
+    """
+    week, sow0 = day_start(year, doy)
+    d = g.doy2ymd(year, doy)
+    elements = orbit_elements(constellations)
+    t = np.arange(0, 86400, interval)
+    xyz = [satellite_xyz(element, sow0 + t)/1000 for element in elements]
+    with open(fname, 'w') as fout:
+        fout.write('#cP{0:4d} {1:2d} {2:2d}  0  0  0.00000000 {3:7d} ORBIT IGS20 HLM  SYNT\n'.format(year, d.month, d.day, len(t)))
+        fout.write('## {0:4d} {1:15.8f} {2:14.8f} {3:5d} 0.0000000000000\n'.format(week, sow0, float(interval), 0))
+        # satellite and accuracy lines, 17 to a line and at least 5 lines as in sp3c
+        names = ['{0:1s}{1:02d}'.format(e[0], e[1]) for e in elements]
+        nlines = max(5, (len(names) + 16)//17)
+        names = names + ['  0']*(17*nlines - len(names))
+        for i in range(nlines):
+            start = '+  {0:3d}   '.format(len(elements)) if i == 0 else '+        '
+            fout.write(start + ''.join(names[17*i:17*i+17]) + '\n')
+        for i in range(nlines):
+            fout.write('++       ' + '  0'*17 + '\n')
+        fout.write('%c M  cc GPS ccc cccc cccc cccc cccc ccccc ccccc ccccc ccccc\n')
+        fout.write('/* synthetic orbits for the gnssrefl benchmarks\n')
+        for i in range(len(t)):
+            hh = int(t[i] // 3600); mm = int((t[i] % 3600) // 60)
+            fout.write('*  {0:4d} {1:2d} {2:2d} {3:2d} {4:2d} {5:11.8f}\n'.format(year, d.month, d.day, hh, mm, 0.0))
+            for e, p in zip(elements, xyz):
+                fout.write('P{0:1s}{1:02d}{2:14.6f}{3:14.6f}{4:14.6f}{5:14.6f}\n'.format(e[0], e[1], p[i, 0], p[i, 1], p[i, 2], 0.0))
+        fout.write('EOF\n')
+
+
+def _d19(v):
+    return '{0:19.12E}'.format(v).replace('E', 'D')
+
+
+def write_nav(fname, year, doy, interval=7200):
+    """
+    writes a RINEX 2 GPS navigation file for the circular orbits
+
+    Parameters
+    ----------
+    fname : str
+        navigation file name
+    year : int
+        full year
+    doy : int
+        day of year
+    interval : int, optional
+        seconds between ephemerides
+
+    """
+    week, sow0 = day_start(year, doy)
+    d = g.doy2ymd(year, doy)
+    with open(fname, 'w') as fout:
+        fout.write(_header_line('     2.11           N: GPS NAV DATA', 'RINEX VERSION / TYPE'))
+        fout.write(_header_line('gnssrefl benchmarks', 'PGM / RUN BY / DATE'))
+        fout.write(_header_line('', 'END OF HEADER'))
+        for element in orbit_elements('G'):
+            con, prn, sat, a, incl, node, u0 = element
+            n = np.sqrt(g.constants.mu/a**3)
+            for toc in np.arange(0, 86400, interval):
+                toe = sow0 + toc
+                hh = int(toc // 3600); mm = int((toc % 3600) // 60)
+                fout.write('{0:2d} {1:02d} {2:2d} {3:2d} {4:2d} {5:2d}{6:5.1f}'.format(prn, year % 100, d.month, d.day, hh, mm, 0.0)
+                           + _d19(0) + _d19(0) + _d19(0) + '\n')
+                M0 = np.arctan2(np.sin(u0 + n*toe), np.cos(u0 + n*toe))
+                rows = [[1, 0, 0, M0], [0, 0, 0, np.sqrt(a)], [toe, 0, node, 0], [incl, 0, 0, 0],
+                        [0, 0, week, 0], [2, 0, 0, 1], [toe, 4]]
+                for row in rows:
+                    fout.write('   ' + ''.join([_d19(v) for v in row]) + '\n')
+
+
+def rh_results(year, doy1, ndays, rh=5.0, tide=1.0, per_day=200, freqs=[1, 20, 5, 101, 201], seed=0):
+    """
+    reflector heights in the format of the daily gnssir result files, for subdaily.
+    The retrievals include the RHdot error (i.e. edot factor times the RH rate)
+    and a bias for each frequency
+
+    Parameters
+    ----------
+    year : int
+        full year
+    doy1 : int
+        first day of year
+    ndays : int
+        number of days
+    rh : float, optional
+        mean reflector height, meters
+    tide : float, optional
+        tidal amplitude, meters
+    per_day : int, optional
+        retrievals per day
+    freqs : list of int, optional
+        frequencies
+    seed : int, optional
+        random seed
+
+    Returns
+    -------
+    tv : numpy array of floats
+        year, doy, RH, sat, UTCtime, Azim, Amp, eminO, emaxO, NumbOf, freq, rise, EdotF,
+        PkNoise, DelT, MJD, refr
+
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for doy in range(doy1, doy1 + ndays):
+        d = g.doy2ymd(year, doy)
+        mjd0, frac = g.mjd(year, d.month, d.day, 0, 0, 0)
+        hours = np.sort(rng.uniform(0, 24, per_day))
+        freq = rng.choice(freqs, per_day)
+        sat = np.where(freq < 100, rng.integers(1, 33, per_day), (freq // 100)*100 + rng.integers(1, 25, per_day))
+        edotf = rng.uniform(0.5, 2.0, per_day)*rng.choice([-1, 1], per_day)
+        t = (doy*24 + hours)*3600
+        w = 2*np.pi/TIDE_PERIOD
+        h = rh - tide*np.sin(w*t)
+        rhdot = -tide*w*np.cos(w*t)*3600
+        bias = np.array([0.01*(f % 7) for f in freq])
+        RH = h + edotf*rhdot + bias + rng.normal(0, 0.02, per_day)
+        for i in range(per_day):
+            rows.append([year, doy, RH[i], sat[i], hours[i], rng.uniform(0, 360), rng.uniform(8, 20), 5.0, 25.0,
+                         300, freq[i], np.sign(edotf[i]), edotf[i], rng.uniform(3, 6), 40, mjd0 + hours[i]/24, 1])
+
+    return np.array(rows)
+
+
+def write_rh_results(fname, tv):
+    """
+    writes the output of rh_results
+
+    Parameters
+    ----------
+    fname : str
+        file name
+    tv : numpy array
+        output of rh_results
+
+    """
+    np.savetxt(fname, tv, fmt='%4.0f %3.0f %6.3f %3.0f %6.3f %6.2f %6.2f %6.2f %6.2f %4.0f %3.0f %2.0f %8.5f %6.2f %7.2f %12.6f %1.0f',
+               header='year, doy, RH, sat, UTCtime, Azim, Amp, eminO, emaxO, NumbOf, freq, rise, EdotF, PkN, DelT, MJD, refr',
+               comments='% ')
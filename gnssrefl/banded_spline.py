@@ -0,0 +1,191 @@
+import numpy as np
+import scipy.linalg as linalg
+import scipy.interpolate as interpolate
+
+# least squares cubic splines with user knots (what interpolate.splrep does
+# with task=-1), written as a banded system so that it can be reused.
+# Each observation only touches k+1 neighbouring B-splines, so the normal
+# matrix has k super-diagonals and is stored in the upper banded form used
+# by scipy.linalg.cholesky_banded.  The normal matrix only depends on the
+# observation times, not on the values being fit, so a new set of values
+# (or the same times minus some outliers) is refit without assembling
+# everything again: removed observations are subtracted (downdated) from
+# the normal matrix and new ones are added, then the band is refactored.
+
+
+def bspline_basis(x, t, k=3):
+    """
+    values of the nonzero B-splines at the observation times
+
+    Parameters
+    ----------
+    x : numpy array of floats
+        observation times, within [t[k], t[-k-1]]
+    t : numpy array of floats
+        full knot vector, boundary knots repeated k+1 times
+    k : int, optional
+        spline degree, default is 3
+
+    Returns
+    -------
+    j0 : numpy array of int
+        index of the first nonzero B-spline for each observation
+    B : numpy array of floats (len(x), k+1)
+        values of B-splines j0 ... j0+k at each observation
+
+    """
+    x = np.asarray(x, dtype=float)
+    n = len(t) - k - 1
+    # knot interval of each point. the last boundary belongs to the last interval
+    l = np.searchsorted(t, x, side='right') - 1
+    l = np.clip(l, k, n-1)
+
+    m = len(x)
+    B = np.zeros((m, k+1))
+    B[:,0] = 1
+    left = np.zeros((m, k+1)); right = np.zeros((m, k+1))
+    # de Boor's recursion for the k+1 nonzero values
+    for j in range(1, k+1):
+        left[:,j] = x - t[l+1-j]
+        right[:,j] = t[l+j] - x
+        saved = np.zeros(m)
+        for r in range(0, j):
+            temp = B[:,r]/(right[:,r+1] + left[:,j-r])
+            B[:,r] = saved + right[:,r+1]*temp
+            saved = left[:,j-r]*temp
+        B[:,j] = saved
+
+    return l - k, B
+
+
+class BandedSpline:
+    """
+    least squares cubic spline with fixed knots, kept as a banded normal
+    matrix so that it can be refit for new values, or after observations
+    are removed or added, without starting from scratch.
+
+    The knots follow interpolate.splrep(x, y, t=knots, task=-1): the boundary
+    knots are the first and last time and the interior knots are the ones given.
+
+    Parameters
+    ----------
+    x : numpy array of floats
+        observation times, sorted
+    knots : numpy array of floats
+        interior knots
+    k : int, optional
+        spline degree, default is 3
+
+    """
+
+    def __init__(self, x, knots, k=3):
+        x = np.asarray(x, dtype=float)
+        self.k = k
+        self.knots = np.asarray(knots, dtype=float)
+        self.t = np.r_[[x[0]]*(k+1), self.knots, [x[-1]]*(k+1)]
+        self.ncoef = len(self.t) - k - 1
+        self.ab = np.zeros((k+1, self.ncoef))
+        self.x = np.empty(0)
+        self.j0 = np.empty(0, dtype=int)
+        self.B = np.empty((0, k+1))
+        self.set_times(x)
+
+    def same_knots(self, x, knots):
+        """
+        whether a spline for these times and interior knots has the same
+        knot vector as this one, i.e. whether set_times can be used
+
+        Parameters
+        ----------
+        x : numpy array of floats
+            observation times, sorted
+        knots : numpy array of floats
+            interior knots
+
+        Returns
+        -------
+        bool
+
+        """
+        return (x[0] == self.t[0]) and (x[-1] == self.t[-1]) and np.array_equal(knots, self.knots)
+
+    def _accumulate(self, j0, B, sign):
+        """
+        adds (sign=1) or removes (sign=-1) observations from the normal matrix
+        """
+        k = self.k
+        for a in range(k+1):
+            for b in range(a, k+1):
+                self.ab[k+a-b,:] += sign*np.bincount(j0+b, weights=B[:,a]*B[:,b], minlength=self.ncoef)
+
+    def set_times(self, x):
+        """
+        changes the observation times of the fit.  Times that were already
+        there are kept, the ones that are gone are downdated from the normal
+        matrix and only the new ones are evaluated and added
+
+        Parameters
+        ----------
+        x : numpy array of floats
+            observation times, within the boundary knots
+
+        """
+        x = np.asarray(x, dtype=float)
+        # match the new times to the current ones, repeated times one by one
+        old_order = np.argsort(self.x, kind='stable')
+        new_order = np.argsort(x, kind='stable')
+        xo = self.x[old_order]; xn = x[new_order]
+        # rank of each new time among the equal ones
+        rn = np.arange(len(xn)) - np.searchsorted(xn, xn, side='left')
+        # row of the old times with the same value and rank, if any
+        lo = np.searchsorted(xo, xn, side='left')
+        cnt = np.searchsorted(xo, xn, side='right') - lo
+        kept = rn < cnt
+        match = np.full(len(xn), -1)
+        match[kept] = old_order[lo[kept] + rn[kept]]
+        used = np.zeros(len(xo), dtype=bool)
+        used[match[kept]] = True
+
+        # downdate the times that are gone
+        gone = ~used
+        if gone.any():
+            self._accumulate(self.j0[gone], self.B[gone,:], -1)
+
+        j0 = np.empty(len(x), dtype=int); B = np.empty((len(x), self.k+1))
+        j0[new_order[kept]] = self.j0[match[kept]]
+        B[new_order[kept],:] = self.B[match[kept],:]
+        # and add the new ones
+        new = new_order[~kept]
+        if len(new) > 0:
+            j0[new], B[new,:] = bspline_basis(x[new], self.t, self.k)
+            self._accumulate(j0[new], B[new,:], 1)
+
+        self.x = x; self.j0 = j0; self.B = B
+        try:
+            self.cb = linalg.cholesky_banded(self.ab, lower=False)
+        except linalg.LinAlgError:
+            raise ValueError('The spline knots do not have enough observations between them ' +
+                    '(Schoenberg-Whitney conditions)')
+
+    def fit(self, y):
+        """
+        least squares spline for values at the current observation times
+
+        Parameters
+        ----------
+        y : numpy array of floats
+            values, in the order of the current times
+
+        Returns
+        -------
+        spline : interpolate.BSpline
+            the fitted spline, no extrapolation
+
+        """
+        y = np.asarray(y, dtype=float)
+        rhs = np.zeros(self.ncoef)
+        for a in range(self.k+1):
+            rhs += np.bincount(self.j0+a, weights=self.B[:,a]*y, minlength=self.ncoef)
+        c = linalg.cho_solve_banded((self.cb, False), rhs)
+
+        return interpolate.BSpline(self.t, c, self.k, extrapolate=False)
@@ -12,7 +12,9 @@ from datetime import date
 
 # my code
 import gnssrefl.gps as g
+import gnssrefl.results_store as results_store
 import gnssrefl.sd_libs as sd
+import gnssrefl.time_arrays as ta
 #
 
 def fbias_daily_avg(station):
@@ -96,7 +98,7 @@ def fbias_daily_avg(station):
 
 
 def readin_plot_daily(station,extension,year1,year2,fr,alldatafile,csvformat,
-        howBig,ReqTracks,azim1,azim2,test,subdir,plot_limits):
+        howBig,ReqTracks,azim1,azim2,test,subdir,plot_limits,usestore=False):
     """
     worker code for daily_avg_cl.py
 
@@ -150,6 +152,9 @@ def readin_plot_daily(station,extension,year1,year2,fr,alldatafile,csvformat,
     subdir : bool
         whether plot limits for the median filter are shown
 
+    usestore : bool, optional
+        read the files through the results store, default is False
+
     Returns
     -------
     tv : numpy array
@@ -191,7 +196,9 @@ def readin_plot_daily(station,extension,year1,year2,fr,alldatafile,csvformat,
     ngps = []; nglo = [] ; ngal = []; nbei = []
     obstimes = []; medRH = []; meanRH = [] ; alltimes = []; meanAmp = []
     tttimes = []
-    fig,ax=plt.subplots()
+    # everything is plotted after the days are aggregated
+    ally = []; alldoy = []; allutc = []; allgood = []
+    tvlist = [tv]; tv_medianlist = [tv_median]
     year_list = np.arange(year1, year2+1, 1)
     NumFiles = 0
     s1 = time.time()
@@ -199,23 +206,16 @@ def readin_plot_daily(station,extension,year1,year2,fr,alldatafile,csvformat,
         direc = xdir + '/' + str(yr) + '/results/' + station + '/' + extension + '/'
         # counter for the legends
         nle = 0
-        # i understand why python people like this - but then the results are not sorted ...
         if os.path.isdir(direc):
-            all_files = os.listdir(direc)
-            all_files = np.sort(all_files)
-            #print('Number of files in ', yr, len(all_files))
-            for f in all_files:
-                fname = direc + f
+            # with usestore the files are read from the results store, one query per
+            # year. The ones that are not in it yet (or changed) are parsed and stored
+            for f, fname, a in results_store.load_results(station, extension, yr, usestore=usestore):
                 L = len(f)
         # file names must have 7 characters in them ...  and end in txt for that matter
                 if (L == 7):
                     NumFiles +=  1
         # check that it is a file and not a directory and that it has something/anything in it
                     try:
-                        # trying to turn off the annoying empty file warnings
-                        with warnings.catch_warnings():
-                            warnings.simplefilter("ignore")
-                            a = np.loadtxt(fname,skiprows=3,comments='%')
                         nr,nc=a.shape
                         if (nr > 0):
                             nle = nle + 1
@@ -223,7 +223,7 @@ def readin_plot_daily(station,extension,year1,year2,fr,alldatafile,csvformat,
                             www = (a[:,5] > azim1 ) & (a[:,5] < azim2 )
                             a = a[www,:]
 
-                            y = a[:,0] +a[:,1]/365.25; rh = a[:,2] ; 
+                            y = ta.fractional_year(a[:,0], a[:,1]); rh = a[:,2] ; 
                             frequency = a[:,10]; azimuth = a[:,5]; sat = a[:,3]; amplitude=a[:,6]
                             # added utc to the all RH file
                             utcTime = a[:,4]; 
@@ -258,18 +258,9 @@ def readin_plot_daily(station,extension,year1,year2,fr,alldatafile,csvformat,
                                 tvall = write_out_all(allrh, csvformat, NG, yr, doy, d, good, gazim, gfreq, gsat,gamp,gpeak2noise,gutcTime,tvall)
 
                                 rh = good
-                                # this is the plot with all the data -not the daily average
-                                alltimes = []
-
-                                # put in the real time (as opposed to just year,month day)
-                                #filler = datetime.datetime(year=yr, month=d.month, day=d.day, hour = hrr, minute=mm, second = ss)
-                                for w in range(0,len(good)):
-                                    hrr = int(np.floor(gutcTime[w])) # 
-                                    mm = int(60*(gutcTime[w] - hrr )); ss = 0
-                                    filler = datetime.datetime(year=yr, month=d.month, day=d.day, hour = hrr, minute=mm, second = ss)
-                                    alltimes.append(filler)
-                                # 
-                                ax.plot(alltimes,good,'b.')
+                                # this is for the plot with all the data -not the daily average
+                                ally.append(np.full(len(good), yr)); alldoy.append(np.full(len(good), doy))
+                                allutc.append(gutcTime); allgood.append(good)
 
                                 # this are stats for the daily averages - is this slowing it down? - apparently not
                                 # turned off for now
@@ -305,8 +296,8 @@ def readin_plot_daily(station,extension,year1,year2,fr,alldatafile,csvformat,
                                 # a new variable is not really needed - but I did not want to oerwrite working code
                                 newl_plus_median = [yr, doy, meanRHtoday, len(rh), d.month, d.day, stdRHtoday, np.mean(goodAmp),medv]
 
-                                tv = np.append(tv, [newl],axis=0)
-                                tv_median = np.append(tv_median, [newl_plus_median],axis=0)
+                                tvlist.append([newl])
+                                tv_medianlist.append([newl_plus_median])
 
                                 k += 1
                             else:
@@ -317,16 +308,20 @@ def readin_plot_daily(station,extension,year1,year2,fr,alldatafile,csvformat,
             abc = 0; # dummy line
     #meanRH = np.asarray(meanRH)
     s2 = time.time()
+    tv = np.vstack(tvlist); tv_median = np.vstack(tv_medianlist)
+
+    fig,ax=plt.subplots()
+    if len(allgood) > 0:
+        # put in the real time (as opposed to just year,month day), to the minute
+        alltimes = ta.obstimes(np.concatenate(ally), np.concatenate(alldoy), np.concatenate(allutc), minutes=True)
+        ax.plot(alltimes,np.concatenate(allgood),'b.')
 
     # not sure you can sort obstimes
-    dumb_time = tv_median[:,0] + tv_median[:,1]/365.25
+    dumb_time = ta.fractional_year(tv_median[:,0], tv_median[:,1])
     # sort it ...
     ii = np.argsort(dumb_time)
     tv_median = tv_median[ii,:]
-    for www in range(0,len(tv_median)):
-        filler = datetime.datetime(year=int(tv_median[www,0]), 
-                month=int(tv_median[www,4]), day=int(tv_median[www,5]), hour = 12, minute=0, second = 0)
-        tttimes.append(filler)
+    tttimes = ta.ymd_obstimes(tv_median[:,0], tv_median[:,4], tv_median[:,5], 12)
 
     # plot the median 
     ax.plot(tttimes, tv_median[:,8],'ks',markerfacecolor='white',label='median value')
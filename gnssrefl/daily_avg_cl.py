@@ -26,10 +26,11 @@ def parse_arguments():
     parser.add_argument("-test", default=None, type=str, help="augmentation to plot")
     parser.add_argument("-subdir", default=None, type=str, help="non-default subdirectory for output ")
     parser.add_argument("-plot_limits", default=None, type=str, help="add median value and limits to plot, default is False ")
+    parser.add_argument("-results_store", default=None, type=str, help="read the results through the results store of the station, default is True")
     args = parser.parse_args().__dict__
 
     # convert all expected boolean inputs from strings to booleans
-    boolean_args = ['plt', 'csv','test','plot_limits']
+    boolean_args = ['plt', 'csv','test','plot_limits','results_store']
     args = str2bool(args, boolean_args)
 
     # only return a dictionary of arguments that were added from the user - all other defaults will be set in code below
@@ -38,7 +39,8 @@ def parse_arguments():
 
 def daily_avg(station: str , medfilter: float, ReqTracks: int, txtfile: str = None, plt: bool = True, 
         extension: str = '', year1: int = 2005, year2: int = 2030, fr: int = 0, csv: bool = False, 
-        azim1: int = 0, azim2: int = 360, test: bool = False, subdir: str=None,plot_limits: bool=False):
+        azim1: int = 0, azim2: int = 360, test: bool = False, subdir: str=None,plot_limits: bool=False,
+        results_store: bool=True):
     """
     The goal of this code is to consolidate individual RH results into a single file consisting of 
     daily averaged RH without outliers. These daily average values are nominally associated 
@@ -165,6 +167,12 @@ def daily_avg(station: str , medfilter: float, ReqTracks: int, txtfile: str = No
         adds the median value and median filter limits to the plot.
         default is False
 
+    results_store: bool, optional
+        read the daily results through the results store of the station (see gnssir -results_store).
+        Days are parsed once and kept with the size and modification time of their file, so
+        running daily_avg again (e.g. with a new medfilter or ReqTracks) does not parse them again.
+        default is True
+
     """
     if len(station) != 4:
         print('Station names must have four characters. Exiting.')
@@ -189,7 +197,7 @@ def daily_avg(station: str , medfilter: float, ReqTracks: int, txtfile: str = No
 
     # read in the files
     tv, obstimes = da.readin_plot_daily(station, extension, year1, year2, fr, 
-            alldatafile, csv, medfilter, ReqTracks,azim1,azim2,test,subdir,plot_limits)
+            alldatafile, csv, medfilter, ReqTracks,azim1,azim2,test,subdir,plot_limits,results_store)
 
     # default is to show the plots
     nr,nc = tv.shape
@@ -1,6 +1,7 @@
 import warnings
 import argparse
 import os
+import statistics
 import subprocess
 import sys
 import time
@@ -11,7 +12,9 @@ from functools import partial
 #import gnssrefl.gnssir as guts
 import gnssrefl.gnssir_v2 as guts2
 import gnssrefl.gps as g
+import gnssrefl.instrument as instrument
 
+from gnssrefl.read_snr_files import evict_snr_cache
 from gnssrefl.utils import str2bool
 
 
@@ -42,13 +45,23 @@ def parse_arguments():
     parser.add_argument("-mmdd", default=None, type=str, help="Boolean, add columns for month,day,hour,minute")
     parser.add_argument("-dec", default=1, type=int, help="decimate SNR file to this sampling rate before computing periodograms")
     parser.add_argument("-newarcs", default=None, type=str, help="This no longer has any meaning")
-    parser.add_argument("-par", default=None, type=int, help="Number of processes to spawn (up to 10)")
+    parser.add_argument("-par", default=None, type=int, help="Number of processes to spawn. -99 uses one per CPU")
+    parser.add_argument("-incremental", default=None, type=str, help="Boolean, only analyze days whose settings or SNR file changed")
+    parser.add_argument("-coarse2fine", default=None, type=str, help="Boolean, two stage periodogram peak search, faster for large maxH")
+    parser.add_argument("-chunksize", default=None, type=int, help="Number of days handed to a process at a time (default 1)")
+    parser.add_argument("-instrument", default=None, type=str, help="Boolean, record the time spent in each stage of the analysis")
+    parser.add_argument("-uncompress", default=None, type=str, help="Boolean, uncompress gz/xz SNR files on disk instead of reading them directly")
+    parser.add_argument("-parallel_decompress", default=None, type=str, help="Boolean, use pigz or xz -T0 to read compressed SNR files")
+    parser.add_argument("-snr_cache", default=None, type=str, help="Boolean, keep a binary copy of each SNR file next to it for faster reads")
+    parser.add_argument("-snr_cache_mb", default=None, type=float, help="size budget of the binary SNR copies of the station in MB (default 2000)")
+    parser.add_argument("-results_store", default=None, type=str, help="Boolean, also put the results in a sqlite store read by subdaily and daily_avg")
 
 
     args = parser.parse_args().__dict__
 
     # convert all expected boolean inputs from strings to booleans
-    boolean_args = ['plt', 'screenstats', 'nooverwrite', 'compress', 'screenstats', 'mmdd','gzip','newarcs']
+    boolean_args = ['plt', 'screenstats', 'nooverwrite', 'compress', 'screenstats', 'mmdd','gzip','newarcs','incremental','coarse2fine','instrument',
+                    'uncompress','parallel_decompress','snr_cache','results_store']
     args = str2bool(args, boolean_args)
 
     # only return a dictionary of arguments that were added from the user - all other defaults will be set in code below
@@ -59,17 +72,20 @@ def gnssir(station: str, year: int, doy: int, snr: int = 66, plt: bool = False,
         ampl: float = None, sat: int = None, doy_end: int = None, year_end: int = None, azim1: int = 0, 
         azim2: int = 360, nooverwrite: bool = False, extension: str = '', compress: bool = False, 
         screenstats: bool = False, delTmax: int = None, e1: float = None, e2: float = None, 
-           mmdd: bool = False, gzip: bool = True, dec : int = 1, newarcs : bool = True, par : int = None ):
+           mmdd: bool = False, gzip: bool = True, dec : int = 1, newarcs : bool = True, par : int = None, 
+           chunksize : int = 1, incremental : bool = False, coarse2fine : bool = None, instrument : bool = False,
+           uncompress : bool = False, parallel_decompress : bool = False, snr_cache : bool = None,
+           snr_cache_mb : float = 2000, results_store : bool = None ):
     """
     gnssir is the main driver for estimating reflector heights. The user is required to 
     have set up an analysis strategy using gnssir_input. 
 
-    beta version of parallel processing is now onine. If you set -par to an integer >=2, it will do processing across years, i.e. you
-    won't see any improvement unless you are trying to analyze two years of data - in which case it will
-    be twice as fast, three years of data, three times as fast.  I have added an option par=-99 which
-    only works for now on a single year. but it will create up to 10 simultaneous processes, so very slick.  
-    Ultimately of course I will put these together and make this the official version.  Huge thank you to
-    Aaryan Rampal for getting this up and running.
+    beta version of parallel processing is now onine. If you set -par to an integer >=2, every day
+    in your requested date range (across as many years as you like) is put in a queue and handed
+    out to that many processes as they become free, so days with missing or tiny SNR files do not
+    hold anybody up. par=-99 uses one process per CPU. A summary of the time spent on each day 
+    and any days that failed is printed at the end.  Huge thank you to
+    Aaryan Rampal for getting the first version of this up and running.
         
     Examples
     --------
@@ -91,6 +107,18 @@ def gnssir(station: str, year: int, doy: int, snr: int = 66, plt: bool = False,
         before computing periodograms, decimates the SNR file contents to 5 seconds
     gnssir p041 2021 15 -gzip T
         gzips the SNR file after you run the code. Big space saver (now the default)
+    gnssir p041 2020 1 -year_end 2023 -doy_end 365 -par -99
+        analyzes four years of data using one process per CPU
+    gnssir p041 2021 15 -coarse2fine T
+        finds the periodogram peak with a coarse grid followed by a fine grid near the peaks.
+        Much faster for water sites with a large maxH
+    gnssir p041 2020 1 -year_end 2023 -doy_end 365 -incremental T
+        only reanalyzes the days whose json settings or SNR files changed since the last incremental run
+    gnssir p041 2021 1 -doy_end 31 -instrument T
+        prints (and saves) where the time went, e.g. reading SNR files vs computing periodograms
+    gnssir p041 2021 1 -doy_end 31 -snr_cache T
+        keeps a binary copy of each SNR file, so analyzing the days again (e.g. with another
+        strategy) does not have to parse the SNR files
 
     Parameters
     ----------
@@ -163,17 +191,51 @@ def gnssir(station: str, year: int, doy: int, snr: int = 66, plt: bool = False,
         adds columns in results for month, day, hour, and minute. default is False.
     gzip : boolean, optional
         gzip compress SNR files after use. default is True (as of 2023 Sep 17).
+        SNR files that are already compressed are left as they are.
     dec : int, optional
         decimate SNR file to this sampling period before the 
         periodograms are computed. 1 sec is default (i.e. no decimating)
     newarcs : bool, optional
         this input no longer has any meaning 
     par : int
-        parallel processing parameter. If an integer from 2-10, it sets up
-        2-10 processes for years, i.e. you should add at least the same number of 
-        processes as you have years. For par = -99, it sets
-        up 10 processes for jobs within that single year. Ultimately these modes will be 
-        merged so that the -99 option goes away.
+        parallel processing parameter, the number of processes used to analyze the 
+        requested days. For par = -99, one process per CPU is used.
+    chunksize : int, optional
+        number of days handed to a process at a time in parallel mode. default is 1,
+        which balances the load best. Larger values reduce the overhead for very short days.
+    incremental : bool, optional
+        only analyze days whose results are missing or whose json settings or SNR file
+        (size, modification time and contents) changed since the last incremental run. 
+        This is tracked in $REFL_CODE/Files/station/extension/gnssir_manifest.db. default is False
+    coarse2fine : bool, optional
+        two stage periodogram peak search. The periodogram is computed on a grid of a quarter of the
+        peak width, and at the desiredP spacing only next to the biggest peaks. The RH is the same
+        as for the full grid, the peak to noise ratio is computed from the coarse periodogram.
+        If not set, the json value is used (default False)
+    instrument : bool, optional
+        record the time spent in each stage (reading, refraction, arc finding, windowing,
+        periodograms, output) and counts of rows and arcs. A json file is written for each
+        day to $REFL_CODE/Files/station/timing and the days are added up in a run summary
+        at the end. Setting the environment variable REFL_INSTRUMENT does the same. default is False
+    uncompress : bool, optional
+        uncompress gzip/xz SNR files on disk before reading them, and compress them again
+        afterwards (the old behavior). default is False, i.e. compressed SNR files are read
+        directly and left as they are
+    parallel_decompress : bool, optional
+        use pigz (gzip) or xz -T0 (xz) to read compressed SNR files, if they are installed.
+        default is False, which uses the python gzip and lzma modules
+    snr_cache : bool, optional
+        keep a binary copy of each SNR file next to it (e.g. ssssddd0.yy.snr66.gz.npy) and read it instead
+        of the text file the next time. A new size or modification time of the SNR file 
+        invalidates it. If not set, the json value is used (default False)
+    snr_cache_mb : float, optional
+        when snr_cache is on, the binary copies of the station are pruned to this many MB 
+        at the end of the run, least recently used first. default is 2000
+    results_store : bool, optional
+        also put the results of each day in $REFL_CODE/Files/station/extension/gnssir_results.db,
+        so subdaily and daily_avg -results_store T do not parse the text files again. 
+        In parallel mode the processes take turns writing to it. 
+        If not set, the json value is used (default False)
 
     """
 
@@ -235,6 +297,11 @@ def gnssir(station: str, year: int, doy: int, snr: int = 66, plt: bool = False,
     # default will be to overwrite
     #if nooverwrite is None:
     lsp['nooverwrite'] = nooverwrite
+    lsp['incremental'] = incremental
+    if coarse2fine is not None:
+        lsp['coarse2fine'] = coarse2fine
+    if instrument:
+        lsp['instrument'] = instrument
     #else:
     #    lsp['overwriteResults'] = False
 
@@ -274,6 +341,12 @@ def gnssir(station: str, year: int, doy: int, snr: int = 66, plt: bool = False,
     lsp['mmdd'] = add_mmddhhss
     # added 2022apr15
     lsp['gzip'] = gzip
+    lsp['uncompress'] = uncompress
+    lsp['parallel_decompress'] = parallel_decompress
+    if snr_cache is not None:
+        lsp['snr_cache'] = snr_cache
+    if results_store is not None:
+        lsp['results_store'] = results_store
 
     # if refraction model is not assigned, set it to 1
     if 'refr_model' not in lsp.keys():
@@ -321,137 +394,193 @@ def gnssir(station: str, year: int, doy: int, snr: int = 66, plt: bool = False,
     # should make sure there are directories for the results ... 
     g.checkFiles(station.lower(), extension)
 
-    year_list = list(range(year_st, year_end+1))
-    # changed to better describe year and doy start/end
-
     print('Requested frequencies ', lsp['freqs'])
-    additional_args = { "year_end": year_end, "year_st": year_st, "doy": doy, "doy_end": doy_end, "args": args }
+    # settings that are wrong for every day stop the run here, rather than failing each day
+    if not guts2.check_settings(lsp):
+        sys.exit()
 
 
     t1 = time.time()
+    tasks = make_task_list(year_st, doy, year_end, doy_end)
     if not par: 
-        # analyze one year at a time in the current code
-        for year in year_list:
-            process_year(year, **additional_args)
+        # analyze one day at a time in the current process
+        results = [process_day(task, args) for task in tasks]
     else:
-        if par > 10:
-            print('For now we will only allow ten simultaneous processes. Submit again. Exiting.')
-            sys.exit()
         if (par == -99):
-            print('Using pools with multiple lists of dates. For now only one year can be accommodating')
-            if (year != year_end):
-                print('Submit within one year for now')
-                sys.exit()
-            numproc = 10
-            # hardwire for five processes now
-            # try sending this instead of just args 
-            #d = { 0: [2020, 251, 260], 1:[2020, 261, 270], 2: [2020, 271, 280], 3:[2020, 281, 290], 4:[2020,291,300] }
-            # may end up using fewer processes ... so return numproc for that
-            d,numproc=guts2.make_parallel_proc_lists(year, doy, doy_end, numproc)
-            print(numproc)
-            print(d)
-
-            index_list = list(range(numproc))
-
-            pool = multiprocessing.Pool(processes=numproc) 
-            partial_process_yearD = partial(process_year_dictionary, args=args,datelist=d)
-            pool.map(partial_process_yearD,index_list)
-
-            pool.close()
-            pool.join()
-
+            numproc = multiprocessing.cpu_count()
         else:
-            print('Using process year with pools')
-            pool = multiprocessing.Pool(processes=par) 
-            partial_process_year = partial(process_year, **additional_args)
-            print(year_list)
-            type(partial_process_year)
-
-            pool.map(partial_process_year, year_list)
-            pool.close()
-            pool.join()
+            numproc = par
+        # no point in having more processes than days
+        numproc = max(1, min(numproc, len(tasks)))
+        print('Using a pool of', numproc, 'processes for', len(tasks), 'days')
+        results = run_task_queue(tasks, args, numproc, chunksize)
 
     t2 = time.time()
+    print_task_summary(results)
+    print_instrument_summary(results, station.lower(), t1)
+    if lsp.get('snr_cache', False):
+        evict_snr_cache(station.lower(), snr_cache_mb)
     print('Time to compute ', round(t2-t1,2))
 
-def process_year(year, year_end, year_st, doy, doy_end, args):
+def make_task_list(year_st, doy, year_end, doy_end):
     """
-    Code that does the processing for a specific year. Refactored to separate 
-    function to allow for parallel processes
+    makes the list of days to analyze
 
     Parameters
     ----------
-    year : int
-        the year you are currently analyzing
+    year_st : int
+        first year
+    doy : int
+        first day of year in the first year
     year_end : int
-        end year. This was the last year you plan to analyze
-    year_st: int 
-        This is starting year you were planning to analyze
-    doy : integer
-        Day of year
-        POOR VARIABLE NAME. SHOULD BE CHANGED. i believe it is the start doy on the start year.
+        last year
     doy_end : int
-        end day of year on the last year you plan to analyze
-        Default is None. 
-    args : dict
-        arguments passed into gnssir through commandline (or python)
+        last day of year in the last year
 
-    """
-    if year != year_end:
-        doy_en = 366
-    else:
-        doy_en = doy_end
+    Returns
+    -------
+    tasks : list of tuples
+        (year, doy) for every day in the range
 
-    if year == year_st:
-        doy_list = list(range(doy, doy_en+1))
-    else:
-        doy_list = list(range(1, doy_en+1))
-
-    # so really this is looking at only a single year
-    # looping through day of year. I think? 
-    args['year'] = year
-    for doy in doy_list:
-        args['doy'] = doy
-        try:
-            guts2.gnssir_guts_v2(**args)
-        except:
-            warnings.warn(f'error processing {year} {doy}');                
-
-def process_year_dictionary(index,args,datelist):
     """
-    Code that does the processing for a specific year. Refactored to separate
-    function to allow for parallel processes
+    tasks = []
+    for year in range(year_st, year_end+1):
+        d1 = 1
+        d2 = g.dec31(year)
+        if year == year_st:
+            d1 = doy
+        if year == year_end:
+            d2 = doy_end
+        for d in range(d1, d2+1):
+            tasks.append((year, d))
+
+    return tasks
+
+def process_day(task, args):
+    """
+    analyzes a single day and keeps track of how long it took and whether it failed
 
     Parameters
     ----------
-    index: int
-        value from '0' to '4', telling you which element of args to use 
+    task : tuple
+        (year, doy) to analyze
     args : dict
         arguments passed into gnssir through commandline (or python)
-        should have the new arguments for sublists
-    datelist : dict
-        list of dates you want to analyze in simple year, doy1, doy2 format
-        should have up to 10 sets of dates, from 0 to 9, e.g. for five processes
-        dd = { 0: [2020, 251, 260], 1:[2020, 261, 270], 2: [2020, 271, 280], 3:[2020, 281, 290], 4:[2020,291,300] }
 
+    Returns
+    -------
+    result : tuple
+        year, doy, time in seconds, whether it succeeded, error message,
+        and the timing record (None unless instrumentation is on)
+
+    """
+    year, doy = task
+    dargs = dict(args)
+    dargs['year'] = year; dargs['doy'] = doy
+    t1 = time.time()
+    ok = True; msg = ''
+    try:
+        guts2.gnssir_guts_v2(**dargs)
+    except (Exception, SystemExit) as e:
+        # the settings were checked before the days were queued (check_settings), so this is
+        # a problem with the data of this day, e.g. the sys.exit when there are no data above 
+        # the minimum elevation angle. do not let that kill the whole run
+        ok = False
+        msg = type(e).__name__ + ': ' + str(e)
+        warnings.warn(f'error processing {year} {doy} {msg}')
+        # days that stop early still get a timing record
+        instrument.finish_record()
+
+    return year, doy, time.time()-t1, ok, msg, instrument.take_last()
+
+def run_task_queue(tasks, args, numproc, chunksize=1):
     """
+    hands the days out to a pool of processes.  Each process asks for more work
+    (chunksize days at a time) as soon as it is done, so the load stays balanced
+    even when some days take much longer than others
+
+    Parameters
+    ----------
+    tasks : list of tuples
+        (year, doy) to analyze
+    args : dict
+        arguments passed into gnssir through commandline (or python)
+    numproc : int
+        number of processes
+    chunksize : int
+        number of days handed to a process at a time
 
+    Returns
+    -------
+    results : list of tuples
+        output of process_day for each day, in the order the days finished
 
-    year = datelist[index][0]; d1 = datelist[index][1] ; d2 = datelist[index][2]
+    """
+    results = []
+    pool = multiprocessing.Pool(processes=numproc) 
+    partial_process_day = partial(process_day, args=args)
+    for result in pool.imap_unordered(partial_process_day, tasks, chunksize=max(1,chunksize)):
+        results.append(result)
+    pool.close()
+    pool.join()
 
-    doy_list = list(range(d1, d2+1))
+    return results
 
-    # now store year and doy in args dictionary, which is somewhat silly
-    args['year'] = year
-    for doy in doy_list:
-        print(f'processing {year} {doy}');
-        args['doy']=doy
+def print_task_summary(results):
+    """
+    prints the number of days analyzed, the time they took and the days that failed
 
-        guts2.gnssir_guts_v2(**args)
+    Parameters
+    ----------
+    results : list of tuples
+        output of process_day for each day
 
-#        warnings.warn(f'error processing {year} {doy}');
+    """
+    if len(results) == 0:
+        return
+    times = [r[2] for r in results]
+    failed = [r for r in results if not r[3]]
+    print('=================================================================================')
+    print('Days analyzed: {0:d} Failed: {1:d}'.format(len(results), len(failed)))
+    print('Seconds per day: mean {0:.2f} median {1:.2f} max {2:.2f} total {3:.1f}'.format(
+        statistics.mean(times), statistics.median(times), max(times), sum(times)))
+    slowest = sorted(results, key=lambda r: r[2], reverse=True)[0:5]
+    print('Slowest days: ', ' '.join(['{0:d}:{1:03d} ({2:.1f}s)'.format(r[0],r[1],r[2]) for r in slowest]))
+    for r in sorted(failed):
+        print('FAILED {0:d} {1:03d} : {2:s}'.format(r[0], r[1], r[4]))
+    print('=================================================================================')
+
+def print_instrument_summary(results, station, start):
+    """
+    adds up the timing records of the days, prints them and saves them 
+    to $REFL_CODE/Files/station/timing/gnssir_run_yyyymmddhhmmss.json
 
+    Parameters
+    ----------
+    results : list of tuples
+        output of process_day for each day
+    station : str
+        4 character station name
+    start : float
+        unix time the run started
 
+    """
+    records = [r[5] for r in results if r[5] is not None]
+    if len(records) == 0:
+        return
+    summary = instrument.summarize(records)
+    summary['station'] = station
+    summary['start'] = start
+    summary['wallclock'] = time.time() - start
+    summary['first'] = [min(results)[0], min(results)[1]]
+    summary['last'] = [max(results)[0], max(results)[1]]
+    summary['failed'] = len([r for r in results if not r[3]])
+    instrument.print_summary(summary)
+    fname = os.environ['REFL_CODE'] + '/Files/' + station + '/timing/gnssir_run_' \
+            + time.strftime('%Y%m%d%H%M%S', time.localtime(start)) + '.json'
+    instrument.write_json(fname, summary)
+    print('Run summary written to ', fname)
+    print('=================================================================================')
 
 def main():
     args = parse_arguments()
@@ -0,0 +1,250 @@
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import sqlite3
+import time
+
+import gnssrefl.gps as g
+
+# lsp keys that change how gnssir runs, but not the reflector heights it writes
+NON_RESULT_KEYS = ['plt_screen', 'pltname', 'screenstats', 'gzip', 'wantCompression',
+                   'nooverwrite', 'overwriteResults', 'incremental', 'seekRinex', 'instrument',
+                   'uncompress', 'parallel_decompress', 'snr_cache',
+                   'results_store']
+
+
+def manifest_name(station, extension):
+    """
+    name of the sqlite file that records which gnssir days are up to date
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    extension : str
+        strategy extension, default is ''
+
+    Returns
+    -------
+    fname : str
+        $REFL_CODE/Files/station/extension/gnssir_manifest.db
+
+    """
+    xdir = os.environ['REFL_CODE']
+    if len(extension) > 0:
+        return xdir + '/Files/' + station + '/' + extension + '/gnssir_manifest.db'
+    else:
+        return xdir + '/Files/' + station + '/gnssir_manifest.db'
+
+
+def open_manifest(station, extension):
+    """
+    opens (and creates if needed) the gnssir manifest for a station
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    extension : str
+        strategy extension, default is ''
+
+    Returns
+    -------
+    conn : sqlite3 connection
+
+    """
+    g.checkFiles(station, extension)
+    # the timeout lets parallel gnssir processes wait for each other's writes
+    conn = sqlite3.connect(manifest_name(station, extension), timeout=60)
+    conn.execute('CREATE TABLE IF NOT EXISTS days (year INTEGER, doy INTEGER, lsp_hash TEXT, '
+            'snr_file TEXT, snr_size INTEGER, snr_mtime REAL, snr_hash TEXT, updated REAL, '
+            'PRIMARY KEY (year, doy))')
+    return conn
+
+
+def lsp_hash(lsp, snr_type):
+    """
+    hash of the gnssir settings that change the results
+
+    Parameters
+    ----------
+    lsp : dict
+        gnssir settings, i.e. the json contents plus command line overrides
+    snr_type : int
+        snr file type
+
+    Returns
+    -------
+    h : str
+        sha1 hex digest
+
+    """
+    d = {key: lsp[key] for key in lsp.keys() if key not in NON_RESULT_KEYS}
+    d['snr_type'] = snr_type
+    s = json.dumps(d, sort_keys=True, default=str)
+    return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+
+def snr_candidates(station, year, doy, snr_type):
+    """
+    SNR file names gnssir looks for, in the order of define_and_xz_snr
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    year : int
+        full year
+    doy : int
+        day of year
+    snr_type : int
+        snr file type
+
+    Returns
+    -------
+    names : list of str
+
+    """
+    xdir = os.environ['REFL_CODE']
+    cyyyy, cyy, cdoy = g.ydoych(year,doy)
+    f = station + cdoy + '0.' + cyy + '.snr' + str(snr_type)
+    fname = xdir + '/' + cyyyy + '/snr/' + station + '/' + f
+    fmakan = xdir + '/' + cyyyy + '/snr/' + station.upper() + '/' + station.upper() + cdoy + '0.' + cyy + '.snr' + str(snr_type)
+
+    return [fname, fname + '.xz', fname + '.gz', fmakan, fmakan + '.gz']
+
+
+def snr_fingerprint(station, year, doy, snr_type):
+    """
+    name, size and modification time of the SNR file, as it currently sits on disk
+    (compressed or not). Nothing is uncompressed.
+
+    Parameters are the same as for snr_candidates
+
+    Returns
+    -------
+    fingerprint : tuple or None
+        (name, size, mtime) or None if there is no SNR file
+
+    """
+    for fname in snr_candidates(station, year, doy, snr_type):
+        if os.path.isfile(fname):
+            st = os.stat(fname)
+            return fname, st.st_size, st.st_mtime
+
+    return None
+
+
+def content_hash(fname):
+    """
+    sha1 of the uncompressed contents of a SNR file. gz and xz files are
+    read as streams, i.e. they are not uncompressed on disk
+
+    Parameters
+    ----------
+    fname : str
+        SNR file name
+
+    Returns
+    -------
+    h : str
+        sha1 hex digest
+
+    """
+    if fname.endswith('.gz'):
+        fid = gzip.open(fname, 'rb')
+    elif fname.endswith('.xz'):
+        fid = lzma.open(fname, 'rb')
+    else:
+        fid = open(fname, 'rb')
+    h = hashlib.sha1()
+    with fid:
+        for block in iter(lambda: fid.read(2**20), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def day_is_current(station, year, doy, snr_type, extension, lsp):
+    """
+    checks whether the gnssir result for a day was made with the current settings
+    and the current SNR file. The size and modification time of the SNR file are
+    compared first. Only if those changed (e.g. the file was gzipped) is the content hash
+    computed.
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    year : int
+        full year
+    doy : int
+        day of year
+    snr_type : int
+        snr file type
+    extension : str
+        strategy extension
+    lsp : dict
+        gnssir settings
+
+    Returns
+    -------
+    current : bool
+        True if the day does not need to be analyzed again
+
+    """
+    fname, fexist = g.LSPresult_name(station,year,doy,extension)
+    if not fexist:
+        return False
+    fp = snr_fingerprint(station, year, doy, snr_type)
+    if fp is None:
+        return False
+    conn = open_manifest(station, extension)
+    row = conn.execute('SELECT lsp_hash, snr_file, snr_size, snr_mtime, snr_hash FROM days WHERE year=? AND doy=?',
+            (year, doy)).fetchone()
+    if row is None:
+        conn.close()
+        return False
+    if row[0] != lsp_hash(lsp, snr_type):
+        conn.close()
+        return False
+    if (row[1] == fp[0]) and (row[2] == fp[1]) and (row[3] == fp[2]):
+        conn.close()
+        return True
+    # the file changed on disk, but perhaps not in content
+    current = (content_hash(fp[0]) == row[4])
+    if current:
+        # remember the new form of the file so the next check is cheap
+        conn.execute('UPDATE days SET snr_file=?, snr_size=?, snr_mtime=? WHERE year=? AND doy=?',
+                (fp[0], fp[1], fp[2], year, doy))
+        conn.commit()
+    conn.close()
+
+    return current
+
+
+def record_day(station, year, doy, snr_type, extension, lsp):
+    """
+    stores the settings and the SNR file fingerprint for a day that was just analyzed.
+    The content hash of the SNR file is only computed if the file is not the one
+    already recorded for the day (same name, size and modification time)
+
+    Parameters are the same as for day_is_current
+
+    """
+    fp = snr_fingerprint(station, year, doy, snr_type)
+    if fp is None:
+        return
+    conn = open_manifest(station, extension)
+    row = conn.execute('SELECT snr_file, snr_size, snr_mtime, snr_hash FROM days WHERE year=? AND doy=?',
+            (year, doy)).fetchone()
+    if (row is not None) and (row[0] == fp[0]) and (row[1] == fp[1]) and (row[2] == fp[2]):
+        snr_hash = row[3]
+    else:
+        snr_hash = content_hash(fp[0])
+    conn.execute('INSERT OR REPLACE INTO days VALUES (?,?,?,?,?,?,?,?)',
+            (year, doy, lsp_hash(lsp, snr_type), fp[0], fp[1], fp[2], snr_hash, time.time()))
+    conn.commit()
+    conn.close()
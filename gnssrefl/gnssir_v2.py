@@ -1,16 +1,19 @@
 import datetime
 import json
 import matplotlib.pyplot as plt
-import math
 import numpy as np
 import os
 import scipy.interpolate
 import scipy.signal
 import subprocess
 import sys
+import time
 import warnings
 
 import gnssrefl.gps as g
+import gnssrefl.gnssir_manifest as manifest
+import gnssrefl.results_store as results_store
+import gnssrefl.instrument as instrument
 import gnssrefl.read_snr_files as snr
 import gnssrefl.refraction as refr
 
@@ -65,6 +68,24 @@ def gnssir_guts_v2(station,year,doy, snr_type, extension,lsp):
             required periodogram amplitude for QC
         ellist: list of floats
             added 23jun16, allow multiple elevation angle regions
+        incremental : bool
+            optional. only analyze the day if the settings or the SNR file changed since the last run
+        coarse2fine : bool
+            optional. two stage periodogram peak search (coarse grid, then desiredP near the peaks)
+        instrument : bool
+            optional. record the time spent in each stage and counts of rows and arcs,
+            see gnssrefl.instrument
+        uncompress : bool
+            optional. uncompress gzip/xz SNR files on disk before reading them (and compress them
+            again afterwards). Default is False, which reads the compressed files directly
+        parallel_decompress : bool
+            optional. use pigz or xz -T0 when reading compressed SNR files, if they are installed
+        snr_cache : bool
+            optional. read (and write) a binary copy of the SNR file next to it, so the next
+            read is fast. Default is False, see read_snr_files.load_snr
+        results_store : bool
+            optional. also put the results of the day in the results store of the
+            station, see gnssrefl.results_store. Default is False
         
     """
 
@@ -93,12 +114,11 @@ def gnssir_guts_v2(station,year,doy, snr_type, extension,lsp):
     e1=lsp['e1']; e2=lsp['e2']; minH = lsp['minH']; maxH = lsp['maxH']
     ediff = lsp['ediff']; NReg = lsp['NReg']  
     PkNoise = lsp['PkNoise']; prec = lsp['desiredP']; delTmax = lsp['delTmax']
-    if 'azval2' in lsp:
-        azval2 = lsp['azval2']; 
-        naz = int(len(azval2)/2)
-    else:
-        print('This module requires azval2 to be set in gnssir_input. This record is not present in your json.')
+    # json problems that are the same for every day
+    if not check_settings(lsp):
         sys.exit()
+    azval2 = lsp['azval2']; 
+    naz = int(len(azval2)/2)
 
     pele = lsp['pele'] ; pfitV = lsp['polyV']
 
@@ -107,11 +127,6 @@ def gnssir_guts_v2(station,year,doy, snr_type, extension,lsp):
     # allows negatiev az value for first pair
     azvalues = rewrite_azel(azval2)
 
-    ok = g.is_it_legal(freqs)
-    if not ok:
-        print('Fix your json list of frequencies. Exiting')
-        sys.exit()
-
     plot_screen = lsp['plt_screen'] 
     onesat = lsp['onesat']; screenstats = lsp['screenstats']
     gzip = lsp['gzip']
@@ -120,6 +135,36 @@ def gnssir_guts_v2(station,year,doy, snr_type, extension,lsp):
     else:
         dec = 1 # so Jupyter notebooks do not need to be rewritten
 
+    if 'coarse2fine' in lsp.keys():
+        coarse2fine = lsp['coarse2fine']
+    else:
+        coarse2fine = False
+
+    if 'uncompress' in lsp.keys():
+        uncompress = lsp['uncompress']
+    else:
+        uncompress = False
+
+    if 'parallel_decompress' in lsp.keys():
+        parallel_decompress = lsp['parallel_decompress']
+    else:
+        parallel_decompress = False
+
+    if 'snr_cache' in lsp.keys():
+        snr_cache = lsp['snr_cache']
+    else:
+        snr_cache = False
+
+    if 'results_store' in lsp.keys():
+        usestore = lsp['results_store']
+    else:
+        usestore = False
+
+    if 'instrument' in lsp.keys():
+        if lsp['instrument']:
+            instrument.enable()
+    instrument.start_record(station, year, doy, 'gnssir')
+
     # no need to print to screen if default
     if (dec != 1):
         print('Using decimation value: ', dec)
@@ -150,15 +195,25 @@ def gnssir_guts_v2(station,year,doy, snr_type, extension,lsp):
     fname, resultExist = g.LSPresult_name(station,year,doy,extension) 
     #print('Results are written to:', fname)
 
+    if 'incremental' in lsp.keys():
+        incremental = lsp['incremental']
+    else:
+        incremental = False
+
     if (lsp['nooverwrite'] == True) & (resultExist == True):
         allGood = 0
         print('>>>>> The result file already exists for this day and you have selected the do not overwrite option')
         #sys.exit()
+    elif incremental and resultExist and manifest.day_is_current(station,year,doy,snr_type,extension,lsp):
+        allGood = 0
+        print('>>>>> The settings and SNR file have not changed since this day was last analyzed. Skipping.')
     else:
-        # uncompress here so you should not have to do it in read_snr_multiday ...
-        obsfile, obsfileCmp, snre = g.define_and_xz_snr(station,year,doy,snr_type) 
+        # compressed files are read as they are, unless you ask for them to be uncompressed
+        with instrument.timer('decompress'):
+            obsfile, obsfileCmp, snre = g.define_and_xz_snr(station,year,doy,snr_type,uncompress=uncompress) 
 
-        allGood, snrD, nrows, ncols = read_snr(obsfile)
+        with instrument.timer('read_snr'):
+            allGood, snrD, nrows, ncols = read_snr(obsfile,parallel_decompress,snr_cache)
         # added gzip option.  first input is xz compression
         if allGood and (dec != 1):
             print('Invoking decimation option')
@@ -172,7 +227,10 @@ def gnssir_guts_v2(station,year,doy, snr_type, extension,lsp):
             # not sure nrows and ncols is being used ... so not redoing it
 
 
-        snr.compress_snr_files(lsp['wantCompression'], obsfile, obsfile2,twoDays,gzip) 
+        # nothing to do if the file was read while compressed
+        if snr.compression_type(obsfile) is None:
+            with instrument.timer('compress'):
+                snr.compress_snr_files(lsp['wantCompression'], obsfile, obsfile2,twoDays,gzip) 
     if (allGood == 1):
         print('Reading from: ', obsfile)
         print('Results will be written to:', fname)
@@ -187,6 +245,7 @@ def gnssir_guts_v2(station,year,doy, snr_type, extension,lsp):
                 print('the minimum elevation angle your receiver used. Exiting.')
                 sys.exit()
 
+        t1 = time.perf_counter()
         if (irefr == 3) or (irefr == 4):
             # elev refraction, lsp, pres, temp, time, sat
             if irefr == 3:
@@ -211,15 +270,34 @@ def gnssir_guts_v2(station,year,doy, snr_type, extension,lsp):
         i= (ele >= pele[0]) & (ele < pele[1])
         ele = ele[i]
         snrD = snrD[i,:]
-        sats = snrD[:,0]
         # make sure the snrD array has elevation angles fixed
         snrD[:,1] = ele # ????
 
+        # sort by satellite once, so each satellite is a simple slice in the loops below
+        snrI = snr.SNRIndex(snrD)
+        instrument.add_time('refraction', time.perf_counter() - t1)
+
         # open output file
         fout,frej = g.open_outputfile(station,year,doy,extension) 
+        # result lines of the day, kept for the results store
+        outlines = []
 #  main loop a given list of frequencies
         total_arcs = 0
         ct = 0
+        # satellite lists for each frequency
+        satlists = []
+        for f in freqs:
+            if onesat == None:
+                satlists.append(find_mgnss_satlist(f,year,doy))
+            else:
+                # check that your requested satellite is the right frequency
+                satlists.append(onesat_freq_check(onesat,f ))
+
+        # find the arcs for all satellites once, they are the same for every frequency
+        with instrument.timer('arc_finding'):
+            allsats = np.unique(np.concatenate([np.asarray(sl, dtype=int) for sl in satlists]))
+            arctable = make_arc_table(snrI, allsats, e1, e2, ellist, ediff, pfitV, screenstats)
+
         for f in freqs:
             found_results = False
             if plot_screen: 
@@ -230,113 +308,87 @@ def gnssir_guts_v2(station,year,doy, snr_type, extension,lsp):
             if screenstats: 
                 print('**** looking at frequency ', f, ' ReqAmp', reqAmp[ct], ' doy ', doy, 'ymd', year, month, day )
 #           get the list of satellites for this frequency
-            if onesat == None:
-                satlist = find_mgnss_satlist(f,year,doy)
-            else:
-                # check that your requested satellite is the right frequency
-                satlist = onesat_freq_check(onesat,f )
+            satlist = satlists[ct]
 
+            # arcs that pass the windowing step, saved for the periodogram calculation
+            arcs = []
             # main satellite loop
             for satNu in satlist:
                 if screenstats: 
                     print('Satellite', satNu)
-                iii = (sats == satNu)
-                thissat = snrD[iii,:]
-                goahead = False
-
-                if len(thissat) > 0:
-                    # if there are data for this satellite, find all the arcs
-                    # separate numpy array of elevation angles .... 
-
-                    # allow more than one set of elevation angles
-                    if len(ellist) > 0:
-                        arclist = np.empty(shape=[0,6])
-                        for ij in range(0,len(ellist),2):
-                            te1 = ellist[ij]; te2 = ellist[ij+1]; newl = [te1,te2]
-                            # poorly named inputs - elev, azimuth, seconds of the day, ...
-                            # te1 and te2 are the requested elevation angles I believe
-                            # satNu is the requested satellite number
-                            tarclist = new_rise_set_again(thissat[:,1],thissat[:,2],thissat[:,3],te1, te2,ediff,satNu,screenstats)
-                            arclist = np.append(arclist, tarclist,axis=0)
-
-                    else:
-                        arclist = new_rise_set_again(thissat[:,1],thissat[:,2],thissat[:,3],e1, e2,ediff,satNu,screenstats)
-
-                    nr,nc = arclist.shape
-                    if nr > 0:
-                        goahead = True
-                    else:
-                        goahead = False
-
-                if goahead:
+                if satNu in arctable:
                     found_results = True
+                    thissat, thisvalid = snrI.satellite(satNu)
+                    arclist, bases = arctable[satNu]
                     # instead of az bins now go through each arc 
-                    for a in range(0,nr):
+                    for a in range(0,len(arclist)):
                         sind = int(arclist[a,0]) ; eind = int(arclist[a,1])
-                        #if screenstats:
-                        #    print('Indices for this arc', a, sind, eind)
                         # create array for the requested arc
-                        d2 = np.array(thissat[sind:eind, :], dtype=float)
+                        d2 = thissat[sind:eind, :]
                         # window the data - which also removes DC 
                         # this is saying that these are the min and max elev angles you should be using
-                        e1 = arclist[a,4]; e2 = arclist[a,5]
-                        x,y, Nvv, cf, meanTime,avgAzim,outFact1, Edot2, delT= window_new(d2, f, 
-                                satNu,ncols,pele, lsp['polyV'],e1,e2,azvalues,screenstats)
-                        Nv = Nvv # number of points
-                        UTCtime = meanTime
+                        ae1 = arclist[a,4]; ae2 = arclist[a,5]
+                        with instrument.timer('window'):
+                            x,y, Nvv, cf, meanTime,avgAzim,outFact1, Edot2, delT= window_new(d2, f, 
+                                satNu,ncols,pele,pfitV,ae1,ae2,azvalues,screenstats,thisvalid[sind:eind],bases[a])
+                        instrument.count('arcs_tried')
 
                         if (delT != 0):
-                            MJD = g.getMJD(year,month,day, meanTime)
-                            maxF, maxAmp, eminObs, emaxObs,riseSet,px,pz= g.strip_compute(x,y,cf,maxH,prec,pfitV,minH)
-
-                            tooclose = False
-                            if (maxF ==0) & (maxAmp == 0):
-                                tooclose == True; Noise = 1; iAzim = 0;
-                            else:
-                                nij =  pz[(px > NReg[0]) & (px < NReg[1])]
-
-                            Noise = 1
-                            if (len(nij) > 0):
-                                Noise = np.mean(nij)
-
-                            iAzim = int(avgAzim)
-
-                            if abs(maxF - minH) < 0.10: #  peak too close to min value
-                                tooclose = True
-
-                            if abs(maxF - maxH) < 0.10: #  peak too close to max value
-                                tooclose = True
-
-                            if False:
-                                print(avgAzim, satNu, e1, e2)
-
-                            if (not tooclose) & (delT < delTmax) & (maxAmp > reqAmp[ct]) & (maxAmp/Noise > PkNoise):
-                            # request from a tide gauge person for Month, Day, Hour, Minute
-
-                                if lsp['mmdd']:
-                                    ctime = g.nicerTime(UTCtime); ctime2 = ctime[0:2] + ' ' + ctime[3:5]
-                                    fout.write(" {0:4.0f} {1:3.0f} {2:6.3f} {3:3.0f} {4:6.3f} {5:6.2f} {6:6.2f} {7:6.2f} {8:6.2f} {9:4.0f} {10:3.0f} {11:2.0f} {12:8.5f} {13:6.2f} {14:7.2f} {15:12.6f} {16:1.0f} {17:2.0f} {18:2.0f} {19:5s} \n".format(year,doy,maxF,satNu, UTCtime, avgAzim,maxAmp,eminObs,emaxObs,Nv, f,riseSet, Edot2, maxAmp/Noise, delT, MJD,irefr,month,day,ctime2)) 
-                                else:
-                                    fout.write(" {0:4.0f} {1:3.0f} {2:6.3f} {3:3.0f} {4:6.3f} {5:6.2f} {6:6.2f} {7:6.2f} {8:6.2f} {9:4.0f} {10:3.0f} {11:2.0f} {12:8.5f} {13:6.2f} {14:7.2f} {15:12.6f} {16:1.0f} \n".format(year,doy,maxF,satNu, UTCtime, avgAzim,maxAmp,eminObs,emaxObs,Nv, f,riseSet, Edot2, maxAmp/Noise, delT, MJD,irefr)) 
-                                gj +=1
-                                if screenstats:
-                                    T = g.nicerTime(UTCtime)
-                                    print('SUCCESS Azimuth {0:3.0f} Sat {1:3.0f} RH {2:7.3f} m PkNoise {3:4.1f} Amp {4:4.1f} Fr{5:3.0f} UTC {6:5s} DT {7:3.0f} '.format(iAzim,satNu,maxF,maxAmp/Noise,maxAmp, f,T,round(delT)))
-                                if plot_screen:
-                                    failed = False
-                                    local_update_plot(x,y,px,pz,ax1,ax2,failed)
-                            else:
-                                rj +=1
-                                if screenstats:
-                                    #print(delT, tooclose,Noise,PkNoise)
-                                    #35.0 False 3.682862189099345 2.8
-
-                                    print('FAILED QC for Azimuth {0:.1f} Satellite {1:2.0f} UTC {2:5.2f} RH {3:5.2f}'.format( iAzim,satNu,UTCtime,maxF))
-                                    g.write_QC_fails(delT,lsp['delTmax'],eminObs,emaxObs,e1,e2,ediff,maxAmp, Noise,PkNoise,reqAmp[ct],tooclose)
-                                if plot_screen:
-                                    failed = True
-                                    local_update_plot(x,y,px,pz,ax1,ax2,failed)
+                            # periodograms are computed for all arcs of this frequency at once, below
+                            arcs.append([satNu,x,y,Nvv,cf,meanTime,avgAzim,Edot2,delT,ae1,ae2])
+
+            # compute the periodograms for every arc of this frequency in one pass
+            instrument.count('arcs_windowed', len(arcs))
+            with instrument.timer('lsp'):
+                lspresults = g.batch_strip_compute([arc[1] for arc in arcs],[arc[2] for arc in arcs],
+                    [arc[4] for arc in arcs],maxH,prec,minH,NReg,coarse=coarse2fine)
+
+            t1 = time.perf_counter()
+
+            for arc, lspresult in zip(arcs, lspresults):
+                satNu,x,y,Nv,cf,UTCtime,avgAzim,Edot2,delT,ae1,ae2 = arc
+                maxF, maxAmp, eminObs, emaxObs,riseSet,px,pz,Noise = lspresult
+                MJD = g.getMJD(year,month,day, UTCtime)
+
+                tooclose = False
+                iAzim = int(avgAzim)
+
+                if abs(maxF - minH) < 0.10: #  peak too close to min value
+                    tooclose = True
+
+                if abs(maxF - maxH) < 0.10: #  peak too close to max value
+                    tooclose = True
 
+                if (not tooclose) & (delT < delTmax) & (maxAmp > reqAmp[ct]) & (maxAmp/Noise > PkNoise):
+                # request from a tide gauge person for Month, Day, Hour, Minute
+
+                    if lsp['mmdd']:
+                        ctime = g.nicerTime(UTCtime); ctime2 = ctime[0:2] + ' ' + ctime[3:5]
+                        outline = " {0:4.0f} {1:3.0f} {2:6.3f} {3:3.0f} {4:6.3f} {5:6.2f} {6:6.2f} {7:6.2f} {8:6.2f} {9:4.0f} {10:3.0f} {11:2.0f} {12:8.5f} {13:6.2f} {14:7.2f} {15:12.6f} {16:1.0f} {17:2.0f} {18:2.0f} {19:5s} \n".format(year,doy,maxF,satNu, UTCtime, avgAzim,maxAmp,eminObs,emaxObs,Nv, f,riseSet, Edot2, maxAmp/Noise, delT, MJD,irefr,month,day,ctime2)
+                    else:
+                        outline = " {0:4.0f} {1:3.0f} {2:6.3f} {3:3.0f} {4:6.3f} {5:6.2f} {6:6.2f} {7:6.2f} {8:6.2f} {9:4.0f} {10:3.0f} {11:2.0f} {12:8.5f} {13:6.2f} {14:7.2f} {15:12.6f} {16:1.0f} \n".format(year,doy,maxF,satNu, UTCtime, avgAzim,maxAmp,eminObs,emaxObs,Nv, f,riseSet, Edot2, maxAmp/Noise, delT, MJD,irefr)
+                    fout.write(outline)
+                    if usestore:
+                        outlines.append(outline)
+                    gj +=1
+                    if screenstats:
+                        T = g.nicerTime(UTCtime)
+                        print('SUCCESS Azimuth {0:3.0f} Sat {1:3.0f} RH {2:7.3f} m PkNoise {3:4.1f} Amp {4:4.1f} Fr{5:3.0f} UTC {6:5s} DT {7:3.0f} '.format(iAzim,satNu,maxF,maxAmp/Noise,maxAmp, f,T,round(delT)))
+                    if plot_screen:
+                        failed = False
+                        local_update_plot(x,y,px,pz,ax1,ax2,failed)
+                else:
+                    rj +=1
+                    if screenstats:
+                        print('FAILED QC for Azimuth {0:.1f} Satellite {1:2.0f} UTC {2:5.2f} RH {3:5.2f}'.format( iAzim,satNu,UTCtime,maxF))
+                        g.write_QC_fails(delT,lsp['delTmax'],eminObs,emaxObs,ae1,ae2,ediff,maxAmp, Noise,PkNoise,reqAmp[ct],tooclose)
+                    if plot_screen:
+                        failed = True
+                        local_update_plot(x,y,px,pz,ax1,ax2,failed)
+
+            instrument.add_time('output', time.perf_counter() - t1)
+            instrument.count('arcs_accepted', gj)
+            instrument.count('arcs_rejected', rj)
             if screenstats:
                 print('=================================================================================')
                 print('     Frequency ', f, ' good arcs:', gj, ' rejected arcs:', rj )
@@ -361,9 +413,16 @@ def gnssir_guts_v2(station,year,doy, snr_type, extension,lsp):
                     #plt.close()
 
         fout.close() ; # these are the LSP results written to text file 
+        if usestore:
+            # and the same lines go in the results store, so the file is not parsed again
+            results_store.store_day(station,year,doy,extension,fname,outlines)
+        if incremental:
+            manifest.record_day(station,year,doy,snr_type,extension,lsp)
         # try moving this
         if found_results and plot_screen:
-            plot2screen(station, f, ax1, ax2,lsp['pltname']) 
+            plot2screen(station, f, ax1, ax2,lsp['pltname'])
+
+    instrument.finish_record() 
 
 
 def set_refraction_params(station, dmjd,lsp):
@@ -697,14 +756,18 @@ def new_rise_set(elv,azm,dates, e1, e2, ediff,sat, screenstats ):
 
     return tv 
 
-def read_snr(obsfile):
+def read_snr(obsfile,parallel=False,usecache=False):
     """
     Simple function to load the contents of a SNR file into a numpy array
 
     Parameters
     ----------
     obsfile : str
-        name of the snrfile 
+        name of the snrfile, which can be gzip or xz compressed
+    parallel : bool, optional
+        use a parallel decompressor for compressed files
+    usecache : bool, optional
+        use the binary SNR cache, see read_snr_files.load_snr
 
     Returns
     -------
@@ -721,7 +784,7 @@ def read_snr(obsfile):
     """
     allGood = 1
     if os.path.isfile(obsfile):
-        f = np.genfromtxt(obsfile,comments='%')
+        f = snr.load_snr(obsfile,usecache=usecache,parallel=parallel)
     else:
         print('No SNR file found')
         allGood = 0
@@ -740,7 +803,7 @@ def read_snr(obsfile):
     return allGood, f, r, c
 
 
-def window_new(snrD, f, satNu,ncols,pele,pfitV,e1,e2,azlist,screenstats):
+def window_new(snrD, f, satNu,ncols,pele,pfitV,e1,e2,azlist,screenstats,validbits=None,basis=None):
     """
     retrieves SNR arcs for a given satellite. returns elevation angle and 
     detrended linear SNR
@@ -769,6 +832,12 @@ def window_new(snrD, f, satNu,ncols,pele,pfitV,e1,e2,azlist,screenstats):
         non-continguous azimuth regions, corrected for negative regions
     screenstats : bool
         whether you want debugging information
+    validbits : numpy array of uint32, optional
+        column validity bitmask for these rows from read_snr_files.SNRIndex.
+        If it is provided, it is used to find the zero (or negative) SNR values instead of searching the column.
+    basis : numpy array of floats, optional
+        poly_basis of the elevation angles in snrD. If it is provided and there are
+        no zero SNR values, it is used for the DC removal instead of a new polynomial fit.
 
     Returns
     -------
@@ -827,10 +896,16 @@ def window_new(snrD, f, satNu,ncols,pele,pfitV,e1,e2,azlist,screenstats):
         # at least there is a column where there should be
         # sep 26, 2023
         # these definitions used to be outside the if, but putting them inside now
-        datatest = snrD[:,icol]
-        ijk = (datatest == 0)
-        nzero = len(datatest[ijk])
-        if np.sum(datatest) < 1:
+        if validbits is None:
+            datatest = snrD[:,icol]
+            nn = (datatest > 0)
+            nzero = len(datatest[(datatest == 0)])
+            allzero = (np.sum(datatest) < 1)
+        else:
+            nn = snr.valid_column(validbits, icol)
+            nzero = len(nn) - np.count_nonzero(nn)
+            allzero = (nzero == len(nn))
+        if allzero:
             if screenstats:
                 print('No useful data on frequency ', f , 'and sat ', satNu, ': all zeros')
             good = False
@@ -838,8 +913,9 @@ def window_new(snrD, f, satNu,ncols,pele,pfitV,e1,e2,azlist,screenstats):
             if nzero > 0:
                 #print('removing ', nzero, ' zero points on frequency ', f )
                 # indices you are keeping ... 
-                nn = (datatest > 0) ; 
                 snrD = snrD[nn,:]
+                # the basis was for all the rows
+                basis = None
 
         sat = snrD[:,0]
         ele = snrD[:,1]
@@ -853,8 +929,11 @@ def window_new(snrD, f, satNu,ncols,pele,pfitV,e1,e2,azlist,screenstats):
             # change to linear units
             data = np.power(10,(data/20))
             if len(ele) > 20:
-                model = np.polyfit(ele,data,pfitV)
-                fit = np.polyval(model,ele)
+                if basis is None:
+                    model = np.polyfit(ele,data,pfitV)
+                    fit = np.polyval(model,ele)
+                else:
+                    fit = basis @ (basis.T @ data)
                 data = data - fit
                 # apply elevation angle constraint
                 i =  (ele > e1) & (ele <= e2)
@@ -969,6 +1048,38 @@ def find_mgnss_satlist(f,year,doy):
 
 
 
+def check_settings(lsp):
+    """
+    checks the analysis settings that do not depend on the day (azimuth regions and
+    frequencies), so that a bad json stops a multi-day run once instead of failing every day
+
+    Parameters
+    ----------
+    lsp : dict
+        analysis settings, from the json and the commandline
+
+    Returns
+    -------
+    ok : bool
+        whether the settings can be used
+
+    """
+    if 'azval2' not in lsp:
+        print('This module requires azval2 to be set in gnssir_input. This record is not present in your json.')
+        return False
+    N2 = len(lsp['azval2'])
+    if (N2 % 2) != 0:
+        print('Azimuth regions must be in pairs. Please check the azval2 variable in your json input file')
+        return False
+    if N2 > 8:
+        print('Not going to allow more than four azimuth regions ...')
+        return False
+    if not g.is_it_legal(lsp['freqs']):
+        print('Fix your json list of frequencies. Exiting')
+        return False
+
+    return True
+
 def rewrite_azel(azval2):
     """
     Trying to allow regions that cross zero degrees azimuth
@@ -1068,13 +1179,43 @@ def new_rise_set_again(elv,azm,dates, e1, e2, ediff,sat, screenstats ):
         satellite number, arc number, elev min, elev max
 
     """
-    # require arcs to be this length in elev angle
-    min_deg = (e2-ediff)   - (e1 + ediff)
+    return rise_set_arcs(elv,azm,dates,[e1,e2],ediff,sat,screenstats)
+
 
+def rise_set_arcs(elv,azm,dates, elist, ediff,sat, screenstats ):
+    """
+    rising and setting arcs for a given satellite for one or more
+    pairs of elevation angles. The arcs are split at the same places 
+    (time gaps and changes in elevation angle direction) for every pair, 
+    so that is only done once. 
+
+    Parameters
+    ----------
+    elv : numpy array  of floats
+        elevation angles from SNR file
+    azm : numpy array  of floats
+        azimuth angles from SNR file
+    dates : numpy array  of floats
+        seconds of the day from SNR file
+    elist : list of floats
+        pairs of min and max elevation angles (deg), i.e. [5, 15] or [5, 10, 7, 15]
+    ediff : float
+        el angle difference required, deg, QC
+    sat : int
+        satellite number
+    screenstats : bool
+        whether you want info printed to the screen
+
+    Returns
+    -------
+    tv : numpy array
+        beginning and ending indices of the arc
+        satellite number, arc number, elev min, elev max.
+        The arcs for the first elevation angle pair come first.
+
+    """
 #   time limit in seconds - taken from david purnell
     gaptlim = 5*60 # seems awfully small
-    #newf = np.array(f[i, :], dtype=float)
-    iarc = 0
     ddate = np.ediff1d(dates)
     delv = np.ediff1d(elv)
     bkpt = len(ddate)
@@ -1082,99 +1223,118 @@ def new_rise_set_again(elv,azm,dates, e1, e2, ediff,sat, screenstats ):
     bkpt = np.append(bkpt,  np.where(np.diff(np.sign(delv)))[0])
     bkpt = np.unique(bkpt)
     bkpt = np.sort(bkpt)
-    N=len(bkpt)
-    tv = np.empty(shape=[0,6])
-
-    for ii in range(N):
-        if ii == 0:
-            sind = 0
-        else:
-            sind = bkpt[ii - 1] + 1
-        eind = bkpt[ii] + 1
-        nelv = np.array(elv[sind:eind], dtype=float)
-        nazm = np.array(azm[sind:eind], dtype=float)
-        nt = np.array(dates[sind:eind], dtype=float)
-        #nazm = azm[sind:eind]
-        minObse = min(nelv)
-        maxObse = max(nelv)
-        #print('min/max obs e ', minObse, maxObse)
-        # how to get the azimuth?
-        minA = min(nazm)
-        maxA = max(nazm)
 
+    # start and end (plus one) indices of each piece
+    eind = bkpt + 1
+    sind = np.append(0, eind[:-1])
+    minObse = np.minimum.reduceat(elv, sind)
+    maxObse = np.maximum.reduceat(elv, sind)
+    verysmall = (eind - sind) == 1
+
+    tv = []
+    for ij in range(0,len(elist),2):
+        e1 = elist[ij]; e2 = elist[ij+1]
+        # require arcs to be this length in elev angle
+        min_deg = (e2-ediff)   - (e1 + ediff)
+        ediff_violation = ((minObse - e1) > ediff) | ((maxObse - e2) < -ediff)
+        nogood = ediff_violation | verysmall | ((maxObse - minObse) < min_deg)
+        iarc = 0
+        for ii in range(len(sind)):
+            if screenstats:
+                minA = min(azm[sind[ii]:eind[ii]])
+                maxA = max(azm[sind[ii]:eind[ii]])
+                if nogood[ii]:
+                    # do not write out warning for these tiny arcs which should not even be there.
+                    add = ''
+                    if ediff_violation[ii]:
+                        add = ' violates ediff'
+                    if not verysmall[ii]:
+                        print('Failed sat/arc',sat,iarc+1, sind[ii],eind[ii],' min/max elev: ', np.round(minObse[ii],2), np.round(maxObse[ii],2), minA,maxA,add)
+                else:
+                    print('Keep   sat/arc',sat,iarc+1, sind[ii],eind[ii],' min/max elev: ', np.round(minObse[ii],2), np.round(maxObse[ii],2),minA,maxA)
+            if not nogood[ii]:
+                iarc = iarc + 1
+                tv.append([sind[ii], eind[ii], int(sat), iarc,e1,e2])
+
+    return np.array(tv, dtype=float).reshape(-1,6)
+
+
+def poly_basis(ele, pfitV):
+    """
+    orthonormal basis for polynomials in elevation angle, used to remove the 
+    direct signal (DC) from SNR data. It only depends on the elevation angles, so
+    it can be computed once per arc and used for every frequency.
 
-        nogood = False
-        verysmall = False
-        ediff_violation = False
-        if (minObse - e1) > ediff:
-            nogood = True
-            ediff_violation = True 
-        if (maxObse - e2) < -ediff:
-            nogood = True
-            ediff_violation = True
-        if (eind-sind) == 1:
-            nogood = True
-            verysmall = True
-        if ((maxObse - minObse) < min_deg):
-            nogood = True
+    Parameters
+    ----------
+    ele : numpy array of floats
+        elevation angles (deg)
+    pfitV : int
+        polynomial order
 
-        if screenstats:
-            if nogood:
-                # do not write out warning for these tiny arcs which should not even be there.
-                # i am likely reading the code incorrectly
-                add = ''
-                if ediff_violation:
-                    add = ' violates ediff'
-                if not verysmall:
-                    print('Failed sat/arc',sat,iarc+1, sind,eind,' min/max elev: ', np.round(minObse,2), np.round(maxObse,2), minA,maxA,add)
-            else:
-                print('Keep   sat/arc',sat,iarc+1, sind,eind,' min/max elev: ', np.round(minObse,2), np.round(maxObse,2),minA,maxA)
+    Returns
+    -------
+    basis : numpy array of floats
+        len(ele) by pfitV+1. The polynomial fit to data is basis @ (basis.T @ data)
 
-        if not nogood :
-            iarc = iarc + 1
-            newl = [sind, eind, int(sat), iarc,e1,e2]
-            #print('indices ',sind, eind, elv[sind], elv[eind] )
-            #print('indices ',sind, eind, elv[sind], elv[eind], azm[sind], azm[eind])
-            tv = np.append(tv, [newl],axis=0)
+    """
+    basis, r = np.linalg.qr(np.vander(ele, int(pfitV)+1))
+    return basis
 
-    return tv 
 
-def make_parallel_proc_lists(year, doy1, doy2, nproc):
+def make_arc_table(snrI, satlist, e1, e2, ellist, ediff, pfitV, screenstats):
     """
-    make lists of dates for parallel processing to spawn multiple jobs
+    finds the rising and setting arcs for every satellite once per day,
+    so that each frequency can use them. The arcs only depend on elevation angle
+    and time, not on the SNR data.
 
     Parameters
-    ==========
-    year : int
-        year of processing
-    doy1 : int
-        start day of year
-    doy 2 : int
-        end day of year
+    ----------
+    snrI : read_snr_files.SNRIndex
+        SNR data, sorted by satellite
+    satlist : list of int
+        satellites to use, i.e. for all frequencies
+    e1 : float
+        min elevation angle (deg)
+    e2 : float
+        max elevation angle (deg)
+    ellist : list of floats
+        pairs of elevation angles. used instead of e1 and e2 if it is not empty
+    ediff : float
+        el angle difference required, deg, QC
+    pfitV : int
+        polynomial order for the DC removal
+    screenstats : bool
+        whether you want info printed to the screen
 
     Returns
-    =======
-    datelist : dict
-        list of dates formatted as year doy1 doy2
-    numproc : int
-        number of datelists, thus number of processes to be used
+    -------
+    arctable : dict
+        for each satellite that has arcs, the output of rise_set_arcs (start and end 
+        indices, satellite, arc number, min and max elevation angles) and a list 
+        with the poly_basis of each arc (None if the arc has too few points)
 
     """
-#   d = { 0: [2020, 251, 260], 1:[2020, 261, 270], 2: [2020, 271, 280], 3:[2020, 281, 290], 4:[2020,291,300] }
-    # number of days for spacing ... 
-    Ndays  = math.ceil((doy2-doy1)/nproc) 
-    #print(Ndays)
-    d = {}
-    i=0
-    for day in range(doy1, doy2+1, Ndays):
-        end_day = day+Ndays-1
-        if (end_day > doy2):
-            l = [year, day, doy2] 
-        else:
-            l = [year, day, end_day] 
-        d[i] = l
-        i=i+1
+    if len(ellist) > 0:
+        elist = ellist
+    else:
+        elist = [e1, e2]
+    arctable = {}
+    for satNu in satlist:
+        thissat, thisvalid = snrI.satellite(satNu)
+        if len(thissat) == 0:
+            continue
+        arclist = rise_set_arcs(thissat[:,1],thissat[:,2],thissat[:,3],elist,ediff,satNu,screenstats)
+        if len(arclist) == 0:
+            continue
+        bases = []
+        for a in range(len(arclist)):
+            ele = thissat[int(arclist[a,0]):int(arclist[a,1]),1]
+            # same minimum number of points as window_new
+            if len(ele) > 20:
+                bases.append(poly_basis(ele, pfitV))
+            else:
+                bases.append(None)
+        arctable[satNu] = (arclist, bases)
 
-    datelist = d
-    numproc = i
-    return datelist, numproc
+    return arctable
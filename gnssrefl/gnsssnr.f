@@ -1,8 +1,7 @@
 C FILE: GNSSSNR.F 
       SUBROUTINE FOO(rawf,outf,sp3file,snrtype,decfac,errf) 
       implicit none
-      character*128 rawfilename, outfilename, sp3file,
-     . rawf,outf,errf
+      character*128 sp3file, rawf,outf,errf
       character*2 snrtype, decfac
 Cf2py intent(in) rawf
 Cf2py intent(in) outf
@@ -31,6 +30,89 @@ c     19feb04
 c     allow sp3 files that are longer than 23 hr 45 minutes
 c     21feb22 port to python f2py so it can be used in gnssrefl
 
+c     23 the work is now done by loadsp3 and snrrows, which can also
+c     be called from python, e.g. to translate several RINEX files
+c     with one sp3 file or to get the SNR data as an array
+
+      integer nsat, nrows
+      real*8 snr(1,11)
+
+      call loadsp3(sp3file, errf, nsat)
+      if (nsat .eq. 0) then
+        return
+      endif
+c     only the file is written
+      call snrrows(rawf,outf,snrtype,decfac,errf,0,snr,nrows)
+      end
+
+      subroutine loadsp3(sp3file, errf, nsat)
+c     reads a sp3 file into the sp3orb common block, so that any number of 
+c     RINEX files can then be translated by snrrows
+c     INPUT sp3file, errf is the log file
+c     OUTPUT nsat, number of satellites (zero if the file could not be read)
+      implicit none
+      character*128 sp3file, errf
+      integer nsat
+Cf2py intent(in) sp3file
+Cf2py intent(in) errf
+Cf2py intent(out) nsat
+      integer maxsat, maxob, maxGNSS, np
+      parameter (maxsat = 200)
+      parameter (maxob = 25)
+      parameter (maxGNSS = 400)
+      parameter (np= 288)
+      real*8 c 
+      parameter (c = 0.299792458D+09)      
+c     sp3 orbits, read by loadsp3 and used by snrrows
+      integer sp3_gps_weeks(np),sp3_nsat,sp3_satnames(maxsat),
+     .  ipointer(maxGNSS), nepochs
+      real*8 sp3_XYZ(maxsat,np,3), sp3_gps_seconds(np),
+     .  sp3_rel_secs(np)
+      logical haveorbit(maxGNSS)
+      common/sp3orb/sp3_XYZ, sp3_gps_seconds, sp3_rel_secs,
+     .  sp3_gps_weeks, sp3_nsat, sp3_satnames, ipointer, nepochs,
+     .  haveorbit
+      integer errid, ios
+      errid = 53
+      open(errid,file=errf,status='unknown',iostat=ios)
+      write(errid,*) 'sp3file :',sp3file
+      call read_sp3_200sats(sp3file, sp3_gps_weeks, sp3_gps_seconds,
+     .   sp3_nsat, sp3_satnames, sp3_XYZ,haveorbit,
+     .   ipointer,nepochs,sp3_rel_secs,errid)
+      write(errid,*) 'first and last',sp3_gps_weeks(1), 
+     .   sp3_gps_seconds(1)
+      write(errid,*)'Last epoch, rel sense', sp3_rel_secs(nepochs)
+      if (sp3_nsat .eq. 0) then
+        write(errid,*) 'problem reading sp3file, so exiting'
+      endif
+      nsat = sp3_nsat
+      close(errid)
+      end
+
+      subroutine snrrows(rawf,outf,snrtype,decfac,errf,maxrows,
+     .  snr,nrows)
+c     translates a RINEX file with the orbits read by loadsp3.
+c     INPUT rawf RINEX file, outf SNR file (blank for no file),
+c     snrtype and decfac as for FOO, errf log file (rewritten), 
+c     maxrows, size of the snr array
+c     OUTPUT snr, the SNR data, one row for each line of the SNR file.
+c     The values are those of the SNR file (read back from the formatted line)
+c     nrows, the number of rows. If it is bigger than maxrows, only the first
+c     maxrows rows are in snr. It is -1 if there are no orbits
+      implicit none
+      character*128 rawfilename, outfilename, rawf,outf,errf
+      character*2 snrtype, decfac
+      integer maxrows, nrows
+      real*8 snr(maxrows,11)
+Cf2py intent(in) rawf
+Cf2py intent(in) outf
+Cf2py intent(in) snrtype
+Cf2py intent(in) decfac
+Cf2py intent(in) errf
+Cf2py intent(in) maxrows
+Cf2py intent(out) snr
+Cf2py intent(out) nrows
+Cf2py depend(maxrows) snr
       integer maxsat, maxob, maxGNSS, np
       parameter (maxsat = 200)
       parameter (maxob = 25)
@@ -38,6 +120,15 @@ c     21feb22 port to python f2py so it can be used in gnssrefl
       parameter (np= 288)
       real*8 c 
       parameter (c = 0.299792458D+09)      
+c     sp3 orbits, read by loadsp3 and used by snrrows
+      integer sp3_gps_weeks(np),sp3_nsat,sp3_satnames(maxsat),
+     .  ipointer(maxGNSS), nepochs
+      real*8 sp3_XYZ(maxsat,np,3), sp3_gps_seconds(np),
+     .  sp3_rel_secs(np)
+      logical haveorbit(maxGNSS)
+      common/sp3orb/sp3_XYZ, sp3_gps_seconds, sp3_rel_secs,
+     .  sp3_gps_weeks, sp3_nsat, sp3_satnames, ipointer, nepochs,
+     .  haveorbit
 
       integer stderr
       parameter (stderr=6)
@@ -50,19 +141,19 @@ c     character*2  key(maxsat)
      +   msec, lli(maxob,maxsat), iprn,
      .   ios, itrack, i, iobs(maxsat), 
      .  gpsweek, prn_pick, fileIN, fileOUT,
-     .  iymd(3), nepochs, FirstWeek, idec
+     .  iymd(3), FirstWeek, idec
       real*8  obs(maxob,maxsat), tod,North(3),
      .   East(3), Up(3), azimuth, elev, staXYZ(3), tod_save,
      .   pi,s1,s2,s5,xrec, yrec, zrec, tc, 
      .   edot,elev2, s6, s7, s8,rt,
      .   rt_lastEpoch, FirstSecond, tod2, Lat,Long,Ht
-      logical eof, bad_point,simon,keep_point,decimate
-      integer sp3_gps_weeks(np),sp3_nsat,sp3_satnames(maxsat)
-      real*8 sp3_XYZ(maxsat,np,3), sp3_gps_seconds(np),
-     .  t9(9), x9(9), y9(9), z9(9), sp3_rel_secs(np)
-      integer ipointer(maxGNSS),errid,itod, iuseful,k
-      logical haveorbit(maxGNSS), debug
+      logical eof, bad_point,simon,keep_point,decimate,writefile
+      real*8 t9(9), x9(9), y9(9), z9(9)
+      integer errid,itod, iuseful,k
+      logical debug
       debug = .false.
+      nrows = -1
+      writefile = .false.
 c      file id for error log
       errid = 53
 c     set some defaults
@@ -76,8 +167,8 @@ c     if you want edot, set this to true
 c     shorter filenames
       rawfilename = rawf
       outfilename = outf
+c     a new log for every translation
       open(errid,file=errf,status='unknown',iostat=ios)
-      write(errid,*) 'sp3file :',sp3file
       write(errid,*) 'RINEX file:',rawf
       write(errid,*) 'Output file:',outf
       write(errid,*) 'Selection:',snrtype
@@ -95,22 +186,18 @@ c     comment out for now
 c     figure out which option is being requested
       READ (prn_pickc, '(I2)')  prn_pick
       write(errid, *) 'Selection ', prn_pick
-c     read in the sp3file
-      call read_sp3_200sats(sp3file, sp3_gps_weeks, sp3_gps_seconds,
-     .   sp3_nsat, sp3_satnames, sp3_XYZ,haveorbit,
-     .   ipointer,nepochs,sp3_rel_secs,errid)
+      if (sp3_nsat .eq. 0) then
+        write(errid,*) 'no sp3 orbits have been read, so exiting'
+        close(errid)
+        return
+      endif
       FirstWeek = sp3_gps_weeks(1)
       FirstSecond = sp3_gps_seconds(1)
-      write(errid,*) 'first and last',FirstWeek, FirstSecond
-c     print*, sp3_gps_weeks(nepochs), sp3_gps_seconds(nepochs)
+      write(errid,*) 'sp3 orbits from loadsp3, first epoch',
+     .   FirstWeek, FirstSecond
 c     figure out the time tag of the last sp3 point.  this way you don't
 c     interpolate (much) beyond your last point
-      write(errid,*)'Last epoch, rel sense', sp3_rel_secs(nepochs)
       rt_lastEpoch = sp3_rel_secs(nepochs)
-      if (sp3_nsat .eq. 0) then
-        write(errid,*) 'problem reading sp3file, so exiting'
-        return
-      endif
 c     read the header of the RINEX file, returning station coordinates
 c     and an observable array and nobs, number of observables
       xrec = 0.d0
@@ -128,15 +215,15 @@ c     and an observable array and nobs, number of observables
       if (iuseful .eq. 0) then
         write(errid,*) 'Your file had no useful SNR observables'
         write(errid,*) 'in it. Look at the header of your file'
-        return
+        goto 98
       endif 
       if (xrec.eq.0.d0) then
         write(errid,*) 'you need real station coords '
-        return
+        goto 98
       endif
       if (zrec.eq.0.d0) then
         write(errid,*) 'you need real station coords '
-        return
+        goto 98
       endif
 c     print*,'number of obs main code', nobs
 c     moving sites has been removed
@@ -144,13 +231,17 @@ c     moving sites has been removed
         write(errid,*) 'Only obs types <= 25 allowed. You'
         write(errid,*) 'can try using teqc to remove'
         write(errid,*) 'unneeded observables'
-        return
+        goto 98
       endif
 
 
       call envTrans(xrec,yrec,zrec,staXYZ,Lat,Long,Ht,North,East,Up)
 c     open output file
-      open(fileOUT,file=outfilename, status='unknown')
+      writefile = outfilename .ne. ' '
+      if (writefile) then
+        open(fileOUT,file=outfilename, status='unknown')
+      endif
+      nrows = 0
       eof = .false.
       do while (.not.eof)
         inline = ' '
@@ -199,7 +290,7 @@ c         check that it is within 20 minutes of the first and last sp3 points
      .           sp3_gps_seconds(nepochs)
              write(errid,*) 'Your epoch is beyond a reasonable'
              write(errid,*) 'sp3 point, so I am exiting now.'
-             return
+             goto 99
           endif
           do itrack = 1, numsat
             iprn = prn(itrack)
@@ -232,7 +323,8 @@ c               assign the SNR values to variables
                 call pickup_snr(obs, iobs, itrack, s1, s2, s5,s6,s7,s8)
 c                 write out to a file
                 call write_gnss_to_file(fileOUT, iprn, tod,
-     .          s1,s2,s5,azimuth, elev,edot,prn_pick,s6,s7,s8,tod2)
+     .          s1,s2,s5,azimuth, elev,edot,prn_pick,s6,s7,s8,tod2,
+     .          writefile,snr,maxrows,nrows)
               endif
             endif
           enddo
@@ -240,11 +332,14 @@ c                 write out to a file
         endif
       enddo
 99    continue
+c     close input and output files
+      if (writefile) then
+        close(fileOUT)
+      endif
+98    continue
 c     close the log file
       close(errid)
-c     close input and output files
       close(fileIN)
-      close(fileOUT)
       end
 
       subroutine read_sp3_200sats(inputfile, gps_weeks, 
@@ -1330,7 +1425,7 @@ c           5 or fewer observable types
       endif
       end
       subroutine write_gnss_to_file(outID, prn, tod, s1,s2,s5,az,
-     .   elev,edot, prn_pick,s6,s7,s8,tod2)
+     .   elev,edot, prn_pick,s6,s7,s8,tod2,writefile,snr,maxrows,nrows)
 c     inputs fileID, prn number, time of day (seconds), 
 c     s1,s2,s5, azimuth, elevation angles
 c     edot, in degrees/second
@@ -1338,6 +1433,8 @@ c     output selection
 c     18ocdt01 added galileo frequencies
 c     added option 66, which is all data < 30 degrees
 c     20mar02 added msec to the output, sent from main code
+c     the line is written to outID if writefile is true and is also stored
+c     in the snr array (see snrrows)
       implicit none
 
       integer maxsat, maxob, maxGNSS, np
@@ -1351,6 +1448,9 @@ c     20mar02 added msec to the output, sent from main code
       real*8 s1, s2, s5, tod, az, elev, edot,tod2
       real*8 s6, s7, s8 
       integer prn_pick,outID,prn,msec
+      logical writefile, keep
+      integer maxrows, nrows
+      real*8 snr(maxrows,11)
 c     logical galileo
 c     asked for all, but < 30 degrees elevation
 c     i made 98 and 99 do the same thing so i would 
@@ -1367,35 +1467,80 @@ c     print*, msec
 c      tod = tod + msec/1000.d0
 c      try this ...
       tod=tod2
+      keep = .false.
       if (prn_pick.eq.99.or.prn_pick.eq.98) then
         if (elev .ge.5.and.elev.le.30) then
-          write(outID,112)
-     .      prn, elev, az, tod, edot,s6, s1, s2,s5,s7,s8
+          keep = .true.
         endif
 c         asked for all data > 5
       elseif (prn_pick.eq.88) then
         if (elev.ge.0) then
-          write(outID, 112)
-     .        prn, elev, az, tod, edot,s6, s1, s2,s5,s7,s8
+          keep = .true.
         endif
 c     all data below 30
 c     KL 2019Sep25 fixed bug found by YNakashima 
       elseif (prn_pick.eq.66.and.elev.le.30) then
-          write(outID, 112) prn, elev, az, tod, 
-     .   edot,s6, s1, s2,s5,s7,s8
+          keep = .true.
 c     all data < 10
       elseif (prn_pick.eq.50) then
         if (elev.le.10) then
-          write(outID, 112)
-     .        prn, elev, az, tod, edot,s6, s1, s2,s5,s7,s8
+          keep = .true.
         endif
       endif
+      if (keep) then
+        call store_gnss_row(outID, writefile, snr, maxrows, nrows,
+     .     prn, elev, az, tod, edot,s6, s1, s2,s5,s7,s8)
+      endif
 c this format statement gives space for edot and S5
 c 111   format(i3,  2f10.4, f10.0, f10.6, f7.2, 3f7.2)
 c this format allows galileo
 112   format(i3,  2f10.4, f10.1, f10.6, f7.2, 5f7.2)
       end
 
+      subroutine store_gnss_row(outID, writefile, snr, maxrows, nrows,
+     .     prn, elev, az, tod, edot,s6, s1, s2,s5,s7,s8)
+c     writes a line of the SNR file and stores what was written
+c     in row nrows+1 of snr (if there is room)
+      implicit none
+      integer outID, maxrows, nrows, prn, iprn, ios, k
+      logical writefile
+      real*8 snr(maxrows,11), elev, az, tod, edot,s6, s1, s2,s5,s7,s8
+      real*8 v(10)
+      character*85 line
+      nrows = nrows + 1
+      if (nrows .gt. maxrows) then
+        if (writefile) then
+          write(outID, 112) prn, elev, az, tod, edot,s6, s1, s2,s5,s7,s8
+        endif
+      else
+        write(line, 112) prn, elev, az, tod, edot,s6, s1, s2,s5,s7,s8
+        if (writefile) then
+          write(outID, '(a)') line
+        endif
+        read(line, 112, iostat=ios) iprn, (v(k), k=1,10)
+        if (ios .ne. 0) then
+c         a value too big for the format
+          iprn = prn
+          v(1) = elev
+          v(2) = az
+          v(3) = tod
+          v(4) = edot
+          v(5) = s6
+          v(6) = s1
+          v(7) = s2
+          v(8) = s5
+          v(9) = s7
+          v(10) = s8
+        endif
+        snr(nrows,1) = iprn
+        do k = 1, 10
+          snr(nrows,k+1) = v(k)
+        enddo
+      endif
+112   format(i3,  2f10.4, f10.1, f10.6, f7.2, 5f7.2)
+      end
+
+
       subroutine checkForNonsense(s1,s2,s5,s6,s7,s8)
 c     this should take care of nonsense values that overrun
 c     the fortran write statements
@@ -35,6 +35,7 @@ import gnssrefl.karnak_libraries as k
 import gnssrefl.EGM96 as EGM96
 import gnssrefl.rinex2snr as rnx
 import gnssrefl.kelly as kelly
+import gnssrefl.time_arrays as ta
 
 # for future ref
 #import urllib.request
@@ -169,7 +170,7 @@ def ydoych(year,doy):
     return cyyyy,cyy,cdoy
 
 
-def define_and_xz_snr(station,year,doy,snr):
+def define_and_xz_snr(station,year,doy,snr,uncompress=True):
     """
     finds and checks for existence of a SNR file
     uncompresses if that is needed (xz or gz)
@@ -184,6 +185,11 @@ def define_and_xz_snr(station,year,doy,snr):
         day of year
     snr : int
         kind of snr file (66,77, 88 etc)
+    uncompress : bool, optional
+        whether a compressed file should be uncompressed on disk. If False, the 
+        compressed file name is returned as it is, since read_snr_files.load_snr 
+        can read it directly. default is True. The binary cache of a file that is
+        uncompressed is deleted with it
 
     Returns
     -------
@@ -208,15 +214,22 @@ def define_and_xz_snr(station,year,doy,snr):
     fname5 = xdir + '/' + cyyyy  + '/snr/' + station.upper() + '/' + fmakan   + '.gz'
 
     snre = False
+    if not uncompress:
+        # leave compressed files alone
+        for name in [fname, fname2, fname3, fname4, fname5]:
+            if os.path.isfile(name):
+                return name, fname2, True
     # add gzip
     if os.path.isfile(fname):
         snre = True
     else:
         if os.path.isfile(fname2):
             subprocess.call(['unxz', fname2])
+            snr.remove_snr_cache(fname2)
         else:
             if os.path.isfile(fname3):
                 subprocess.call(['gunzip', fname3])
+                snr.remove_snr_cache(fname3)
                 fname2 = fname3 #Switch file names for .xz to .gz, for returning proper name below
         # make sure the uncompression worked
         if os.path.isfile(fname):
@@ -230,6 +243,7 @@ def define_and_xz_snr(station,year,doy,snr):
             elif os.path.isfile(fname5):
                 print('found gzipped uppercase station name')
                 subprocess.call(['gunzip', fname5])
+                snr.remove_snr_cache(fname5)
                 fname = fname4
                 fname2 = fname4 # not needed
                 snre = True
@@ -992,85 +1006,294 @@ def igsname(year,month,day):
 def read_sp3(file):
     """
     borrowed from Ryan Hardy, who got it from David Wiese ... 
+    now uses read_sp3_records
+
+    Parameters
+    ----------
+    file : str
+        sp3 filename
+
+    Returns
+    -------
+    week, tow, prn, x, y, z, clock : numpy arrays
+        GPS week, seconds of the week, satellite number (without the constellation),
+        coordinates (km) and clock (microseconds) of each satellite record
+
     """
     try:      
-        f = open(file)
-        raw = f.read()
-        f.close()
-        lines  = raw.splitlines()
-        nprn = int(lines[2].split()[1])
-        lines  = raw.splitlines()[22:-1]
-        epochs = lines[::(nprn+1)]
-        nepoch =  len(lines[::(nprn+1)])
-        week, tow, x, y, z, clock, prn = np.zeros((nepoch*nprn, 7)).T
-        for i in range(nepoch):
-            year, month, day, hour, minute, second = np.array(epochs[i].split()[1:], dtype=float)
-            week[i*nprn:(i+1)*nprn], tow[i*nprn:(i+1)*nprn] = \
-				kgpsweek(year, month, day, hour, minute, second)
-            for j in range(nprn):
-                prn[i*nprn+j] =  int(lines[i*(nprn+1)+j+1][2:4])
-                x[i*nprn+j] = float(lines[i*(nprn+1)+j+1][4:18])
-                y[i*nprn+j] = float(lines[i*(nprn+1)+j+1][18:32])
-                z[i*nprn+j] = float(lines[i*(nprn+1)+j+1][32:46])
-                clock[i*nprn+j] = float(lines[(i)*(nprn+1)+j+1][46:60])
+        con, prn, week, tow, x, y, z, clock = read_sp3_records(file)
     except:
         print('sorry - the sp3file does not exist')
         week,tow,x,y,z,prn,clock=[0,0,0,0,0,0,0]
 		
     return week, tow, prn, x, y, z, clock
 
-def myreadnav(file):
+def _fixed_width(lines, width=80):
+    """
+    puts lines of a text file in a 2-d array of bytes, one row per line, 
+    so fixed width fields can be sliced for all the lines at once
+
+    Parameters
+    ----------
+    lines : list of bytes
+        lines of the file
+    width : int, optional
+        longer lines are cut. default is 80
+
+    Returns
+    -------
+    u : numpy array of uint8
+        shape is (number of lines, width). short lines are padded with zeros
+
+    """
+    if len(lines) == 0:
+        return np.zeros((0,width), dtype=np.uint8)
+    return np.array(lines, dtype='S{0:d}'.format(width)).view(np.uint8).reshape(len(lines), width)
+
+def _fixed_field(u, i1, i2, dtype=float):
+    """
+    converts a fixed width field (columns i1 to i2) of every row made by _fixed_width
+
+    Parameters
+    ----------
+    u : numpy array of uint8
+        from _fixed_width
+    i1 : int
+        first column
+    i2 : int
+        column after the last one
+    dtype : type, optional
+        float (default) or int
+
+    Returns
+    -------
+    values : numpy array
+
+    """
+    f = np.ascontiguousarray(u[..., i1:i2]).view('S{0:d}'.format(i2-i1))[..., 0]
+    if dtype == int:
+        return f.astype(float).astype(int)
+    return f.astype(float)
+
+def _weeks_seconds(ymdhms):
+    """
+    GPS week and seconds of the week (kgpsweek) for many times. 
+    kgpsweek is called once per distinct time
+
+    Parameters
+    ----------
+    ymdhms : numpy array
+        one row per time: year, month, day, hour, minute, second
+
+    Returns
+    -------
+    week : numpy array of floats
+    sow : numpy array of floats
+
     """
+    if len(ymdhms) == 0:
+        return np.zeros(0), np.zeros(0)
+    times, inverse = np.unique(ymdhms, axis=0, return_inverse=True)
+    ws = np.array([kgpsweek(*t) for t in times], dtype=float)
+    inverse = inverse.ravel()
+    return ws[inverse,0], ws[inverse,1]
+
+def read_sp3_records(file):
+    """
+    reads the position records of a sp3 (c or d) file, all lines at once
+
+    Parameters
+    ----------
+    file : str
+        sp3 filename
+
+    Returns
+    -------
+    con : numpy array of str
+        constellation letter of each record (G, R, E, C, J ...)
+    prn : numpy array of int
+        satellite number in the constellation
+    week : numpy array of floats
+        GPS week
+    sow : numpy array of floats
+        GPS seconds of the week
+    x, y, z : numpy arrays of floats
+        coordinates (km)
+    clock : numpy array of floats
+        clock (microseconds)
+
+    """
+    with open(file, 'rb') as f:
+        lines = f.read().splitlines()
+    u = _fixed_width(lines)
+    first = u[:,0]
+    # all time tags have a * in the first column
+    epochs = np.flatnonzero(first == ord('*'))
+    ymdhms = np.array([lines[i].split()[1:7] for i in epochs], dtype=float).reshape(-1,6)
+    eweek, esow = _weeks_seconds(ymdhms)
+    epoch = np.cumsum(first == ord('*')) - 1
+    # position records after the first time tag
+    ii = np.flatnonzero((first == ord('P')) & (epoch >= 0))
+    P = u[ii]
+    con = P[:,1].view('S1').astype(str)
+    prn = _fixed_field(P, 2, 4, int)
+    x = _fixed_field(P, 4, 18)
+    y = _fixed_field(P, 18, 32)
+    z = _fixed_field(P, 32, 46)
+    clock = _fixed_field(P, 46, 60)
+
+    return con, prn, eweek[epoch[ii]], esow[epoch[ii]], x, y, z, clock
+
+ORBIT_CACHE_VERSION = 1
+
+def orbit_cache_name(orbfile):
+    """
+    name of the binary cache kept next to an orbit file
+
+    Parameters
+    ----------
+    orbfile : str
+        sp3 or nav filename
+
+    Returns
+    -------
+    cachefile : str
+        the cache name, e.g. auto0150.21n.npy
+
+    """
+    return orbfile + '.npy'
+
+def write_orbit_cache(orbfile, table):
+    """
+    writes the parsed orbit table (read_sp3file or myreadnav) next to the orbit file. 
+    The first row is a header (negative cache version, size and modification time 
+    of the orbit file, number of rows), as for the SNR file cache in read_snr_files
+
+    Parameters
+    ----------
+    orbfile : str
+        sp3 or nav filename
+    table : numpy array of floats
+        parsed orbit file
+
+    Returns
+    -------
+    success : bool
+        whether the cache was written
+
+    """
+    if (len(table) == 0) or (table.shape[1] < 4):
+        return False
+    st = os.stat(orbfile)
+    header = np.zeros((1,table.shape[1]))
+    header[0,0:4] = [-ORBIT_CACHE_VERSION, st.st_size, st.st_mtime, len(table)]
+    cachefile = orbit_cache_name(orbfile)
+    tmpfile = cachefile + '.' + str(os.getpid())
+    try:
+        with open(tmpfile, 'wb') as fout:
+            np.save(fout, np.vstack((header, table)))
+        os.replace(tmpfile, cachefile)
+    except OSError:
+        # read-only orbit directory or full disk. not fatal
+        if os.path.isfile(tmpfile):
+            os.remove(tmpfile)
+        return False
+
+    return True
+
+def read_orbit_cache(orbfile, ncols):
+    """
+    reads the cache of a parsed orbit file, if it is current, i.e. the orbit file
+    has the size and modification time stored in the cache header
+
+    Parameters
+    ----------
+    orbfile : str
+        sp3 or nav filename
+    ncols : int
+        number of columns of the table, 6 for read_sp3file and 32 for myreadnav
+
+    Returns
+    -------
+    table : numpy array of floats or None
+        None if there is no valid cache
+
+    """
+    cachefile = orbit_cache_name(orbfile)
+    if (not os.path.isfile(orbfile)) or (not os.path.isfile(cachefile)):
+        return None
+    try:
+        a = np.load(cachefile)
+    except (OSError, ValueError):
+        return None
+    if (a.ndim != 2) or (a.shape[0] == 0) or (a.shape[1] != ncols):
+        return None
+    st = os.stat(orbfile)
+    version, size, mtime, r = a[0,0:4]
+    if (version != -ORBIT_CACHE_VERSION) or (size != st.st_size) or (mtime != st.st_mtime) or (r != a.shape[0]-1):
+        return None
+
+    return a[1:,:]
+
+def myreadnav(file, usecache=True):
+    """
+    reads a GPS broadcast ephemeris file, RINEX 2 or RINEX 3 (only the GPS messages are kept).
+    The parsed table is kept in a cache next to the file (see write_orbit_cache)
+
     Parameters
     ----------
     file : str
         nav filename
+    usecache : bool, optional
+        whether to read and write the cache. default is True
 
     output is complicated - broadcast ephemeris blocks
     """
 # input is the nav file
+    if usecache:
+        ephem = read_orbit_cache(file, 32)
+        if ephem is not None:
+            return ephem
     try:
-        f = open(file, 'r')
-        nav = f.read()
-        f.close()
-        nephem = (len(nav.split('END OF HEADER')[1].splitlines())-1)/8
-        nephem = int(nephem) #    print(nephem)         
-        lines = nav.split('END OF HEADER')[1].splitlines()[1:]
+        with open(file, 'rb') as f:
+            nav = f.read()
+        header, body = nav.split(b'END OF HEADER', 1)
+        rinexv = float(header[0:9])
+        lines = body.splitlines()[1:]
+        u = _fixed_width(lines)
+        if rinexv >= 3:
+            # a message starts with the satellite name. GPS messages have eight lines
+            starts = np.flatnonzero(u[:,0] != ord(' '))
+            nlines = np.diff(np.append(starts, len(lines)))
+            starts = starts[(u[starts,0] == ord('G')) & (nlines == 8)]
+            blocks = u[starts[:,None] + np.arange(8)]
+            first = blocks[:,0,:]
+            prn = _fixed_field(first, 1, 3)
+            ymdhms = np.column_stack([_fixed_field(first, i1, i2) for i1, i2 in [(4,8),(9,11),(12,14),(15,17),(18,20),(21,23)]])
+            c0 = 23; c1 = 4
+        else:
+            nephem = len(lines)//8
+            blocks = u[0:nephem*8].reshape(nephem, 8, -1)
+            first = blocks[:,0,:]
+            prn = _fixed_field(first, 0, 2)
+            ymdhms = np.column_stack([_fixed_field(first, i1, i2) for i1, i2 in [(2,5),(5,8),(8,11),(11,14),(14,17),(17,22)]])
+            year = ymdhms[:,0]
+            ymdhms[:,0] = np.where(year > 76, year + 1900, year + 2000)
+            c0 = 22; c1 = 3
+        nephem = len(blocks)
+        # D is used for the exponent
+        blocks = blocks.copy()
+        blocks[(blocks == ord('D')) | (blocks == ord('d'))] = ord('E')
         table = np.zeros((nephem, 32))
-        #print('Total number of ephemeris messages',nephem)
-        for i in range(nephem):
-            for j in range(8):
-                if j == 0:
-                    prn = int(lines[i*8+j][:2])
-                    year = int(lines[i*8+j].split()[1])
-                    if year > 76:
-                        year += 1900
-                    else:
-                        year += 2000
-                    month = int(lines[i*8+j].split()[2])
-                    day = int(lines[i*8+j].split()[3])
-                    hour = int(lines[i*8+j].split()[4])
-                    minute = int(lines[i*8+j].split()[5])
-                    second = float(lines[i*8+j][17:22])
-                    table[i, 0] = prn
-#                    print('Ephem for: ', prn, year, month, day, hour, minute)
-                    week, Toc = kgpsweek(year, month, day, hour, minute, second)
-                    table[i, 1] =  week
-                    table[i, 2] = Toc
-                    Af0 = float(lines[i*8][-3*19:-2*19].replace('D', 'E'))
-                    Af1 = float(lines[i*8][-2*19:-1*19].replace('D', 'E'))
-                    Af2 = float(lines[i*8][-19:].replace('D', 'E'))
-                    table[i,3:6] = Af0, Af1, Af2
-                elif j != 7:
-                    for k in range(4):
-                        value = float(lines[i*8+j][19*k+3:19*(k+1)+3].replace('D', 'E'))
-                        table[i,2+4*j+k] = value
-                elif j== 7:
-                    table[i,-2]= float(lines[i*8+j][3:19+3].replace('D', 'E'))
-                    if not lines[i*8+7][22:].replace('D', 'E').isalpha():
-                        table[i,-1]= 0
-                    else:
-                        table[i, -1] = float(lines[i*8+7][22:41].replace('D', 'E'))
+        table[:, 0] = prn
+        table[:, 1], table[:, 2] = _weeks_seconds(ymdhms)
+        # Af0, Af1, Af2
+        for k in range(3):
+            table[:, 3+k] = _fixed_field(blocks[:,0,:], c0+19*k, c0+19*(k+1))
+        for j in range(1,7):
+            for k in range(4):
+                table[:, 2+4*j+k] = _fixed_field(blocks[:,j,:], c1+19*k, c1+19*(k+1))
+        table[:, -2] = _fixed_field(blocks[:,7,:], c1, c1+19)
 # output is stored as:
 #
 # 0-10   prn, week, Toc, Af0, Af1, Af2, IODE, Crs, delta_n, M0, Cuc,\
@@ -1083,6 +1306,8 @@ def myreadnav(file):
     except:
         #print('This ephemeris file does not exist',file)
         ephem = []
+    if usecache and (len(ephem) > 0):
+        write_orbit_cache(file, ephem)
     return ephem
 
 def myfindephem(week, sweek, ephem, prn):
@@ -1464,7 +1689,7 @@ def get_ofac_hifac(elevAngles, cf, maxH, desiredPrec):
 
     return ofac, hifac
 
-def strip_compute(x,y,cf,maxH,desiredP,pfitV,minH):
+def strip_compute(x,y,cf,maxH,desiredP,pfitV,minH,coarse=False):
     """
     strips snr data
 
@@ -1484,6 +1709,11 @@ def strip_compute(x,y,cf,maxH,desiredP,pfitV,minH):
         polynomial order for DC model
     minH : float
         minimum reflector height in meters
+    coarse : bool, optional
+        two stage peak search.  The periodogram is first computed on a coarse grid 
+        (a quarter of the characteristic peak width), and then only near the 
+        biggest coarse peaks at the desiredP spacing. The peak is the same as for the full grid
+        but px and pz are returned on the coarse grid. default is False
 
     Returns 
     -------
@@ -1530,6 +1760,16 @@ def strip_compute(x,y,cf,maxH,desiredP,pfitV,minH):
 #    y=newy
 #   get frequency spacing
     px = freq_out(x,ofac,hifac) 
+    coarseP = coarse_spacing(x)
+    if coarse and (len(px) > 0) and (coarseP > desiredP):
+        # coarse grid, which has the same definition as the regular one
+        pxc = freq_out(x,ofac*desiredP/coarseP,hifac)
+        pzc = 2*np.sqrt(spectral.lombscargle(x, y, 2*np.pi*pxc)/len(x))
+        pzc = pzc[(pxc > minH)]
+        pxc = pxc[(pxc > minH)]
+        maxF, maxAmp = refine_lsp_peak(x, y, px[(px > minH)], pxc, pzc)
+        return maxF, maxAmp, eminObs, emaxObs,riseSet, pxc,pzc
+
 #   compute spectrum using scipy
     scipy_LSP = spectral.lombscargle(x, y, 2*np.pi*px)
 
@@ -1555,6 +1795,264 @@ def strip_compute(x,y,cf,maxH,desiredP,pfitV,minH):
 
     return maxF, maxAmp, eminObs, emaxObs,riseSet, px,pz
 
+def coarse_spacing(x):
+    """
+    RH spacing used for the coarse grid in the two stage periodogram peak search,
+    a quarter of the characteristic peak width
+
+    Parameters
+    ----------
+    x : numpy array
+        sine(elevation angle)/cf, i.e. in inverse meters
+
+    Returns
+    -------
+    coarseP : float
+        coarse grid spacing in meters (0 for a bad window)
+
+    """
+    W = np.max(x) - np.min(x)
+    if W == 0:
+        return 0
+    return 0.25/W
+
+def refine_lsp_peak(x, y, px, pxc, pzc, npeaks=3):
+    """
+    finds the periodogram peak on the fine RH grid px by only evaluating
+    the grid points next to the biggest peaks of a coarse periodogram.  
+    The coarse grid is much finer than the width of a peak, so the maximum of
+    a peak lies between the coarse neighbors of its highest coarse value.
+
+    Parameters
+    ----------
+    x : numpy array
+        sine(elevation angle)/cf, sorted
+    y : numpy array
+        SNR data, linear units, direct signal removed
+    px : numpy array
+        fine RH grid (m), already restricted to be > minH
+    pxc : numpy array
+        coarse RH grid (m)
+    pzc : numpy array
+        periodogram amplitude on the coarse grid
+    npeaks : int, optional
+        number of coarse peaks that are refined
+
+    Returns
+    -------
+    maxF : float
+        RH of the biggest peak (m)
+    maxAmp : float
+        amplitude of the biggest peak
+
+    """
+    if (len(pzc) == 0) or (len(px) == 0):
+        print('invalid LSP, no data returned. If this is pervasive, check your inputs')
+        return 0, 0
+    # local maxima of the coarse periodogram, ends included
+    padded = np.concatenate(([-np.inf], pzc, [-np.inf]))
+    ipeak = np.where((pzc >= padded[0:-2]) & (pzc >= padded[2:]))[0]
+    ipeak = ipeak[np.argsort(pzc[ipeak])[::-1][0:npeaks]]
+    keep = np.zeros(len(px), dtype=bool)
+    for i in ipeak:
+        lo = pxc[max(i-1,0)] ; hi = pxc[min(i+1,len(pxc)-1)]
+        keep[(px >= lo) & (px <= hi)] = True
+    if not np.any(keep):
+        keep[np.argmin(np.abs(px - pxc[ipeak[0]]))] = True
+    pxf = px[keep]
+    pzf = 2*np.sqrt(spectral.lombscargle(x, y, 2*np.pi*pxf)/len(x))
+    ij = np.argmax(pzf)
+
+    return pxf[ij], pzf[ij]
+
+def batch_strip_compute(xlist,ylist,cflist,maxH,desiredP,minH,NReg,maxelem=2**18,coarse=False):
+    """
+    Computes Lomb Scargle periodograms for many arcs at once.  This returns the
+    same values as calling strip_compute arc by arc, but all arcs that share a
+    reflector height grid are evaluated in one vectorized pass.
+
+    The RH grid made by freq_out is always linspace(desiredP, maxH), so every arc
+    of a given frequency has (up to round-off) the same grid.  The sums needed by the
+    periodogram are nonuniform Fourier sums, exp(i w x), which are computed for
+    blocks of frequencies as exp(i w0 x) * exp(i j dw x), so only a complex multiply
+    is needed per frequency and observation instead of a sine and a cosine.
+
+    Parameters
+    ----------
+    xlist : list of numpy arrays
+        elevation angles in degrees, one array per arc
+    ylist : list of numpy arrays
+        SNR data with the direct signal removed, one array per arc
+    cflist : list of floats
+        scale factor (wavelength/2) for each arc
+    maxH : float
+        maximum reflector height in meters
+    desiredP : float
+        precision of Lomb Scargle in meters
+    minH : float
+        minimum reflector height in meters
+    NReg : list of floats
+        noise region for RH peak2noise , meters
+    maxelem : int, optional
+        maximum number of complex elements held in memory for one block
+    coarse : bool, optional
+        two stage peak search, as in strip_compute. The coarse grid is shared by all
+        the arcs (it uses the smallest coarse spacing of the batch). The noise and the
+        returned px,pz come from the coarse periodogram. default is False
+
+    Returns
+    -------
+    results : list of tuples
+        one tuple per arc, in the order of the inputs:
+        maxF, maxAmp, eminObs, emaxObs, riseSet, px, pz, Noise.
+        The first seven are the same as returned by strip_compute.
+        Noise is the mean periodogram amplitude in the NReg region (1 if there are no values)
+    """
+    narcs = len(xlist)
+    results = [None]*narcs
+    # arcs are grouped by the number of grid points (which should be the same for everybody)
+    groups = {}
+    coarsearcs = []
+    for i in range(narcs):
+        x = np.asarray(xlist[i],dtype=float)
+        y = np.asarray(ylist[i],dtype=float)
+        cf = cflist[i]
+        ofac,hifac = get_ofac_hifac(x,cf,maxH,desiredP)
+        if np.isnan(ofac) or (ofac == 0):
+            print("WARNING - bad ofac")
+            results[i] = (0, 0, 0, 0, 0, 0, 0, 1)
+            continue
+        eminObs = min(x); emaxObs = max(x)
+        if x[0] > x[1]:
+            riseSet = -1
+        else:
+            riseSet = 1
+        ij = np.argsort(x)
+        xs = np.sin(x[ij]*np.pi/180)/cf
+        ys = y[ij]
+        # same grid definition as freq_out
+        n = len(xs)
+        xdif = np.max(xs) - np.min(xs)
+        nout = int(0.5*ofac*hifac*n)
+        if (xdif == 0) or (nout == 0):
+            print('invalid LSP, no data returned. If this is pervasive, check your inputs')
+            results[i] = (0, 0, eminObs, emaxObs, riseSet, np.empty(0), np.empty(0), 1)
+            continue
+        pstart = 1.0/(xdif*ofac)
+        pstop = hifac*n/(2*xdif)
+        px = np.linspace(pstart, pstop, nout)
+        if nout > 1:
+            pstep = (pstop-pstart)/(nout-1)
+        else:
+            pstep = 0
+        kmin = int(np.argmax(px > minH)) if np.any(px > minH) else nout
+        member = [i, xs, ys, pstart, pstep, kmin, px, eminObs, emaxObs, riseSet]
+        if coarse and (coarse_spacing(xs) > desiredP):
+            coarsearcs.append(member)
+        else:
+            groups.setdefault(nout, []).append(member)
+
+    for nout, members in groups.items():
+        for batch in _split_lsp_batches(members, maxelem):
+            k0, amps = _batch_lsp_amplitudes(batch, nout, maxelem)
+            for j,m in enumerate(batch):
+                pz = amps[m[5]-k0:,j]
+                px = m[6][m[5]:]
+                if len(pz) == 0:
+                    print('invalid LSP, no data returned. If this is pervasive, check your inputs')
+                    maxF = 0; maxAmp = 0
+                else:
+                    ij = np.argmax(pz)
+                    maxF = px[ij]
+                    maxAmp = pz[ij]
+                results[m[0]] = (maxF, maxAmp, m[7], m[8], m[9], px, pz, _lsp_noise(px, pz, NReg))
+
+    if len(coarsearcs) > 0:
+        # one coarse grid for everybody, with the same definition as freq_out
+        coarseP = min([coarse_spacing(m[1]) for m in coarsearcs])
+        ncoarse = int(maxH/coarseP)
+        pxc = np.linspace(coarseP, maxH, ncoarse)
+        kminc = int(np.argmax(pxc > minH)) if np.any(pxc > minH) else ncoarse
+        cstep = (maxH - coarseP)/(ncoarse - 1) if ncoarse > 1 else 0
+        members = [[j, m[1], m[2], coarseP, cstep, kminc, pxc] for j,m in enumerate(coarsearcs)]
+        for batch in _split_lsp_batches(members, maxelem):
+            k0, amps = _batch_lsp_amplitudes(batch, ncoarse, maxelem)
+            for j,c in enumerate(batch):
+                m = coarsearcs[c[0]]
+                pzc = amps[kminc-k0:,j]
+                px = pxc[kminc:]
+                maxF, maxAmp = refine_lsp_peak(m[1], m[2], m[6][m[5]:], px, pzc)
+                results[m[0]] = (maxF, maxAmp, m[7], m[8], m[9], px, pzc, _lsp_noise(px, pzc, NReg))
+
+    return results
+
+def _lsp_noise(px, pz, NReg):
+    """
+    mean periodogram amplitude in the noise region, 1 if there are no values there
+    """
+    nij = pz[(px > NReg[0]) & (px < NReg[1])]
+    Noise = 1
+    if len(nij) > 0:
+        Noise = np.mean(nij)
+    return Noise
+
+def _split_lsp_batches(members, maxelem):
+    """
+    splits the arcs into batches small enough that the frequency blocks stay a reasonable size
+    """
+    batches = []
+    batch = []; npts = 0
+    for m in members:
+        batch.append(m); npts += len(m[1])
+        if npts*32 >= maxelem:
+            batches.append(batch)
+            batch = []; npts = 0
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
+
+def _batch_lsp_amplitudes(batch, nout, maxelem):
+    """
+    evaluates the periodograms for one batch of arcs that have nout grid points.
+    See batch_strip_compute.  Returns the first grid index that was computed and 
+    the amplitudes, one column per arc
+    """
+    X = np.concatenate([m[1] for m in batch])
+    Y = np.concatenate([m[2] for m in batch])
+    lengths = np.array([len(m[1]) for m in batch])
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    # angular frequency of the first grid point and the grid spacing, per observation
+    w0 = np.repeat(np.array([2*np.pi*m[3] for m in batch]), lengths)*X
+    dw = np.repeat(np.array([2*np.pi*m[4] for m in batch]), lengths)*X
+    k0 = min([m[5] for m in batch])
+    nk = nout - k0
+    M = len(X)
+    B = int(max(1, min(nk, maxelem // M)))
+    steps = np.exp(1j*np.outer(np.arange(B), dw))
+
+    Z1 = np.empty((nk, len(batch)), dtype=complex)
+    Z2 = np.empty((nk, len(batch)), dtype=complex)
+    E = np.empty((B, M), dtype=complex)
+    EY = np.empty((B, M), dtype=complex)
+    for kb in range(k0, nout, B):
+        nb = min(B, nout-kb)
+        np.multiply(steps[0:nb,:], np.exp(1j*(w0 + kb*dw)), out=E[0:nb,:])
+        np.multiply(E[0:nb,:], Y, out=EY[0:nb,:])
+        Z1[kb-k0:kb-k0+nb,:] = np.add.reduceat(EY[0:nb,:], starts, axis=1)
+        np.multiply(E[0:nb,:], E[0:nb,:], out=E[0:nb,:])
+        Z2[kb-k0:kb-k0+nb,:] = np.add.reduceat(E[0:nb,:], starts, axis=1)
+
+    # rotate by tau so the cos*sin cross term vanishes, as in scipy lombscargle
+    N = lengths.astype(float)
+    A = np.abs(Z2)
+    Z1 = Z1*np.exp(-0.5j*np.angle(Z2))
+    epsneg = np.finfo(float).epsneg
+    CC = np.maximum(0.5*(N + A), N*epsneg)
+    SS = np.maximum(0.5*(N - A), N*epsneg)
+    P = 0.5*(Z1.real**2/CC + Z1.imag**2/SS)
+
+    return k0, 2*np.sqrt(P/N)
+
 def window_data(s1,s2,s5,s6,s7,s8, sat,ele,azi,seconds,edot,f,az1,az2,e1,e2,satNu,pfitV,pele,screenstats):
     """
 
@@ -1970,7 +2468,8 @@ def glonass_channels(f,prn):
     dL2 = 0.4375e6
 
     ch = channel[(slot == prn)]
-    ch = int(ch)
+    # newer numpy versions do not allow int() of a 1x1 matrix
+    ch = int(np.asarray(ch).ravel()[0])
 #   wavelengths in meters
 #    print(prn,ch,f)
     l = 0.0
@@ -4228,12 +4727,20 @@ def nextdoy(year,doy):
 
     return nyear, ndoy
 
-def read_sp3file(file_path):
+def read_sp3file(file_path, usecache=True):
     """ 
     input: file_path is the sp3file name
     this code is from Joakim Strandberg I believe.
     It is for the python only version of the translator, which 
-    should be deprecated
+    should be deprecated. The file is now read with read_sp3_records and
+    the parsed table is kept in a cache next to the file (see write_orbit_cache)
+
+    Parameters
+    ----------
+    file_path : str
+        sp3 filename
+    usecache : bool, optional
+        whether to read and write the cache. default is True
 
     Returns
     -------
@@ -4244,44 +4751,28 @@ def read_sp3file(file_path):
     respectively.  all other satellites are ignored
 
     """
-    ignorePoint = False
-    max_sat = 150 # not used
-    # store as satNu, week, sec of week , x, y, and z?
-    sp3 = np.empty(shape=[0, 6])
-    count = -1
-    firstEpochFound = False
-
-    f = open(file_path, 'r')
-    for line in f.readlines():
-        #all time tags have a * in first column
-        if line[0] == '*':
-            year,month,day,hour,minute,second = line.split()[1:]
-            wk,swk = kgpsweek(int(year), int(month), int(day), int(hour), int(minute), float(second))
-            wk = int(wk) ; swk = float(swk)
-            if (not firstEpochFound):
-                firstWeek = wk 
-                firstEpochFound = True
-                #print('first GPS Week and Seconds in the file', firstWeek, swk)
-            count += 1
-            if (wk != firstWeek):
-                #print('this is a problem - this code should not be used with files that crossover GPS weeks ')
-                #print('JAXA orbits have this extra point, which is going to be thrown out')
-                ignorePoint = True
-        if (line[0] == 'P') and (not ignorePoint):
-            co = line[1]
-            out = findConstell(co)
-            satNu = int(line[2:4]) + out
-            xs = line.split()
-            # do not allow SBAS etc
-            if satNu < 400:
-                x = float(xs[1])*1000.0
-                y = float(xs[2])*1000.0
-                z = float(xs[3])*1000.0
-                lis = [satNu, wk,swk, x,y,z]
-                sp3 = np.vstack((sp3,lis))
-    f.close()
-    nr,nc = sp3.shape
-    #print('number of rows and columns being returned from the sp3 file', nr,nc)
+    if usecache:
+        sp3 = read_orbit_cache(file_path, 6)
+        if sp3 is not None:
+            return sp3
+    con, prn, week, sow, x, y, z, clock = read_sp3_records(file_path)
+    if len(week) == 0:
+        return np.empty(shape=[0, 6])
+    # this code should not be used with files that crossover GPS weeks.
+    # JAXA orbits have this extra point, which is going to be thrown out (as are those after it)
+    keep = np.cumsum(week != week[0]) == 0
+    # 0, 100, 200 or 300 (see findConstell)
+    addon = np.full(len(con), 300)
+    addon[(con == 'G') | (con == ' ')] = 0
+    addon[con == 'R'] = 100
+    addon[con == 'E'] = 200
+    satNu = prn + addon
+    # do not allow SBAS etc
+    keep = keep & (satNu < 400)
+    sp3 = np.column_stack((satNu, week, sow, x*1000.0, y*1000.0, z*1000.0))[keep]
+    if usecache:
+        write_orbit_cache(file_path, sp3)
+
     return sp3
 
 def nicerTime(UTCtime):
@@ -4651,9 +5142,7 @@ def get_obstimes(tvd):
     obstimes = []
 
     if nr > 0:
-        for ijk in range(0,nr):
-            dtime, iyear,imon,iday,ihour,imin,isec = ymd_hhmmss(tvd[ijk,0],tvd[ijk,1],tvd[ijk,4],True)
-            obstimes.append(dtime)
+        obstimes = ta.obstimes(tvd[:,0],tvd[:,1],tvd[:,4])
     else:
         print('empty file')
 
@@ -4674,12 +5163,8 @@ def get_obstimes_plus(tvd):
     modjulian = np.empty(shape=[0,1])
 
     if nr > 0:
-        for ijk in range(0,nr):
-            dtime, iyear,imon,iday,ihour,imin,isec = ymd_hhmmss(tvd[ijk,0],tvd[ijk,1],tvd[ijk,4],True)
-            obstimes.append(dtime)
-            m,f = mjd(iyear,imon,iday,ihour,imin,isec)
-            x=[m+f]
-            modjulian = np.append(modjulian, [x],axis=0 )
+        obstimes = ta.obstimes(tvd[:,0],tvd[:,1],tvd[:,4])
+        modjulian = ta.ydoy_mjd(tvd[:,0],tvd[:,1],tvd[:,4]).reshape(nr,1)
     else:
         print('empty file')
 
@@ -4702,10 +5187,7 @@ def confused_obstimes(tvd):
     nr,nc = tvd.shape
     modifiedjulian = []
     if nr > 0:
-        for ijk in range(0,nr):
-            dtime, iyear,imon,iday,ihour,imin,isec = ymd_hhmmss(tvd[ijk,0],tvd[ijk,1],tvd[ijk,4],True)
-            m,f = mjd(iyear,imon,iday,ihour,imin,isec)
-            modifiedjulian = np.append(modifiedjulian, m+f)
+        modifiedjulian = ta.ydoy_mjd(tvd[:,0],tvd[:,1],tvd[:,4])
     else:
         print('empty file')
 
@@ -4728,15 +5210,8 @@ def more_confused_obstimes(tvd):
     nr,nc = tvd.shape
     modifiedjulian = []
     if nr > 0:
-        for ijk in range(0,nr):
-            #MM DD HH Min Sec
-            (18,19,20,21,22)
-            #dtime, iyear,imon,iday,ihour,imin,isec = ymd_hhmmss(tvd[ijk,0],tvd[ijk,1],tvd[ijk,4],True)
-            iyear = tvd[ijk,0]; imon = tvd[ijk,17]; iday = tvd[ijk,18]
-            ihour = tvd[ijk,19]; imin = tvd[ijk,20]
-            isec =  tvd[ijk,21]
-            m,f = mjd(iyear,imon,iday,ihour,imin,isec)
-            modifiedjulian = np.append(modifiedjulian, m+f)
+        #MM DD HH Min Sec are in columns 18,19,20,21,22
+        modifiedjulian = ta.mjd(tvd[:,0],tvd[:,17],tvd[:,18],tvd[:,19],tvd[:,20],tvd[:,21])
     else:
         print('empty file')
 
@@ -6586,8 +7061,8 @@ def ydoy2datetime(y,doy):
     """
     translates year/day of year numpy array into datetimes for plotting
 
-    this was running slow for large datasets.  changing to use lists
-    and then asarray to numpy
+    this was running slow for large datasets.  now it uses the
+    vectorized conversions in time_arrays
 
     Parameters
     ----------
@@ -6602,19 +7077,7 @@ def ydoy2datetime(y,doy):
         datetime objects
 
     """
-    obstimes = []
-    obstimes_list = []
-    N = len(y)
-    for i in range (0,N):
-        yy = int( y[i] );
-        ddoy = int(doy[i])
-        d = datetime.datetime(yy, 1, 1) + datetime.timedelta(days=(ddoy-1))
-        #print(yy,ddoy,d.month,d.day)
-        bigT = datetime.datetime(year=yy, month=d.month, day=d.day)
-        #obstimes = np.append(obstimes,bigT)
-        obstimes_list.append(bigT)
-
-    obstimes = np.asarray(obstimes_list)
+    obstimes = np.asarray(ta.obstimes(y, doy))
 
     return obstimes
 
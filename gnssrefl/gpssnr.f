@@ -1,15 +1,49 @@
 C FILE: GPSSNR.F 
       SUBROUTINE FOO(rawf,outf,broadf,snrtype,decfac,errf) 
+      implicit none
+      character*2 snrtype, decfac
+      character*132 rawf,outf,broadf,errf
+Cf2py intent(in) rawf
+Cf2py intent(in) outf
+Cf2py intent(in) broadf
+Cf2py intent(in) snrtype
+Cf2py intent(in) decfac
+Cf2py intent(in) errf
+c     the work is done by snrrows, which can also be called from python
+c     to get the SNR data as an array
+      integer nrows
+      real*8 snr(1,9)
+c     only the file is written
+      call snrrows(rawf,outf,broadf,snrtype,decfac,errf,0,snr,nrows)
+      end
+
+      subroutine snrrows(rawf,outf,broadf,snrtype,decfac,errf,maxrows,
+     .  snr,nrows)
+c     translates a RINEX file
+c     INPUT rawf RINEX file, outf SNR file (blank for no file), broadf
+c     navigation file, snrtype and decfac as for FOO, errf log file
+c     maxrows, size of the snr array
+c     OUTPUT snr, the SNR data, one row for each line of the SNR file.
+c     The values are those of the SNR file (read back from the formatted line)
+c     The SNR file of option 50 has eight columns, so the last one is zero.
+c     nrows, the number of rows. If it is bigger than maxrows, only the first
+c     maxrows rows are in snr. It is -1 if the files could not be used
       implicit none
       character*132 rawfilename, outfilename, broadfile
       character*2 snrtype, decfac
       character*132 rawf,outf,broadf,mess,errf
+      integer maxrows, nrows
+      real*8 snr(maxrows,9)
 Cf2py intent(in) rawf
 Cf2py intent(in) outf
 Cf2py intent(in) broadf
 Cf2py intent(in) snrtype
 Cf2py intent(in) decfac
 Cf2py intent(in) errf
+Cf2py intent(in) maxrows
+Cf2py intent(out) snr
+Cf2py intent(out) nrows
+Cf2py depend(maxrows) snr
 
 c change to 132 characters for inputs
 
@@ -36,7 +70,7 @@ c change to 132 characters for inputs
      .   s1,s2,xrec, yrec, zrec, tc, Lat,Long,Ht,
      .   bele(maxeph, maxsat, 28),s5
       logical eof, bad_point, keep_point
-      logical debugging, decimate
+      logical debugging, decimate, writefile
 c     Kristine M. Larson
 c     version 2.0 new version - uses subroutines, fixed bug in az-el
 c     verison 2.1 fixes bug in selection 77 (reading the LLI value)
@@ -72,6 +106,7 @@ c    change dimension to place for ephemeris each hour
      .  nridot(24,maxsat), nistano(24,maxsat)
 
 c     was not sure about inputs - so use short names there
+      nrows = -1
       mess = 'message'
       errid = 53
       fileIN = 12
@@ -160,7 +195,11 @@ c     read the broadcast ephemeris information
 
       call envTrans(xrec,yrec,zrec,staXYZ,Lat,Long,Ht,North,East,Up)
 c     open output file
-      open(fileOUT,file=outfilename, status='unknown')
+      writefile = outfilename .ne. ' '
+      if (writefile) then
+        open(fileOUT,file=outfilename, status='unknown')
+      endif
+      nrows = 0
       eof = .false.
       current_hour = 0
 c     print*, 'S1 location:', iobs(6)
@@ -231,7 +270,8 @@ c             check for S5
 c                 no data, SNR so do not print it
               else
                 call write_to_file(fileOUT, prn_pick, iprn, 
-     .           elev,azimuth, tod, s1,s2, s5)
+     .           elev,azimuth, tod, s1,s2, s5, 
+     .           writefile, snr, maxrows, nrows)
                  
                 npts = npts + 1
               endif
@@ -249,11 +289,13 @@ c             print*, 'skipping non-GPS satellite'
       endif
 c     close input and output files
       close(fileIN)
-      close(fileOUT)
+      if (writefile) then
+        close(fileOUT)
+      endif
       end
 
       subroutine write_to_file(outID, prn_pick, prn, elev, 
-     . azimuth, tod, s1,s2, s5)
+     . azimuth, tod, s1,s2, s5, writefile, snr, maxrows, nrows)
       implicit none
 
       integer maxsat, maxeph, maxob
@@ -265,6 +307,10 @@ c     close input and output files
 
       real*8 s1, s2, tod, elev, azimuth, x,y, s5
       integer prn_pick, outID, prn
+      logical writefile, keep
+      integer maxrows, nrows, ncol
+      real*8 snr(maxrows,9)
+      character*40 fmt
 c     author: Kristine Larson
 c     2020aug17 check for large (nonsense) SNR values
 c
@@ -278,26 +324,80 @@ c     make sure that you do not have huge SNR values which overrun the
 c     fortran write statement
       call checkForNonsense(s1,s2,s5)
 
+c     the line is written to outID if writefile is true and is also stored
+c     in the snr array (see snrrows)
+      keep = .true.
+      fmt = '(i3,  2f10.4, f10.0, 2f7.2, 3f7.2)'
+      ncol = 9
       if (prn_pick.eq.99.and.(elev.gt.5
      .  .and.elev.lt.30)) then
-          write(outID,'(i3,  2f10.4, f10.0, 2f7.2, 3f7.2)' )
-     .    prn, elev, azimuth, tod, x,y, s1, s2, s5
       elseif ( prn_pick.eq.50 .and.  elev.lt.10 ) then
-        write(outID,'(i3,  2f10.4, f10.0, 2f7.2, 2f7.2)' )
-     .    prn, elev, azimuth, tod, 0.d0,0.d0, s1, s2
+        fmt = '(i3,  2f10.4, f10.0, 2f7.2, 2f7.2)'
+        ncol = 8
 c     all data above 5 degrees
       elseif ( prn_pick.eq.88 .and.  elev.gt.0 ) then
-        write(outID,'(i3,  2f10.4, f10.0, 2f7.2, 3f7.2)' )
-     .    prn, elev, azimuth, tod, x,y, s1, s2,s5
 c     everything < 30
       elseif (  prn_pick.eq.66 .and. elev.lt.30 ) then
-        write(outID,'(i3,  2f10.4, f10.0, 2f7.2, 3f7.2)' )
-     .    prn, elev, azimuth, tod, 0.d0, 0.d0, s1, s2, s5
 c       L2C data only - LLI indicator has to be a zero
 c       assumes if no phase data, then it is not a good snr value
       elseif (prn.eq.prn_pick)  then
-        write(outID,'(i3,  2f10.4, f10.0, 2f7.2, 3f7.2)' )
-     .    prn, elev, azimuth, tod, x,y, s1, s2, s5
+      else
+        keep = .false.
+      endif
+      if (keep) then
+        call store_gps_row(outID, writefile, snr, maxrows, nrows,
+     .    fmt, ncol, prn, elev, azimuth, tod, x, y, s1, s2, s5)
+      endif
+      end
+
+      subroutine store_gps_row(outID, writefile, snr, maxrows, nrows,
+     .    fmt, ncol, prn, elev, azimuth, tod, x, y, s1, s2, s5)
+c     writes a line of the SNR file and stores what was written
+c     in row nrows+1 of snr (if there is room)
+      implicit none
+      integer outID, maxrows, nrows, ncol, prn, iprn, ios, k
+      logical writefile
+      real*8 snr(maxrows,9), elev, azimuth, tod, x, y, s1, s2, s5
+      real*8 v(8)
+      character*40 fmt
+      character*68 line
+      nrows = nrows + 1
+      if (nrows .gt. maxrows) then
+        if (writefile) then
+          if (ncol .eq. 8) then
+            write(outID,fmt) prn, elev, azimuth, tod, x,y, s1, s2
+          else
+            write(outID,fmt) prn, elev, azimuth, tod, x,y, s1, s2, s5
+          endif
+        endif
+      else
+        line = ' '
+        if (ncol .eq. 8) then
+          write(line,fmt) prn, elev, azimuth, tod, x,y, s1, s2
+        else
+          write(line,fmt) prn, elev, azimuth, tod, x,y, s1, s2, s5
+        endif
+        if (writefile) then
+          write(outID,'(a)') line(1:3+10*3+7*(ncol-4))
+        endif
+        v(8) = 0.d0
+        read(line, fmt, iostat=ios) iprn, (v(k), k=1,ncol-1)
+        if (ios .ne. 0) then
+c         a value too big for the format
+          iprn = prn
+          v(1) = elev
+          v(2) = azimuth
+          v(3) = tod
+          v(4) = x
+          v(5) = y
+          v(6) = s1
+          v(7) = s2
+          v(8) = s5
+        endif
+        snr(nrows,1) = iprn
+        do k = 1, 8
+          snr(nrows,k+1) = v(k)
+        enddo
       endif
       end
 
@@ -1007,6 +1107,8 @@ c       print*, it1, it2, it3, it4, it5, 'PRN ', iprn
       endif
       goto 12
 14    continue
+c     close it, so the file can be opened again in the same process
+      close(44)
       return
       end
       subroutine rearrange_bele(bele)
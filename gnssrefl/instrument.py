@@ -0,0 +1,270 @@
+import contextlib
+import json
+import os
+import time
+
+# timers and counters for the stages of gnssir, rinex2snr and subdaily.
+# Nothing is recorded unless it is turned on, either with enable() or by
+# setting the environment variable REFL_INSTRUMENT (to anything but 0).
+# Each process keeps its own record, so parallel workers do not interfere.
+
+_enabled = False
+_callback = None
+_record = None
+_last = None
+_null = contextlib.nullcontext()
+
+
+def enabled():
+    """
+    whether timers and counters are being recorded
+
+    Returns
+    -------
+    bool
+
+    """
+    return _enabled or (os.environ.get('REFL_INSTRUMENT', '0') not in ['', '0'])
+
+
+def enable(on=True, callback=None):
+    """
+    turns the timers and counters on (or off)
+
+    Parameters
+    ----------
+    on : bool, optional
+        default is True
+    callback : function, optional
+        called with the record (a dictionary) for each finished day instead of writing
+        the record to a json file
+
+    """
+    global _enabled, _callback
+    _enabled = on
+    _callback = callback
+
+
+def start_record(station, year, doy, tool):
+    """
+    starts the record for one day of one tool. Does nothing if instrumentation is off
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    year : int
+        full year
+    doy : int
+        day of year
+    tool : str
+        name of the code being timed, e.g. gnssir
+
+    """
+    global _record
+    if not enabled():
+        _record = None
+        return
+    _record = {'station': station, 'year': int(year), 'doy': int(doy), 'tool': tool,
+               'start': time.time(), 't0': time.perf_counter(), 'stages': {}, 'counters': {}}
+
+
+def add_time(name, seconds):
+    """
+    adds time to a named stage of the current record
+
+    Parameters
+    ----------
+    name : str
+        stage name
+    seconds : float
+        elapsed time
+
+    """
+    if _record is None:
+        return
+    stages = _record['stages']
+    stages[name] = stages.get(name, 0.0) + seconds
+
+
+class _Timer:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t1 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        add_time(self.name, time.perf_counter() - self.t1)
+        return False
+
+
+def timer(name):
+    """
+    context manager that adds the time spent inside it to a named stage, i.e.
+
+    with instrument.timer('lsp'):
+        ...
+
+    This is a no-op if there is no current record
+
+    Parameters
+    ----------
+    name : str
+        stage name
+
+    """
+    if _record is None:
+        return _null
+    return _Timer(name)
+
+
+def count(name, n=1):
+    """
+    adds to a named counter of the current record
+
+    Parameters
+    ----------
+    name : str
+        counter name, e.g. arcs_accepted
+    n : int, optional
+        amount to add, default is 1
+
+    """
+    if _record is None:
+        return
+    counters = _record['counters']
+    counters[name] = counters.get(name, 0) + n
+
+
+def record_name(record):
+    """
+    json file name for a finished record
+
+    Parameters
+    ----------
+    record : dict
+        output of finish_record
+
+    Returns
+    -------
+    fname : str
+        $REFL_CODE/Files/station/timing/tool_year_doy.json
+
+    """
+    xdir = os.environ['REFL_CODE'] + '/Files/' + record['station'] + '/timing/'
+    return xdir + '{0:s}_{1:04d}_{2:03d}.json'.format(record['tool'], record['year'], record['doy'])
+
+
+def write_json(fname, d):
+    """
+    writes a dictionary to a json file, making the directory if needed
+
+    Parameters
+    ----------
+    fname : str
+        file name
+    d : dict
+        contents
+
+    """
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with open(fname, 'w') as fid:
+        json.dump(d, fid, indent=2)
+
+
+def finish_record():
+    """
+    closes the current record and sends it to the callback (if one was given to enable),
+    otherwise it is written to $REFL_CODE/Files/station/timing/
+
+    Returns
+    -------
+    record : dict or None
+        station, year, doy, tool, start (unix time), total (seconds), stages (seconds)
+        and counters. None if there was no current record
+
+    """
+    global _record, _last
+    if _record is None:
+        return None
+    record = _record
+    _record = None
+    record['total'] = time.perf_counter() - record.pop('t0')
+    if _callback is not None:
+        _callback(record)
+    else:
+        try:
+            write_json(record_name(record), record)
+        except (OSError, KeyError) as e:
+            print('Could not save the timing record', e)
+    _last = record
+
+    return record
+
+
+def take_last():
+    """
+    returns the most recently finished record and forgets it, so it is not
+    reported twice
+
+    Returns
+    -------
+    record : dict or None
+
+    """
+    global _last
+    record = _last
+    _last = None
+    return record
+
+
+def summarize(records):
+    """
+    adds up the stage times and counters of many records
+
+    Parameters
+    ----------
+    records : list of dict
+        output of finish_record
+
+    Returns
+    -------
+    summary : dict
+        ndays, total (seconds), stages (seconds) and counters
+
+    """
+    summary = {'ndays': 0, 'total': 0.0, 'stages': {}, 'counters': {}}
+    for record in records:
+        if record is None:
+            continue
+        summary['ndays'] += 1
+        summary['total'] += record['total']
+        for key, value in record['stages'].items():
+            summary['stages'][key] = summary['stages'].get(key, 0.0) + value
+        for key, value in record['counters'].items():
+            summary['counters'][key] = summary['counters'].get(key, 0) + value
+
+    return summary
+
+
+def print_summary(summary):
+    """
+    prints the time spent in each stage, biggest first, and the counters
+
+    Parameters
+    ----------
+    summary : dict
+        output of summarize
+
+    """
+    if summary['ndays'] == 0:
+        return
+    total = summary['total']
+    print('Time by stage for', summary['ndays'], 'days (seconds, percent of total)')
+    for key, value in sorted(summary['stages'].items(), key=lambda s: s[1], reverse=True):
+        print('{0:>16s} {1:10.2f} {2:6.1f}%'.format(key, value, 100*value/max(total, 1e-9)))
+    print('{0:>16s} {1:10.2f}'.format('total', total))
+    for key, value in sorted(summary['counters'].items()):
+        print('{0:>16s} {1:10d}'.format(key, int(value)))
@@ -9,6 +9,7 @@ from scipy.interpolate import interp1d
 
 import gnssrefl.gps as g
 import gnssrefl.decipher_argt as gt
+from gnssrefl.read_snr_files import remove_snr_cache
 
 #Last modified Feb 22, 2023 by Taylor Smith (git: tasmi) for additional constellation support
 
@@ -844,6 +845,7 @@ def run_nmea2snr(station, year_list, doy_list, isnr, overwrite, dec, llh, sp3, g
                     if gzip:
                         if not snrfile.endswith('.gz'):
                             subprocess.call(['gzip', snrfile])
+                            remove_snr_cache(snrfile)
                             print('SNR file gzip compressed')
                 else:
                     print('NMEA file '+ locdir + r +' does not exist')
@@ -0,0 +1,410 @@
+import datetime
+import json
+import os
+import re
+
+import gnssrefl.gps as g
+
+# catalog of the orbit files stored under $ORBITS (yyyy/nav and yyyy/sp3).
+# It is a json file, $ORBITS/orbit_catalog.json, with one entry per directory:
+# the modification time of the directory and, for each orbit file in it, the
+# analysis center, the latency (broadcast, final, rapid or ultra) and the date.
+# A directory is only scanned again when its modification time changes, i.e.
+# when files were added, removed or renamed.  The catalog is never trusted
+# blindly - a file it names is checked before it is used, and a missing entry
+# just means the usual search (gps.get_orbits_setexe) is done.
+
+CATALOG_VERSION = 1
+
+# latency of the products with old-style (lowercase) names
+_short_latency = {'igs': 'final', 'igr': 'rapid', 'gfz': 'final', 'esa': 'final', 'jax': 'final',
+                  'grg': 'final', 'gbm': 'rapid', 'gfu': 'ultra', 'wum': 'ultra', 'sha': 'rapid'}
+_long_latency = {'FIN': 'final', 'RAP': 'rapid', 'ULT': 'ultra', 'ULA': 'ultra'}
+
+_nav_re = re.compile(r'^([a-z0-9]{4})(\d{3})0\.(\d{2})n(\.xz|\.gz|\.Z)?$')
+_short_re = re.compile(r'^([a-z]{3})(\d{4})(\d)(_\d{2})?\.sp3(\.xz|\.gz|\.Z)?$')
+_long_re = re.compile(r'^([A-Z0-9]{3})\d[A-Z]{3}([A-Z]{3})_(\d{4})(\d{3})\d{4}_01D_\d{2}[MS]_ORB\.SP3(\.xz|\.gz)?$')
+
+# the catalog of this process, see catalog()
+_catalog = None
+
+
+def catalog_name():
+    """
+    name of the orbit catalog
+
+    Returns
+    -------
+    fname : str
+        $ORBITS/orbit_catalog.json
+
+    """
+    return os.environ['ORBITS'] + '/orbit_catalog.json'
+
+
+def parse_orbit_name(fname):
+    """
+    reads the center, latency and date from the name of an orbit file
+
+    Parameters
+    ----------
+    fname : str
+        file name (without directory), e.g. auto0200.23n, gbm22452.sp3 or
+        GFZ0MGXRAP_20230200000_01D_05M_ORB.SP3.gz
+
+    Returns
+    -------
+    entry : list or None
+        center (e.g. gfz, auto), latency (broadcast, final, rapid, ultra or unknown),
+        year and day of year. None if it is not the name of an orbit file
+
+    """
+    m = _nav_re.match(fname)
+    if m:
+        yy = int(m.group(3))
+        year = 2000 + yy if yy < 80 else 1900 + yy
+        return [m.group(1), 'broadcast', year, int(m.group(2))]
+    m = _short_re.match(fname)
+    if m:
+        d = datetime.date(1980,1,6) + datetime.timedelta(weeks=int(m.group(2)), days=int(m.group(3)))
+        return [m.group(1), _short_latency.get(m.group(1), 'unknown'), d.year, d.timetuple().tm_yday]
+    m = _long_re.match(fname)
+    if m:
+        return [m.group(1).lower(), _long_latency.get(m.group(2), 'unknown'), int(m.group(3)), int(m.group(4))]
+
+    return None
+
+
+def scan_dir(xdir):
+    """
+    finds the orbit files in a directory
+
+    Parameters
+    ----------
+    xdir : str
+        directory name
+
+    Returns
+    -------
+    files : dict
+        entry (see parse_orbit_name) of each orbit file, by file name
+
+    """
+    files = {}
+    with os.scandir(xdir) as it:
+        for e in it:
+            entry = parse_orbit_name(e.name)
+            if (entry is not None) and e.is_file():
+                files[e.name] = entry
+
+    return files
+
+
+def update_catalog(cat=None):
+    """
+    brings a catalog up to date, scanning only the directories of $ORBITS that
+    are new or have changed since they were last scanned. The catalog file is
+    written if anything changed
+
+    Parameters
+    ----------
+    cat : dict, optional
+        catalog to update. default is the catalog file (or an empty catalog)
+
+    Returns
+    -------
+    cat : dict
+        version, orbits (the $ORBITS directory) and dirs, the entry of each yyyy/nav
+        and yyyy/sp3 directory: its modification time and its files (see scan_dir)
+
+    """
+    if cat is None:
+        cat = read_catalog()
+    orbits = os.environ['ORBITS']
+    dirs = {}
+    changed = False
+    if os.path.isdir(orbits):
+        with os.scandir(orbits) as it:
+            years = sorted(e.name for e in it if (len(e.name) == 4) and e.name.isdigit() and e.is_dir())
+        for cyyyy in years:
+            for sub in ['nav', 'sp3']:
+                key = cyyyy + '/' + sub
+                try:
+                    mtime = os.stat(orbits + '/' + key).st_mtime_ns
+                except OSError:
+                    continue
+                old = cat['dirs'].get(key)
+                if (old is not None) and (old['mtime'] == mtime):
+                    dirs[key] = old
+                else:
+                    dirs[key] = {'mtime': mtime, 'files': scan_dir(orbits + '/' + key)}
+                    changed = True
+    if set(dirs) != set(cat['dirs']):
+        changed = True
+    cat = {'version': CATALOG_VERSION, 'orbits': orbits, 'dirs': dirs}
+    if changed:
+        write_catalog(cat)
+
+    return cat
+
+
+def read_catalog():
+    """
+    reads the catalog file
+
+    Returns
+    -------
+    cat : dict
+        see update_catalog. Empty if there is no catalog file or it cannot be used
+
+    """
+    empty = {'version': CATALOG_VERSION, 'dirs': {}}
+    try:
+        with open(catalog_name()) as fid:
+            cat = json.load(fid)
+    except (OSError, ValueError):
+        return empty
+    if (not isinstance(cat, dict)) or (cat.get('version') != CATALOG_VERSION) or ('dirs' not in cat):
+        return empty
+
+    return cat
+
+
+def write_catalog(cat):
+    """
+    writes the catalog file.  A catalog that cannot be written is not an error,
+    the orbit files are just searched for again next time
+
+    Parameters
+    ----------
+    cat : dict
+        see update_catalog
+
+    Returns
+    -------
+    success : bool
+        whether the catalog was written
+
+    """
+    fname = catalog_name()
+    tmpfile = fname + '.' + str(os.getpid())
+    try:
+        with open(tmpfile, 'w') as fid:
+            json.dump(cat, fid)
+        os.replace(tmpfile, fname)
+    except OSError:
+        if os.path.isfile(tmpfile):
+            os.remove(tmpfile)
+        return False
+
+    return True
+
+
+def catalog(refresh=False):
+    """
+    catalog of this process. It is read (and updated) the first time it is needed,
+    and again if $ORBITS changes
+
+    Parameters
+    ----------
+    refresh : bool, optional
+        update it again, default is False
+
+    Returns
+    -------
+    cat : dict
+        see update_catalog
+
+    """
+    global _catalog
+    if (_catalog is None) or (_catalog.get('orbits') != os.environ['ORBITS']):
+        _catalog = update_catalog()
+    elif refresh:
+        _catalog = update_catalog(_catalog)
+
+    return _catalog
+
+
+def orbits_by_day(cat=None):
+    """
+    what is available for each day
+
+    Parameters
+    ----------
+    cat : dict, optional
+        see update_catalog. default is the catalog of this process
+
+    Returns
+    -------
+    days : dict
+        for each (year, doy), a list of the orbit files for that day:
+        file name, directory, center and latency
+
+    """
+    if cat is None:
+        cat = catalog()
+    orbits = os.environ['ORBITS']
+    days = {}
+    for key, d in cat['dirs'].items():
+        for name, (center, latency, year, doy) in d['files'].items():
+            days.setdefault((year, doy), []).append((name, orbits + '/' + key, center, latency))
+
+    return days
+
+
+def local_names(orbtype, year, doy):
+    """
+    names of the uncompressed orbit files that gps.get_orbits_setexe would use for a day,
+    in the order it looks for them
+
+    Parameters
+    ----------
+    orbtype : str
+        orbit source, e.g. nav, gbm, rapid
+    year : int
+        full year
+    doy : int
+        day of year
+
+    Returns
+    -------
+    names : list of tuples or None
+        subdirectory (yyyy/nav or yyyy/sp3) and file name. None for an orbit
+        type that is not known here
+
+    """
+    d = g.doy2ymd(year, doy)
+    cyyyy = str(year); cdoy = '{:03d}'.format(doy); cyy = cyyyy[2:4]
+    nav = cyyyy + '/nav'; sp3 = cyyyy + '/sp3'
+    shortname = lambda pCtr: g.sp3_name(year, d.month, d.day, pCtr)[0]
+    longname = lambda prefix, smp: prefix + '_' + cyyyy + cdoy + '0000_01D_' + smp + '_ORB.SP3'
+    mgex = {'gbm': ('GFZ0MGXRAP', '05M'), 'wum': ('WUM0MGXULT', '05M'),
+            'grg': ('GRG0MGXFIN', '15M'), 'jax': ('JAX0MGXFIN', '05M')}
+    if ('nav' in orbtype) or (orbtype == 'test'):
+        return [(nav, 'auto' + cdoy + '0.' + cyy + 'n')]
+    if orbtype in mgex:
+        # getsp3file_mgex prefers the long name
+        return [(sp3, longname(*mgex[orbtype])), (sp3, shortname(orbtype))]
+    if orbtype in ['gfr', 'rapid']:
+        if (year + doy/365.25) < (2021 + 137/365.25):
+            return []
+        return [(sp3, shortname('gfz'))]
+    if orbtype in ['gnss3', 'gnss-gfz']:
+        return [(sp3, shortname('gbm')), (sp3, longname('GFZ0MGXRAP', '05M'))]
+    if orbtype == 'sp3':
+        return [(sp3, shortname('igs'))]
+    if orbtype in ['gfz', 'igr', 'igs', 'esa']:
+        return [(sp3, shortname(orbtype))]
+    if orbtype == 'wum2':
+        return [(sp3, longname('WUM0MGXULT', '05M'))]
+    if orbtype == 'ultra':
+        if (year + doy/365.25) < (2021 + 137/365.25):
+            return []
+        return [(sp3, shortname('gfu')[:-4] + '_00.sp3')]
+
+    return None
+
+
+def find_orbit(orbtype, year, doy, cat=None):
+    """
+    looks for the orbit file of a day in the catalog
+
+    Parameters
+    ----------
+    orbtype : str
+        orbit source, e.g. nav, gbm, rapid
+    year : int
+        full year
+    doy : int
+        day of year
+    cat : dict, optional
+        see update_catalog. default is the catalog of this process
+
+    Returns
+    -------
+    f : str or None
+        name of the orbit file. None if the catalog does not have it (uncompressed)
+    orbdir : str or None
+        its directory
+
+    """
+    if cat is None:
+        cat = catalog()
+    names = local_names(orbtype, year, doy)
+    if names is None:
+        return None, None
+    for key, name in names:
+        d = cat['dirs'].get(key)
+        if (d is not None) and (name in d['files']):
+            return name, os.environ['ORBITS'] + '/' + key
+
+    return None, None
+
+
+def add_orbit(f, orbdir):
+    """
+    adds an orbit file to the catalog of this process (and the catalog file)
+
+    Parameters
+    ----------
+    f : str
+        orbit file name
+    orbdir : str
+        its directory
+
+    """
+    entry = parse_orbit_name(f)
+    key = os.path.relpath(orbdir, os.environ['ORBITS'])
+    cat = catalog()
+    if (entry is None) or (key not in cat['dirs']):
+        # a new directory, which the next update scans
+        return
+    cat['dirs'][key]['files'][f] = entry
+    write_catalog(cat)
+
+
+def get_orbits_setexe(year,month,day,orbtype,fortran):
+    """
+    same as gps.get_orbits_setexe, but the orbit file is looked for in the catalog
+    first. Only the days that are not in it are searched for (and downloaded)
+    by gps.get_orbits_setexe
+
+    Parameters
+    ----------
+    year : int
+        full year
+    month : int
+        calendar month
+    day : int
+        calendar day
+    orbtype : str
+        orbit source, e.g. nav, gps...
+    fortran : bool
+        whether you are using fortran code for translation
+
+    Returns
+    -------
+    foundit : bool
+        whether orbit file was found
+    f : str
+        name of the orbit file
+    orbdir : str
+        location of the orbit file
+    snrexe : str
+        location of SNR executable. only relevant for fortran users
+
+    """
+    doy = g.ymd2ch(year, month, day)[2]
+    f, orbdir = find_orbit(orbtype, year, doy)
+    if (f is not None) and os.path.isfile(orbdir + '/' + f):
+        if ('nav' in orbtype):
+            snrexe = g.gpsSNR_version()
+        else:
+            snrexe = g.gnssSNR_version()
+        g.warn_and_exit(snrexe,fortran)
+        return True, f, orbdir, snrexe
+    foundit, f, orbdir, snrexe = g.get_orbits_setexe(year,month,day,orbtype,fortran)
+    if foundit and os.path.isfile(orbdir + '/' + f):
+        add_orbit(f, orbdir)
+
+    return foundit, f, orbdir, snrexe
@@ -10,6 +10,7 @@ import gnssrefl.read_snr_files as read_snr
 from gnssrefl.utils import FileManagement, FileTypes
 import gnssrefl.daily_avg_cl as da
 import gnssrefl.gnssir_v2 as gnssir
+import gnssrefl.time_arrays as ta
 
 from functools import partial
 from scipy import optimize
@@ -355,7 +356,7 @@ def phase_tracks(station, year, doy, snr_type, fr_list, e1, e2, pele, plot, scre
 
 
     # get the SNR filename
-    obsfile, obsfilecmp, snrexist = g.define_and_xz_snr(station, year, doy, snr_type)
+    obsfile, obsfilecmp, snrexist = g.define_and_xz_snr(station, year, doy, snr_type, uncompress=False)
 
     # noise region - hardwired for normal sites ~ 2-3 meters tall
     noise_region = [0.5, 8]
@@ -449,8 +450,8 @@ def phase_tracks(station, year, doy, snr_type, fr_list, e1, e2, pele, plot, scre
 
                                 result = [[year, doy, utctime, phase, nv, avg_azim, sat_number, amp, min_el, max_el, del_t, rh_apriori, freq, max_f, obs_pk2noise, max_amp]]
                                 np.savetxt(my_file, result, fmt="%4.0f %3.0f %6.2f %8.3f %5.0f %6.1f %3.0f %5.2f %5.2f %5.2f %6.2f %5.3f %2.0f %6.3f %6.2f %6.2f", comments="%")
-        # gzip SNR file if requested
-        if gzip:
+        # gzip SNR file if requested (and it was not already compressed)
+        if gzip and (read_snr.compression_type(obsfile) is None):
             subprocess.call(['gzip', obsfile])
 
 
@@ -570,7 +571,7 @@ def convert_phase(station, year, year_end=None, plt2screen=True,fr=20,tmin=0.05,
     months = avg_phase_results_requested[:, 6]
     days = avg_phase_results_requested[:, 7]
 
-    t = years + doys/365.25
+    t = ta.fractional_year(years, doys)
     tspan = t[-1] - t[0]
     print('>>> Timespan in years: ', np.round(tspan,3))
     if tspan < 1.5:
@@ -649,7 +650,7 @@ def convert_phase(station, year, year_end=None, plt2screen=True,fr=20,tmin=0.05,
     plt.suptitle(f'Station: {station}', size=16)
 
     # list comprehension to make datetime objects from year, doy
-    t_datetime = [datetime.strptime(f'{int(yr)} {int(d)}', '%Y %j') for yr, d in zip(years, doys)]
+    t_datetime = ta.obstimes(years, doys)
 
     # create subplots: 2 rows 1 column, 1st subplot
     ax = plt.subplot(2, 1, 1)
@@ -666,8 +667,8 @@ def convert_phase(station, year, year_end=None, plt2screen=True,fr=20,tmin=0.05,
 
 
     # More descriptive variable names would help 
-    st = nodes[:, 0] + nodes[:, 1]/365.25
-    st_datetime = [datetime.strptime(f'{int(yr)} {int(d)}', '%Y %j') for yr, d in zip(nodes[:, 0], nodes[:, 1])]
+    st = ta.fractional_year(nodes[:, 0], nodes[:, 1])
+    st_datetime = ta.obstimes(nodes[:, 0], nodes[:, 1])
     sp = nodes[:, 2]
 
     howmanynodes = len(sp)
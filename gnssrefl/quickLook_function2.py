@@ -135,7 +135,7 @@ def quickLook_function(station, year, doy, snr_type,f,e1,e2,minH,maxH,reqAmp,pel
     pltname = 'temp.png' # default plot
     requireAmp = reqAmp[0]
 
-    obsfile, obsfileCmp, snre =  g.define_and_xz_snr(station,year,doy,snr_type)
+    obsfile, obsfileCmp, snre =  g.define_and_xz_snr(station,year,doy,snr_type,uncompress=False)
     allGood, snrD, nrows, ncols = gnssir_v2.read_snr(obsfile)
 
     if allGood == 0:
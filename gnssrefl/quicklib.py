@@ -5,9 +5,9 @@ import numpy as np
 import os
 import subprocess
 import sys
-from astropy.time import Time
 
 import gnssrefl.gps as g
+import gnssrefl.time_arrays as ta
 
 def trans_time(tvd, ymd, ymdhm, convert_mjd, ydoy ,xcol,ycol,utc_offset):
     """
@@ -57,16 +57,11 @@ def trans_time(tvd, ymd, ymdhm, convert_mjd, ydoy ,xcol,ycol,utc_offset):
         sys.exit()
 
     if ymd :
-        for i in range(0,len(tvd)):
-            bigT = datetime.datetime(year=int(tvd[i,0]), month=int(tvd[i,1]), day=int(tvd[i,2]) )
-            tval.append(bigT)
-            yval.append( tvd[i,ycol])
+        tval = ta.ymd_obstimes(tvd[:,0], tvd[:,1], tvd[:,2])
+        yval = tvd[:,ycol]
     elif ymdhm:
-        for i in range(0,len(tvd)):
-            bigT = datetime.datetime(year=int(tvd[i,0]), month=int(tvd[i,1]), 
-                                     day=int(tvd[i,2]), hour=int(tvd[i,3]), minute=int(tvd[i,4]), second=0)
-            tval.append(bigT)
-            yval.append( tvd[i,ycol])
+        tval = ta.ymd_obstimes(tvd[:,0], tvd[:,1], tvd[:,2], tvd[:,3], tvd[:,4])
+        yval = tvd[:,ycol]
     else:
         if convert_mjd:
             mm = tvd[:,xcol]
@@ -74,15 +69,10 @@ def trans_time(tvd, ymd, ymdhm, convert_mjd, ydoy ,xcol,ycol,utc_offset):
                 if utc_offset != 0:
                     print('Apply local time offset')
                     mm = mm + utc_offset*3600/86400
-            t1 = Time(mm,format='mjd')
-            t1_utc = t1.utc # change to UTC
-            #if utc_offset is not None:
-
-            # probably can be done in one step!
-            tval =  t1_utc.datetime # change to datetime
+            tval =  ta.mjd_to_obstimes(mm) # change to datetime
             yval = tvd[:,ycol] # save the y values
         elif ydoy:
-            tval = tvd[:,0]  + tvd[:,1]/365.25
+            tval = ta.fractional_year(tvd[:,0], tvd[:,1])
             yval = tvd[:,ycol]
             ii = np.argsort( tval)
             tval = tval[ii]; yval=yval[ii]
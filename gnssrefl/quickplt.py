@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import argparse
-from astropy.time import Time
 import datetime
 import matplotlib.pyplot as plt
 import numpy as np
@@ -10,6 +9,7 @@ import sys
 
 import gnssrefl.quicklib as q
 import gnssrefl.gps as g
+import gnssrefl.time_arrays as ta
 
 from gnssrefl.utils import validate_input_datatypes, str2bool
 
@@ -299,12 +299,7 @@ def run_quickplt (filename: str, xcol: int, ycol: int, errorcol: int=None, mjd:
     if len(xlimits) == 2:
         print('found x-axis limits')
         if convert_mjd:
-            t1 = Time(xlimits[0],format='mjd')
-            t1_utc = t1.utc # change to UTC
-            tval1 =  t1_utc.datetime # change to datetime
-            t2 = Time(xlimits[1],format='mjd')
-            t2_utc = t2.utc # change to UTC
-            tval2 =  t2_utc.datetime # change to datetime
+            tval1, tval2 = ta.mjd_to_obstimes(xlimits) # change to datetime
             plt.xlim((tval1,tval2))
             if utc_offset is not None:
                 cc = '{:02d}'.format(abs(utc_offset)) + ':00'
@@ -1,9 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import contextlib
+import glob
+import gzip
+import lzma
 import numpy as np
 import os
+import shutil
 import subprocess 
 import sys
+import warnings
+
+import gnssrefl.instrument as instrument
+
+# version of the binary SNR cache layout. bump it if the layout changes
+SNR_CACHE_VERSION = 3
 
 def read_snr_multiday(obsfile,obsfile2,twoDays,dec=1):
     """
@@ -156,6 +167,305 @@ def read_snr_multiday(obsfile,obsfile2,twoDays,dec=1):
         s8 =  np.hstack((Ps1,Qs8))
     return  allGood1,sat,ele,azi,t,edot,s1,s2,s5,s6,s7,s8,snrE
 
+def snr_cache_name(obsfile):
+    """
+    name of the binary cache file kept next to a SNR file
+
+    Parameters
+    ----------
+    obsfile : str
+        SNR file name, e.g. p0410150.21.snr66
+
+    Returns
+    -------
+    cachefile : str
+        the cache name, e.g. p0410150.21.snr66.npy
+
+    """
+    return obsfile + '.npy'
+
+def compression_type(obsfile):
+    """
+    kind of compression of a SNR file, from its name
+
+    Parameters
+    ----------
+    obsfile : str
+        SNR file name
+
+    Returns
+    -------
+    kind : str or None
+        'gz', 'xz' or None if the file is not compressed
+
+    """
+    if obsfile.endswith('.gz'):
+        return 'gz'
+    if obsfile.endswith('.xz'):
+        return 'xz'
+    return None
+
+@contextlib.contextmanager
+def open_snr(obsfile, parallel=False):
+    """
+    opens a SNR file for reading, uncompressing gzip and xz files as they are
+    read, so nothing is written to disk
+
+    Parameters
+    ----------
+    obsfile : str
+        SNR file name, can end in .gz or .xz
+    parallel : bool, optional
+        use pigz (gzip) or xz -T0 (xz) to uncompress, if they are installed.
+        default is False, which uses the python gzip and lzma modules
+
+    Returns
+    -------
+    fid : text file object
+
+    """
+    kind = compression_type(obsfile)
+    cmd = None
+    if parallel:
+        if (kind == 'gz') and (shutil.which('pigz') is not None):
+            cmd = ['pigz', '-dc', obsfile]
+        elif (kind == 'xz') and (shutil.which('xz') is not None):
+            cmd = ['xz', '-T0', '-dc', obsfile]
+    if cmd is not None:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        try:
+            yield proc.stdout
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+        if returncode != 0:
+            raise OSError('could not uncompress ' + obsfile)
+    else:
+        if kind == 'gz':
+            fid = gzip.open(obsfile, 'rt')
+        elif kind == 'xz':
+            fid = lzma.open(obsfile, 'rt')
+        else:
+            fid = open(obsfile, 'r')
+        with fid:
+            yield fid
+
+def read_snr_text(obsfile, parallel=False):
+    """
+    parses a SNR text file.  uses the fast numpy reader and falls back to genfromtxt
+    for files it cannot handle. gzip and xz files are read without
+    uncompressing them on disk
+
+    Parameters
+    ----------
+    obsfile : str
+        SNR file name
+    parallel : bool, optional
+        use a parallel decompressor for compressed files, see open_snr
+
+    Returns
+    -------
+    f : numpy array of floats
+        contents of the SNR file, always two dimensional
+
+    """
+    try:
+        with open_snr(obsfile, parallel) as fid, warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            f = np.loadtxt(fid,comments='%',ndmin=2)
+    except ValueError:
+        with open_snr(obsfile, parallel) as fid:
+            f = np.genfromtxt(fid,comments='%')
+        f = np.atleast_2d(f)
+
+    return f
+
+def write_snr_cache(obsfile, f=None):
+    """
+    writes the binary cache for a SNR file.  The cache is a .npy file whose first
+    row is a small header (negative cache version, size and modification time of the
+    SNR file, number of rows), followed by the contents of the SNR file as 64 bit
+    floats, i.e. exactly what the text file is parsed into
+
+    Parameters
+    ----------
+    obsfile : str
+        SNR file name
+    f : numpy array of floats, optional
+        contents of the SNR file, if they have already been read
+
+    Returns
+    -------
+    success : bool
+        whether the cache was written
+
+    """
+    if f is None:
+        f = read_snr_text(obsfile)
+    r,c = f.shape
+    # the header needs four columns. SNR files always have more than that
+    if (r == 0) or (c < 4):
+        return False
+    st = os.stat(obsfile)
+    header = np.zeros((1,c))
+    header[0,0:4] = [-SNR_CACHE_VERSION, st.st_size, st.st_mtime, r]
+    cachefile = snr_cache_name(obsfile)
+    tmpfile = cachefile + '.' + str(os.getpid())
+    try:
+        with open(tmpfile, 'wb') as fout:
+            np.save(fout, np.vstack((header, np.asarray(f, dtype=float))))
+        os.replace(tmpfile, cachefile)
+    except OSError:
+        # read-only archive or full disk. not fatal - the cache is only a convenience
+        if os.path.isfile(tmpfile):
+            os.remove(tmpfile)
+        return False
+
+    return True
+
+def read_snr_cache(obsfile):
+    """
+    memory maps the binary cache for a SNR file, if it exists and is current, i.e.
+    the SNR file has the size and modification time stored in the cache header
+
+    Parameters
+    ----------
+    obsfile : str
+        SNR file name
+
+    Returns
+    -------
+    f : numpy array of floats or None
+        contents of the SNR file (read-only). None if there is no valid cache
+
+    """
+    cachefile = snr_cache_name(obsfile)
+    if not os.path.isfile(cachefile):
+        return None
+    try:
+        a = np.load(cachefile, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if (a.ndim != 2) or (a.shape[0] == 0) or (a.shape[1] < 4) or (a.dtype != np.float64):
+        return None
+    st = os.stat(obsfile)
+    version, size, mtime, r = a[0,0:4]
+    if (version != -SNR_CACHE_VERSION) or (size != st.st_size) or (mtime != st.st_mtime) or (r != a.shape[0]-1):
+        return None
+    # a cache hit counts as a use when the cache is pruned (evict_snr_cache)
+    try:
+        os.utime(cachefile)
+    except OSError:
+        pass
+
+    return a[1:,:]
+
+def remove_snr_cache(obsfile):
+    """
+    deletes the binary cache of a SNR file, e.g. when the file is compressed and
+    the cache no longer belongs to a file that exists. A cache of the older .npz
+    layout (obsfile + '.npz') is deleted as well
+
+    Parameters
+    ----------
+    obsfile : str
+        SNR file name
+
+    """
+    for cachefile in [snr_cache_name(obsfile), obsfile + '.npz']:
+        if os.path.isfile(cachefile):
+            try:
+                os.remove(cachefile)
+            except OSError:
+                pass
+
+def evict_snr_cache(station, budget_mb, keep=None):
+    """
+    prunes the binary SNR caches of a station in $REFL_CODE/yyyy/snr/ssss.
+    Caches whose SNR file is gone and caches of the old layout are always deleted,
+    then the least recently used ones until the rest is within the size budget.
+    A budget of 0 deletes all of them
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    budget_mb : float
+        size budget of the caches of the station in MB
+    keep : str, optional
+        a cache file that should not be deleted
+
+    """
+    xdir = os.environ.get('REFL_CODE', '.')
+    files = []
+    for sdir in glob.glob(xdir + '/[0-9][0-9][0-9][0-9]/snr/' + station):
+        for name in os.listdir(sdir):
+            if ('.snr' not in name) or (name[-4:] not in ['.npz', '.npy']):
+                continue
+            cachefile = sdir + '/' + name
+            # .npz caches are from an older layout and are no longer read
+            if name.endswith('.npz') or (not os.path.isfile(cachefile[:-4])):
+                if cachefile != keep:
+                    try:
+                        os.remove(cachefile)
+                    except OSError:
+                        pass
+                continue
+            st = os.stat(cachefile)
+            files.append((st.st_mtime, st.st_size, cachefile))
+    total = sum(f[1] for f in files)
+    # oldest first. a cache hit updates the modification time
+    for mtime, size, cachefile in sorted(files):
+        if total <= budget_mb*1e6:
+            break
+        if cachefile == keep:
+            continue
+        try:
+            os.remove(cachefile)
+            total -= size
+        except OSError:
+            pass
+
+def load_snr(obsfile, usecache=False, parallel=False):
+    """
+    loads the contents of a SNR file.  With usecache, a current binary cache 
+    is read if there is one, otherwise the text file is parsed and the cache is written
+    so the next read is fast.  Edits to the SNR file (a new size or modification time)
+    invalidate the cache. See evict_snr_cache for pruning the caches
+
+    Parameters
+    ----------
+    obsfile : str
+        SNR file name
+    usecache : bool, optional
+        whether to read and write the binary cache. default is False
+    parallel : bool, optional
+        use a parallel decompressor for gzip and xz files, see open_snr
+
+    Returns
+    -------
+    f : numpy array of floats
+        contents of the SNR file, always two dimensional
+
+    """
+    if usecache:
+        f = read_snr_cache(obsfile)
+        if f is not None:
+            instrument.count('snr_cache_hits')
+            instrument.count('rows_read', f.shape[0])
+            instrument.count('bytes_read', os.path.getsize(snr_cache_name(obsfile)))
+            return f
+    f = read_snr_text(obsfile, parallel)
+    instrument.count('rows_read', f.shape[0])
+    instrument.count('bytes_read', os.path.getsize(obsfile))
+    if usecache:
+        write_snr_cache(obsfile, f)
+
+    return f
+
 def read_one_snr(obsfile,ifile):
     """
     reads a SNR file, changes units (linear) and stores as variables
@@ -201,7 +511,7 @@ def read_one_snr(obsfile,ifile):
 #
 
     snrE = np.array([False, True, True,False,False,True,True,True,True],dtype = bool)
-    f = np.genfromtxt(obsfile,comments='%')
+    f = load_snr(obsfile)
     #print('reading from this snr file ',obsfile)
     r,c = f.shape
     if (r > 0) & (c > 0):
@@ -286,7 +596,8 @@ def read_one_snr(obsfile,ifile):
 
 def compress_snr_files(wantCompression, obsfile, obsfile2,TwoDays,gzip):
     """
-    compresses SNR files
+    compresses SNR files. A binary cache of a file that is compressed
+    is moved to the compressed file (see compress_snr_file)
 
     Parameters
     ----------
@@ -304,13 +615,114 @@ def compress_snr_files(wantCompression, obsfile, obsfile2,TwoDays,gzip):
     """
     if gzip:
         if (os.path.isfile(obsfile) == True):
-            subprocess.call(['gzip', obsfile])
+            compress_snr_file(obsfile, 'gzip')
         if (os.path.isfile(obsfile2) == True and twoDays == True):
-            subprocess.call(['gzip', obsfile2])
+            compress_snr_file(obsfile2, 'gzip')
     else:
         # this is only for xz compression
         if wantCompression:
             if (os.path.isfile(obsfile) == True):
-                subprocess.call(['xz', obsfile])
+                compress_snr_file(obsfile, 'xz')
             if (os.path.isfile(obsfile2) == True and twoDays == True):
-                subprocess.call(['xz', obsfile2])
+                compress_snr_file(obsfile2, 'xz')
+
+def compress_snr_file(obsfile, program):
+    """
+    compresses a SNR file with gzip or xz.  If the file has a current binary cache,
+    it is rewritten for the compressed file, any other cache of the file is deleted,
+    so no cache is left behind for a file that no longer exists
+
+    Parameters
+    ----------
+    obsfile : str
+        SNR file name
+    program : str
+        gzip or xz
+
+    """
+    f = read_snr_cache(obsfile)
+    if f is not None:
+        # a copy, the memory mapped cache is deleted below
+        f = np.array(f)
+    subprocess.call([program, obsfile])
+    remove_snr_cache(obsfile)
+    newfile = obsfile + ('.gz' if program == 'gzip' else '.xz')
+    if (f is not None) and os.path.isfile(newfile):
+        write_snr_cache(newfile, f)
+
+class SNRIndex:
+    """
+    SNR file contents sorted by satellite and time, with the row offsets for each
+    satellite and a validity bitmask for each column.  This is made once per day so
+    that the satellite/frequency loops in gnssir do not have to search the whole
+    SNR array to pull out one satellite or to find the zeros in an SNR column.
+
+    Parameters
+    ----------
+    snrD : numpy array (multiD)
+        contents of the snr file, i.e. 0 column is satellite numbers, 1 column elevation angle ...
+
+    """
+
+    def __init__(self, snrD):
+        r,c = snrD.shape
+        # sort by satellite and then time. lexsort is stable, so epochs with identical
+        # time tags stay in the order of the file
+        ij = np.lexsort((snrD[:,3], snrD[:,0]))
+        self.data = snrD[ij,:]
+        self.nrows = r
+        self.ncols = c
+
+        # row offsets for each satellite
+        sats, starts, counts = np.unique(self.data[:,0], return_index=True, return_counts=True)
+        self.offsets = {}
+        for sat, start, count in zip(sats.astype(int), starts, counts):
+            self.offsets[sat] = (start, start + count)
+
+        # bit icol is set when column icol has a positive value, the test window_new used
+        self.valid = np.zeros(r, dtype=np.uint32)
+        for icol in range(min(c,32)):
+            self.valid |= (self.data[:,icol] > 0).astype(np.uint32) << np.uint32(icol)
+
+    def satellite(self, satNu):
+        """
+        all the observations for one satellite, sorted by time
+
+        Parameters
+        ----------
+        satNu : int
+            satellite number
+
+        Returns
+        -------
+        thissat : numpy array (multiD)
+            rows of the SNR array for this satellite. This is a view, not a copy.
+            Empty if the satellite is not in the file.
+        validbits : numpy array of uint32
+            column validity bitmask for these rows. See valid_column
+
+        """
+        if satNu in self.offsets:
+            s,e = self.offsets[satNu]
+        else:
+            s,e = 0,0
+        return self.data[s:e,:], self.valid[s:e]
+
+def valid_column(validbits, icol):
+    """
+    translates the SNRIndex validity bitmask into a boolean array for one column
+
+    Parameters
+    ----------
+    validbits : numpy array of uint32
+        validity bitmask from SNRIndex
+    icol : int
+        python column number in the SNR file
+
+    Returns
+    -------
+    good : numpy array of bool
+        whether the column has a positive value in each row
+
+    """
+    return (validbits & np.uint32(1 << icol)) != 0
@@ -0,0 +1,255 @@
+import numpy as np
+import os
+import sqlite3
+import time
+import warnings
+
+from concurrent.futures import ThreadPoolExecutor
+
+import gnssrefl.gps as g
+
+# optional consolidated store of the gnssir results of a station (gnssir, subdaily
+# and daily_avg use it with -results_store T). The daily text files
+# ($REFL_CODE/yyyy/results/ssss/extension/ddd.txt) are still the results; the store
+# is a sqlite table with the parsed contents of each day, keyed by (year, doy), and
+# the size and modification time of the text file it came from.  A day whose text
+# file changed (or that is not in the store yet) is parsed again and stored, so the
+# store never gives anything but the contents of the text files.
+
+# threads used to read the result files that are not in the store yet. Reading
+# them is mostly waiting on the file system, so this does not depend on the cpus
+PARSE_THREADS = 8
+
+
+def store_name(station, extension):
+    """
+    name of the sqlite file with the gnssir results of a station
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    extension : str
+        strategy extension, default is ''
+
+    Returns
+    -------
+    fname : str
+        $REFL_CODE/Files/station/extension/gnssir_results.db
+
+    """
+    xdir = os.environ['REFL_CODE']
+    if len(extension) > 0:
+        return xdir + '/Files/' + station + '/' + extension + '/gnssir_results.db'
+    else:
+        return xdir + '/Files/' + station + '/gnssir_results.db'
+
+
+def open_store(station, extension):
+    """
+    opens (and creates if needed) the results store of a station
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    extension : str
+        strategy extension, default is ''
+
+    Returns
+    -------
+    conn : sqlite3 connection
+
+    """
+    g.checkFiles(station, extension)
+    # the timeout lets parallel gnssir processes wait for each other's writes
+    conn = sqlite3.connect(store_name(station, extension), timeout=60)
+    conn.execute('CREATE TABLE IF NOT EXISTS days (year INTEGER, doy INTEGER, fsize INTEGER, fmtime REAL, '
+            'nrows INTEGER, ncols INTEGER, data BLOB, updated REAL, PRIMARY KEY (year, doy))')
+    return conn
+
+
+def results_dir(station, year, extension):
+    """
+    directory of the daily gnssir result files
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    year : int
+        full year
+    extension : str
+        strategy extension, default is ''
+
+    Returns
+    -------
+    direc : str
+        $REFL_CODE/yyyy/results/station/extension/
+
+    """
+    return os.environ['REFL_CODE'] + '/' + str(year) + '/results/' + station + '/' + extension + '/'
+
+
+def read_result_text(fname):
+    """
+    parses a daily gnssir result file
+
+    Parameters
+    ----------
+    fname : str or list of str
+        result file name, or the lines written to it
+
+    Returns
+    -------
+    a : numpy array of floats or None
+        one row per reflector height, always two dimensional. None if the
+        file cannot be read
+
+    """
+    try:
+        # trying to turn off the annoying empty file warnings
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            a = np.loadtxt(fname,comments='%',ndmin=2)
+    except (OSError, ValueError):
+        return None
+    if a.shape[0] == 0:
+        a = np.empty(shape=[0, 0])
+
+    return a
+
+
+def _put(conn, year, doy, st, a):
+    """
+    stores the contents of a result file, with the os.stat of the file
+    """
+    nr, nc = a.shape
+    conn.execute('INSERT OR REPLACE INTO days VALUES (?,?,?,?,?,?,?,?)',
+            (year, doy, st.st_size, st.st_mtime, nr, nc, np.ascontiguousarray(a, dtype=float).tobytes(), time.time()))
+
+
+def store_day(station, year, doy, extension, fname=None, lines=None):
+    """
+    puts the result file of a day into the store (or replaces it). gnssir calls this
+    after it writes a day, so readers do not have to parse the text file.
+    Problems with the store are printed, they do not stop gnssir
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    year : int
+        full year
+    doy : int
+        day of year
+    extension : str
+        strategy extension, default is ''
+    fname : str, optional
+        result file, default is the one given by gps.LSPresult_name
+    lines : list of str, optional
+        the result lines written to the file. They are stored without
+        reading the file again. Default is to parse the file
+
+    """
+    if fname is None:
+        fname = results_dir(station, year, extension) + '{0:03d}.txt'.format(doy)
+    try:
+        st = os.stat(fname)
+        a = read_result_text(fname if lines is None else lines)
+        if a is None:
+            return
+        conn = open_store(station, extension)
+        _put(conn, year, doy, st, a)
+        conn.commit()
+        conn.close()
+    except (OSError, sqlite3.Error) as e:
+        print('Could not put the results into the store', e)
+
+
+def load_results(station, extension, year, doy1=1, doy2=366, usestore=False):
+    """
+    reads the daily gnssir result files of a year, with one query of the store.
+    Days that are not in the store, or whose text file changed since they
+    were stored, are parsed and stored
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    extension : str
+        strategy extension, default is ''
+    year : int
+        full year
+    doy1 : int, optional
+        first day of year, default is 1
+    doy2 : int, optional
+        last day of year, default is 366
+    usestore : bool, optional
+        whether to use the store, default is False, i.e. every file is parsed
+
+    Returns
+    -------
+    days : list of tuples
+        for each result file, sorted by day of year: the file name (ddd.txt),
+        the full file name and its contents (see read_result_text)
+
+    """
+    direc = results_dir(station, year, extension)
+    if not os.path.isdir(direc):
+        return []
+    names = sorted(f for f in os.listdir(direc) if (len(f) == 7) and (f[3:7] == '.txt') and f[0:3].isdigit())
+    names = [f for f in names if (int(f[0:3]) >= doy1) and (int(f[0:3]) <= doy2)]
+    conn = None
+    stored = {}
+    if usestore and (len(names) > 0):
+        try:
+            conn = open_store(station, extension)
+            rows = conn.execute('SELECT doy, fsize, fmtime, nrows, ncols, data FROM days WHERE year=? AND doy>=? AND doy<=?',
+                    (year, doy1, doy2)).fetchall()
+            stored = {row[0]: row[1:] for row in rows}
+        except sqlite3.Error as e:
+            print('Could not read the results store', e)
+            conn = None
+    days = []
+    # the days that are not in the store (or changed) are parsed in parallel
+    toparse = []
+    for f in names:
+        doy = int(f[0:3])
+        fname = direc + f
+        try:
+            st = os.stat(fname)
+        except OSError:
+            continue
+        row = stored.get(doy)
+        if (row is not None) and (row[0] == st.st_size) and (row[1] == st.st_mtime):
+            a = np.frombuffer(row[4], dtype=float).reshape(row[2], row[3]).copy()
+        else:
+            a = None
+            toparse.append((len(days), doy, st))
+        days.append((f, fname, a))
+
+    changed = False
+    if len(toparse) > 0:
+        fnames = [days[i][1] for i, doy, st in toparse]
+        with ThreadPoolExecutor(max_workers=min(PARSE_THREADS, len(toparse))) as pool:
+            parsed = list(pool.map(read_result_text, fnames))
+        for (i, doy, st), a in zip(toparse, parsed):
+            days[i] = (days[i][0], days[i][1], a)
+            if (a is not None) and (conn is not None):
+                try:
+                    _put(conn, year, doy, st, a)
+                    changed = True
+                except sqlite3.Error as e:
+                    print('Could not update the results store', e)
+                    conn.close()
+                    conn = None
+    if conn is not None:
+        try:
+            if changed:
+                conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print('Could not update the results store', e)
+
+    return days
@@ -1,10 +1,14 @@
+import collections
+import concurrent.futures
 import datetime
 import matplotlib.pyplot as plt
+import multiprocessing
 import numpy as np
 import os
 from scipy.interpolate import interp1d
 import subprocess
 import sys
+import threading
 import time
 
 
@@ -16,6 +20,9 @@ import gnssrefl.gps as g
 import gnssrefl.rinpy as rinpy
 import gnssrefl.karnak_libraries as k
 import gnssrefl.highrate as ch
+import gnssrefl.instrument as instrument
+import gnssrefl.orbit_catalog as orbit_catalog
+import gnssrefl.read_snr_files as snr
 
 # fortran codes for translating RINEX
 import gnssrefl.gpssnr as gpssnr
@@ -57,16 +64,24 @@ def quickname(station,year,cyy, cdoy, csnr):
 
     return fname
 
+# days fetched at the same time can need the same orbit file
+_orbit_lock = threading.Lock()
+# orbits read once and used by the translating processes of rinex2snr_stations_day
+_shared_orbits = None
+
+
 def run_rinex2snr(station, year_list, doy_list, isnr, orbtype, rate,dec_rate,archive,fortran,nol,overwrite,translator,srate,
-        mk,skipit,stream,strip,bkg,screenstats,gzip):
+        mk,skipit,stream,strip,bkg,screenstats,gzip,sp3_interp='quadratic',rinex_cache=0,par=None,prefetch=2,
+        snr_cache=0):
     """
     main code to convert RINEX files into SNR files 
 
     Parameters
     ----------
-    station : str
+    station : str or list of str
         4 or 9 character station name. 6 ch allowed for japanese archive
-        9 means it is a RINEX 3 file
+        9 means it is a RINEX 3 file. For a list of stations, the orbits of 
+        each day are read once for all of them (see rinex2snr_stations_day)
 
     year_list : list of int
         years to be analyzed
@@ -128,12 +143,105 @@ def run_rinex2snr(station, year_list, doy_list, isnr, orbtype, rate,dec_rate,arc
 
     gzip: bool
          whether SNR files are gzipped after creation
+
+    sp3_interp : str, optional
+         how the python translator interpolates sp3 orbits, quadratic (default) or lagrange
+
+    rinex_cache : float, optional
+         size budget (MB) of the parsed RINEX cache used by the python translator.
+         default is 0, no cache
+
+    par : int, optional
+         number of processes that translate days in parallel (see run_rinex2snr_pipeline),
+         or stations for a list of stations. -99 uses one per CPU. default is None, 
+         one after another
+
+    prefetch : int, optional
+         in parallel mode, the number of days whose files are downloaded ahead of the translation.
+         default is 2
+
+    snr_cache : float, optional
+         size budget (MB) of the binary copies of the SNR files read by gnssir 
+         (see read_snr_files.load_snr). default is 0, none are written
     """
     #
     # do not allow illegal skipit values
     if skipit < 1:
         skipit = 1
 
+    if isinstance(station, str):
+        names = [station_names(station, archive, mk)]
+    else:
+        names = [station_names(s, archive, mk) for s in station]
+    station, station9ch, version = names[0]
+
+    year_st = year_list[0]
+    year_end = year_list[-1]
+
+    doy_st = doy_list[0]
+    doy_end = doy_list[-1]
+
+# loop thru years and days
+    days = []
+    for year in year_list:
+        ann = g.make_nav_dirs(year)
+        cyyyy = str(year)
+        dec31 = g.dec31(year)
+        if year != year_end:
+            doy_en = dec31
+        else:
+            doy_en = doy_end
+
+        if year == year_st:
+            doy_list = list(range(doy_st, doy_en+1,skipit))
+        else:
+            doy_list = list(range(1, doy_en+1,skipit))
+
+        for doy in doy_list:
+            days.append((year, doy))
+
+    opts = {'station': station, 'station9ch': station9ch, 'version': version, 'isnr': isnr, 'orbtype': orbtype,
+            'rate': rate, 'dec_rate': dec_rate, 'archive': archive, 'fortran': fortran, 'nol': nol,
+            'overwrite': overwrite, 'translator': translator, 'srate': srate, 'mk': mk, 'stream': stream,
+            'strip': strip, 'bkg': bkg, 'screenstats': screenstats, 'sp3_interp': sp3_interp,
+            'rinex_cache': rinex_cache, 'snr_cache': snr_cache}
+    if len(names) > 1:
+        for year, doy in days:
+            rinex2snr_stations_day(names, year, doy, opts, par)
+    elif par:
+        run_rinex2snr_pipeline(days, opts, par, prefetch)
+    else:
+        for year, doy in days:
+            rinex2snr_day(year, doy, opts)
+    if snr_cache > 0:
+        for name in names:
+            snr.evict_snr_cache(name[0], snr_cache)
+
+
+def station_names(station, archive, mk):
+    """
+    station names used for the RINEX files of a station
+
+    Parameters
+    ----------
+    station : str
+        4, 6 (japanese archive) or 9 (RINEX 3) character station name
+    archive : str
+        choice of GNSS archive
+    mk : bool
+        makan option, keeps the case of the station name
+
+    Returns
+    -------
+    station : str
+        4 character station name
+    station9ch : str or None
+        9 character station name, None for RINEX 2
+    version : int
+        RINEX version, 2 or 3
+
+    """
+    station9ch = None
     NS = len(station)
     if (NS == 4):
         version = 2
@@ -155,227 +263,473 @@ def run_rinex2snr(station, year_list, doy_list, isnr, orbtype, rate,dec_rate,arc
         print('Illegal station input - Station must have 4,6,or 9 characters. Exiting')
         sys.exit()
 
-    year_st = year_list[0]
-    year_end = year_list[-1]
+    return station, station9ch, version
 
-    doy_st = doy_list[0]
-    doy_end = doy_list[-1]
 
-# loop thru years and days
-    for year in year_list:
-        ann = g.make_nav_dirs(year)
-        cyyyy = str(year)
-        dec31 = g.dec31(year)
-        if year != year_end:
-            doy_en = dec31
+def rinex2snr_stations_day(names, year, doy, opts, par=None):
+    """
+    makes the SNR files of many stations for one day. The orbit file is found once and,
+    for the python translator, read and interpolated once (see load_orbits) instead of 
+    once per station. The RINEX files are found (or downloaded) one station at a time 
+    and translated right away, or by par processes that share the orbits.
+
+    Parameters
+    ----------
+    names : list of tuples
+        station, station9ch and version of each station (see station_names)
+    year : int
+        full year
+    doy : int
+        day of year
+    opts : dict
+        see rinex2snr_day. The station names in it are not used
+    par : int, optional
+        number of translating processes. -99 uses one per CPU. default is None, 
+        one station after another
+
+    """
+    global _shared_orbits
+    if (doy > g.dec31(year)):
+        return
+    d = g.doy2ymd(year,doy)
+    t1 = time.time()
+    foundit, f, orbdir, snrexe = orbit_catalog.get_orbits_setexe(year,d.month,d.day,opts['orbtype'],opts['fortran'])
+    if not foundit:
+        print('The orbit file you requested does not exist.', year, doy)
+        return
+    # the fortran translator reads the orbit file itself
+    if opts['translator'] == 'python':
+        print('Reading the orbit file once for', len(names), 'stations:', orbdir + '/' + f)
+        _shared_orbits = load_orbits(orbdir + '/' + f, opts['sp3_interp'])
+    module = hybrid_module(opts['orbtype'])
+    if (opts['translator'] == 'hybrid') and (module is not gpssnr) and hasattr(module, 'loadsp3'):
+        # sp3 files stay in the memory of the fortran translator (and of the processes forked below)
+        print('Reading the orbit file once for', len(names), 'stations:', orbdir + '/' + f)
+        if not os.path.isdir('logs'):
+            os.makedirs('logs', exist_ok=True)
+        load_hybrid_sp3(module, orbdir + '/' + f, 'logs/' + names[0][0] + '_hybrid_error.txt')
+    if (par == -99):
+        par = multiprocessing.cpu_count()
+    pool = None
+    if par and (par > 1) and (len(names) > 1):
+        if 'fork' in multiprocessing.get_all_start_methods():
+            # the orbits are inherited by the processes rather than copied to each of them
+            ctx = multiprocessing.get_context('fork')
         else:
-            doy_en = doy_end
+            ctx = multiprocessing.get_context()
+        pool = ctx.Pool(min(par, len(names)), initializer=_share_orbits, initargs=(_shared_orbits,))
+        print('Using', min(par, len(names)), 'translating processes for', len(names), 'stations')
+
+    made = []; nofile = []
+    waiting = collections.deque()
+    for station, station9ch, version in names:
+        sopts = dict(opts, station=station, station9ch=station9ch, version=version)
+        try:
+            job = rinex2snr_day(year, doy, sopts, fetchonly=True)
+        except SystemExit:
+            # some of the checks exit when a file is not what was expected
+            job = None
+        if job is None:
+            nofile.append(station)
+            continue
+        if pool is None:
+            waiting.append((station, _station_translate(job)))
+        else:
+            waiting.append((station, pool.apply_async(_station_translate, (job,))))
+        # at most 2*par RINEX files are waiting to be translated
+        while waiting and ((pool is None) or (len(waiting) > 2*par)):
+            _station_store(waiting.popleft(), pool, made, nofile)
+    while waiting:
+        _station_store(waiting.popleft(), pool, made, nofile)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    _shared_orbits = None
+    if (opts['translator'] == 'fortran') and os.path.isfile(orbdir + '/' + f):
+        # every station has been translated, so the orbit file can be compressed
+        subprocess.call(['xz', orbdir + '/' + f])
+
+    print('SNR files made for {0:d} of {1:d} stations for {2:d}:{3:03d} in {4:.1f} seconds'.format(len(made), len(names), year, doy, time.time()-t1))
+    if len(nofile) > 0:
+        print('No SNR file made (or it already existed) for', ' '.join(nofile))
+
+
+def _share_orbits(orbits):
+    """
+    sets the orbits used by the translating processes of rinex2snr_stations_day
+    """
+    global _shared_orbits
+    _shared_orbits = orbits
 
-        if year == year_st:
-            doy_list = list(range(doy_st, doy_en+1,skipit))
+
+def _station_translate(job):
+    """
+    translates one station for rinex2snr_stations_day, with the shared orbits
+    """
+    instrument.start_record(job['station'], job['year'], job['doy'], 'rinex2snr')
+    for name, seconds in job['times'].items():
+        instrument.add_time(name, seconds)
+    job = translate_day(job, _shared_orbits)
+    instrument.finish_record()
+
+    return job
+
+
+def _station_store(waiting, pool, made, nofile):
+    """
+    waits for the translation of a station (rinex2snr_stations_day) and stores the SNR file
+    """
+    station, job = waiting
+    if pool is not None:
+        try:
+            job = job.get()
+        except Exception as e:
+            print('Problem translating', station, ':', e)
+            job = None
+    if job is None:
+        nofile.append(station)
+    else:
+        store_day(job)
+        made.append(station)
+
+
+def rinex2snr_day(year, doy, opts, fetchonly=False, logname=None):
+    """
+    makes the SNR file for one day: finds (or downloads) the RINEX file and the orbits
+    and translates them
+
+    Parameters
+    ----------
+    year : int
+        full year
+    doy : int
+        day of year
+    opts : dict
+        inputs of run_rinex2snr (station, station9ch, version, isnr, orbtype, rate, dec_rate, archive,
+        fortran, nol, overwrite, translator, srate, mk, stream, strip, bkg, screenstats, sp3_interp, rinex_cache,
+        snr_cache)
+    fetchonly : bool, optional
+        stop once the RINEX and orbit files are ready (see conv2snr). default is False
+    logname : str, optional
+        log file for the translation, default is logs/station.txt
+
+    Returns
+    -------
+    job : dict or None
+        only for fetchonly, the files that are ready to be translated (see fetch_day_files)
+
+    """
+    station = opts['station']; station9ch = opts['station9ch']; version = opts['version']
+    isnr = opts['isnr']; orbtype = opts['orbtype']; rate = opts['rate']; dec_rate = opts['dec_rate']
+    archive = opts['archive']; fortran = opts['fortran']; nol = opts['nol']; overwrite = opts['overwrite']
+    translator = opts['translator']; srate = opts['srate']; mk = opts['mk']; stream = opts['stream']
+    strip = opts['strip']; bkg = opts['bkg']; screenstats = opts['screenstats']
+    sp3_interp = opts['sp3_interp']; rinex_cache = opts['rinex_cache']; snr_cache = opts.get('snr_cache', 0)
+    job = None
+    dec31 = g.dec31(year)
+    cyyyy = str(year)
+    csnr = str(isnr)
+    cdoy = '{:03d}'.format(doy)
+    if (year<2000):
+        cyy = '{:02d}'.format(year-1900)
+    else:
+        cyy = '{:02d}'.format(year-2000)
+    # first, check to see if the SNR file exists
+    fname =  quickname(station,year,cyy,cdoy,csnr)
+    # now it unzips if that version exists
+    snre = g.snr_exist(station,year,doy,csnr)
+    if snre:
+        if overwrite:
+            print('File exists, ', fname, ' and you requested overwriting, so will delete existing file')
+            if os.path.isfile(fname):
+                subprocess.call(['rm', fname]); 
+            if os.path.isfile(fname + '.gz'):
+                subprocess.call(['rm', fname + '.gz']); 
+            snre = False
         else:
-            doy_list = list(range(1, doy_en+1,skipit))
+            print('SNR file already exists', fname, '\n')
+    else:
+        print('SNR file does not already exist. Which means I will try to make it.')
+
+
+    illegal_day = False
+    if (doy > dec31):
+        illegal_day = True
+
+    if (not illegal_day) and (not snre):
+        if not fetchonly:
+            instrument.start_record(station, year, doy, 'rinex2snr')
+        r = station + cdoy + '0.' + cyy + 'o'
+        rgz = station + cdoy + '0.' + cyy + 'o.gz'
+        localpath2 =  os.environ['REFL_CODE'] + '/' + cyyyy + '/rinex/' + station + '/'
+        if nol:
+            current_local = os.getcwd()
+            print('Will first assume RINEX file ', station, ' year:', year, ' doy:', doy, 'is located here :', current_local)
+            # this assumes RINEX file is in local directory or "nearby"
+            if version == 2:
+
+                if mk:
+                    the_makan_option(station,cyyyy,cyy,cdoy) # looks everywhere in your local directories
+                if not os.path.exists(r):
+                    print('Did not find the plain observation file, so now trying other names/directories')
+                    # could try this way? - look for file in localpath2. gunzip if necessary
+                    allgood = get_local_rinexfile(r,localpath2)
+                if os.path.exists(r):
+                    rinext =float(np.loadtxt(r,usecols=0,dtype='str',max_rows=1))
+                    print('Apparent Rinex version', rinext)
+                    if (rinext != 2.11):
+                        print('Your file is not RINEX v2.11 which is what you told the code it was. Exiting')
+                        sys.exit()
 
-        for doy in doy_list:
-            csnr = str(isnr)
-            cdoy = '{:03d}'.format(doy)
-            if (year<2000):
-                cyy = '{:02d}'.format(year-1900)
-            else:
-                cyy = '{:02d}'.format(year-2000)
-            # first, check to see if the SNR file exists
-            fname =  quickname(station,year,cyy,cdoy,csnr)
-            # now it unzips if that version exists
-            snre = g.snr_exist(station,year,doy,csnr)
-            if snre:
-                if overwrite:
-                    print('File exists, ', fname, ' and you requested overwriting, so will delete existing file')
-                    if os.path.isfile(fname):
-                        subprocess.call(['rm', fname]); 
-                    if os.path.isfile(fname + '.gz'):
-                        subprocess.call(['rm', fname + '.gz']); 
-                    snre = False
+                    if screenstats:
+                        print('Found the RINEX 2.11 file', r)
+                    if strip:
+                        if screenstats:
+                            print('Testing out stripping the RINEX 2 file here')
+                        k.strip_rinexfile(r)
+                    job = conv2snr(year, doy, station, isnr, orbtype,rate,dec_rate,archive,fortran,translator,sp3_interp,rinex_cache,fetchonly,logname,snr_cache)
                 else:
-                    print('SNR file already exists', fname, '\n')
-            else:
-                print('SNR file does not already exist. Which means I will try to make it.')
-
-
-            illegal_day = False
-            if (doy > dec31):
-                illegal_day = True
-
-            if (not illegal_day) and (not snre):
-                r = station + cdoy + '0.' + cyy + 'o'
-                rgz = station + cdoy + '0.' + cyy + 'o.gz'
-                localpath2 =  os.environ['REFL_CODE'] + '/' + cyyyy + '/rinex/' + station + '/'
-                if nol:
-                    current_local = os.getcwd()
-                    print('Will first assume RINEX file ', station, ' year:', year, ' doy:', doy, 'is located here :', current_local)
-                    # this assumes RINEX file is in local directory or "nearby"
-                    if version == 2:
-
-                        if mk:
-                            the_makan_option(station,cyyyy,cyy,cdoy) # looks everywhere in your local directories
-                        if not os.path.exists(r):
-                            print('Did not find the plain observation file, so now trying other names/directories')
-                            # could try this way? - look for file in localpath2. gunzip if necessary
-                            allgood = get_local_rinexfile(r,localpath2)
-                        if os.path.exists(r):
-                            rinext =float(np.loadtxt(r,usecols=0,dtype='str',max_rows=1))
-                            print('Apparent Rinex version', rinext)
-                            if (rinext != 2.11):
-                                print('Your file is not RINEX v2.11 which is what you told the code it was. Exiting')
-                                sys.exit()
+                    print('You Chose the No Look Option, but did not provide the needed RINEX file.')
+            if version == 3:
+                if rate == 'high':
+                    csrate = '01' # high rate assumes 1-sec
+                else:
+                    csrate = '{:02d}'.format(srate)
+                streamid = '_' + stream  + '_'
+                # this can be done in a function now ...
+                r3cmpgz = station9ch + streamid + str(year) + cdoy + '0000_01D_' + csrate + 'S_MO.crx.gz'
+                r3 = station9ch + streamid + str(year) + cdoy + '0000_01D_' + csrate + 'S_MO.rnx'
+                r3gz = station9ch + streamid + str(year) + cdoy + '0000_01D_' + csrate + 'S_MO.rnx.gz'
+                r2 = station + cdoy + '0.' + cyy + 'o'
+                if os.path.exists(r3cmpgz):
+                    if screenstats: 
+                        print('Try to translate', r3cmpgz)
+                    deletecrx = True
+                    translated, rnx_filename = go_from_crxgz_to_rnx(r3cmpgz,deletecrx)
+                if os.path.exists(r3gz):
+                    if screenstats: 
+                        print('Try to gunzip ', r3gz)
+                    subprocess.call(['gunzip', r3gz])
+
+                # have not found the rinex 3 file
+                if not os.path.exists(r3):
+                    local_rinex3_dir  = os.environ['REFL_CODE'] + '/' + cyyyy + '/rinex/' + station + '/'
+                    print('try looking for RINEX 3 in ', local_rinex3_dir)
+                    lrinex3 = local_rinex3_dir+r3
+                    if os.path.exists(lrinex3):
+                        subprocess.call(['cp', lrinex3, '.'])
+                    else:
+                        lrinex3 = local_rinex3_dir+r3cmpgz
+                        if os.path.exists(lrinex3):
+                            subprocess.call(['cp', lrinex3, '.']); 
+                            deletecrx = True
+                            translated, rnx_filename = go_from_crxgz_to_rnx(r3cmpgz,deletecrx)
+                if os.path.exists(r3):
+                    rinext =float(np.loadtxt(r3,usecols=0,dtype='str',max_rows=1))
+                    print('Apparent Rinex version', rinext)
+                    if (rinext < 3):
+                        print('Your file is not RINEX v3 or higher which is I was expecting. Exiting.')
+                        sys.exit()
+                    if screenstats: 
+                        print('The RINEX 3 file exists locally', r3)
+                    # convert to RINEX 2.11
+                    fexists = g.new_rinex3_rinex2(r3,r2,dec_rate)
+                    if fexists:
+                        job = conv2snr(year, doy, station, isnr, orbtype,rate,dec_rate,archive,fortran,translator,sp3_interp,rinex_cache,fetchonly,logname,snr_cache)
+                    else:
+                        print('Something about the RINEX 3-2 conversion did not work')
+                else:
+                    print('You Chose the No Look Option, but did not provide the needed RINEX3 file ', r3)
+                    print('I looked for files ending with rnx, rnx.gz, and crx.gz in the local directory')
+                    print('I looked for files ending with rnx and crx.gz in $REFL_CODE/YYYY/rinex for your station')
 
+        else:
+            if screenstats:
+                print('Will seek the RINEX file from an external archive')
+            if version == 3:
+                fexists = False
+                rnx_filename = '' # just in  case?
+                print(station9ch, ' year:', year, ' doy:', doy, 'from: ', archive)
+                r2 = station + cdoy + '0.' + cyy + 'o'
+                rinex2exists = False; rinex3name = '';
+                if (rate == 'high'):
+                    print('This code only accesses 1-Hz Rinex 3 data at BKG, CDDIS, and GA')
+                    if archive == 'ga':
+                        deleteOld = True
+                        # cold should return the new name of the rinex 2 file
+                        r2, foundit = g.ga_highrate(station9ch,year,doy,dec_rate,deleteOld)
+                        if foundit and screenstats:
+                            print('rinex2 file should now exist:', r2)
+                    if archive == 'cddis':
+                        bad_day = g.cddis_restriction(year, doy,'cddis')
+                        if not bad_day:
+                            rnx_filename,foundit = ch.cddis_highrate(station9ch, year, doy, 0,stream,dec_rate)
+                        else: 
+                            print('No high-rate RINEX data will be downloaded')
+                            foundit = False; fexists = False; rnx_file = ''
+                        if foundit:
                             if screenstats:
-                                print('Found the RINEX 2.11 file', r)
-                            if strip:
-                                if screenstats:
-                                    print('Testing out stripping the RINEX 2 file here')
-                                k.strip_rinexfile(r)
-                            conv2snr(year, doy, station, isnr, orbtype,rate,dec_rate,archive,fortran,translator)
-                        else:
-                            print('You Chose the No Look Option, but did not provide the needed RINEX file.')
-                    if version == 3:
-                        if rate == 'high':
-                            csrate = '01' # high rate assumes 1-sec
+                                print('The RINEX 3 file has been downloaded from CDDIS . Try to make ', r2)
+                            fexists = g.new_rinex3_rinex2(rnx_filename,r2,dec_rate)
+                    if archive == 'bkg':
+                        bad_day = g.cddis_restriction(year, doy,'bkg')
+                        if not bad_day:
+                            rnx_filename,foundit = ch.bkg_highrate(station9ch, year, doy, 0,stream,dec_rate,bkg)
                         else:
-                            csrate = '{:02d}'.format(srate)
-                        streamid = '_' + stream  + '_'
-                        # this can be done in a function now ...
-                        r3cmpgz = station9ch + streamid + str(year) + cdoy + '0000_01D_' + csrate + 'S_MO.crx.gz'
-                        r3 = station9ch + streamid + str(year) + cdoy + '0000_01D_' + csrate + 'S_MO.rnx'
-                        r3gz = station9ch + streamid + str(year) + cdoy + '0000_01D_' + csrate + 'S_MO.rnx.gz'
-                        r2 = station + cdoy + '0.' + cyy + 'o'
-                        if os.path.exists(r3cmpgz):
-                            if screenstats: 
-                                print('Try to translate', r3cmpgz)
-                            deletecrx = True
-                            translated, rnx_filename = go_from_crxgz_to_rnx(r3cmpgz,deletecrx)
-                        if os.path.exists(r3gz):
-                            if screenstats: 
-                                print('Try to gunzip ', r3gz)
-                            subprocess.call(['gunzip', r3gz])
-
-                        # have not found the rinex 3 file
-                        if not os.path.exists(r3):
-                            local_rinex3_dir  = os.environ['REFL_CODE'] + '/' + cyyyy + '/rinex/' + station + '/'
-                            print('try looking for RINEX 3 in ', local_rinex3_dir)
-                            lrinex3 = local_rinex3_dir+r3
-                            if os.path.exists(lrinex3):
-                                subprocess.call(['cp', lrinex3, '.'])
-                            else:
-                                lrinex3 = local_rinex3_dir+r3cmpgz
-                                if os.path.exists(lrinex3):
-                                    subprocess.call(['cp', lrinex3, '.']); 
-                                    deletecrx = True
-                                    translated, rnx_filename = go_from_crxgz_to_rnx(r3cmpgz,deletecrx)
-                        if os.path.exists(r3):
-                            rinext =float(np.loadtxt(r3,usecols=0,dtype='str',max_rows=1))
-                            print('Apparent Rinex version', rinext)
-                            if (rinext < 3):
-                                print('Your file is not RINEX v3 or higher which is I was expecting. Exiting.')
-                                sys.exit()
-                            if screenstats: 
-                                print('The RINEX 3 file exists locally', r3)
-                            # convert to RINEX 2.11
-                            fexists = g.new_rinex3_rinex2(r3,r2,dec_rate)
-                            if fexists:
-                                conv2snr(year, doy, station, isnr, orbtype,rate,dec_rate,archive,fortran,translator)
-                            else:
-                                print('Something about the RINEX 3-2 conversion did not work')
+                            print('No high-rate RINEX data will be downloaded')
+                            foundit = False; fexists = False; rnx_file = ''
+                        if foundit:
+                            if screenstats:
+                                print('The RINEX 3 file has been downloaded from the BKG and merged. Try to make ', r2)
+                            fexists = g.new_rinex3_rinex2(rnx_filename,r2,dec_rate)
+                    if archive == 'ignes':
+                        bad_day = g.cddis_restriction(year, doy,'bkg')
+                        if not bad_day:
+                            rnx_filename,foundit = ch.esp_highrate(station9ch, year, doy, 0,stream,dec_rate)
                         else:
-                            print('You Chose the No Look Option, but did not provide the needed RINEX3 file ', r3)
-                            print('I looked for files ending with rnx, rnx.gz, and crx.gz in the local directory')
-                            print('I looked for files ending with rnx and crx.gz in $REFL_CODE/YYYY/rinex for your station')
+                            print('No high-rate RINEX data will be downloaded')
+                            foundit = False; fexists = False; rnx_file = ''
+                        if foundit:
+                            if screenstats:
+                                print('The RINEX 3 file has been downloaded from IGN ES and merged. Try to make ', r2)
+                            fexists = g.new_rinex3_rinex2(rnx_filename,r2,dec_rate)
 
                 else:
-                    if screenstats:
-                        print('Will seek the RINEX file from an external archive')
-                    if version == 3:
-                        fexists = False
-                        rnx_filename = '' # just in  case?
-                        print(station9ch, ' year:', year, ' doy:', doy, 'from: ', archive)
-                        r2 = station + cdoy + '0.' + cyy + 'o'
-                        rinex2exists = False; rinex3name = '';
-                        if (rate == 'high'):
-                            print('This code only accesses 1-Hz Rinex 3 data at BKG, CDDIS, and GA')
-                            if archive == 'ga':
-                                deleteOld = True
-                                # cold should return the new name of the rinex 2 file
-                                r2, foundit = g.ga_highrate(station9ch,year,doy,dec_rate,deleteOld)
-                                if foundit and screenstats:
-                                    print('rinex2 file should now exist:', r2)
-                            if archive == 'cddis':
-                                bad_day = g.cddis_restriction(year, doy,'cddis')
-                                if not bad_day:
-                                    rnx_filename,foundit = ch.cddis_highrate(station9ch, year, doy, 0,stream,dec_rate)
-                                else: 
-                                    print('No high-rate RINEX data will be downloaded')
-                                    foundit = False; fexists = False; rnx_file = ''
-                                if foundit:
-                                    if screenstats:
-                                        print('The RINEX 3 file has been downloaded from CDDIS . Try to make ', r2)
-                                    fexists = g.new_rinex3_rinex2(rnx_filename,r2,dec_rate)
-                            if archive == 'bkg':
-                                bad_day = g.cddis_restriction(year, doy,'bkg')
-                                if not bad_day:
-                                    rnx_filename,foundit = ch.bkg_highrate(station9ch, year, doy, 0,stream,dec_rate,bkg)
-                                else:
-                                    print('No high-rate RINEX data will be downloaded')
-                                    foundit = False; fexists = False; rnx_file = ''
-                                if foundit:
-                                    if screenstats:
-                                        print('The RINEX 3 file has been downloaded from the BKG and merged. Try to make ', r2)
-                                    fexists = g.new_rinex3_rinex2(rnx_filename,r2,dec_rate)
-                            if archive == 'ignes':
-                                bad_day = g.cddis_restriction(year, doy,'bkg')
-                                if not bad_day:
-                                    rnx_filename,foundit = ch.esp_highrate(station9ch, year, doy, 0,stream,dec_rate)
-                                else:
-                                    print('No high-rate RINEX data will be downloaded')
-                                    foundit = False; fexists = False; rnx_file = ''
-                                if foundit:
-                                    if screenstats:
-                                        print('The RINEX 3 file has been downloaded from IGN ES and merged. Try to make ', r2)
-                                    fexists = g.new_rinex3_rinex2(rnx_filename,r2,dec_rate)
+                    if (archive == 'all'):
+                        file_name,foundit = k.universal_all(station9ch, year, doy,srate,stream,screenstats)
+                        if (not foundit): # try again
+                            file_name,foundit = k.universal_all(station9ch, year, doy, srate,k.swapRS(stream),screenstats)
+                    else:
+                        #print('stream',stream)
+                        file_name,foundit = k.universal(station9ch, year, doy, archive,srate,stream)
+                        if (not foundit): # try again
+                            #print('stream',stream)
+                            file_name,foundit = k.universal(station9ch, year, doy, archive,srate,k.swapRS(stream))
+                    if foundit: # version 3 found - now need to gzip, then hatanaka decompress
+                        deletecrx = True # no point keeping this around
+                        translated, rnx_filename = go_from_crxgz_to_rnx(file_name,deletecrx)
+                    # now make rinex2
+                        if translated:
+                            if screenstats:
+                                print('The RINEX 3 file has been downloaded. Try to make ', r2)
+                            fexists = g.new_rinex3_rinex2(rnx_filename,r2,dec_rate)
+                            #subprocess.call(['rm', '-f',rnx_filename]) # rnx
+                # this means the rinex 2 version exists
+                if fexists:
+                     if screenstats:
+                         print('RINEX 2 created from v3', year, doy, ' Now remove RINEX 3 files and convert')
+                     subprocess.call(['rm', '-f',rnx_filename]) # rnx
+                     job = conv2snr(year, doy, station, isnr, orbtype,rate,dec_rate,archive,fortran,translator,sp3_interp,rinex_cache,fetchonly,logname,snr_cache)
+                else:
+                    print('Unsuccessful RINEX 3 retrieval/translation', year, doy)
+            else:
+                print(station, ' year:', year, ' doy:', doy, ' from: ', archive, ' rate:', rate, ' orb:', orbtype)
+                # this is rinex version 2 - finds rinex and converts it
+                job = conv2snr(year, doy, station, isnr, orbtype,rate,dec_rate,archive,fortran,translator,sp3_interp,rinex_cache,fetchonly,logname,snr_cache)
+        if not fetchonly:
+            instrument.finish_record()
 
+    return job
+
+
+def run_rinex2snr_pipeline(days, opts, par, prefetch=2):
+    """
+    makes the SNR files for many days in three stages that run at the same time:
+    a few threads find (or download) the RINEX and orbit files of the coming days,
+    a pool of processes translates them, and a thread moves and gzips the SNR files.
+    At most par + prefetch days are between download and the end of their translation,
+    so the RINEX files on disk are bounded no matter how many days are requested.
+
+    Parameters
+    ----------
+    days : list of (int, int)
+        year and day of year
+    opts : dict
+        see rinex2snr_day
+    par : int
+        number of translating processes. -99 uses one per CPU
+    prefetch : int, optional
+        number of days downloaded ahead of the translation. default is 2
+
+    """
+    if len(days) == 0:
+        return
+    if (par == -99):
+        par = multiprocessing.cpu_count()
+    par = max(1, min(par, len(days)))
+    prefetch = max(1, prefetch)
+    limit = par + prefetch
+    nfetch = min(prefetch, 4)
+    os.makedirs('logs', exist_ok=True)
+    print('Using', par, 'translating processes and', nfetch, 'download threads for', len(days), 'days')
+
+    t1 = time.time()
+    pending = collections.deque(days)
+    active = {}
+    ondisk = 0
+    made = []; nofile = []
+    with concurrent.futures.ProcessPoolExecutor(par) as translators:
+        # start the translating processes before there are any other threads
+        translators.submit(int).result()
+        with concurrent.futures.ThreadPoolExecutor(nfetch) as fetchers, \
+             concurrent.futures.ThreadPoolExecutor(1) as writer:
+            while pending or active:
+                while pending and (ondisk < limit):
+                    year, doy = pending.popleft()
+                    active[fetchers.submit(_pipeline_fetch, year, doy, opts)] = ('fetch', year, doy)
+                    ondisk += 1
+                done, notdone = concurrent.futures.wait(active, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    stage, year, doy = active.pop(future)
+                    try:
+                        job = future.result()
+                    except Exception as e:
+                        print('Problem in the', stage, 'stage for', year, doy, ':', e)
+                        job = None
+                    if stage != 'write':
+                        if (stage == 'translate') or (job is None):
+                            ondisk -= 1
+                        if job is None:
+                            nofile.append((year, doy))
+                        elif stage == 'fetch':
+                            active[translators.submit(_pipeline_translate, job)] = ('translate', year, doy)
                         else:
-                            if (archive == 'all'):
-                                file_name,foundit = k.universal_all(station9ch, year, doy,srate,stream,screenstats)
-                                if (not foundit): # try again
-                                    file_name,foundit = k.universal_all(station9ch, year, doy, srate,k.swapRS(stream),screenstats)
-                            else:
-                                #print('stream',stream)
-                                file_name,foundit = k.universal(station9ch, year, doy, archive,srate,stream)
-                                if (not foundit): # try again
-                                    #print('stream',stream)
-                                    file_name,foundit = k.universal(station9ch, year, doy, archive,srate,k.swapRS(stream))
-                            if foundit: # version 3 found - now need to gzip, then hatanaka decompress
-                                deletecrx = True # no point keeping this around
-                                translated, rnx_filename = go_from_crxgz_to_rnx(file_name,deletecrx)
-                            # now make rinex2
-                                if translated:
-                                    if screenstats:
-                                        print('The RINEX 3 file has been downloaded. Try to make ', r2)
-                                    fexists = g.new_rinex3_rinex2(rnx_filename,r2,dec_rate)
-                                    #subprocess.call(['rm', '-f',rnx_filename]) # rnx
-                        # this means the rinex 2 version exists
-                        if fexists:
-                             if screenstats:
-                                 print('RINEX 2 created from v3', year, doy, ' Now remove RINEX 3 files and convert')
-                             subprocess.call(['rm', '-f',rnx_filename]) # rnx
-                             conv2snr(year, doy, station, isnr, orbtype,rate,dec_rate,archive,fortran,translator)
-                        else:
-                            print('Unsuccessful RINEX 3 retrieval/translation', year, doy)
+                            active[writer.submit(store_day, job)] = ('write', year, doy)
                     else:
-                        print(station, ' year:', year, ' doy:', doy, ' from: ', archive, ' rate:', rate, ' orb:', orbtype)
-                        # this is rinex version 2 - finds rinex and converts it
-                        conv2snr(year, doy, station, isnr, orbtype,rate,dec_rate,archive,fortran,translator)
+                        made.append((year, doy))
+
+    print('SNR files made for {0:d} of {1:d} days in {2:.1f} seconds'.format(len(made), len(days), time.time()-t1))
+    if len(nofile) > 0:
+        print('No SNR file made (or it already existed) for', ' '.join(['{0:d}:{1:03d}'.format(y, d) for y, d in sorted(nofile)]))
+
+
+def _pipeline_fetch(year, doy, opts):
+    """
+    download stage of run_rinex2snr_pipeline. Each day has its own log file
+    """
+    logname = 'logs/{0:s}_{1:04d}_{2:03d}.txt'.format(opts['station'], year, doy)
+    try:
+        return rinex2snr_day(year, doy, opts, fetchonly=True, logname=logname)
+    except SystemExit:
+        # some of the checks exit when a file is not what was expected
+        return None
 
 
-def conv2snr(year, doy, station, option, orbtype,receiverrate,dec_rate,archive,fortran,translator):
+def _pipeline_translate(job):
+    """
+    translation stage of run_rinex2snr_pipeline, runs in a separate process
+    """
+    instrument.start_record(job['station'], job['year'], job['doy'], 'rinex2snr')
+    for name, seconds in job['times'].items():
+        instrument.add_time(name, seconds)
+    job = translate_day(job)
+    instrument.finish_record()
+
+    return job
+
+
+def conv2snr(year, doy, station, option, orbtype,receiverrate,dec_rate,archive,fortran,translator,sp3_interp='quadratic',rinex_cache=0,
+        fetchonly=False,logname=None,snr_cache=0):
     """
     convert RINEX files to SNR files
 
@@ -408,12 +762,64 @@ def conv2snr(year, doy, station, option, orbtype,receiverrate,dec_rate,archive,f
     translator : str
          hybrid, python, or fortran
 
+    sp3_interp : str, optional
+         sp3 orbit interpolation used by the python translator, quadratic (default)
+         or lagrange (9 point, as in the fortran translators)
+
+    rinex_cache : float, optional
+         size budget (MB) of the parsed RINEX cache used by the python translator.
+         default is 0, no cache
+
+    fetchonly : bool, optional
+         only get the orbit and RINEX files and return them (see fetch_day_files), so they
+         can be translated later. default is False
+
+    logname : str, optional
+         log file, default is logs/station.txt
+
+    snr_cache : float, optional
+         if positive, the binary copy of the SNR file read by gnssir is written 
+         (see read_snr_files.load_snr). default is 0
+
+    Returns
+    -------
+    job : dict or None
+         for fetchonly, the files that are ready to be translated. None otherwise
+
+    """
+    job = fetch_day_files(year, doy, station, option, orbtype,receiverrate,dec_rate,archive,fortran,translator,
+            sp3_interp,rinex_cache,logname,snr_cache)
+    if (job is None) or fetchonly:
+        return job
+    orbfile = job['orbfile']
+    job = translate_day(job)
+    if job is not None:
+        store_day(job)
+    if translator == 'fortran':
+        # the orbit file is compressed once nothing else needs it. Translations that share
+        # it (rinex2snr_stations_day) compress it at the end of the day and the pipeline
+        # (run_rinex2snr_pipeline) leaves it as it is
+        subprocess.call(['xz', orbfile])
+
+
+def fetch_day_files(year, doy, station, option, orbtype,receiverrate,dec_rate,archive,fortran,translator,
+        sp3_interp='quadratic',rinex_cache=0,logname=None,snr_cache=0):
+    """
+    first stage of conv2snr: gets the orbit file and the RINEX 2.11 file (and decimates
+    it with teqc for the fortran translator). The inputs are those of conv2snr
+
+    Returns
+    -------
+    job : dict or None
+        what translate_day needs, None if the orbit or the RINEX file is missing
+
     """
     screenstats = False # for now
     # define directory for the conversion executables
     if not os.path.isdir('logs'):
-        subprocess.call(['mkdir', 'logs'])
-    logname = 'logs/' + station + '.txt'
+        os.makedirs('logs', exist_ok=True)
+    if logname is None:
+        logname = 'logs/' + station + '.txt'
     log = open(logname, 'w+')
     log.write("Receiver rate: {0:5s} \n".format(receiverrate))
     log.write("Decimation rate: {0:3.0f} \n".format(dec_rate))
@@ -425,147 +831,362 @@ def conv2snr(year, doy, station, option, orbtype,receiverrate,dec_rate,archive,f
     cyy = str(year)[2:4]
     snrname_full =  quickname(station,year,cyy,cdoy,csnr)
     print('Creating ', snrname_full)
-    snrname_compressed = ''
-
-    # if it exists, you should not have gotten to this code...
-    snre = False
-    #snrname_full, snrname_compressed, snre = g.define_and_xz_snr(station,year,doy,option)
-    if (snre == True):
-        log.write("The snrfile already exists: {0:50s} \n".format(snrname_full))
-        print("The snrfile already exists: ", snrname_full)
+    times = {}
+
+    log.write("The snrfile does not exist: {0:50s} \n".format(snrname_full))
+    d = g.doy2ymd(year,doy);
+    month = d.month; day = d.day
+    # new function to do the whole orbit thing. Days fetched at the same time
+    # (run_rinex2snr_pipeline) can need the same orbit file, so one at a time
+    t1 = time.perf_counter()
+    with _orbit_lock:
+        foundit, f, orbdir, snrexe = orbit_catalog.get_orbits_setexe(year,month,day,orbtype,fortran)
+    times['orbits'] = time.perf_counter() - t1
+    instrument.add_time('orbits', times['orbits'])
+    # if you have the orbit file, you can get the rinex file. First lets define the expected names
+    print('Orbit file: ', orbdir + '/' + f)
+    if not foundit:
+        print('The orbit file you requested does not exist.')
+        log.close()
+        return None
+    # now you can look for a rinex file
+    rinexfile,rinexfiled = g.rinex_name(station, year, month, day)
+    # This goes to find the rinex file. I am changing it to allow
+    # an archive preference
+    t1 = time.perf_counter()
+    if receiverrate == 'high':
+        strip_snr = False # for now -
+        #print('trying to find highrate file')
+        file_name, foundit = k.rinex2_highrate(station, year, doy,archive,strip_snr)
     else:
-        log.write("The snrfile does not exist: {0:50s} \n".format(snrname_full))
-        d = g.doy2ymd(year,doy);
-        month = d.month; day = d.day
-        # new function to do the whole orbit thing
-        foundit, f, orbdir, snrexe = g.get_orbits_setexe(year,month,day,orbtype,fortran)
-        # if you have the orbit file, you can get the rinex file. First lets define the expected names
-        print('Orbit file: ', orbdir + '/' + f)
-        if foundit:
-            # now you can look for a rinex file
-            rinexfile,rinexfiled = g.rinex_name(station, year, month, day)
-            # This goes to find the rinex file. I am changing it to allow
-            # an archive preference
-            if receiverrate == 'high':
-                strip_snr = False # for now -
-                #print('trying to find highrate file')
-                file_name, foundit = k.rinex2_highrate(station, year, doy,archive,strip_snr)
-            else:
-                # added karnak librariies
-                if (archive == 'all'):
-                    foundrinex = False
-                    for archivechoice in ['unavco','sopac','sonel']:
-                        if (not foundrinex):
-                            file_name,foundrinex = k.universal_rinex2(station, year, doy, archivechoice,screenstats)
-                else:
-                    file_name,foundrinex = k.universal_rinex2(station, year, doy, archive,screenstats)
-
-                if foundrinex: #uncompress etc  to make o files ...
-                    rinexfile, foundit2 = k.make_rinex2_ofiles(file_name) # translate
-
-#           define booleans for various files
-            oexist = os.path.isfile(orbdir + '/' + f) == True
-            rexist = os.path.isfile(rinexfile) == True
-            exc = exedir + '/teqc'
-            texist = os.path.isfile(exc) == True
-            if rexist:
-                # decimate using teqc  if you have it
-                if (texist) and (fortran) and (dec_rate > 0):
-                    log.write("Decimating using teqc:  {0:3.0f}  seconds \n".format(dec_rate))
-                    log.write('Unfortunately teqc removes Beidou data. Eventually I will remove this. \n')
-                    rinexout = rinexfile + '.tmp'; cdec = str(dec_rate)
-                    fout = open(rinexout,'w')
-                    subprocess.call([exc, '-O.dec', cdec, rinexfile],stdout=fout)
-                    fout.close() # needed?
-                    status = subprocess.call(['mv','-f', rinexout, rinexfile])
-            # if orbits and rinexfile exist
-            if (oexist) and (rexist):
-                snrname = g.snr_name(station, year,month,day,option)
-                orbfile = orbdir + '/' + f
-                #print('translator',translator)
-                if translator == 'hybrid':
-                    g.make_snrdir(year,station) # make sure output directory exists
-                    in1 = g.binary(rinexfile)
-                    in2 = g.binary(snrname) # this file is made locally and moved later
-                    in3 = g.binary(orbfile)
-                    if (len(snrname) > 132) or (len(orbfile) > 132):
-                        print('The orbit or SNR file name is too long.')
-                        print('Make your environment variable names shorter.')
-                        return
-                    in4 = g.binary(str(option))
-                    if (dec_rate > 0):
-                        decr = str(dec_rate)
-                    else:
-                        decr = '0'
-                    in5 = g.binary(decr) # decimation can be used in hybrid option
-                    message = 'None '
-                    errorlog = 'logs/' + station + '_hybrid_error.txt'
-                    in6 = g.binary(errorlog)
-                    log.write('SNR file {0:50s} \n will use hybrid of python and fortran to make \n'.format( snrname))
-                    # these are calls to the fortran codes that have been ported to be called from python
-                    if (orbtype  == 'gps') or ('nav' in orbtype):
-                        gpssnr.foo(in1,in2,in3,in4,in5,in6)
-                    else:
-                        if orbtype in ['ultra', 'wum', 'wum2']:
-                            print('Using an ultrarapid orbit', orbtype)
-                            gnsssnrbigger.foo(in1,in2,in3,in4,in5,in6)
-                        else:
-                            gnsssnr.foo(in1,in2,in3,in4,in5,in6)
-                else:
-                    if (translator == 'fortran'):
-                        t1=time.time()
-                        try:
-                            #subprocess.call([snrexe, rinexfile, snrname, orbfile, str(option)])
-                            log.write('Using standalone fortran for translation  - separate log is used for stdout \n')
-                            flogname = 'logs/' + station + '_fortran.txt'
-                            flog = open(flogname, 'w+')
-                            a=subprocess.run([snrexe, rinexfile, snrname, orbfile, str(option)],capture_output=True,text=True)
-                            ddd = a.stdout; flog.write(ddd); flog.close()
-                            status = subprocess.call(['rm','-f', rinexfile ])
-                            status = subprocess.call(['xz', orbfile])
-                        except:
-                            log.write('Problem with making SNR file, check fortran specific log {0:50s} \n'.format(flogname))
-                        t2=time.time()
-#                        print(' Exec time:', '{0:4.2f}'.format(t2-t1) )
-#                      this is for people that want to use slow python code
-                    else:
-                        log.write('SNR file {0:50s} \n will use python to make \n'.format( snrname))
-                        log.write('Decimating will be done here instead of using teqc \n')
-                        t1=time.time()
-                        rnx2snr(rinexfile, orbfile,snrname,option,year,month,day,dec_rate,log)
-                        t2=time.time()
-#                        print(' Exec time:', '{0:4.2f}'.format(t2-t1) )
-
-                # remove the rinex file
-                subprocess.call(['rm', '-f',rinexfile])
-
-                if os.path.isfile(snrname):
-#                make sure it exists and is non-zero size before moving it
-                    if (os.stat(snrname).st_size == 0):
-                        log.write('you created a zero file size which could mean a lot of things \n')
-                        log.write('bad exe, bad snr option, do not really have the orbit file \n')
-                        status = subprocess.call(['rm','-f', snrname ])
-                    else:
-                        log.write('A SNR file was created : {0:50s}  \n'.format(snrname_full))
-                        print('\n')
-                        print('SUCCESS: SNR file was created \n', snrname_full)
-                        g.store_snrfile(snrname,year,station)
-                        subprocess.call(['gzip', snrname_full])
-
-                else:
-                    logfile = 'logs/' + station + '_hybrid_error.txt'
-                    print('No SNR file created - check ', logfile, ' for why it failed.')
-            else:
-                print('Either the RINEX file or orbit file does not exist, so there is nothing to convert')
-                log.write('Either the RINEX file or orbit file does not exist, so there is nothing to convert \n')
+        # added karnak librariies
+        if (archive == 'all'):
+            foundrinex = False
+            for archivechoice in ['unavco','sopac','sonel']:
+                if (not foundrinex):
+                    file_name,foundrinex = k.universal_rinex2(station, year, doy, archivechoice,screenstats)
         else:
-            print('The orbit file you requested does not exist.')
+            file_name,foundrinex = k.universal_rinex2(station, year, doy, archive,screenstats)
+
+        if foundrinex: #uncompress etc  to make o files ...
+            rinexfile, foundit2 = k.make_rinex2_ofiles(file_name) # translate
+    times['download'] = time.perf_counter() - t1
+    instrument.add_time('download', times['download'])
+
+#   define booleans for various files
+    oexist = os.path.isfile(orbdir + '/' + f) == True
+    rexist = os.path.isfile(rinexfile) == True
+    exc = exedir + '/teqc'
+    texist = os.path.isfile(exc) == True
+    if rexist:
+        # decimate using teqc  if you have it
+        if (texist) and (fortran) and (dec_rate > 0):
+            log.write("Decimating using teqc:  {0:3.0f}  seconds \n".format(dec_rate))
+            log.write('Unfortunately teqc removes Beidou data. Eventually I will remove this. \n')
+            rinexout = rinexfile + '.tmp'; cdec = str(dec_rate)
+            fout = open(rinexout,'w')
+            subprocess.call([exc, '-O.dec', cdec, rinexfile],stdout=fout)
+            fout.close() # needed?
+            status = subprocess.call(['mv','-f', rinexout, rinexfile])
+    # if orbits and rinexfile exist
+    if not ((oexist) and (rexist)):
+        print('Either the RINEX file or orbit file does not exist, so there is nothing to convert')
+        log.write('Either the RINEX file or orbit file does not exist, so there is nothing to convert \n')
+        log.close()
+        return None
+    log.close()
+
+    job = {'year': year, 'doy': doy, 'month': month, 'day': day, 'station': station, 'option': option,
+           'orbtype': orbtype, 'dec_rate': dec_rate, 'translator': translator, 'sp3_interp': sp3_interp,
+           'rinex_cache': rinex_cache, 'rinexfile': rinexfile, 'orbfile': orbdir + '/' + f, 'snrexe': snrexe,
+           'snrname': g.snr_name(station, year,month,day,option), 'snrname_full': snrname_full,
+           'logname': logname, 'snr_cache': snr_cache, 'times': times}
+
+    return job
+
+
+def translate_day(job, orbits=None):
+    """
+    second stage of conv2snr: translates the RINEX file into a SNR file
+    and removes the RINEX file
 
-    # close the log file
+    Parameters
+    ----------
+    job : dict
+        output of fetch_day_files
+    orbits : dict, optional
+        orbits already read by load_orbits, used by the python translator
+        if they were read from the orbit file of this job
+
+    Returns
+    -------
+    job : dict or None
+        the same, None if there is no (or an empty) SNR file
+
+    """
+    station = job['station']; option = job['option']; orbtype = job['orbtype']
+    rinexfile = job['rinexfile']; orbfile = job['orbfile']; snrname = job['snrname']
+    dec_rate = job['dec_rate']; translator = job['translator']
+    year = job['year']; month = job['month']; day = job['day']
+    snrname_full = job['snrname_full']
+    log = open(job['logname'], 'a')
+    # the fortran logs go next to the log of the day, so days translated at the same
+    # time (run_rinex2snr_pipeline) do not write to the same files
+    logbase = os.path.splitext(job['logname'])[0]
+    errorlog = logbase + '_hybrid_error.txt'
+    flogname = logbase + '_fortran.txt'
+    #print('translator',translator)
+    t1 = time.perf_counter()
+    if translator == 'hybrid':
+        g.make_snrdir(year,station) # make sure output directory exists
+        # the SNR file is made locally and moved later
+        if (len(snrname) > 132) or (len(orbfile) > 132):
+            print('The orbit or SNR file name is too long.')
+            print('Make your environment variable names shorter.')
+            log.close()
+            return None
+        if (dec_rate > 0):
+            decr = str(dec_rate)
+        else:
+            decr = '0'
+        # decimation can be used in hybrid option
+        log.write('SNR file {0:50s} \n will use hybrid of python and fortran to make \n'.format( snrname))
+        # these are calls to the fortran codes that have been ported to be called from python
+        if orbtype in ['ultra', 'wum', 'wum2']:
+            print('Using an ultrarapid orbit', orbtype)
+        # the SNR rows are only kept in memory for the binary SNR cache
+        job['snrdata'] = hybrid_snr(rinexfile, snrname, orbfile, orbtype, option, decr, errorlog,
+                keeprows=job.get('snr_cache', 0) > 0)
+    else:
+        if (translator == 'fortran'):
+            try:
+                #subprocess.call([snrexe, rinexfile, snrname, orbfile, str(option)])
+                log.write('Using standalone fortran for translation  - separate log is used for stdout \n')
+                flog = open(flogname, 'w+')
+                a=subprocess.run([job['snrexe'], rinexfile, snrname, orbfile, str(option)],capture_output=True,text=True)
+                ddd = a.stdout; flog.write(ddd); flog.close()
+                status = subprocess.call(['rm','-f', rinexfile ])
+            except:
+                log.write('Problem with making SNR file, check fortran specific log {0:50s} \n'.format(flogname))
+#                      this is for people that want to use slow python code
+        else:
+            log.write('SNR file {0:50s} \n will use python to make \n'.format( snrname))
+            log.write('Decimating will be done here instead of using teqc \n')
+            if (orbits is not None) and (orbits['navfile'] != orbfile):
+                orbits = None
+            rnx2snr(rinexfile, orbfile,snrname,option,year,month,day,dec_rate,log,job['sp3_interp'],rinex_cache=job['rinex_cache'],orbits=orbits)
+
+    instrument.add_time('translate', time.perf_counter() - t1)
+    # remove the rinex file
+    subprocess.call(['rm', '-f',rinexfile])
+
+    if not os.path.isfile(snrname):
+        if translator == 'fortran':
+            print('No SNR file created - check ', flogname, ' for why it failed.')
+        elif translator == 'hybrid':
+            print('No SNR file created - check ', errorlog, ' for why it failed.')
+        else:
+            print('No SNR file created - check ', job['logname'], ' for why it failed.')
+        log.close()
+        return None
+#   make sure it exists and is non-zero size before moving it
+    if (os.stat(snrname).st_size == 0):
+        log.write('you created a zero file size which could mean a lot of things \n')
+        log.write('bad exe, bad snr option, do not really have the orbit file \n')
+        status = subprocess.call(['rm','-f', snrname ])
+        log.close()
+        return None
+    log.write('A SNR file was created : {0:50s}  \n'.format(snrname_full))
     log.close()
 
+    return job
+
+
+def hybrid_module(orbtype):
+    """
+    fortran translator used by the hybrid option for an orbit type
+
+    Parameters
+    ----------
+    orbtype : str
+        orbit source (nav, gps, gnss, ultra etc)
+
+    Returns
+    -------
+    module
+        gpssnr (navigation files), gnsssnrbigger (ultra, wum, wum2) or gnsssnr
+
+    """
+    if (orbtype  == 'gps') or ('nav' in orbtype):
+        return gpssnr
+    if orbtype in ['ultra', 'wum', 'wum2']:
+        return gnsssnrbigger
+    return gnsssnr
+
+
+# sp3 file (name, modification time) held in memory by each of the sp3 translators
+_loaded_sp3 = {}
+
+
+def load_hybrid_sp3(module, orbfile, errorlog):
+    """
+    reads a sp3 file into the memory of a fortran translator (gnsssnr or gnsssnrbigger),
+    unless it already holds that file. The RINEX files translated afterwards with
+    hybrid_snr use it, so a sp3 file is read once for many RINEX files.
+    Processes forked after this call share it.
+
+    Parameters
+    ----------
+    module : module
+        gnsssnr or gnsssnrbigger
+    orbfile : str
+        sp3 file
+    errorlog : str
+        fortran log file
+
+    Returns
+    -------
+    bool
+        whether the translator has the orbits
+
+    """
+    key = (orbfile, os.path.getmtime(orbfile))
+    if _loaded_sp3.get(module.__name__) == key:
+        return True
+    _loaded_sp3.pop(module.__name__, None)
+    nsat = module.loadsp3(g.binary(orbfile), g.binary(errorlog))
+    if nsat == 0:
+        return False
+    _loaded_sp3[module.__name__] = key
+
     return True
 
+
+def rinex2_max_rows(rinexfile):
+    """
+    upper bound for the number of SNR rows translated from a RINEX 2.11 file: 
+    each satellite of an epoch takes one line for every five observables, so there
+    are no more satellite records than the lines after the header divided by that
+
+    Parameters
+    ----------
+    rinexfile : str
+        RINEX 2.11 file
+
+    Returns
+    -------
+    maxrows : int
+
+    """
+    nobs = 0
+    nlines = 0
+    with open(rinexfile, 'rb') as fid:
+        for line in fid:
+            if (nobs == 0) and (b'# / TYPES OF OBSERV' in line):
+                try:
+                    nobs = int(line[0:6])
+                except ValueError:
+                    nobs = 0
+            if b'END OF HEADER' in line:
+                break
+        for block in iter(lambda: fid.read(1 << 22), b''):
+            nlines += block.count(b'\n')
+    lines_per_sat = max(1, (nobs + 4)//5)
+
+    return max(nlines//lines_per_sat, 1)
+
+
+def hybrid_snr(rinexfile, snrname, orbfile, orbtype, option, decr, errorlog, keeprows=True):
+    """
+    translates a RINEX file with the fortran translators. The SNR file is written
+    and, if asked for, its contents are also returned, so they do not have to be read back.
+    sp3 files are kept in memory between calls (see load_hybrid_sp3)
+
+    Parameters
+    ----------
+    rinexfile : str
+        RINEX 2.11 file
+    snrname : str
+        SNR file to write
+    orbfile : str
+        navigation or sp3 file
+    orbtype : str
+        orbit source, see hybrid_module
+    option : int
+        snr choice (66, 99 etc)
+    decr : str
+        decimation in seconds, '0' for none
+    errorlog : str
+        fortran log file
+    keeprows : bool, optional
+        whether to return the contents of the SNR file. If False, no memory
+        is set aside for them. default is True
+
+    Returns
+    -------
+    snrdata : numpy array of floats or None
+        contents of the SNR file, None if nothing was translated, they were
+        not asked for (or the translator has no array interface)
+
+    """
+    module = hybrid_module(orbtype)
+    in1 = g.binary(rinexfile); in2 = g.binary(snrname); in3 = g.binary(orbfile)
+    in4 = g.binary(str(option)); in5 = g.binary(decr); in6 = g.binary(errorlog)
+    if not hasattr(module, 'snrrows'):
+        # fortran extension built before snrrows was added
+        module.foo(in1,in2,in3,in4,in5,in6)
+        return None
+    # the rows do not fit in a buffer of size 0, so the translator only writes the file
+    maxrows = rinex2_max_rows(rinexfile) if keeprows else 0
+    if module is gpssnr:
+        data, nrows = module.snrrows(in1,in2,in3,in4,in5,in6,maxrows)
+        # the option 50 file has no S5 column
+        ncols = 8 if str(option) == '50' else 9
+    else:
+        if not load_hybrid_sp3(module, orbfile, errorlog):
+            return None
+        data, nrows = module.snrrows(in1,in2,in4,in5,in6,maxrows)
+        ncols = data.shape[1]
+    if (nrows <= 0) or (not keeprows):
+        return None
+    if nrows > maxrows:
+        # more rows than the header suggested. the SNR file is complete, so read it
+        del data
+        return snr.read_snr_text(snrname)
+
+    return np.ascontiguousarray(data[0:nrows,0:ncols])
+
+
+def store_day(job):
+    """
+    last stage of conv2snr: moves the SNR file to $REFL_CODE/yyyy/snr/ssss and gzips it.
+    If the binary SNR cache was requested and the translator returned the SNR data, 
+    the cache read by gnssir is written from it (see read_snr_files.load_snr)
+
+    Parameters
+    ----------
+    job : dict
+        output of translate_day
+
+    """
+    snrname_full = job['snrname_full']
+    print('\n')
+    print('SUCCESS: SNR file was created \n', snrname_full)
+    g.store_snrfile(job['snrname'],job['year'],job['station'])
+    if os.path.isfile(snrname_full):
+        instrument.count('snr_bytes_written', os.path.getsize(snrname_full))
+    with instrument.timer('compress'):
+        subprocess.call(['gzip', snrname_full])
+    if os.path.isfile(snrname_full + '.gz'):
+        # a cache of an older uncompressed version of this file
+        snr.remove_snr_cache(snrname_full)
+    if (job.get('snr_cache', 0) > 0) and (job.get('snrdata') is not None):
+        if os.path.isfile(snrname_full + '.gz'):
+            snr.write_snr_cache(snrname_full + '.gz', job['snrdata'])
+        elif os.path.isfile(snrname_full):
+            snr.write_snr_cache(snrname_full, job['snrdata'])
+
+
 def satorb(week, sec_of_week, ephem):
     """
     Calculate GPS satellite orbits
@@ -629,7 +1250,39 @@ def satorb(week, sec_of_week, ephem):
     return np.array([xk, yk, zk])
 
 
-def rnx2snr(obsfile, navfile,snrfile,snroption,year,month,day,dec_rate,log):
+def load_orbits(navfile, interp='quadratic'):
+    """
+    reads an orbit file and makes what rnx2snr needs from it. This only depends on the 
+    orbit file, so it can be done once and used for every station of that day.
+
+    Parameters
+    ----------
+    navfile : str
+        GPS navigation file or sp3 file (the name must end in sp3 or SP3)
+    interp : str, optional
+        interpolation of sp3 orbits, quadratic (default) or lagrange
+
+    Returns
+    -------
+    orbits : dict
+        orbtype ('nav' or 'sp3'), navfile and either ephemdata (from g.myreadnav) or 
+        sp3 (from g.read_sp3file) and interpolants (from sp3_interpolants)
+
+    """
+    orbits = {'navfile': navfile, 'interp': interp}
+    last3 = navfile[-3::]
+    if (last3 != 'SP3') and (last3 != 'sp3'):
+        orbits['orbtype'] = 'nav'
+        orbits['ephemdata'] = g.myreadnav(navfile)
+    else:
+        orbits['orbtype'] = 'sp3'
+        orbits['sp3'] = g.read_sp3file(navfile)
+        orbits['interpolants'] = sp3_interpolants(orbits['sp3'], interp)
+
+    return orbits
+
+
+def rnx2snr(obsfile, navfile,snrfile,snroption,year,month,day,dec_rate,log,interp='quadratic',chunksize=3600,rinex_cache=0,orbits=None):
     """
     Converts a rinex v2.11 obs file using Joakim's rinex reading code
 
@@ -654,6 +1307,20 @@ def rnx2snr(obsfile, navfile,snrfile,snroption,year,month,day,dec_rate,log):
         calendar day
     dec_rate : int
         decimation rate in seconds
+    log : file object
+        for comments
+    interp : str, optional
+        interpolation of sp3 orbits, quadratic (default) or lagrange (nine points, like
+        the fortran translator)
+    chunksize : int, optional
+        number of epochs read and translated at a time. default is 3600
+    rinex_cache : float, optional
+        if positive, the parsed SNR observables are kept in $REFL_CODE/rinex_cache/
+        (with this size budget in MB) and reused the next time this RINEX file is translated.
+        default is 0, no cache
+    orbits : dict, optional
+        output of load_orbits for navfile, e.g. shared by all the stations of a day.
+        The orbit file is read here if it is not given
 
     """
     station = obsfile[0:4]
@@ -664,172 +1331,407 @@ def rnx2snr(obsfile, navfile,snrfile,snroption,year,month,day,dec_rate,log):
     orbtype = 'sp3' # assume it is sp3
     if (last3 != 'SP3') and (last3 != 'sp3'):
         orbtype = 'nav'
+    if orbits is not None:
+        orbtype = orbits['orbtype']
     log.write("Orbit type {0:4s} \n".format(orbtype))
     log.write("File name {0:50s} \n".format(navfile))
     # these are the elevation angle limits I have been using for the various SNR formats
     emin,emax = elev_limits(snroption)
 
     exitQ = False
-    obsdata, systemsatlists, prntoidx, obstypes, header, obstimes,gpstime = rinpy.processrinexfile(obsfile)
-    obsdata = rinpy.separateobservables(obsdata, obstypes)
-    obslist = obstypes['G'][:]
-    # need to check to see what happens without coordinates
-    key = 'APPROX POSITION XYZ'
-    if key in header.keys():
-        log.write('Cartesian coordinates are in the RINEX Header \n')
+    # the RINEX file is read (and translated) chunksize epochs at a time, so memory does not grow
+    # with the length of the file. Only the SNR observables are kept
+    if rinex_cache > 0:
+        chunks = rinpy.cachedrinexchunks(obsfile, chunksize, obscodes=['S'], budget_mb=rinex_cache)
     else:
-        log.write('RINEX file does not have station coordinates. Exiting \n')
-        print('RINEX file does not have station coordinates. This is illegal. Exiting')
-        return
-    rv =  header['APPROX POSITION XYZ']
-    recv = [float(i) for i in rv.split()]
-    recv = np.array(recv)
-    log.write("XYZ from header {0:15.5f} {1:15.5f} {2:15.5f} \n".format(recv[0],recv[1],recv[2]))
-    if np.sum(np.abs(recv)) < 5:
-        print('Your receiver coordinates are in the middle of the Earth. Exiting.')
-        exitQ = True
-        return
-
-    lat, lon, h = g.xyz2llh(recv,1e-8) # returns lat/lon in radians
-    up,East,North = g.up(lat,lon) # returns unit vector for UP
-
+        chunks = rinpy.readrinexchunks(obsfile, chunksize, obscodes=['S'])
+    fout = None
+    for obsdata, systemsatlists, prntoidx, obstypes, header, obstimes, gpstime in chunks:
+        if fout is None:
+            # need to check to see what happens without coordinates
+            key = 'APPROX POSITION XYZ'
+            if key in header.keys():
+                log.write('Cartesian coordinates are in the RINEX Header \n')
+            else:
+                log.write('RINEX file does not have station coordinates. Exiting \n')
+                print('RINEX file does not have station coordinates. This is illegal. Exiting')
+                return
+            rv =  header['APPROX POSITION XYZ']
+            recv = [float(i) for i in rv.split()]
+            recv = np.array(recv)
+            log.write("XYZ from header {0:15.5f} {1:15.5f} {2:15.5f} \n".format(recv[0],recv[1],recv[2]))
+            if np.sum(np.abs(recv)) < 5:
+                print('Your receiver coordinates are in the middle of the Earth. Exiting.')
+                exitQ = True
+                return
+
+            lat, lon, h = g.xyz2llh(recv,1e-8) # returns lat/lon in radians
+            up,East,North = g.up(lat,lon) # returns unit vector for UP
+
+            if orbits is None:
+                if (orbtype == 'nav'):
+                    log.write('reading the ephemeris data \n')
+                else:
+                    log.write('Read the sp3 file \n')
+                orbits = load_orbits(navfile, interp)
+            else:
+                log.write('Using orbits that were already read \n')
+            if (orbtype == 'nav'):
+                ephemdata = orbits['ephemdata']
+                if len(ephemdata) == 0:
+                    log.write("Empty ephemeris or the file does not exist \n")
+                    return
+            else:
+                sp3 = orbits['sp3']
+            fout = open(snrfile, 'w+')
 
+        obsdata = rinpy.separateobservables(obsdata, obstypes)
+        if (orbtype == 'nav'):
+            obslist = obstypes.get('G', [])
 # set defaults
-    s5exist = False; s1exist = False; s2exist = False;
-    if 'S1' in obslist :
-        s1exist = True
-    if 'S2' in obslist :
-        s2exist = True
-    if 'S5' in obslist :
-        s5exist = True
-    if not s1exist and not s2exist:
-        log.write('There are no S1 and no S2 data - this file is not useful for reflectometry \n')
-        exitQ = True
-    if (orbtype == 'nav'):
-        gpssatlist = systemsatlists['G'][:]
-        #print('GPS satellite list', gpssatlist)
-        navorbits(navfile,obstimes,obsdata,obslist,prntoidx,gpssatlist,snrfile,s1exist,s2exist,s5exist,up,East,North,emin,emax,recv,dec_rate,log)
-    else:
-        log.write('Read the sp3 file \n'); sp3 = g.read_sp3file(navfile)
-        _testing_sp3(gpstime,sp3,systemsatlists,obsdata,obstypes,prntoidx,year,month,day,emin,emax,snrfile,up,East,North,recv,dec_rate,log)
-        #_test_sp3(gpstime,sp3,systemsatlists,obsdata,obstypes,prntoidx,year,month,day,emin,emax,snrfile,up,East,North,recv,dec_rate,log)
+            s5exist = False; s1exist = False; s2exist = False;
+            if 'S1' in obslist :
+                s1exist = True
+            if 'S2' in obslist :
+                s2exist = True
+            if 'S5' in obslist :
+                s5exist = True
+            if not s1exist and not s2exist:
+                log.write('There are no S1 and no S2 data - this file is not useful for reflectometry \n')
+                exitQ = True
+                continue
+            gpssatlist = systemsatlists['G'][:]
+            saveit = nav_snr_rows(ephemdata,obstimes,obsdata,obslist,prntoidx,gpssatlist,s1exist,s2exist,s5exist,up,East,North,emin,emax,recv,dec_rate,log)
+            np.savetxt(fout, saveit, fmt='%3.0f %10.4f %10.4f %10.0f %7.2f %7.2f %7.2f %7.2f %7.2f ')
+        else:
+            saveit = sp3_snr_rows(gpstime,sp3,systemsatlists,obsdata,obstypes,prntoidx,year,month,day,emin,emax,up,East,North,recv,dec_rate,log,interp,orbits['interpolants'])
+            np.savetxt(fout, saveit, fmt='%3.0f %10.4f %10.4f %10.0f %7.2f %7.2f %7.2f %7.2f %7.2f %7.2f %7.2f ')
+    if fout is not None:
+        fout.close()
 
     #print('Closing python RINEX conversion log file:',logname)
     #log.close()
 
-def navorbits(navfile,obstimes,observationdata,obslist,prntoidx,gpssatlist,snrfile,s1exist,s2exist,s5exist,up,East,North,emin,emax,recv,dec_rate,log):
+def nav_snr_rows(ephemdata,obstimes,observationdata,obslist,prntoidx,gpssatlist,s1exist,s2exist,s5exist,up,East,North,emin,emax,recv,dec_rate,log):
     """
-    Strandberg nav reading file?
+    computes the SNR file rows for GPS data and broadcast orbits
 
     Parameters
-    ---------
-    navfile : string
+    ----------
+    ephemdata : numpy array
+        from g.myreadnav
+    obstimes : list of datetime
+        observation times
+    observationdata : dict
+        from rinpy.separateobservables
+    obslist : list of str
+        GPS observables
+    prntoidx : dict
+        column of each satellite in the observation arrays
+    gpssatlist : list of int
+        GPS satellites
+    s1exist, s2exist, s5exist : bool
+        whether there are S1, S2 and S5 data
+    up, East, North : numpy arrays
+        unit vectors at the receiver
+    emin, emax : float
+        elevation angle limits (degrees)
+    recv : numpy array
+        receiver Cartesian coordinates (meters)
+    dec_rate : int
+        decimation rate in seconds
+    log : file object
+        for comments
 
-    obstimes : ??
+    Returns
+    -------
+    saveit : numpy array
+        satellite, elevation angle, azimuth, seconds of the day, 0, 0, S1, S2, S5
+        epoch by epoch
 
-    observationdata :
+    """
+    K=len(obstimes)
+    log.write('Number of epochs in the RINEX file {0:6.0f} \n '.format( K))
+    log.write('Decimation rate {0:3.0f} \n'.format(dec_rate))
+    # sod is seconds of the day
+    sod = np.array([3600*a.hour + 60*a.minute + a.second for a in obstimes])
+    if dec_rate > 0:
+        epochs = np.where(sod % dec_rate == 0)[0]
+    else:
+        epochs = np.arange(K)
+    gpst = np.array([g.kgpsweek(obstimes[i].year, obstimes[i].month, obstimes[i].day, 
+        obstimes[i].hour, obstimes[i].minute, obstimes[i].second) for i in epochs]).reshape(-1,2)
+    gweek = gpst[:,0]; gpss = gpst[:,1]
+
+    # each satellite is done for all epochs at once
+    saveit = []
+    with Bar('Processing RINEX', max=len(gpssatlist),fill='@',suffix='%(percent)d%%') as bar:
+        for sat in gpssatlist:
+            bar.next()
+            s1,s2,s5 = readSNRcols(s1exist,s2exist,s5exist,observationdata,prntoidx,sat,epochs)
+            ii = (s1 > 0)
+            if not np.any(ii):
+                continue
+            closest = findephem_epochs(gweek[ii], gpss[ii], ephemdata, sat)
+            if len(closest) == 0:
+                continue
+            satv = satorb_prop_array(gpss[ii], recv, closest)
+            r=np.subtract(satv,recv) # satellite minus receiver vector
+            eleA = elev_angle_array(up, r)*180/np.pi
+            azimA = azimuth_angle_array(r, East, North)
+            jj = (eleA >= emin) & (eleA <= emax)
+            n = np.count_nonzero(jj)
+            saveit.append(np.column_stack((np.full(n,sat), eleA[jj], azimA[jj], sod[epochs[ii]][jj], np.zeros(n), np.zeros(n),
+                s1[ii][jj], s2[ii][jj], s5[ii][jj], epochs[ii][jj])))
+
+    if len(saveit) > 0:
+        saveit = np.vstack(saveit)
+        # epoch by epoch, and in the order of the satellite list within an epoch
+        saveit = saveit[np.argsort(saveit[:,9], kind='stable'), 0:9]
+    else:
+        saveit = np.empty(shape=[0,9])
 
-    obslist :
+    return saveit
 
-    prn2oidx :
 
-    gpssatlist :
+def readSNRcols(s1exist,s2exist,s5exist,observationdata,prntoidx,sat,epochs):
+    """
+    GPS SNR data for one satellite and many epochs. Missing values
+    are set to zero
 
-    snrfile : str
-        name of the output file
+    Parameters
+    ----------
+    s1exist : bool
+        whether there are S1 data
+    s2exist : bool
+        whether there are S2 data
+    s5exist : bool
+        whether there are S5 data
+    observationdata : dict
+        from rinpy.separateobservables
+    prntoidx : dict
+        column of each satellite in the observation arrays
+    sat : int
+        satellite number
+    epochs : numpy array of int
+        epoch indices
 
-    s1exist :
+    Returns
+    -------
+    s1 : numpy array of floats
+    s2 : numpy array of floats
+    s5 : numpy array of floats
 
-    s2exist :
+    """
+    out = []
+    for exist, obs in zip([s1exist,s2exist,s5exist], ['S1','S2','S5']):
+        if exist:
+            s = observationdata['G'][obs][epochs, prntoidx['G'][sat]]
+            s = np.where(np.isnan(s), 0, s)
+        else:
+            s = np.zeros(len(epochs))
+        out.append(s)
+    return out[0], out[1], out[2]
 
-    s5exist :
 
-    This is for GPS only files !
-    navfile is nav broadcast ephemeris in RINEX format
-    inputs are rinex info, obstimes, observationdata,prntoidx,gpssatlist
-    various bits about SNR existence
-    snrfile is output name
-    log is for screen outputs - now going to a file
+def findephem_epochs(week, sweek, ephem, prn):
     """
-    log.write('reading the ephemeris data \n')
-    ephemdata = g.myreadnav(navfile)
-    if len(ephemdata) == 0:
-        log.write("Empty ephemeris or the file does not exist \n")
-        return
+    picks the ephemeris for each epoch the same way as gps.myfindephem, 
+    i.e. the last one at or before the epoch, or the first one in the file if 
+    there is none before the epoch
 
-    # change variable name to save typing
-    a=obstimes
-    if True:
-        log.write('Opening output file for the SNR data \n')
-        fout = open(snrfile, 'w+')
-        K=len(obstimes)
-        log.write('Number of epochs in the RINEX file {0:6.0f} \n '.format( K))
-        log.write('Decimation rate {0:3.0f} \n'.format(dec_rate))
-
-        with Bar('Processing RINEX', max=K,fill='@',suffix='%(percent)d%%') as bar:
-            for i in range(0,K):
-                bar.next()
-                if np.remainder(i,200) == 0:
-                    log.write('Epoch {0:6.0f} \n'.format( i))
-            # sod is seconds of the day
-                sod = 3600*a[i].hour + 60*a[i].minute + a[i].second
-                if dec_rate > 0:
-                    rem = sod % dec_rate
-                else:
-                    rem = 0
-                if (rem == 0):
-                    gweek, gpss = g.kgpsweek(a[i].year, a[i].month, a[i].day, a[i].hour, a[i].minute, a[i].second)
-                    for sat in gpssatlist:
-                        s1,s2,s5 = readSNRval(s1exist,s2exist,s5exist,observationdata,prntoidx,sat,i)
-                        if (s1 > 0):
-                            closest = g.myfindephem(gweek, gpss, ephemdata, sat)
-                            if len(closest) > 0:
-                                satv = satorb_prop(gweek, gpss, sat, recv, closest)
-                                r=np.subtract(satv,recv) # satellite minus receiver vector
-                                eleA = g.elev_angle(up, r)*180/np.pi
-                                azimA = g.azimuth_angle(r, East, North)
-                                if (eleA >= emin) and (eleA <= emax):
-                                    fout.write("{0:3.0f} {1:10.4f} {2:10.4f} {3:10.0f} {4:7.2f} {5:7.2f} {6:7.2f} {7:7.2f} {8:7.2f} \n".format(sat,eleA, azimA, sod,0, 0, s1,s2, s5))
-        fout.close()
-    else:
-        log.write('There was some kind of problem with your file, exiting ...\n')
-        print('There was some kind of problem with your file, exiting ...')
+    Parameters
+    ----------
+    week : numpy array of int
+        GPS week
+    sweek : numpy array of floats
+        GPS seconds of the week
+    ephem : numpy array of floats
+        ephemerides from gps.myreadnav
+    prn : int
+        satellite number
+
+    Returns
+    -------
+    closest : numpy array of floats
+        one ephemeris block (row) per epoch, empty if there are none for this satellite
 
-def readSNRval(s1exist,s2exist,s5exist,observationdata,prntoidx,sat,i):
     """
-    what it looks like only reads GPS data for now
-    interface between Joakim's code and mine ...
+    e = ephem[ephem[:,0] == prn]
+    if len(e) == 0:
+        return []
+    t = week*86400*7+sweek
+    teph = e[:,24]*86400*7+e[:,14]
+    # stable, so that for identical Toe the first one in the file is used
+    isort = np.argsort(teph, kind='stable')
+    tsort = teph[isort]
+    # last ephemeris at or before the epoch
+    k = np.searchsorted(tsort, t, side='right') - 1
+    before = (k >= 0)
+    k[before] = np.searchsorted(tsort, tsort[k[before]], side='left')
+    closest = np.empty((len(t), e.shape[1]))
+    closest[before] = e[isort[k[before]]]
+    closest[~before] = e[0]
+
+    return closest
+
+
+def satorb_array(sec_of_week, ephem):
+    """
+    vectorized version of satorb: GPS satellite orbits for many epochs
 
     Parameters
     ----------
-    s1exist : boolean
+    sec_of_week : numpy array of floats
+        GPS seconds of the week
+    ephem : numpy array of floats
+        ephemeris block for each epoch, one row per epoch
 
-    s2exist : boolean
+    Returns
+    -------
+    numpy array
+         the x,y,z, coordinates of the satellite in meters, one row per epoch
 
-    s5exist : boolean
+    """
+    Crs = ephem[:,7]; delta_n = ephem[:,8]; M0 = ephem[:,9]; Cuc = ephem[:,10]
+    ecc = ephem[:,11]; Cus = ephem[:,12]; sqrta = ephem[:,13]; Toe = ephem[:,14]
+    Cic = ephem[:,15]; Loa = ephem[:,16]; Cis = ephem[:,17]; incl = ephem[:,18]
+    Crc = ephem[:,19]; perigee = ephem[:,20]; radot = ephem[:,21]; idot = ephem[:,22]
+    week = ephem[:,24]
+    # semi-major axis
+    a = sqrta**2
+    t = week*7*86400+sec_of_week
+    tk = t-Toe
+    tk  =  (tk - 302400) % (302400*2) - 302400
+    n0 = np.sqrt(constants.mu/a**3)
+    n = n0+ delta_n
+    Mk = M0 + n*tk
+    Ek = Mk
+    E0 = Mk + ecc*np.sin(Mk)
+    # solve kepler's equation. each epoch stops when it has converged, as in satorb
+    for i in range(3):
+        Ek = Mk + ecc*np.sin(E0)
+        E0 = Mk + ecc*np.sin(Ek)
+    k = np.abs(Ek-E0) > 1e-12
+    while np.any(k):
+        Ek[k] = Mk[k] + ecc[k]*np.sin(E0[k])
+        E0[k] = Mk[k] + ecc[k]*np.sin(Ek[k])
+        k[k] = np.abs(Ek[k]-E0[k]) > 1e-12
+    nuk = np.arctan2(np.sqrt(1-ecc**2)*np.sin(Ek),np.cos(Ek)-ecc)
+    Phik = nuk + perigee
+    duk = Cus*np.sin(2*Phik)+Cuc*np.cos(2*Phik)
+    drk = Crs*np.sin(2*Phik)+Crc*np.cos(2*Phik)
+    dik = Cis*np.sin(2*Phik)+Cic*np.cos(2*Phik)
+    uk = Phik + duk
+    rk = a*(1-ecc*np.cos(Ek))+drk
+
+    ik = incl+dik+idot*tk
+    xkp = rk*np.cos(uk)
+    ykp = rk*np.sin(uk)
+    Omegak = Loa + (radot-constants.omegaEarth)*tk -constants.omegaEarth*Toe
+    xk = xkp*np.cos(Omegak)-ykp*np.cos(ik)*np.sin(Omegak)
+    yk = xkp*np.sin(Omegak)+ykp*np.cos(ik)*np.cos(Omegak)
+    zk = ykp*np.sin(ik)
+    return np.column_stack((xk, yk, zk))
+
+
+def satorb_prop_array(secweek, rrec0, closest_ephem):
+    """
+    vectorized version of satorb_prop: satellite coordinates at transmit time, 
+    in the Earth fixed frame at receive time, for many epochs
+
+    Parameters
+    ----------
+    secweek : numpy array of floats
+        GPS seconds of the week
+    rrec0 : 3vector
+        receiver coordinates, meters
+    closest_ephem : numpy array of floats
+        ephemeris block for each epoch, one row per epoch
 
     Returns
     -------
-    s1 :
-    s2 :
-    s5 :
-
-    """
-    s1 = 0; s2 = 0; s5 = 0 # set defaults
-    if s1exist:
-        s1 = observationdata['G']['S1'][i, prntoidx['G'][sat]]
-        if np.isnan(s1):
-           s1 = 0
-    if s2exist:
-        s2 = observationdata['G']['S2'][i, prntoidx['G'][sat]]
-        if np.isnan(s2):
-            s2 = 0
-    if s5exist:
-        s5 = observationdata['G']['S5'][i, prntoidx['G'][sat]]
-        if np.isnan(s5):
-            s5 = 0
-    return s1, s2, s5
+    SatOrbn : numpy array of floats
+        Cartesian location of satellite in meters, one row per epoch
+
+    """
+    # might as well start with 70 milliseconds
+    SatOrb = satorb_array(secweek-0.07, closest_ephem)
+    deltaT = norm_array(SatOrb - rrec0)/constants.c
+    # should not need more than two iterations, since i am
+    # starting with 70 msec
+    for k in range(2):
+        SatOrb = satorb_array(secweek-deltaT, closest_ephem)
+        Th = -constants.omegaEarth * deltaT
+        xs = SatOrb[:,0]*np.cos(Th)-SatOrb[:,1]*np.sin(Th)
+        ys = SatOrb[:,0]*np.sin(Th)+SatOrb[:,1]*np.cos(Th)
+        SatOrbn = np.column_stack((xs, ys, SatOrb[:,2]))
+        deltaT = norm_array(SatOrbn-rrec0)/constants.c
+    return SatOrbn
+
 
+def norm_array(vect):
+    """
+    magnitudes of many vectors
+
+    Parameters
+    ----------
+    vect : numpy array of floats
+        one vector per row
+
+    Returns
+    -------
+    nv : numpy array of floats
+
+    """
+    return np.sqrt(np.einsum('ij,ij->i', vect, vect))
+
+
+def elev_angle_array(up, RecSat):
+    """
+    vectorized version of gps.elev_angle
+
+    Parameters
+    ----------
+    up : 3 vector float
+        unit vector in the up direction
+    RecSat : numpy array of floats
+        receiver to satellite vectors in meters, one per row
+
+    Returns
+    -------
+    angle : numpy array of floats
+        elevation angles in radians
+
+    """
+    ang = np.arccos(np.dot(RecSat,up) / norm_array(RecSat))
+    return np.pi/2.0 - ang
+
+
+def azimuth_angle_array(RecSat, East, North):
+    """
+    vectorized version of gps.azimuth_angle
+
+    Parameters
+    ----------
+    RecSat : numpy array of floats
+        receiver to satellite vectors in meters, one per row
+    East : 3-vector
+        unit vector in east direction
+    North : 3-vector
+        unit vector in north direction
+
+    Returns
+    -------
+    azangle : numpy array of floats
+        azimuth angles in degrees
+
+    """
+    staSatE = East[0]*RecSat[:,0] + East[1]*RecSat[:,1] + East[2]*RecSat[:,2]
+    staSatN = North[0]*RecSat[:,0] + North[1]*RecSat[:,1] + North[2]*RecSat[:,2]
+    azangle = np.arctan2(staSatE, staSatN)*180/np.pi
+    azangle[azangle < 0] += 360
+    return azangle
 
 def satorb_prop(week, secweek, prn, rrec0, closest_ephem):
     """
@@ -980,7 +1882,7 @@ def _test_sp3(gpstime,sp3,systemsatlists,obsdata,obstypes,prntoidx,year,month,da
                     Tp = gpstime[not_ij,1] # only use the seconds of the week for now
                     s1 = s1[not_ij];
                     #print(s1.shape)
-                    emp = np.zeros(shape=[len(s1),1],dtype=float)
+                    emp = np.zeros(shape=[len(s1)],dtype=float)
         # get the rest of the SNR data in a function
                     s2,s5,s6,s7,s8 = extract_snr(prn, con, obslist,obsdata,prntoidx,not_ij,emp)
 
@@ -1076,87 +1978,279 @@ def elev_limits(snroption):
     return emin, emax
 
 
-def _testing_sp3(gpstime,sp3,systemsatlists,obsdata,obstypes,prntoidx,year,month,day, emin,emax,outputfile,up,East,North,recv,dec_rate,log):
+def sp3_interpolant(t, x, y, z, interp='quadratic'):
     """
-    inputs are gpstime( numpy array with week and sow)
-    sp3 is what has been read from the sp3 file
-    columsn are satNu, week, sow, x, y, z (in meters)
-    log is for comments
+    interpolator for the sp3 orbit of one satellite for the whole file. 
+    It does not depend on the receiver, so it can be made once and used for many stations
+
+    Parameters
+    ----------
+    t : numpy array of floats
+        sp3 times, GPS seconds of the week
+    x : numpy array of floats
+        sp3 X coordinates, meters
+    y : numpy array of floats
+        sp3 Y coordinates, meters
+    z : numpy array of floats
+        sp3 Z coordinates, meters
+    interp : str, optional
+        quadratic (default) uses a quadratic interp1d through all the sp3 points.
+        lagrange uses a ninth order Lagrange polynomial through the nine sp3 points
+        closest to the receive time, as pick_9points and polint do in the fortran translator.
+        If there are fewer than nine points, quadratic is used.
+
+    Returns
+    -------
+    orbit : function
+        orbit(tq, Tp) returns the coordinates (meters) at times tq, one row per time.
+        Tp are the receive times (same length as tq), which pick the nine points 
+        for the lagrange option. The quadratic option does not use them
+
+    """
+    n = len(t)
+    if (interp == 'lagrange') and (n >= 9):
+        # the nine points and the denominators of the Lagrange basis polynomials,
+        # for every possible first point
+        i9 = np.arange(n - 8)[:,None] + np.arange(9)
+        T9all = t[i9]
+        XYZ9all = np.stack((x[i9], y[i9], z[i9]), axis=2)
+        denall = np.ones((n - 8,9))
+        for k in range(9):
+            for m in range(9):
+                if m != k:
+                    denall[:,k] *= T9all[:,k] - T9all[:,m]
+
+        def orbit(tq, Tp):
+            # the epoch at or before the receive time is the fifth of the nine points,
+            # except at the ends of the file
+            j = np.searchsorted(t, Tp, side='right') - 1
+            first = np.clip(j - 4, 0, n - 9)
+            D = tq[:,None] - T9all[first]
+            w = np.ones((len(tq),9))
+            for k in range(9):
+                for m in range(9):
+                    if m != k:
+                        w[:,k] *= D[:,m]
+            w = w/denall[first]
+            return np.einsum('ij,ijk->ik', w, XYZ9all[first])
+    else:
+        iX= interp1d(t, x, 'quadratic',bounds_error=False,fill_value='extrapolate')
+        iY= interp1d(t, y, 'quadratic',bounds_error=False,fill_value='extrapolate')
+        iZ= interp1d(t, z, 'quadratic',bounds_error=False,fill_value='extrapolate')
+
+        def orbit(tq, Tp=None):
+            return np.column_stack((iX(tq), iY(tq), iZ(tq)))
+
+    return orbit
+
+
+def sp3_interpolants(sp3, interp='quadratic'):
+    """
+    makes the interpolator (sp3_interpolant) of every satellite in a sp3 file
+
+    Parameters
+    ----------
+    sp3 : numpy array
+        from g.read_sp3file. columns are satNu, week, sow, x, y, z (in meters)
+    interp : str, optional
+        quadratic (default) or lagrange
+
+    Returns
+    -------
+    orbits : dict
+        interpolator for each satellite number (e.g. 1, 101, 201, 301)
+
+    """
+    orbits = {}
+    if len(sp3) == 0:
+        return orbits
+    # stable sort, so each satellite keeps the time order of the file
+    ii = np.argsort(sp3[:,0], kind='stable')
+    sats, first = np.unique(sp3[ii,0], return_index=True)
+    for sat, rows in zip(sats, np.split(ii, first[1:])):
+        orbits[int(sat)] = sp3_interpolant(sp3[rows,2], sp3[rows,3], sp3[rows,4], sp3[rows,5], interp)
+
+    return orbits
+
+
+def sp3_orbit_function(t, x, y, z, Tp, interp='quadratic'):
     """
+    interpolator for the sp3 orbit of one satellite at the receive times Tp
+
+    Parameters
+    ----------
+    t, x, y, z : numpy arrays of floats
+        sp3 times (GPS seconds of the week) and coordinates (meters)
+    Tp : numpy array of floats
+        receive times the orbit is needed for (seconds of the week). 
+        Only used to pick the points for the lagrange option.
+    interp : str, optional
+        quadratic (default) or lagrange (see sp3_interpolant)
+
+    Returns
+    -------
+    orbit : function
+        orbit(tq) returns the coordinates (meters) at times tq, one row per time.
+        tq must have the same length as Tp for the lagrange option
+
+    """
+    orbit = sp3_interpolant(t, x, y, z, interp)
+
+    return lambda tq: orbit(tq, Tp)
+
+
+def satorb_prop_sp3_array(orbit, recv, Tp):
+    """
+    vectorized version of satorb_prop_sp3: satellite coordinates at transmit time, 
+    in the Earth fixed frame at receive time, for many epochs
+
+    Parameters
+    ----------
+    orbit : function
+        from sp3_orbit_function
+    recv : 3 vector, float
+        receiver coordinates, meters
+    Tp : numpy array of floats
+        receive times, GPS seconds of the week
+
+    Returns
+    -------
+    SatOrbn : numpy array of floats
+        Cartesian location of satellite in meters, one row per epoch
+
+    """
+    oE = constants.omegaEarth
+    c = constants.c
+    # start with 70 milliseconds as the guess for the transmission time
+    SatOrb = orbit(Tp-0.07)
+    tau = norm_array(SatOrb - recv)/c
+    for k in range(2):
+        SatOrb = orbit(Tp-tau)
+        Th = -oE * tau
+        xs = SatOrb[:,0]*np.cos(Th)-SatOrb[:,1]*np.sin(Th)
+        ys = SatOrb[:,0]*np.sin(Th)+SatOrb[:,1]*np.cos(Th)
+        SatOrbn = np.column_stack((xs, ys, SatOrb[:,2]))
+        tau = norm_array(SatOrbn-recv)/c
+
+    return SatOrbn
+
+
+def sp3_snr_rows(gpstime,sp3,systemsatlists,obsdata,obstypes,prntoidx,year,month,day, emin,emax,up,East,North,recv,dec_rate,log,interp='quadratic',orbits=None):
+    """
+    computes the SNR file rows for multi-GNSS data and sp3 orbits.
+    All epochs of a satellite are computed at once.
+
+    Parameters
+    ----------
+    gpstime : numpy array
+        GPS week and seconds of the week of each epoch
+    sp3 : numpy array
+        from g.read_sp3file. columns are satNu, week, sow, x, y, z (in meters)
+    systemsatlists : dict
+        satellites of each constellation
+    obsdata : dict
+        from rinpy.separateobservables
+    obstypes : dict
+        observables of each constellation
+    prntoidx : dict
+        column of each satellite in the observation arrays
+    year, month, day : int
+        date of the RINEX file
+    emin, emax : float
+        elevation angle limits (degrees)
+    up, East, North : numpy arrays
+        unit vectors at the receiver
+    recv : numpy array
+        receiver Cartesian coordinates (meters)
+    dec_rate : int
+        decimation rate in seconds
+    log : file object
+        for comments
+    interp : str, optional
+        quadratic (default) or lagrange (see sp3_interpolant)
+    orbits : dict, optional
+        interpolators from sp3_interpolants. They are made from sp3 if not given
+
+    Returns
+    -------
+    saveit : numpy array
+        satellite, elevation angle, azimuth, seconds of the day, 0, S6, S1, S2, S5, S7, S8
+        sorted by time and then satellite
+
+    """
+    if orbits is None:
+        orbits = sp3_interpolants(sp3, interp)
     checkD = False
     if dec_rate > 0:
         checkD = True
         log.write('You are decimating \n')
     # epoch at the beginning of the day of your RINEX file
     gweek0, gpssec0 = g.kgpsweek(year, month,day,0,0,0 )
+    if checkD:
+        keep = (gpstime[:,1] % dec_rate) == 0
+    else:
+        keep = np.ones(len(gpstime), dtype=bool)
 
-    ll = 'quadratic'
-#   will store in this variable, then sort it before writing out to a file
-    saveit = np.empty(shape=[0,11] )
-    fout = open(outputfile, 'w+')
-    NsatT = 0
+#   will store in this variable, then sort it before writing out to a file.
+#   there cannot be more rows than S1 observations
+    nmax = 0
+    for con in ['G','E','R','C']:
+        if (con in obstypes) and ('S1' in obstypes[con]):
+            nmax += np.count_nonzero(~np.isnan(obsdata[con]['S1']))
+    saveit = np.empty(shape=[nmax,11] )
+    nrows = 0
     # make a dictionary for constellation name
     sname ={}; sname['G']='GPS' ; sname['R'] = 'GLONASS'; sname['E'] = 'GALILEO'; sname['C']='BEIDOU'
     for con in ['G','E','R','C']:
         if con in obstypes:
             satL = len(systemsatlists[con][:])
             satS = 'Processing ' + sname[con]
+            obslist = obstypes[con][:]
+            if 'S1' not in obslist:
+                log.write('No S1 data for constellation {0:s}, which are needed \n'.format( con))
+                continue
             with Bar(satS, max=satL,fill='@',suffix='%(percent)d%%') as bar:
                 log.write('Good news - found data for constellation {0:s} \n'.format( con))
-                obslist = obstypes[con][:]
                 satlist = systemsatlists[con][:]
                 for prn in satlist:
                     bar.next()
                     addon = g.findConstell(con) # 100,200,or 300 for R,E, and C
                     log.write('Constellation {0:1s} Satellite {1:2.0f}  Addon {2:3.0f} \n'.format( con, prn, addon))
-                # window out the data for this satellite
-                    m = sp3[:,0] == prn + addon
-                    x = sp3[m,3]
-                    if len(x) > 0:
-                        sp3_week = sp3[m,1] ; sp3_sec = sp3[m,2]
-                        x = sp3[m,3] ; y = sp3[m,4] ; z = sp3[m,5]
-                # fit the orbits for this satellite
-                        t=sp3_sec
-                        iX= interp1d(t, x, ll,bounds_error=False,fill_value='extrapolate')
-                        iY= interp1d(t, y, ll,bounds_error=False,fill_value='extrapolate')
-                        iZ= interp1d(t, z, ll,bounds_error=False,fill_value='extrapolate')
-        # get the S1 data for this satellite
-                        if 'S1' in obslist:
-                            s1 = obsdata[con]['S1'][:, prntoidx[con][prn]]
-
-        # indices when there are no data for this satellite
-                        ij = np.isnan(s1)
+                    if (prn + addon) in orbits:
+                        s1 = obsdata[con]['S1'][:, prntoidx[con][prn]]
         # indices when there are data in the RINEX file - this way you do not compute
         # orbits unless there are data.
-                        not_ij = np.logical_not(ij)
+                        not_ij = np.logical_not(np.isnan(s1))
                         Tp = gpstime[not_ij,1] # only use the seconds of the week for now
-                        s1 = s1[not_ij];
-                    #print(s1.shape)
-                        emp = np.zeros(shape=[len(s1),1],dtype=float)
+                        s1 = s1[not_ij]
+                        emp = np.zeros(shape=[len(s1)],dtype=float)
         # get the rest of the SNR data in a function
                         s2,s5,s6,s7,s8 = extract_snr(prn, con, obslist,obsdata,prntoidx,not_ij,emp)
-        # make sure there are no nan values in s2 or s5
-
-                        nepochs = len(Tp)
-                        for ij in range(0,nepochs):
-                            TT = 0 # default value
-                            if checkD:
-                                TT = Tp[ij]  % dec_rate # get the modulus
-                            if TT == 0:
-                                SatOrb = satorb_prop_sp3(iX,iY,iZ,recv,Tp,ij)
-                                r=np.subtract(SatOrb,recv)
-                                azimA = g.azimuth_angle(r, East, North)
-                                eleA = g.elev_angle(up, r)*180/np.pi
-                                if (eleA >= emin) and (eleA <= emax):
-                                    # bug reported by Andrea Gatti. 2021 October 26
-                                    fout.write("{0:3.0f} {1:10.4f} {2:10.4f} {3:10.0f} {4:7.2f} {5:7.2f} {6:7.2f} {7:7.2f} {8:7.2f} {9:7.2f} {10:7.2f} \n".format(
-                                        prn+addon,eleA,azimA,Tp[ij]-gpssec0, 0,float(s6[ij]),s1[ij],float(s2[ij]),float(s5[ij]),float(s7[ij]),float(s8[ij]) ))
+                        kk = keep[not_ij]
+                        Tp = Tp[kk]
+                        if len(Tp) == 0:
+                            continue
+                # orbits for this satellite at the receive times
+                        orbit = orbits[prn + addon]
+                        SatOrb = satorb_prop_sp3_array(lambda tq: orbit(tq, Tp), recv, Tp)
+                        r=np.subtract(SatOrb,recv)
+                        azimA = azimuth_angle_array(r, East, North)
+                        eleA = elev_angle_array(up, r)*180/np.pi
+                        jj = (eleA >= emin) & (eleA <= emax)
+                        n = np.count_nonzero(jj)
+                        # bug reported by Andrea Gatti. 2021 October 26
+                        saveit[nrows:nrows+n,:] = np.column_stack((np.full(n, prn+addon), eleA[jj], azimA[jj], 
+                            Tp[jj]-gpssec0, np.zeros(n), s6[kk][jj], s1[kk][jj], s2[kk][jj], s5[kk][jj], s7[kk][jj], s8[kk][jj]))
+                        nrows += n
                     else:
                         log.write('This satellite is not in the orbit file. {0:3.0f} \n'.format(prn))
         else:
             log.write('No data for constellation {0:1s} \n'.format(con))
-    log.write('write SNR data to file \n')
-    fout.close()
+    saveit = saveit[0:nrows,:]
+    # sort by time and then satellite
+    ii = np.lexsort((saveit[:,0], saveit[:,3]))
+
+    return saveit[ii,:]
 
 
 def the_makan_option(station,cyyyy,cyy,cdoy):
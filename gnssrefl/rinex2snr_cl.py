@@ -25,7 +25,7 @@ def parse_arguments():
 
     parser = argparse.ArgumentParser()
     #parser = argparse.ArgumentParser(epilog=msg)
-    parser.add_argument("station", help="station name", type=str)
+    parser.add_argument("station", help="station name, or comma separated station names", type=str)
     parser.add_argument("year", help="year", type=int)
     parser.add_argument("doy", help="start day of year", type=int)
     parser.add_argument("-snr", default=None, help="snr file ending, 99: 5-30 deg.; 66: < 30 deg.; 88: all data; 50: < 10 deg.", type=int)
@@ -51,11 +51,18 @@ def parse_arguments():
     parser.add_argument("-strip", default=None, help="use T to reduce number of obs", type=str)
     parser.add_argument("-screenstats", default=None, help="set to T see more info printed to screen", type=str)
     parser.add_argument("-gzip", default=None, help="boolean, default is SNR files are gzipped after creation", type=str)
+    parser.add_argument("-sp3_interp", default=None, help="sp3 interpolation for the python translator (quadratic or lagrange)", type=str)
+    parser.add_argument("-rinex_cache", default=None, help="boolean, keep parsed RINEX files for the python translator", type=str)
+    parser.add_argument("-rinex_cache_mb", default=None, help="size budget of the parsed RINEX cache in MB (default 2000)", type=float)
+    parser.add_argument("-snr_cache", default=None, help="boolean, also write a binary copy of each SNR file for gnssir -snr_cache", type=str)
+    parser.add_argument("-snr_cache_mb", default=None, help="size budget of the binary SNR copies of the station in MB (default 2000)", type=float)
+    parser.add_argument("-par", default=None, type=int, help="Number of translating processes. -99 uses one per CPU")
+    parser.add_argument("-prefetch", default=None, type=int, help="Number of days downloaded ahead in parallel mode (default 2)")
 
     args = parser.parse_args().__dict__
 
     # convert all expected boolean inputs from strings to booleans
-    boolean_args = ['nolook', 'fortran', 'overwrite', 'mk', 'weekly','strip','screenstats','gzip','monthly']
+    boolean_args = ['nolook', 'fortran', 'overwrite', 'mk', 'weekly','strip','screenstats','gzip','monthly','rinex_cache','snr_cache']
     args = str2bool(args, boolean_args)
 
     # only return a dictionary of arguments that were added from the user - all other defaults will be set in code below
@@ -66,7 +73,9 @@ def rinex2snr(station: str, year: int, doy: int, snr: int = 66, orb: str = None,
               fortran: bool = False, nolook: bool = False, archive: str = 'all', doy_end: int = None,
               year_end: int = None, overwrite: bool = False, translator: str = 'hybrid', samplerate: int = 30,
               stream: str = 'R', mk: bool = False, weekly: bool = False, strip: bool = False, 
-              screenstats : bool = False, gzip : bool = True, monthly : bool = False ):
+              screenstats : bool = False, gzip : bool = True, monthly : bool = False, sp3_interp : str = 'quadratic',
+              rinex_cache : bool = False, rinex_cache_mb : float = 2000, par : int = None, prefetch : int = 2,
+              snr_cache : bool = False, snr_cache_mb : float = 2000 ):
     """
     rinex2snr translates RINEX files to a new file in SNR format. This function will also fetch orbit files for you.
     RINEX obs files are provided by the user or fetched from a long list of archives. Although RINEX 3 is supported, 
@@ -163,10 +172,15 @@ def rinex2snr(station: str, year: int, doy: int, snr: int = 66, orb: str = None,
     rinex2snr tgho  2019 1 -doy_end 365 -archive nz
         example for multiday SNR file creation
 
+    rinex2snr p041,p042,p043 2022 15 -orb rapid -translator python -par 3
+        three stations for the same day. The orbit file is read once and shared by
+        the three translating processes
+
     Parameters
     ----------
     station : str
-        4 or 9 character ID of the station, preferably lowercase
+        4 or 9 character ID of the station, preferably lowercase.
+        Several stations of the same kind can be given, separated by commas
     year : int
         Year
     doy : int
@@ -323,6 +337,38 @@ def rinex2snr(station: str, year: int, doy: int, snr: int = 66, orb: str = None,
     monthly : bool, optional
         default is false. snr files created every 30 days instead of every day
 
+    sp3_interp : str, optional
+        how the python translator interpolates sp3 orbits. default is quadratic.
+        lagrange uses the 9 point interpolation of the fortran translators
+
+    rinex_cache : bool, optional
+        default is false. The python translator keeps the parsed SNR observables of each
+        RINEX file in $REFL_CODE/rinex_cache/, so translating the file again (e.g. with
+        another snr choice, orbit or decimation) does not parse it again.
+
+    rinex_cache_mb : float, optional
+        size budget of the parsed RINEX cache in MB. The least recently used files are
+        deleted beyond it. default is 2000
+
+    par : int, optional
+        number of processes that translate days in parallel. While they translate, a few threads
+        download the RINEX and orbit files of the next days and another thread stores and gzips
+        the SNR files. -99 uses one process per CPU. default is None, one day after another
+        For several stations, the processes translate the stations of each day instead,
+        using the orbits read once for that day
+
+    prefetch : int, optional
+        in parallel mode, how many days are downloaded ahead of the translation. This bounds
+        the number of RINEX files waiting on disk. default is 2
+
+    snr_cache : bool, optional
+        default is false. Also writes the binary copy of each new SNR file (ssssddd0.yy.snr66.gz.npy)
+        that gnssir -snr_cache T reads instead of the text file. 
+
+    snr_cache_mb : float, optional
+        size budget of the binary SNR copies of the station in MB. The least recently used
+        ones are deleted beyond it at the end of the run. default is 2000
+
     """
     archive_list_rinex3 = ['unavco', 'epn','cddis', 'bev', 'bkg', 'ga', 'epn', 'bfg','sonel','all','unavco2','nrcan','gfz','ignes']
     archive_list = ['sopac', 'unavco', 'sonel',  'nz', 'ga', 'bkg', 'jeff',
@@ -348,12 +394,18 @@ def rinex2snr(station: str, year: int, doy: int, snr: int = 66, orb: str = None,
         else:
             orb = 'nav'
 
-    ns = len(station)
+    stations = station.split(',')
+    ns = len(stations[0])
     if (ns == 4) or (ns == 6) or (ns == 9):
         pass
     else:
         print('Illegal input - Station name must have 4 (RINEX 2), 6 (GSI), or 9 (RINEX 3) characters. Exiting.')
         sys.exit()
+    if any([len(s) != ns for s in stations]):
+        print('Illegal input - Station names must all have the same number of characters. Exiting.')
+        sys.exit()
+    if len(stations) > 1:
+        station = stations
 
     if len(str(year)) != 4:
         print('Year must be four characters long. Exiting.', year)
@@ -537,10 +589,16 @@ def rinex2snr(station: str, year: int, doy: int, snr: int = 66, orb: str = None,
     if stream not in ['R', 'S']:
         stream = 'R'
 
+    if sp3_interp not in ['quadratic', 'lagrange']:
+        print('sp3_interp must be quadratic or lagrange. Using quadratic.')
+        sp3_interp = 'quadratic'
+
     args = {'station': station, 'year_list': year_list, 'doy_list': doy_list, 'isnr': snr, 'orbtype': orb,
             'rate': rate, 'dec_rate': dec, 'archive': archive, 'fortran': fortran, 'nol': nolook,
             'overwrite': overwrite, 'translator': translator, 'srate': samplerate, 'mk': mk,
-            'skipit': skipit, 'stream': stream, 'strip': strip, 'bkg': bkg, 'screenstats': screenstats, 'gzip' : gzip}
+            'skipit': skipit, 'stream': stream, 'strip': strip, 'bkg': bkg, 'screenstats': screenstats, 'gzip' : gzip,
+            'sp3_interp': sp3_interp, 'rinex_cache': rinex_cache_mb if rinex_cache else 0,
+            'par': par, 'prefetch': prefetch, 'snr_cache': snr_cache_mb if snr_cache else 0}
 
     s1 = time.time()
     rnx.run_rinex2snr(**args)
@@ -1,7 +1,11 @@
 import numpy as np
 import re
 import datetime
+import hashlib
+import json
+import os
 import struct
+import zipfile
 
 import gnssrefl.gps as g
 
@@ -12,6 +16,10 @@ class RinexError(Exception):
     pass
 
 
+# version of the parsed RINEX cache layout. bump it if the layout changes
+RINEX_CACHE_VERSION = 1
+
+
 def getrinexversion(filename):
     """ Scan the file for RINEX version number.
 
@@ -119,7 +127,7 @@ def _readheader_v21x(lines):
     # This will result in an error if the record overlaps the end of the century. So if someone feels this is a major
     # problem, feel free to fix it. Personally can't bother to do it...
 
-    pattern = re.compile('(\s{2}\d|\s\d{2}){2}')
+    pattern = re.compile(r'(\s{2}\d|\s\d{2}){2}')
 
     while i < len(lines):
         if pattern.match(lines[i][:6]):  # then it's the first line in a header record
@@ -192,6 +200,7 @@ def _readheader_v3(lines):
     headerlines = []
     obstimes = []
     epochsatlists = []
+    gpstime = []
     satset = set()
 
     while i < len(lines):
@@ -208,11 +217,12 @@ def _readheader_v3(lines):
                                                   second=int(float(second)),
                                                   microsecond=int(float(second) % 1 * 100000)))
 
+                week, sow = g.kgpsweek(int(year), int(month), int(day), int(hour), int(minute), int(float(second)))
+                gpstime.append((week, sow))
+
                 numsats = int(lines[i][33:35])  # Number of visible satellites %i3
 
-                sv = []
-                for j in range(numsats):
-                    sv.append(lines[i+1+j][:3])
+                sv = [line[:3] for line in lines[i+1:i+1+numsats]]
 
                 i += numsats+1
                 epochsatlists.append(sv)
@@ -231,7 +241,8 @@ def _readheader_v3(lines):
         satset = satset.union(satlist)
 
     headerlengths = None
-    return header, headerlines, headerlengths, obstimes, epochsatlists, satset
+    gpstime = np.array(gpstime, dtype=float).reshape(-1, 2)
+    return header, headerlines, headerlengths, obstimes, epochsatlists, satset, gpstime
 
 
 def _converttofloat(numberstr):
@@ -241,7 +252,7 @@ def _converttofloat(numberstr):
         return np.nan
 
 
-def _readblocks(lines, rinexversion, header, headerlines, headerlengths, epochsatlists, satset):
+def _readblocks(lines, rinexversion, header, headerlines, headerlengths, epochsatlists, satset, obscodes=None):
     """ Read and return information in the blocks for the RINEX file
 
     Parameters
@@ -267,6 +278,9 @@ def _readblocks(lines, rinexversion, header, headerlines, headerlengths, epochsa
     satset : set(str)
         Set containing all satellites in the data.
 
+    obscodes : list[str], optional
+        Observables to keep. See processrinexfile.
+
     Returns
     -------
     observationdata : dict
@@ -283,8 +297,10 @@ def _readblocks(lines, rinexversion, header, headerlines, headerlengths, epochsa
     """
     try:
         if '2.1' in rinexversion:
-            return _readblocks_v21(lines, header, headerlines, headerlengths, epochsatlists, satset)
+            return _readblocks_v21(lines, header, headerlines, headerlengths, epochsatlists, satset, obscodes)
         elif '3' in rinexversion:
+            if obscodes is not None:
+                return _readcolumns_v3(lines, header, headerlines, epochsatlists, satset, obscodes)
             return _readblocks_v3(lines, header, headerlines, epochsatlists, satset)
         else:
             raise RinexError('RINEX v%s is not supported.' % rinexversion)
@@ -294,7 +310,7 @@ def _readblocks(lines, rinexversion, header, headerlines, headerlengths, epochsa
 
 
 
-def _readblocks_v21(lines, header, headerlines, headerlengths, epochsatlists, satset):
+def _readblocks_v21(lines, header, headerlines, headerlengths, epochsatlists, satset, obscodes=None):
     """ Read the lines of data.
 
     Parameters
@@ -317,6 +333,9 @@ def _readblocks_v21(lines, header, headerlines, headerlengths, epochsatlists, sa
     satset : set(str)
         Set containing all satellites in the data.
 
+    obscodes : list[str], optional
+        Observables to keep. The whole record is still parsed.
+
     Returns
     -------
     observationdata : dict
@@ -376,7 +395,8 @@ def _readblocks_v21(lines, header, headerlines, headerlengths, epochsatlists, sa
                 continue
 
     for letter in observationdata:
-        kept_observables = [i for i in range(len(obstypes[letter])) if np.sum(~np.isnan(observationdata[letter][:,:,i]))>0]
+        kept_observables = [i for i in range(len(obstypes[letter])) if np.sum(~np.isnan(observationdata[letter][:,:,i]))>0
+                            and _wanted(obstypes[letter][i], obscodes)]
         observationdata[letter] = observationdata[letter][:, :, kept_observables]
         obstypes[letter] = [obstypes[letter][i] for i in kept_observables]
 
@@ -483,7 +503,168 @@ def _readblocks_v3(lines, header, headerlines, epochsatlists, satset):
     return observationdata, satlists, prntoidx, obstypes
 
 
-def processrinexfile(filename, savefile=None):
+def _wanted(obstype, obscodes):
+    """ Whether an observable is one of the requested ones (None means all). """
+    if obscodes is None:
+        return True
+    return any(obstype.startswith(code) for code in obscodes)
+
+
+# RINEX 3 observations are F14.3 followed by the LLI and signal strength flags
+_FIELDWIDTH = 14
+_DECIMALPOINT = 10
+# integer weights of the digits, as floats the sums are exact (below 2**53)
+_FIELDWEIGHTS = np.array([10**(12-j) for j in range(_DECIMALPOINT)] + [0] +
+                         [10**(13-j) for j in range(_DECIMALPOINT+1, _FIELDWIDTH)], dtype=float)
+
+
+def _fieldstofloat(fields):
+    """ Converts fixed-width F14.3 fields to floats without going through python strings.
+
+    Parameters
+    ----------
+    fields : np.ndarray
+        n x 14 array of bytes (uint8). Blank or missing (null, end of line) fields become NaN.
+
+    Returns
+    -------
+    values : np.ndarray
+        n floats
+    """
+    isdigit = (fields >= 48) & (fields <= 57)
+    digits = np.where(isdigit, fields - 48.0, 0.0)
+    # the integer value of the field in units of 0.001, divided once so the result
+    # is the same as float() of the string
+    values = (digits @ _FIELDWEIGHTS) / 1000.0
+    negative = (fields == 45).any(axis=1)
+    values[negative] = -values[negative]
+    values[~isdigit.any(axis=1)] = np.nan
+
+    # anything that does not look like F14.3 is converted the slow way
+    blank = (fields == 32) | (fields == 0) | (fields == 10) | (fields == 13)
+    regular = isdigit | blank | (fields == 45)
+    regular[:, _DECIMALPOINT] = (fields[:, _DECIMALPOINT] == 46) | blank[:, _DECIMALPOINT]
+    for i in np.where(~regular.all(axis=1))[0]:
+        values[i] = _converttofloat(fields[i].tobytes().rstrip(b'\x00').decode('ascii', 'replace'))
+
+    return values
+
+
+def _readcolumns_v3(lines, header, headerlines, epochsatlists, satset, obscodes, chunksize=100000):
+    """ Read only the requested observables of a rinex 3 file.
+
+    Instead of unpacking every field of every satellite line, the data lines are copied into
+    fixed-width byte arrays (chunksize lines at a time) and only the wanted columns are converted,
+    all at once.
+
+    Parameters
+    ----------
+    lines : list[str]
+        List of each line in the RINEX file.
+
+    header : dict
+        Dict containing the header information from the RINEX file.
+
+    headerlines : list[int]
+        List of starting line for the headers of each data block.
+
+    satlists : list[list[str]]
+        List containing lists of satellites present in each block.
+
+    satset : set(str)
+        Set containing all satellites in the data.
+
+    obscodes : list[str]
+        Observables to keep. See processrinexfile.
+
+    chunksize : int, optional
+        Number of data lines converted at a time.
+
+    Returns
+    -------
+    observationdata : dict
+        Dict with data-arrays (only the requested observables).
+
+    satlists : dict
+        Dict with lists of visible satellites.
+
+    prntoidx : dict
+        Dict with translation dicts.
+
+    obstypes : dict
+        Dict with observation types.
+
+    See also
+    --------
+    _readblocks_v3 : reads every observable.
+    """
+    nepochs = len(headerlines)
+
+    allobstypes = {}
+    systemletter = ''
+    for line in header['SYS / # / OBS TYPES'].splitlines():
+        if line[0] != ' ':
+            systemletter = line[0]
+            allobstypes[systemletter] = line[6:].split()
+        else:
+            allobstypes[systemletter].extend(line[6:].split())
+
+    satlists = {letter: [] for letter in allobstypes}
+    for sat in satset:
+        if sat[0] in satlists:
+            satlists[sat[0]].append(int(sat[1:]))
+
+    observationdata = {}
+    prntoidx = {}
+    obstypes = {}
+    columns = {}
+    prnlookup = {}
+    width = 3
+    for letter in allobstypes:
+        if len(satlists[letter]) == 0:
+            satlists.pop(letter)
+            continue
+        satlists[letter].sort()
+        prntoidx[letter] = {prn: idx for idx, prn in enumerate(satlists[letter])}
+        columns[letter] = [i for i, o in enumerate(allobstypes[letter]) if _wanted(o, obscodes)]
+        obstypes[letter] = [allobstypes[letter][i] for i in columns[letter]]
+        observationdata[letter] = np.full((nepochs, len(satlists[letter]), len(columns[letter])), np.nan)
+        prnlookup[letter] = np.full(100, -1)
+        prnlookup[letter][satlists[letter]] = np.arange(len(satlists[letter]))
+        if len(columns[letter]) > 0:
+            width = max(width, 3 + 16*columns[letter][-1] + _FIELDWIDTH)
+
+    # line number and epoch of every satellite record
+    nsat = np.array([len(satlist) for satlist in epochsatlists], dtype=int)
+    epochs = np.repeat(np.arange(nepochs), nsat)
+    first = np.cumsum(nsat) - nsat
+    linenumbers = np.repeat(np.asarray(headerlines, dtype=int) + 1 - first, nsat) + np.arange(len(epochs))
+
+    for start in range(0, len(linenumbers), chunksize):
+        chunk = linenumbers[start:start+chunksize]
+        block = np.array([lines[k] for k in chunk], dtype='S{0:d}'.format(width))
+        block = block.view(np.uint8).reshape(len(chunk), width)
+        epoch = epochs[start:start+chunksize]
+        prn = np.where(block[:, 1] == 32, 0, block[:, 1].astype(int) - 48)*10 + block[:, 2].astype(int) - 48
+        for letter in observationdata:
+            rows = np.where(block[:, 0] == ord(letter))[0]
+            if len(rows) == 0 or len(columns[letter]) == 0:
+                continue
+            isat = prnlookup[letter][np.clip(prn[rows], 0, 99)]
+            rows, isat = rows[isat >= 0], isat[isat >= 0]
+            for j, col in enumerate(columns[letter]):
+                i1 = 3 + 16*col
+                observationdata[letter][epoch[rows], isat, j] = _fieldstofloat(block[rows, i1:i1+_FIELDWIDTH])
+
+    for letter in observationdata:
+        kept_observables = [i for i in range(len(obstypes[letter])) if np.sum(~np.isnan(observationdata[letter][:,:,i]))>0]
+        observationdata[letter] = observationdata[letter][:, :, kept_observables]
+        obstypes[letter] = [obstypes[letter][i] for i in kept_observables]
+
+    return observationdata, satlists, prntoidx, obstypes
+
+
+def processrinexfile(filename, savefile=None, obscodes=None):
     """ Process a RINEX file into python format
 
     Parameters
@@ -494,6 +675,11 @@ def processrinexfile(filename, savefile=None):
     savefile : str, optional
         Name of file to save data to. If supplied the data is saved to a compressed npz file.
 
+    obscodes : list[str], optional
+        Observables to keep, e.g. ['S1C', 'S2W']. An entry matches every observable that starts with it,
+        so ['S'] keeps all the signal strengths. For RINEX 3 only these columns are read, which is much
+        faster and uses much less memory than reading everything. Default (None) keeps all observables.
+
     Returns
     -------
     observationdata : dict
@@ -528,7 +714,7 @@ def processrinexfile(filename, savefile=None):
 
     header, headerlines, headerlengths, obstimes, epochsatlists, satset,gpstime = _readheader(lines, rinexversion)
     observationdata, satlists, prntoidx, obstypes = _readblocks(lines, rinexversion, header, headerlines,
-                                                                headerlengths, epochsatlists, satset)
+                                                                headerlengths, epochsatlists, satset, obscodes)
 
     if savefile is not None:
         saverinextonpz(savefile, observationdata, satlists, prntoidx, obstypes, header, obstimes)
@@ -536,7 +722,306 @@ def processrinexfile(filename, savefile=None):
     return observationdata, satlists, prntoidx, obstypes, header, obstimes, gpstime 
 
 
-def mergerinexfiles(filelist, savefile=None):
+def _epochrecords(f, rinexversion, header):
+    """ Yields the lines of one epoch record at a time (the epoch line, its continuation lines and the
+    observations, or an event record with its following lines).
+
+    Parameters
+    ----------
+    f : file object
+        open RINEX file, positioned just after END OF HEADER
+
+    rinexversion : str
+        Version number for the RINEX file
+
+    header : dict
+        Dict containing the header information from the RINEX file.
+    """
+    if '3' in rinexversion and '2.1' not in rinexversion:
+        # every epoch record starts with '>', observation lines never do
+        record = []
+        for line in f:
+            if line[0] == '>' and len(record) > 0:
+                yield record
+                record = []
+            record.append(line)
+        if len(record) > 0:
+            yield record
+        return
+
+    rowpersat = 1 + (len(header['# / TYPES OF OBSERV'][6:].split())-1) // 5
+    pattern = re.compile(r'(\s{2}\d|\s\d{2}){2}')
+    line = f.readline()
+    while line:
+        if not pattern.match(line[:6]):
+            # not an epoch line, same as _readheader_v21x we look for the next one
+            line = f.readline()
+            continue
+        record = [line]
+        if int(line[28]) in (0, 1, 6):
+            numsats = int(line[29:32])
+            nlines = (numsats-1)//12 + numsats*rowpersat
+        else:
+            nlines = int(line[30:32])
+        for i in range(nlines):
+            record.append(f.readline())
+        yield record
+        line = f.readline()
+
+
+def readrinexchunks(filename, chunksize=3600, obscodes=None):
+    """ Reads a RINEX file a chunk of epochs at a time, so that memory depends on the chunk size
+    rather than the size of the file.
+
+    Parameters
+    ----------
+    filename : str
+        Filename of the rinex file
+
+    chunksize : int, optional
+        Number of observation epochs in each chunk. Default is 3600 (an hour of 1 Hz data).
+
+    obscodes : list[str], optional
+        Observables to keep, see processrinexfile.
+
+    Yields
+    ------
+    observationdata, satlists, prntoidx, obstypes, header, obstimes, gpstime
+        The same as processrinexfile, for the epochs of one chunk. The satellite lists (and the
+        observables that have data) are those of the chunk.
+    """
+    rinexversion = getrinexversion(filename)
+
+    with open(filename, 'r') as f:
+        headerlines = []
+        for line in f:
+            headerlines.append(line)
+            if 'END OF HEADER' in line:
+                break
+        header = _readheader(headerlines, rinexversion)[0]
+
+        # only observation epochs count, an event record goes along with the chunk it is in
+        flagcolumn = 28 if '2.1' in rinexversion else 31
+        lines = []
+        nepochs = 0
+        for record in _epochrecords(f, rinexversion, header):
+            lines.extend(record)
+            if record[0][flagcolumn:flagcolumn+1] in ('0', '1', '6'):
+                nepochs += 1
+            if nepochs == chunksize:
+                yield _readchunk(headerlines + lines, rinexversion, obscodes)
+                lines = []
+                nepochs = 0
+        if nepochs > 0:
+            yield _readchunk(headerlines + lines, rinexversion, obscodes)
+
+
+def _readchunk(lines, rinexversion, obscodes):
+    """ Reads the header and data of (part of) a RINEX file that is already split into lines. """
+    header, headerlines, headerlengths, obstimes, epochsatlists, satset, gpstime = _readheader(lines, rinexversion)
+    observationdata, satlists, prntoidx, obstypes = _readblocks(lines, rinexversion, header, headerlines,
+                                                                headerlengths, epochsatlists, satset, obscodes)
+    return observationdata, satlists, prntoidx, obstypes, header, obstimes, gpstime
+
+
+def rinex_cache_name(filename, obscodes=None):
+    """ Name of the cache file for a RINEX file, in $REFL_CODE/rinex_cache/
+
+    The name is the SHA-1 of the contents of the RINEX file and the observables that are kept,
+    so a renamed or copied file uses the same cache, and an edited one does not.
+
+    Parameters
+    ----------
+    filename : str
+        Filename of the rinex file
+
+    obscodes : list[str], optional
+        Observables that are kept, see processrinexfile.
+
+    Returns
+    -------
+    cachefile : str
+        e.g. $REFL_CODE/rinex_cache/0b5e...c2_S.npz
+    """
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    tag = 'all' if obscodes is None else '-'.join(obscodes)
+    xdir = os.environ.get('REFL_CODE', '.') + '/rinex_cache/'
+    return xdir + sha.hexdigest() + '_' + tag + '.npz'
+
+
+def _writearray(zf, name, array):
+    """ Adds one array to an open npz (zip) file. """
+    with zf.open(name + '.npy', 'w', force_zip64=True) as fid:
+        np.lib.format.write_array(fid, np.asanyarray(array), allow_pickle=False)
+
+
+def _writecachechunk(zf, k, chunk):
+    """ Adds chunk number k (as yielded by readrinexchunks) to an open npz (zip) file. """
+    observationdata, satlists, prntoidx, obstypes, header, obstimes, gpstime = chunk
+    prefix = 'c{0:d}_'.format(k)
+    systems = [letter for letter in observationdata]
+    _writearray(zf, prefix + 'systems', np.array(systems, dtype='U1'))
+    for letter in systems:
+        _writearray(zf, prefix + letter + 'systemdata', observationdata[letter])
+        _writearray(zf, prefix + letter + 'systemsatlists', np.array(satlists[letter], dtype=int))
+        _writearray(zf, prefix + letter + 'obstypes', np.array(obstypes[letter], dtype='U3'))
+    _writearray(zf, prefix + 'obstimes', np.array(obstimes, dtype='datetime64[us]'))
+    _writearray(zf, prefix + 'gpstime', gpstime)
+
+
+def _readcachechunk(npz, k, header):
+    """ Chunk number k of a cache file, in the format of readrinexchunks. """
+    prefix = 'c{0:d}_'.format(k)
+    observationdata = {}
+    satlists = {}
+    prntoidx = {}
+    obstypes = {}
+    for letter in npz[prefix + 'systems']:
+        letter = str(letter)
+        observationdata[letter] = npz[prefix + letter + 'systemdata']
+        satlists[letter] = [int(prn) for prn in npz[prefix + letter + 'systemsatlists']]
+        prntoidx[letter] = {prn: idx for idx, prn in enumerate(satlists[letter])}
+        obstypes[letter] = [str(o) for o in npz[prefix + letter + 'obstypes']]
+    obstimes = npz[prefix + 'obstimes'].tolist()
+    gpstime = npz[prefix + 'gpstime']
+    return observationdata, satlists, prntoidx, obstypes, header, obstimes, gpstime
+
+
+def _opencache(cachefile):
+    """ Opens a cache file, returns the npz file, the header and the number of chunks,
+    or None if the file is missing, unreadable or from another cache version. """
+    if not os.path.isfile(cachefile):
+        return None
+    try:
+        npz = np.load(cachefile)
+        if int(npz['version']) != RINEX_CACHE_VERSION:
+            return None
+        nchunks = int(npz['nchunks'])
+        if 'c{0:d}_gpstime.npy'.format(nchunks-1) not in npz.zip.namelist():
+            return None
+        header = json.loads(str(npz['header']))
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+    return npz, header, nchunks
+
+
+def evict_rinex_cache(budget_mb, keep=None):
+    """ Deletes the least recently used cache files until the cache is within its size budget
+
+    Parameters
+    ----------
+    budget_mb : float
+        size budget of $REFL_CODE/rinex_cache/ in MB
+
+    keep : str, optional
+        a cache file that should not be deleted (e.g. the one just written)
+    """
+    xdir = os.environ.get('REFL_CODE', '.') + '/rinex_cache/'
+    if not os.path.isdir(xdir):
+        return
+    files = []
+    for name in os.listdir(xdir):
+        if name.endswith('.npz'):
+            st = os.stat(xdir + name)
+            files.append((st.st_mtime, st.st_size, xdir + name))
+    total = sum(f[1] for f in files)
+    # oldest first. a cache hit updates the modification time
+    for mtime, size, cachefile in sorted(files):
+        if total <= budget_mb*1e6:
+            break
+        if cachefile == keep:
+            continue
+        try:
+            os.remove(cachefile)
+            total -= size
+        except OSError:
+            pass
+
+
+def cachedrinexchunks(filename, chunksize=3600, obscodes=None, budget_mb=2000):
+    """ Same as readrinexchunks, but the parsed data are kept in a cache ($REFL_CODE/rinex_cache/)
+    so the RINEX file only has to be parsed once, e.g. when it is translated again with another
+    SNR choice, orbit source or decimation rate.
+
+    With obscodes=['S'] only the signal strengths and times are stored, so the cache files are small.
+    The least recently used files are deleted when the cache is bigger than budget_mb.
+
+    Parameters
+    ----------
+    filename : str
+        Filename of the rinex file
+
+    chunksize : int, optional
+        Number of epochs in each chunk when the file is parsed. Default is 3600.
+
+    obscodes : list[str], optional
+        Observables to keep, see processrinexfile.
+
+    budget_mb : float, optional
+        size budget of the cache in MB. Default is 2000
+
+    Yields
+    ------
+    observationdata, satlists, prntoidx, obstypes, header, obstimes, gpstime
+        The same as readrinexchunks
+    """
+    cachefile = rinex_cache_name(filename, obscodes)
+    cache = _opencache(cachefile)
+    if cache is not None:
+        npz, header, nchunks = cache
+        print('Using the parsed RINEX cache', cachefile)
+        try:
+            os.utime(cachefile)
+        except OSError:
+            pass
+        with npz:
+            for k in range(nchunks):
+                yield _readcachechunk(npz, k, header)
+        return
+
+    tmpfile = cachefile + '.' + str(os.getpid())
+    zf = None
+    try:
+        os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+        zf = zipfile.ZipFile(tmpfile, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+    except OSError:
+        # read-only area or full disk. not fatal - the cache is only a convenience
+        zf = None
+
+    nchunks = 0
+    header = None
+    try:
+        for chunk in readrinexchunks(filename, chunksize, obscodes):
+            if zf is not None:
+                try:
+                    _writecachechunk(zf, nchunks, chunk)
+                except OSError:
+                    zf.close(); zf = None
+            header = chunk[4]
+            nchunks += 1
+            yield chunk
+        if (zf is not None) and (nchunks > 0):
+            try:
+                _writearray(zf, 'header', np.array(json.dumps(header)))
+                _writearray(zf, 'nchunks', np.array(nchunks))
+                _writearray(zf, 'version', np.array(RINEX_CACHE_VERSION))
+                zf.close(); zf = None
+                os.replace(tmpfile, cachefile)
+                evict_rinex_cache(budget_mb, keep=cachefile)
+            except OSError:
+                pass
+    finally:
+        # also reached if the caller stops early. an incomplete cache is not kept
+        if zf is not None:
+            zf.close()
+        if os.path.isfile(tmpfile):
+            os.remove(tmpfile)
+
+
+def mergerinexfiles(filelist, savefile=None, obscodes=None):
     """ Process several rinexfiles and merges them into one file.
 
     Can be used to for example merge several rinexfiles from the same day to a single file. All files must be from the
@@ -553,6 +1038,9 @@ def mergerinexfiles(filelist, savefile=None):
     savefile : str, optional
         Name of file to save data to. If supplied the data is saved to a compressed npz file.
 
+    obscodes : list[str], optional
+        Observables to keep, see processrinexfile.
+
     Returns
     -------
     observationdata : dict
@@ -595,9 +1083,9 @@ def mergerinexfiles(filelist, savefile=None):
                         line = f.readline()
                     lines.extend(f.read().splitlines(True))
 
-        header, headerlines, headerlengths, obstimes, epochsatlists, satset = _readheader(lines, rinexversion)
+        header, headerlines, headerlengths, obstimes, epochsatlists, satset, gpstime = _readheader(lines, rinexversion)
         observationdata, satlists, prntoidx, obstypes = _readblocks(lines, rinexversion, header, headerlines,
-                                                                    headerlengths, epochsatlists, satset)
+                                                                    headerlengths, epochsatlists, satset, obscodes)
 
         if savefile is not None:
             saverinextonpz(savefile, observationdata, satlists, prntoidx, obstypes, header, obstimes)
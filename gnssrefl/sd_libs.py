@@ -3,11 +3,11 @@ import datetime
 import math
 import matplotlib.pyplot as plt
 import numpy as np
-from astropy.time import Time
 
 # gnssrefl specific code
 import gnssrefl.gps as g
 import gnssrefl.gnssir_v2 as guts2
+import gnssrefl.time_arrays as ta
 
 def mjd_to_obstimes(mjd):
     """
@@ -24,7 +24,7 @@ def mjd_to_obstimes(mjd):
 
     """
 
-    dt = Time(mjd,format='mjd').utc.datetime; 
+    dt = ta.mjd_to_obstimes(mjd)
 
     return dt
 
@@ -87,15 +87,14 @@ def write_spline_output(iyear, th, spline, delta_out, station, txtdir,Hortho):
         fout.write('{0:1s}  {1:30s}  \n'.format('%','(1)              (2)  (3) (4) (5) (6) (7) (8)    (9)'))
 
 
-        dtime = False
+        modjul = ta.fdoy2mjd(iyear,tplot)
+        doy = np.floor(tplot)
+        utc= 24*(tplot - doy)
+        yy,mm,dd,hh,mi,ss = ta.ymd_hhmmss(iyear,doy,utc)
         for i in range(0,N):
-            modjul = g.fdoy2mjd(iyear,tplot[i])
-            doy = math.floor(tplot[i])
-            utc= 24*(tplot[i] - doy)
-            bigt,yy,mm,dd,hh,mi,ss = g.ymd_hhmmss(iyear,doy,utc,dtime)
             if (tplot[i] >= firstpoint) & (tplot[i] <= lastpoint):
                 fout.write('{0:15.7f}  {1:10.3f} {2:4.0f} {3:3.0f} {4:3.0f} {5:3.0f} {6:3.0f} {7:3.0f} {8:10.3f} \n'.format(
-                    modjul, spline_even[i], yy,mm,dd,hh,mi,ss, Hortho-spline_even[i]))
+                    modjul[i], spline_even[i], yy[i],mm[i],dd[i],hh[i],mi[i],ss[i], Hortho-spline_even[i]))
         fout.close()
 
 def testing_nvals(Gval, Rval, Eval, Cval):
@@ -939,6 +938,52 @@ def subdaily_resids_last_stage(station, year, th, biasCor_rh, spline_at_GPS, fs,
 
     return badpoints2
 
+def write_spline_header(fout, station, H0):
+    """
+    writes the header of the evenly sampled spline output file
+
+    Parameters
+    ----------
+    fout : file handle
+        the spline output file
+    station : str
+        name of station, 4 ch
+    H0 : float
+        orthometric height used to convert RH to water level, in meters
+
+    """
+    vn = station + ' gnssrefl v' + str(g.version('gnssrefl'))
+    fout.write('{0:1s}  {1:30s}  \n'.format('%','station ' + vn))
+    fout.write('{0:1s}  {1:30s}  \n'.format('%','This is NOT observational data - be careful when interpreting it.'))
+    fout.write('{0:1s}  {1:30s}  \n'.format('%','If the data are not well represented by the spline functions, you will '))
+    fout.write('{0:1s}  {1:30s}  \n'.format('%','have a very poor representation of the data. I am also writing out station '))
+    fout.write('{0:1s}  {1:30s}  {2:8.3f} \n'.format('%','orthometric height minus RH, where Hortho (m) is ', H0  ))
+    #fout.write('{0:1s}  {1:30s}  \n'.format('%','This assumes RH is measured relative to the L1 phase center.  '))
+    #fout.write('{0:1s}  {1:30s}  \n'.format('%','MJD, RH(m), YY,MM,DD,HH,MM,SS, quasi-sea-level(m)'))
+    fout.write('{0:1s}  {1:30s}  \n'.format('%','MJD              RH(m)  YYYY  MM  DD  HH  MM  SS   quasi-sea-level(m)'))
+    fout.write('{0:1s}  {1:30s}  \n'.format('%','(1)               (2)   (3)  (4) (5)  (6) (7) (8)    (9)'))
+
+def write_spline_row(fout, mjd, rhout, year, month, day, hour, minute, second, H0):
+    """
+    writes one line of the evenly sampled spline output file
+
+    Parameters
+    ----------
+    fout : file handle
+        the spline output file
+    mjd : float
+        modified julian day
+    rhout : float
+        spline value of the reflector height, meters
+    year, month, day, hour, minute, second : int
+        calendar time of mjd
+    H0 : float
+        orthometric height used to convert RH to water level, in meters
+
+    """
+    fout.write('{0:15.7f}  {1:10.3f} {2:4.0f} {3:3.0f} {4:3.0f} {5:3.0f} {6:3.0f} {7:3.0f} {8:10.3f} \n'.format(
+        mjd, rhout, year, month, day, hour, minute, second, H0-rhout))
+
 def RH_ortho_plot2( station, H0, year,  txtdir, fs, time_rh, rh, gap_min_val,th,spline,delta_out):
     """
 
@@ -998,16 +1043,7 @@ def RH_ortho_plot2( station, H0, year,  txtdir, fs, time_rh, rh, gap_min_val,th,
     splinefileout =  txtdir + '/' + station +  '_spline_out.txt'
     print('Writing evenly sampled file to: ', splinefileout)
     fout = open(splinefileout,'w+')
-    vn = station + ' gnssrefl v' + str(g.version('gnssrefl'))
-    fout.write('{0:1s}  {1:30s}  \n'.format('%','station ' + vn))
-    fout.write('{0:1s}  {1:30s}  \n'.format('%','This is NOT observational data - be careful when interpreting it.'))
-    fout.write('{0:1s}  {1:30s}  \n'.format('%','If the data are not well represented by the spline functions, you will '))
-    fout.write('{0:1s}  {1:30s}  \n'.format('%','have a very poor representation of the data. I am also writing out station '))
-    fout.write('{0:1s}  {1:30s}  {2:8.3f} \n'.format('%','orthometric height minus RH, where Hortho (m) is ', H0  ))
-    #fout.write('{0:1s}  {1:30s}  \n'.format('%','This assumes RH is measured relative to the L1 phase center.  '))
-    #fout.write('{0:1s}  {1:30s}  \n'.format('%','MJD, RH(m), YY,MM,DD,HH,MM,SS, quasi-sea-level(m)'))
-    fout.write('{0:1s}  {1:30s}  \n'.format('%','MJD              RH(m)  YYYY  MM  DD  HH  MM  SS   quasi-sea-level(m)'))
-    fout.write('{0:1s}  {1:30s}  \n'.format('%','(1)               (2)   (3)  (4) (5)  (6) (7) (8)    (9)'))
+    write_spline_header(fout, station, H0)
 
 
     # difference function to find time between all rh measurements
@@ -1026,17 +1062,12 @@ def RH_ortho_plot2( station, H0, year,  txtdir, fs, time_rh, rh, gap_min_val,th,
     N = len(mjd[ii])
     Ngdiff = len(gdiff)
 
-    dlist = mjd_new_obstimes.tolist()
-
 
     # i have not figured this one out yet ... the horror
     #if not multiyear:
     if True:
     # get the integer values to write out  to the text file ...
-        theyear = [y.year for y in dlist ]
-        xm = [y.month for y in dlist]; xd = [y.day for y in dlist]
-        xh = [y.hour for y in dlist]; xmin = [y.minute for y in dlist]
-        xs = [y.second for y in dlist]
+        theyear, xm, xd, xh, xmin, xs = ta.datetime64_parts(ta.mjd_datetime64(mjd_new))
 
         if (Ngdiff > 0):
             for i in range(0,Ngdiff):
@@ -1049,9 +1080,7 @@ def RH_ortho_plot2( station, H0, year,  txtdir, fs, time_rh, rh, gap_min_val,th,
     # write the spline values to a file, with gaps removed
         for i in range(0,N_new):
             if not np.isnan(spline_new[i]):
-                rhout = spline_new[i]
-                fout.write('{0:15.7f}  {1:10.3f} {2:4.0f} {3:3.0f} {4:3.0f} {5:3.0f} {6:3.0f} {7:3.0f} {8:10.3f} \n'.format(
-                    mjd_new[i], rhout, theyear[i], xm[i], xd[i], xh[i], xmin[i], xs[i], H0-rhout))
+                write_spline_row(fout, mjd_new[i], spline_new[i], theyear[i], xm[i], xd[i], xh[i], xmin[i], xs[i], H0)
 
 
     fout.close()
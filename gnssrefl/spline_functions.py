@@ -17,6 +17,7 @@ import time
 
 # my local functions
 import gnssrefl.gps as g
+import gnssrefl.read_snr_files as snr
 import gnssrefl.refraction as refr
 
 
@@ -1329,7 +1330,8 @@ def loadsnrfile(snrfile, thedir):
 
     print('Reading file:', snrin)
     # this assumes someone has checked existence first
-    snrdata = np.loadtxt(snrin)
+    # copy, since the time tags are changed below
+    snrdata = np.array(snr.load_snr(snrin))
 
     stryear = str(int(snrfile[9:11]) + 2000)
     strdoy = snrfile[4:7]
@@ -13,8 +13,11 @@ from datetime import date
 # support code
 import gnssrefl.gnssir_v2 as guts2
 import gnssrefl.gps as g
+import gnssrefl.results_store as results_store
 
+import gnssrefl.banded_spline as banded_spline
 import gnssrefl.sd_libs as sd
+import gnssrefl.time_arrays as ta
 
 
 import scipy
@@ -134,12 +137,12 @@ def write_subdaily(outfile,station,ntv,writecsv,extraline,**kwargs):
             write_out_header(fout,station,extraline, IF=True)
         else:
             write_out_header(fout,station,extraline)
-    dtime = False
+    # calendar dates and times of all the rows at once
+    yy, mm, dd, hh, mi, ss = ta.ymd_hhmmss(ntv[:,0], ntv[:,1], ntv[:,4])
     for i in np.arange(0,N,1):
         year = int(ntv[i,0]); doy = int(ntv[i,1])
-        year, month, day, cyyyy,cdoy, YMD = g.ydoy2useful(year,doy)
         rh = ntv[i,2]; UTCtime = ntv[i,4]; 
-        dob, year, month, day, hour, minute, second = g.ymd_hhmmss(year,doy,UTCtime,dtime)
+        month = mm[i]; day = dd[i]; hour = hh[i]; minute = mi[i]; second = ss[i]
         #ctime = g.nicerTime(UTCtime); 
         #hr = ctime[0:2]
         #minute = ctime[3:5]
@@ -238,6 +241,8 @@ def readin_and_plot(station, year,d1,d2,plt2screen,extension,sigma,writecsv,azim
 
     # felipe nievinski alternate definition
     alt_sigma = kwargs.get('alt_sigma', False)
+    # read the daily results through the results store
+    usestore = kwargs.get('usestore', False)
     # fontsize for plot labels and such
     xdir = os.environ['REFL_CODE']
     print('Will remove daily outliers greater than ', sigma, ' sigma')
@@ -259,21 +264,15 @@ def readin_and_plot(station, year,d1,d2,plt2screen,extension,sigma,writecsv,azim
         obstimes = []
         tv = np.empty(shape=[0, 17])
         if os.path.isdir(direc):
-            all_files = os.listdir(direc)
-            for f in all_files:
-            # only evaluate txt files
-                if (len(f) ==  7) and (f[4:7] == 'txt'):
-                    day = int(f[0:3])
-                    if (day >= d1) & (day <= d2):
-                        fname = direc + f
-                        try:
-                            with warnings.catch_warnings():
-                                warnings.simplefilter("ignore")
-                                a = np.loadtxt(fname,comments='%')
-                            if len(a) > 0:
-                                tv = np.append(tv, a,axis=0)
-                        except:
-                            print('some issue with ',fname)
+            # with usestore, one query of the results store for the whole day range. Files
+            # that are not in it yet (or changed) are parsed and stored
+            tvlist = [tv]
+            for f, fname, a in results_store.load_results(station, extension, year, d1, d2, usestore):
+                if (a is None) or ((len(a) > 0) and (a.shape[1] != tv.shape[1])):
+                    print('some issue with ',fname)
+                elif len(a) > 0:
+                    tvlist.append(a)
+            tv = np.vstack(tvlist)
 
     else:
         print('using external file of concatenated results', txtfile)
@@ -289,10 +288,7 @@ def readin_and_plot(station, year,d1,d2,plt2screen,extension,sigma,writecsv,azim
     # now that you have everything the way you want it .... 
     # make the datatime objects
     nr,nc = tv.shape
-    otimes = []
-    for ijk in range(0,nr):
-        dtime, iyear,imon,iday,ihour,imin,isec = g.ymd_hhmmss(tv[ijk,0],tv[ijk,1],tv[ijk,4],True)
-        otimes.append(dtime)
+    otimes = ta.obstimes(tv[:,0],tv[:,1],tv[:,4])
 
     # make arrays to save number of RH retrievals on each day
     residuals = np.empty(shape=[0,1])
@@ -302,9 +298,10 @@ def readin_and_plot(station, year,d1,d2,plt2screen,extension,sigma,writecsv,azim
     Cval=[]; Gval =[]; Rval=[]; Eval=[]
     stats = np.empty(shape=[0,3])
     # only look at the doy range where i have data
+    noons = ta.obstimes(year,np.arange(fdoy,ldoy+1),12)
     for d in range(fdoy,(ldoy+1)):
         ii = (tv[:,1] == d) ; tmp = tv[ii,:]
-        dtime, iyear,imon,iday,ihour,imin,isec = g.ymd_hhmmss(year,d,12,True)
+        dtime = noons[d-fdoy]
         tval.append(dtime)
         n = len(tv[ii,1])
         # total
@@ -662,42 +659,64 @@ def flipit(tvd,col):
     # ???
     gap = 5/24 # up to five hour gap allowed before warning
 
-    tnew =[] ; ynew =[]; faket = [];
-    # fill in gaps using variables called tnew and ynew
-    Ngaps = 0
-    for i in range(1,len(th)):
-        d= th[i]-th[i-1] # delta in time in units of days ?
-        if (d > gap):
-            x0 = th[i-1:i+1] ; h0 = h[i-1:i+1]
-
-            # only print out the gap information the first time thru
-            if col == 3:
-                print('Gap on doy:', int(np.floor(x0[0])), ' lasting ', round(d*24,2), ' hours ')
-            #print(d,x0,h0)
-            Ngaps = Ngaps + 1
-            f = scipy.interpolate.interp1d(x0,h0)
-            # so this is fake data
-            ttnew = np.arange(th[i-1]+fillgap, th[i], fillgap)
-            yynew = f(ttnew)
-            faket = np.append(faket, ttnew)
-            # now append it to your real data
-            tnew = np.append(tnew,ttnew)
-            ynew = np.append(ynew,yynew)
-        else:
-            tnew = np.append(tnew,th[i])
-            ynew = np.append(ynew,h[i])
+    tnew, ynew = fill_gaps(th, h, gap, fillgap, col == 3, 'doy')
+
+    return tnew, ynew
 
+def fill_gaps(th, h, gap, fillgap, verbose, units):
+    """
+    fills the temporal gaps of a sorted RH series with fake data, linearly
+    interpolated, for flipit and flipit2.  As before, the first point and
+    the point ending each gap are not kept.
+
+    Parameters
+    ----------
+    th : numpy array of floats
+        sorted times, in days
+    h : numpy array of floats
+        RH in meters
+    gap : float
+        gaps longer than this (days) are filled
+    fillgap : float
+        spacing of the fake data, in days
+    verbose : bool
+        whether the gaps are printed to the screen
+    units : str
+        name of the time units for the printout (doy or MJD)
 
-    if (Ngaps > 3) and (col == 3):
+    Returns
+    -------
+    tnew : numpy array of floats
+        times with the gaps filled, sorted
+    ynew : numpy array
+        RH in meters
+
+    """
+    d = np.diff(th) # delta in time in units of days
+    igap = np.flatnonzero(d > gap) + 1
+    keep = np.ones(len(th), dtype=bool)
+    keep[0] = False; keep[igap] = False
+
+    tlist = [th[keep]]; ylist = [h[keep]]
+    # only loop over the gaps, not over the points
+    for i in igap:
+        # only print out the gap information the first time thru
+        if verbose:
+            print('Gap on ' + units + ':', int(np.floor(th[i-1])), ' lasting ', round(d[i-1]*24,2), ' hours ')
+        # so this is fake data
+        ttnew = np.arange(th[i-1]+fillgap, th[i], fillgap)
+        tlist.append(ttnew)
+        ylist.append(np.interp(ttnew, th[i-1:i+1], h[i-1:i+1]))
+
+    if (len(igap) > 3) and verbose:
         print('\nThis is a beta version of the rhdot/spline fit code - and does not')
         print('work well with gaps. You have been warned!\n')
 
+    tnew = np.concatenate(tlist); ynew = np.concatenate(ylist)
     # sort again
-    ii = np.argsort( tnew) 
-    tnew = tnew[ii]
-    ynew = ynew[ii]
+    ii = np.argsort( tnew)
 
-    return tnew, ynew
+    return tnew[ii], ynew[ii]
 
 
 def rhdot_correction2(station,fname,fname_new,pltit,outlierV,outlierV2,**kwargs):
@@ -876,10 +895,10 @@ def rhdot_correction2(station,fname,fname_new,pltit,outlierV,outlierV2,**kwargs)
     t2 = tnew.max()-firstKnot_in_minutes/60/24
     knots =np.linspace(t1,t2,num=numKnots)
 
-    t, c, k = interpolate.splrep(tnew, ynew, s=0, k=3,t=knots,task=-1)
-
-
-    spline = interpolate.BSpline(t, c, k, extrapolate=False)
+    # least squares spline, same as splrep with task=-1. The banded normal matrix
+    # is kept so that the second fit only has to downdate the outliers
+    bspline = banded_spline.BandedSpline(tnew, knots)
+    spline = bspline.fit(ynew)
     # this is to get  RHdot, evenly spaced data - units of days
     N = int(Ndays*perday)
     xx = np.linspace(tnew.min(), tnew.max(), N)
@@ -1095,9 +1114,14 @@ def rhdot_correction2(station,fname,fname_new,pltit,outlierV,outlierV2,**kwargs)
     knots =np.linspace(t1,t2,num=numKnots)
 
 
-    t, c, k = interpolate.splrep(tnew, ynew, s=0, k=3,t=knots,task=-1)
-    # compute spline - use for times th
-    spline = interpolate.BSpline(t, c, k, extrapolate=False)
+    # compute spline - use for times th. With the same knots, the normal matrix of
+    # the first fit is reused: the removed points are downdated and only the new
+    # ones (if the outliers opened new gaps) are added
+    if bspline.same_knots(tnew, knots):
+        bspline.set_times(tnew)
+    else:
+        bspline = banded_spline.BandedSpline(tnew, knots)
+    spline = bspline.fit(ynew)
 
     # calculate spline values at GPS time tags
     spline_at_GPS = spline(th)
@@ -1253,40 +1277,7 @@ def flipit2(tvd,col):
     # ???
     gap = 5/24 # up to five hour gap allowed before warning
 
-    tnew =[] ; ynew =[]; faket = [];
-    # fill in gaps using variables called tnew and ynew
-    Ngaps = 0
-    for i in range(1,len(th)):
-        d= th[i]-th[i-1] # delta in time in units of days ?
-        if (d > gap):
-            x0 = th[i-1:i+1] ; h0 = h[i-1:i+1]
-
-            # only print out the gap information the first time thru
-            if col == 3:
-                print('Gap on MJD:', int(np.floor(x0[0])), ' lasting ', round(d*24,2), ' hours ')
-            #print(d,x0,h0)
-            Ngaps = Ngaps + 1
-            f = scipy.interpolate.interp1d(x0,h0)
-            # so this is fake data
-            ttnew = np.arange(th[i-1]+fillgap, th[i], fillgap)
-            yynew = f(ttnew)
-            faket = np.append(faket, ttnew)
-            # now append it to your real data
-            tnew = np.append(tnew,ttnew)
-            ynew = np.append(ynew,yynew)
-        else:
-            tnew = np.append(tnew,th[i])
-            ynew = np.append(ynew,h[i])
-
-
-    if (Ngaps > 3) and (col == 3):
-        print('\nThis is a beta version of the rhdot/spline fit code - and does not')
-        print('work well with gaps. You have been warned!\n')
-
-    # sort again
-    ii = np.argsort( tnew) 
-    tnew = tnew[ii]
-    ynew = ynew[ii]
+    tnew, ynew = fill_gaps(th, h, gap, fillgap, col == 3, 'MJD')
 
     return tnew, ynew
 
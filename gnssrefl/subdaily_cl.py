@@ -8,6 +8,8 @@ import sys
 
 import gnssrefl.gps as g
 import gnssrefl.subdaily as t
+import gnssrefl.subdaily_incremental as subdaily_incremental
+import gnssrefl.instrument as instrument
 
 from gnssrefl.utils import str2bool
 
@@ -47,11 +49,14 @@ def parse_arguments():
     parser.add_argument("-alt_sigma", default=None, type=str, help="boolean test for alternate Nievinski sigma definition. default is False")
     parser.add_argument("-gap_min_val", default=None, type=float, help="min gap allowed in splinefit output file. default is 6 hours")
     parser.add_argument("-knots2", default=None, type=int, help="Secondary knots value for final fit. default is to use original knots value.")
+    parser.add_argument("-incremental", default=None, type=str, help="set to True to only refit the last days and append to the spline output. default is False")
+    parser.add_argument("-window", default=None, type=int, help="days refit in incremental mode. default is 2")
+    parser.add_argument("-results_store", default=None, type=str, help="set to True to read the results through the store written by gnssir -results_store T. default is False")
 
     args = parser.parse_args().__dict__
 
     # convert all expected boolean inputs from strings to booleans
-    boolean_args = ['csvfile', 'plt', 'rhdot', 'testing','kplt','if_corr','hires_figs','apply_rhdot','alt_sigma']
+    boolean_args = ['csvfile', 'plt', 'rhdot', 'testing','kplt','if_corr','hires_figs','apply_rhdot','alt_sigma','incremental','results_store']
     args = str2bool(args, boolean_args)
 
     # only return a dictionary of arguments that were added from the user - all other defaults will be set in code below
@@ -65,7 +70,7 @@ def subdaily(station: str, year: int, txtfile_part1: str = '', txtfile_part2: st
         azim1: int=0, azim2: int = 360, peak2noise: float = 0, kplt: bool = False, 
         subdir: str = None, delta_out : int = 1800, if_corr: bool = True, knots_test: int = 0, 
              hires_figs : bool=False, apply_rhdot : bool=True, fs: int = 10, alt_sigma: bool= False, gap_min_val: float=6.0,
-             year_end: int=None, knots2 : int=None):
+             year_end: int=None, knots2 : int=None, incremental: bool=False, window: int=2, results_store: bool=False):
     """
     Subdaily combines gnssir solutions and applies relevant corrections needed to measure water levels (tides). 
     As of January 2024, it will allow multiple years. You can also specify which day of year to start with, i.e.
@@ -129,6 +134,10 @@ def subdaily(station: str, year: int, txtfile_part1: str = '', txtfile_part2: st
     subdaily at03 2022 -azim1 180 -azim2 270
         restrict solutions to azimuths between 180 and 270
 
+    subdaily at01 2023 -incremental T
+        only refit the last two days of 2023 and append them to the spline output.
+        meant for stations where subdaily is rerun every hour
+
     Parameters
     ----------
     station : str
@@ -205,6 +214,18 @@ def subdaily(station: str, year: int, txtfile_part1: str = '', txtfile_part2: st
         bigger than this value, in hours
     year_end : int, optional
         last year of analysis period.  
+    knots2 : int, optional
+        knots per day for the final fit. default is to use knots
+    incremental : bool, optional
+        keeps the fitted state of the station and only refits the last days
+        (window) of results, appending them to the spline output file
+        (Files/ssss_spline_out.txt). The first run, or a run with new settings, fits 
+        everything. No plots or edited RH files are made. default is False
+    window : int, optional
+        number of days refit in incremental mode. default is 2
+    results_store : bool, optional
+        read the daily results through the results store of the station (see gnssir -results_store),
+        which is much faster for many years of results. default is False
 
     """
 
@@ -243,6 +264,8 @@ def subdaily(station: str, year: int, txtfile_part1: str = '', txtfile_part2: st
         csvfile = False
 
     outputs = [] # this is for multiple years
+    # timers and counters, if REFL_INSTRUMENT is set
+    instrument.start_record(station, year, doy1, 'subdaily')
 
     if csvfile:
         writecsv = True
@@ -257,6 +280,21 @@ def subdaily(station: str, year: int, txtfile_part1: str = '', txtfile_part2: st
 
     year_list = list(range(year, year_end+1))
 
+    if incremental:
+        if not rhdot or not if_corr:
+            print('Incremental mode makes the final spline output, so it needs rhdot and if_corr. Exiting')
+            sys.exit()
+        settings = {'knots': knots, 'knots2': knots2, 'sigma': sigma, 'alt_sigma': alt_sigma, 
+                'spline_outlier1': spline_outlier1, 'spline_outlier2': spline_outlier2, 'apply_rhdot': apply_rhdot, 
+                'ampl': ampl, 'azim1': azim1, 'azim2': azim2, 'h1': h1, 'h2': h2, 'peak2noise': peak2noise, 
+                'delta_out': delta_out, 'gap_min_val': gap_min_val}
+        mjd1 = int(g.fdoy2mjd(year, doy1))
+        mjd2 = int(g.fdoy2mjd(year_end, min(doy2, g.dec31(year_end))))
+        with instrument.timer('incremental'):
+            subdaily_incremental.run_incremental(station, extension, txtdir, mjd1, mjd2, settings, window, results_store)
+        instrument.finish_record()
+        return
+
     if txtfile_part2 is None:
         if txtfile_part1 == '':
             print('Will pick up and concatenate daily result files')
@@ -285,9 +323,11 @@ def subdaily(station: str, year: int, txtfile_part1: str = '', txtfile_part2: st
 
             print('Reading in the results for year: ', y, ' and doys ',  doy_st, ':', doy_en)
 
-            ntv, obstimes, fname, fname_new = t.readin_and_plot(station, y, doy_st, doy_en, plt, \
+            with instrument.timer('readin'):
+                ntv, obstimes, fname, fname_new = t.readin_and_plot(station, y, doy_st, doy_en, plt, \
                     extension, sigma, writecsv, azim1, azim2, ampl, peak2noise, txtfile_part1, \
-                    h1,h2,kplt,txtdir,default_usage,hires_figs,fs,alt_sigma=alt_sigma)
+                    h1,h2,kplt,txtdir,default_usage,hires_figs,fs,alt_sigma=alt_sigma,usestore=results_store)
+            instrument.count('rh_read', len(ntv))
             outputs.append(fname_new)
 
         haveObstimes = True
@@ -314,10 +354,14 @@ def subdaily(station: str, year: int, txtfile_part1: str = '', txtfile_part2: st
 
     # not sure why tv and corr are being returned.
     if rhdot:
-       tv, corr = t.rhdot_correction2(station, input2spline, output4spline, plt, spline_outlier1, spline_outlier2, 
+       with instrument.timer('rhdot_correction2'):
+           tv, corr = t.rhdot_correction2(station, input2spline, output4spline, plt, spline_outlier1, spline_outlier2, 
                    knots=knots,txtdir=txtdir,testing=testing,delta_out=delta_out,
                    if_corr=if_corr,knots_test=knots_test,hires_figs=hires_figs,
                    apply_rhdot=apply_rhdot,fs=fs,gap_min_val=gap_min_val,year=year,extension=extension,knots2=knots2)
+       instrument.count('rh_corrected', len(tv))
+    instrument.finish_record()
+    if rhdot:
        if plt:
            mplt.show()
 
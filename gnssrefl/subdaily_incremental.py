@@ -0,0 +1,472 @@
+import json
+import numpy as np
+import os
+
+import gnssrefl.banded_spline as banded_spline
+import gnssrefl.results_store as results_store
+import gnssrefl.sd_libs as sd
+import gnssrefl.subdaily as subdaily
+import gnssrefl.time_arrays as ta
+
+# incremental subdaily, for stations where subdaily is rerun every hour or so
+# to make a tide-gauge-like product.  The full subdaily refits everything and
+# rewrites all of its files each time.  Here the fitted state of the station
+# (per-day residual statistics used for the outlier criteria and the
+# inter-frequency biases, the knots and coefficients of the last fit, and where
+# each day starts in the spline output file) is kept in a json file next to the
+# subdaily outputs.  A run only reads and refits the trailing days (plus an
+# overlap day before them, so the written days are not at the edge of the fit),
+# truncates the spline output file where the refit days start and appends the
+# new rows.
+#
+# The steps are the ones of readin_and_plot and rhdot_correction2 (crude daily
+# outliers, spline fit, RHdot correction, spline outliers, IF biases, final
+# spline), always on the MJD time axis.  Outlier criteria and IF biases use the
+# statistics of all the days in the state, so they follow the full run; the
+# days before the window are not refit.
+
+# frequencies that get an IF bias, as in rhdot_correction2
+IF_FREQS = [1, 2, 20, 5, 101, 102, 201, 205, 206, 207, 208, 302, 306, 307]
+# padding (days) fit before the refit days but not written out
+OVERLAP = 1
+STATE_VERSION = 1
+
+
+def state_name(txtdir, station):
+    """
+    name of the json file with the incremental subdaily state
+
+    Parameters
+    ----------
+    txtdir : str
+        subdaily output directory
+    station : str
+        4 character station name
+
+    Returns
+    -------
+    fname : str
+        txtdir/ssss_subdaily_state.json
+
+    """
+    return txtdir + '/' + station + '_subdaily_state.json'
+
+
+def spline_name(txtdir, station):
+    """
+    name of the evenly sampled spline output file, the same one the full
+    subdaily writes (see sd_libs.RH_ortho_plot2)
+
+    """
+    return txtdir + '/' + station + '_spline_out.txt'
+
+
+def load_state(txtdir, station, settings):
+    """
+    reads the incremental state of a station
+
+    Parameters
+    ----------
+    txtdir : str
+        subdaily output directory
+    station : str
+        4 character station name
+    settings : dict
+        subdaily settings of this run
+
+    Returns
+    -------
+    state : dict or None
+        None if there is no state, it cannot be read, it was made with other
+        settings or the spline output file it describes is gone
+
+    """
+    fname = state_name(txtdir, station)
+    if not os.path.isfile(fname):
+        return None
+    try:
+        with open(fname, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        print('Could not read the subdaily state file, starting over', fname)
+        return None
+    if (state.get('version') != STATE_VERSION) or (state.get('settings') != settings):
+        print('The subdaily settings changed, starting over')
+        return None
+    if not os.path.isfile(spline_name(txtdir, station)):
+        return None
+    return state
+
+
+def save_state(txtdir, station, state):
+    """
+    writes the incremental state of a station. A temporary file is renamed
+    so that an interrupted run does not leave a broken state behind
+
+    """
+    fname = state_name(txtdir, station)
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(fname + '.tmp', fname)
+
+
+def mjd_to_ydoy(mjd):
+    """
+    year and day of year of integer MJDs
+
+    Parameters
+    ----------
+    mjd : numpy array or scalar
+        modified julian day
+
+    Returns
+    -------
+    year : numpy array of int
+    doy : numpy array of int
+
+    """
+    days = ta.mjd_datetime64(np.floor(mjd)).astype('datetime64[D]')
+    years = days.astype('datetime64[Y]')
+    return years.astype(np.int64) + 1970, (days - years.astype('datetime64[D]')).astype(np.int64) + 1
+
+
+def read_window(station, extension, mjd1, mjd2, settings, usestore=False):
+    """
+    reads the gnssir results for a range of days and applies the commandline
+    constraints and the crude daily outlier detector of readin_and_plot
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    extension : str
+        strategy extension
+    mjd1 : int
+        first MJD
+    mjd2 : int
+        last MJD
+    settings : dict
+        subdaily settings
+    usestore : bool, optional
+        read the results through the results store, default is False
+
+    Returns
+    -------
+    tv : numpy array
+        edited LSP results, sorted by MJD
+
+    """
+    y1, d1 = mjd_to_ydoy(mjd1)
+    y2, d2 = mjd_to_ydoy(mjd2)
+    tvlist = [np.empty(shape=[0, 17])]
+    for year in range(int(y1), int(y2)+1):
+        doy1 = int(d1) if year == y1 else 1
+        doy2 = int(d2) if year == y2 else 366
+        for f, fname, a in results_store.load_results(station, extension, year, doy1, doy2, usestore):
+            if (a is not None) and (len(a) > 0) and (a.shape[1] == 17):
+                tvlist.append(a)
+    tv = np.vstack(tvlist)
+
+    ii = (tv[:,2] <= settings['h2']) & (tv[:,2] >= settings['h1']) & \
+        (tv[:,5] >= settings['azim1']) & (tv[:,5] <= settings['azim2']) & \
+        (tv[:,6] >= settings['ampl']) & (tv[:,13] >= settings['peak2noise'])
+    tv = tv[ii,:]
+    tv = tv[np.argsort(tv[:,15], kind='stable'),:]
+
+    # remove the daily outliers, as in readin_and_plot
+    sigma = settings['sigma']
+    keep = np.ones(len(tv), dtype=bool)
+    days = np.floor(tv[:,15])
+    for d in np.unique(days):
+        ii = (days == d)
+        rh = tv[ii,2]
+        if settings['alt_sigma']:
+            rhavg = np.median(rh)
+            rhstd = np.median(abs(rh-rhavg))/0.6745
+        else:
+            rhavg = np.mean(rh)
+            rhstd = np.std(rh)
+        if rhstd == 0:
+            rhstd = 1
+        keep[ii] = np.absolute((rh - rhavg)/rhstd) < sigma
+
+    return tv[keep,:]
+
+
+def add_day_stats(stats, days, values, mask=None):
+    """
+    per-day count, sum and sum of squares of some values
+
+    Parameters
+    ----------
+    stats : dict
+        statistics of each day, keyed by str(MJD day), changed in place
+    days : numpy array of int
+        MJD day of each value
+    values : numpy array of floats
+    mask : numpy array of bool, optional
+        values to use
+
+    """
+    if mask is not None:
+        days = days[mask]; values = values[mask]
+    for d in np.unique(days):
+        v = values[days == d]
+        stats[str(int(d))] = [len(v), float(np.sum(v)), float(np.sum(v*v))]
+
+
+def combined_std(stats):
+    """
+    standard deviation of all the values summarized in per-day statistics
+    """
+    s = np.array(list(stats.values())).reshape(-1, 3)
+    n = s[:,0].sum()
+    if n == 0:
+        # no values, so nothing is an outlier
+        return np.inf
+    return float(np.sqrt(max(s[:,2].sum()/n - (s[:,1].sum()/n)**2, 0)))
+
+
+def merge_stats(old, new, first_day):
+    """
+    statistics of the days before first_day from the state, and of the
+    refit days from this run
+    """
+    merged = {d: v for d, v in old.items() if int(d) < first_day}
+    merged.update(new)
+    return merged
+
+
+def fit_window(tvd, state, first_day, settings):
+    """
+    the spline fits of rhdot_correction2 for the trailing window
+
+    Parameters
+    ----------
+    tvd : numpy array
+        edited LSP results for the window, sorted by MJD
+    state : dict
+        incremental state, the statistics of the days before first_day are used
+    first_day : int
+        first MJD day that is refit and written out
+    settings : dict
+        subdaily settings
+
+    Returns
+    -------
+    spline : interpolate.BSpline
+        final spline fit, in MJD
+    th : numpy array of floats
+        MJD of the observations kept in the final fit
+    newstats : dict
+        statistics of the refit days
+
+    """
+    knots_per_day = settings['knots']
+    knots2_per_day = knots_per_day if settings['knots2'] is None else settings['knots2']
+    firstKnot_in_minutes = 15
+    perday = 24*20
+    days = np.floor(tvd[:,15]).astype(int)
+    written = days >= first_day
+
+    # first spline fit
+    th = tvd[:,15]; h = tvd[:,2]
+    tnew, ynew = subdaily.flipit2(tvd, 3)
+    Ndays = tnew.max()-tnew.min()
+    knots = np.linspace(tnew.min()+firstKnot_in_minutes/60/24, tnew.max()-firstKnot_in_minutes/60/24,
+            num=int(knots_per_day*Ndays))
+    bspline = banded_spline.BandedSpline(tnew, knots)
+    spline = bspline.fit(ynew)
+
+    # RHdot correction
+    N = int(Ndays*perday)
+    xx = np.linspace(tnew.min(), tnew.max(), N)
+    spl_y = spline(xx)
+    rhdot_at_th = np.interp(th, xx[1:N], (perday/24)*np.diff(spl_y))
+    correction = tvd[:,12]*rhdot_at_th
+    if settings['apply_rhdot']:
+        correctedRH = h - correction
+    else:
+        correctedRH = h
+    residual_after = correctedRH - spline(th)
+
+    # spline outliers, with the sigma of all the days
+    newstats = {'res1': {}, 'res2': {}, 'if': {}}
+    add_day_stats(newstats['res1'], days, residual_after, written)
+    res1 = merge_stats(state['res1'], newstats['res1'], first_day)
+    if settings['spline_outlier1'] is None:
+        OutlierLimit = 3*combined_std(res1)
+    else:
+        OutlierLimit = float(settings['spline_outlier1'])
+    ii = np.abs(residual_after) <= OutlierLimit
+    tvd = tvd[ii,:]; correctedRH = correctedRH[ii]; residual_after = residual_after[ii]
+    days = days[ii]; written = written[ii]
+
+    # inter-frequency biases, means of the residuals of all the days
+    biasCor_rh = correctedRH.copy()
+    biases = {}
+    for f in IF_FREQS:
+        ff = (tvd[:,10] == f)
+        stats = {}
+        add_day_stats(stats, days, residual_after, ff & written)
+        newstats['if'][str(f)] = stats
+        fstats = merge_stats(state['if'].get(str(f), {}), stats, first_day)
+        s = np.array(list(fstats.values())).reshape(-1, 3)
+        if s[:,0].sum() > 0:
+            biases[f] = s[:,1].sum()/s[:,0].sum()
+    if 1 in biases:
+        L1bias = biases[1]
+        biases = {f: b - L1bias for f, b in biases.items()}
+    for f, b in biases.items():
+        ff = (tvd[:,10] == f)
+        biasCor_rh[ff] = correctedRH[ff] - b
+    state['biases'] = {str(f): float(b) for f, b in biases.items()}
+
+    # second spline fit, downdating the outliers from the first one
+    tv2 = np.hstack((tvd, biasCor_rh.reshape(-1,1)))
+    th = tv2[:,15]
+    tnew, ynew = subdaily.flipit2(tv2, tv2.shape[1])
+    Ndays = tnew.max()-tnew.min()
+    knots = np.linspace(tnew.min()+firstKnot_in_minutes/60/24, tnew.max()-firstKnot_in_minutes/60/24,
+            num=int(knots2_per_day*Ndays))
+    if bspline.same_knots(tnew, knots):
+        bspline.set_times(tnew)
+    else:
+        bspline = banded_spline.BandedSpline(tnew, knots)
+    spline = bspline.fit(ynew)
+
+    resid = biasCor_rh - spline(th)
+    add_day_stats(newstats['res2'], days, resid, written)
+    res2 = merge_stats(state['res2'], newstats['res2'], first_day)
+    if settings['spline_outlier2'] is None:
+        jj = np.abs(resid) <= 3*combined_std(res2)
+    else:
+        jj = np.abs(resid) <= float(settings['spline_outlier2'])
+
+    state['knots'] = bspline.t.tolist()
+    state['coefs'] = spline.c.tolist()
+
+    return spline, th[jj], newstats
+
+
+def write_rows(txtdir, station, state, spline, th, first_day, last_day, settings, H0):
+    """
+    truncates the spline output file where first_day starts and appends the
+    spline values from first_day through last_day, with the gaps removed as
+    in RH_ortho_plot2
+
+    """
+    fname = spline_name(txtdir, station)
+    offsets = state['offsets']
+    # the same grid as RH_ortho_plot2, which starts at midnight of the first day
+    numvals = 1 + int((last_day + 1 - first_day)*86400/settings['delta_out'])
+    mjd_new = np.linspace(first_day, last_day + 1, numvals, endpoint=True)
+    spline_new = spline(mjd_new)
+    # gaps in the observations
+    gap_min_val = settings['gap_min_val']/24
+    gdiff = np.diff(th)
+    for i in np.flatnonzero(gdiff > gap_min_val):
+        spline_new[(mjd_new > th[i]) & (mjd_new < th[i+1])] = np.nan
+    theyear, xm, xd, xh, xmin, xs = ta.datetime64_parts(ta.mjd_datetime64(mjd_new))
+
+    if len(offsets) == 0:
+        # a new state, the file is written from scratch
+        fout = open(fname, 'w+')
+        sd.write_spline_header(fout, station, H0)
+    else:
+        # run_incremental starts the refit on a day of the file, so this is first_day
+        # unless it is before the first day of the file, where only the header is kept
+        start = [int(d) for d in offsets if int(d) <= first_day]
+        start = str(max(start)) if len(start) > 0 else min(offsets, key=int)
+        fout = open(fname, 'r+')
+        fout.seek(offsets[start])
+        fout.truncate()
+    offsets = {d: o for d, o in offsets.items() if int(d) < first_day}
+    day = None
+    for i in range(len(mjd_new)):
+        d = int(np.floor(mjd_new[i]))
+        if d != day:
+            day = d
+            if d <= last_day:
+                offsets[str(d)] = fout.tell()
+        if not np.isnan(spline_new[i]):
+            sd.write_spline_row(fout, mjd_new[i], spline_new[i], theyear[i], xm[i], xd[i], xh[i], xmin[i], xs[i], H0)
+    fout.close()
+    state['offsets'] = offsets
+
+    return fname
+
+
+def run_incremental(station, extension, txtdir, mjd1, mjd2, settings, window=2, usestore=False):
+    """
+    incremental subdaily: refits the last window days of gnssir results
+    (plus an overlap day) and appends the new spline values to the spline
+    output file. Without a state (first run, or the settings changed) all
+    the days from mjd1 are fit.
+
+    Parameters
+    ----------
+    station : str
+        4 character station name
+    extension : str
+        strategy extension
+    txtdir : str
+        subdaily output directory
+    mjd1 : int
+        first MJD of the requested period
+    mjd2 : int
+        last MJD of the requested period
+    settings : dict
+        subdaily settings (knots, outlier criteria, constraints ...)
+    window : int, optional
+        number of trailing days that are refit and rewritten, default is 2
+    usestore : bool, optional
+        read the results through the results store, default is False
+
+    Returns
+    -------
+    fname : str
+        spline output file, None if nothing was done
+
+    """
+    state = load_state(txtdir, station, settings)
+    if state is None:
+        state = {'version': STATE_VERSION, 'settings': settings, 'last_day': None, 'offsets': {},
+                'res1': {}, 'res2': {}, 'if': {}, 'signature': None}
+        first_day = mjd1
+    else:
+        first_day = max(mjd1, state['last_day'] - window + 1)
+        # refit from a day that starts in the spline output file, e.g. when the new year
+        # is requested, the last days of the year before are refit too
+        recorded = [int(d) for d in state['offsets'] if int(d) <= first_day]
+        if len(recorded) > 0:
+            first_day = max(recorded)
+    print('Incremental subdaily, refitting from MJD ', first_day)
+
+    tvd = read_window(station, extension, first_day - OVERLAP, mjd2, settings, usestore)
+    if len(tvd) == 0:
+        print('No results to fit')
+        return None
+    last_day = int(np.floor(tvd[-1,15]))
+    # nothing new since the last run
+    signature = [len(tvd), float(tvd[-1,15])]
+    if (state['signature'] == signature) and (state['last_day'] == last_day):
+        print('No new results since the last run')
+        return spline_name(txtdir, station)
+    if first_day > last_day:
+        first_day = last_day
+
+    spline, th, newstats = fit_window(tvd, state, first_day, settings)
+    for key in ['res1', 'res2']:
+        state[key] = merge_stats(state[key], newstats[key], first_day)
+    for f, stats in newstats['if'].items():
+        state['if'][f] = merge_stats(state['if'].get(f, {}), stats, first_day)
+
+    H0 = sd.find_ortho_height(station, extension)
+    fname = write_rows(txtdir, station, state, spline, th, first_day, last_day, settings, H0)
+    state['last_day'] = last_day
+    state['signature'] = signature
+    save_state(txtdir, station, state)
+    print('Spline output written through MJD ', last_day, ':', fname)
+
+    return fname
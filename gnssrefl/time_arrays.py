@@ -0,0 +1,391 @@
+import numpy as np
+
+# vectorized time conversions for the columns of the gnssir/subdaily result
+# arrays (year, day of year, UTC hours, MJD).  Everything is done with
+# numpy datetime64/timedelta64, so a whole array is translated at once
+# instead of building one datetime object per row.  The rounding rules are
+# the ones of the scalar functions in gps.py (ymd_hhmmss, mjd, fdoy2mjd)
+
+# MJD 0
+MJD_EPOCH = np.datetime64('1858-11-17T00:00:00', 'us')
+
+
+def ydoy_days(year, doy):
+    """
+    dates from year and day of year
+
+    Parameters
+    ----------
+    year : numpy array or scalar
+        full year
+    doy : numpy array or scalar
+        day of year
+
+    Returns
+    -------
+    days : numpy array of datetime64[D]
+
+    """
+    year = np.asarray(year).astype(np.int64)
+    doy = np.asarray(doy).astype(np.int64)
+    return (year - 1970).astype('datetime64[Y]').astype('datetime64[D]') + (doy - 1).astype('timedelta64[D]')
+
+
+def ymd_days(year, month, day):
+    """
+    dates from year, month and day
+
+    Parameters
+    ----------
+    year : numpy array or scalar
+        full year
+    month : numpy array or scalar
+        calendar month
+    day : numpy array or scalar
+        calendar day
+
+    Returns
+    -------
+    days : numpy array of datetime64[D]
+
+    """
+    year = np.asarray(year).astype(np.int64)
+    month = np.asarray(month).astype(np.int64)
+    day = np.asarray(day).astype(np.int64)
+    months = ((year - 1970)*12 + month - 1).astype('datetime64[M]')
+    return months.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+
+
+def hhmmss(utc):
+    """
+    hours, minutes and seconds from fractional hours, rounded to the
+    second the same way as gps.ymd_hhmmss
+
+    Parameters
+    ----------
+    utc : numpy array or scalar
+        fractional hours
+
+    Returns
+    -------
+    hour : numpy array of int
+        hour of the day (can be 24 for times that round up to midnight)
+    minute : numpy array of int
+        minutes
+    second : numpy array of int
+        seconds
+
+    """
+    utc = np.asarray(utc, dtype=float)
+    hour = np.floor(utc)
+    minute = np.floor(60*(utc - hour))
+    # np.round rounds halves to even, just like python round
+    second = np.round(utc*3600 - (hour*3600 + minute*60))
+    ii = (second == 60)
+    second = np.where(ii, 0, second)
+    minute = np.where(ii, minute + 1, minute)
+    ii = (minute == 60)
+    minute = np.where(ii, 0, minute)
+    hour = np.where(ii, hour + 1, hour)
+
+    return hour.astype(np.int64), minute.astype(np.int64), second.astype(np.int64)
+
+
+def ymd_hhmmss(year, doy, utc):
+    """
+    array version of gps.ymd_hhmmss, without the datetime objects
+
+    Parameters
+    ----------
+    year : numpy array or scalar
+        full year
+    doy : numpy array or scalar
+        day of year
+    utc : numpy array or scalar
+        fractional hours
+
+    Returns
+    -------
+    year : numpy array of int
+        full year
+    month : numpy array of int
+        calendar month
+    day : numpy array of int
+        calendar day
+    hour : numpy array of int
+        hour of the day
+    minute : numpy array of int
+        minutes
+    second : numpy array of int
+        seconds
+
+    """
+    year, month, day, h, m, s = datetime64_parts(ydoy_days(year, doy))
+    hour, minute, second = hhmmss(utc)
+    return year, month, day, hour, minute, second
+
+
+def ydoy_datetime64(year, doy, utc=0, minutes=False):
+    """
+    times from year, day of year and UTC hours
+
+    Parameters
+    ----------
+    year : numpy array or scalar
+        full year
+    doy : numpy array or scalar
+        day of year
+    utc : numpy array or scalar, optional
+        fractional hours, default is 0
+    minutes : bool, optional
+        truncate the times to the minute, default is False,
+        i.e. they are rounded to the second as in gps.ymd_hhmmss
+
+    Returns
+    -------
+    t : numpy array of datetime64[s]
+
+    """
+    days = ydoy_days(year, doy)
+    utc = np.asarray(utc, dtype=float)
+    if minutes:
+        hour = np.floor(utc)
+        secs = 3600*hour + 60*np.floor(60*(utc - hour))
+    else:
+        hour, minute, second = hhmmss(utc)
+        secs = 3600*hour + 60*minute + second
+    return days.astype('datetime64[s]') + np.asarray(secs).astype(np.int64).astype('timedelta64[s]')
+
+
+def obstimes(year, doy, utc=0, minutes=False):
+    """
+    datetime objects (for plotting) from year, day of year and UTC hours
+
+    Parameters
+    ----------
+    year : numpy array or scalar
+        full year
+    doy : numpy array or scalar
+        day of year
+    utc : numpy array or scalar, optional
+        fractional hours, default is 0
+    minutes : bool, optional
+        truncate the times to the minute, default is False
+
+    Returns
+    -------
+    obstimes : list of datetime objects
+
+    """
+    t = ydoy_datetime64(year, doy, utc, minutes)
+    return np.atleast_1d(t).tolist()
+
+
+def ymd_obstimes(year, month, day, hour=0, minute=0, second=0):
+    """
+    datetime objects (for plotting) from calendar dates and times
+
+    Parameters
+    ----------
+    year : numpy array or scalar
+        full year
+    month : numpy array or scalar
+        calendar month
+    day : numpy array or scalar
+        calendar day
+    hour : numpy array or scalar, optional
+        hour of the day
+    minute : numpy array or scalar, optional
+        minutes
+    second : numpy array or scalar, optional
+        seconds
+
+    Returns
+    -------
+    obstimes : list of datetime objects
+
+    """
+    secs = np.asarray(hour).astype(np.int64)*3600 + np.asarray(minute).astype(np.int64)*60 + np.asarray(second).astype(np.int64)
+    t = ymd_days(year, month, day).astype('datetime64[s]') + secs.astype('timedelta64[s]')
+    return np.atleast_1d(t).tolist()
+
+
+def datetime64_parts(t):
+    """
+    calendar values of times
+
+    Parameters
+    ----------
+    t : numpy array of datetime64
+
+    Returns
+    -------
+    year : numpy array of int
+        full year
+    month : numpy array of int
+        calendar month
+    day : numpy array of int
+        calendar day
+    hour : numpy array of int
+        hour of the day
+    minute : numpy array of int
+        minutes
+    second : numpy array of int
+        seconds (truncated)
+
+    """
+    t = np.asarray(t)
+    Y = t.astype('datetime64[Y]')
+    M = t.astype('datetime64[M]')
+    D = t.astype('datetime64[D]')
+    year = Y.astype(np.int64) + 1970
+    month = (M - Y.astype('datetime64[M]')).astype(np.int64) + 1
+    day = (D - M.astype('datetime64[D]')).astype(np.int64) + 1
+    secs = (t.astype('datetime64[s]') - D.astype('datetime64[s]')).astype(np.int64)
+    hour = secs // 3600
+    minute = (secs - 3600*hour) // 60
+    second = secs - 3600*hour - 60*minute
+
+    return year, month, day, hour, minute, second
+
+
+def mjd(year, month, day, hour=0, minute=0, second=0):
+    """
+    array version of gps.mjd, i.e. modified julian day with the
+    fractional day added
+
+    Parameters
+    ----------
+    year : numpy array or scalar
+        full year
+    month : numpy array or scalar
+        calendar month
+    day : numpy array or scalar
+        calendar day
+    hour : numpy array or scalar, optional
+        hour of the day
+    minute : numpy array or scalar, optional
+        minutes
+    second : numpy array or scalar, optional
+        seconds
+
+    Returns
+    -------
+    mjd : numpy array of floats
+        modified julian day
+
+    """
+    days = ymd_days(year, month, day) - MJD_EPOCH.astype('datetime64[D]')
+    s = np.asarray(hour)*3600 + np.asarray(minute)*60 + np.asarray(second)
+    return days.astype(np.int64) + s/86400
+
+
+def ydoy_mjd(year, doy, utc=0):
+    """
+    modified julian day from year, day of year and UTC hours, with the UTC
+    rounded to the second as in gps.ymd_hhmmss
+
+    Parameters
+    ----------
+    year : numpy array or scalar
+        full year
+    doy : numpy array or scalar
+        day of year
+    utc : numpy array or scalar, optional
+        fractional hours, default is 0
+
+    Returns
+    -------
+    mjd : numpy array of floats
+        modified julian day
+
+    """
+    days = ydoy_days(year, doy) - MJD_EPOCH.astype('datetime64[D]')
+    hour, minute, second = hhmmss(utc)
+    return days.astype(np.int64) + (hour*3600 + minute*60 + second)/86400
+
+
+def fdoy2mjd(year, fdoy):
+    """
+    array version of gps.fdoy2mjd, i.e. modified julian day from year and
+    fractional day of year, with the seconds truncated
+
+    Parameters
+    ----------
+    year : numpy array or scalar
+        full year
+    fdoy : numpy array or scalar
+        fractional day of year
+
+    Returns
+    -------
+    mjd : numpy array of floats
+        modified julian day
+
+    """
+    fdoy = np.asarray(fdoy, dtype=float)
+    doy = np.floor(fdoy)
+    fract_hour = 24*(fdoy - doy)
+    hours = np.floor(fract_hour)
+    leftover = fract_hour - hours
+    minutes = np.floor(leftover*60)
+    seconds = np.floor(leftover*3600 - minutes*60)
+    days = ydoy_days(year, doy) - MJD_EPOCH.astype('datetime64[D]')
+    return days.astype(np.int64) + (hours*3600 + minutes*60 + seconds)/86400
+
+
+def mjd_datetime64(mjd):
+    """
+    times from modified julian days, rounded to the microsecond
+
+    Parameters
+    ----------
+    mjd : numpy array or scalar
+        modified julian day
+
+    Returns
+    -------
+    t : numpy array of datetime64[us]
+
+    """
+    us = np.round(np.asarray(mjd, dtype=float)*86400e6).astype(np.int64)
+    return MJD_EPOCH + us.astype('timedelta64[us]')
+
+
+def mjd_to_obstimes(mjd):
+    """
+    datetime objects (for plotting) from modified julian days
+
+    Parameters
+    ----------
+    mjd : numpy array of floats
+        modified julian day
+
+    Returns
+    -------
+    dt : numpy array of datetime objects
+
+    """
+    return mjd_datetime64(mjd).astype(object)
+
+
+def fractional_year(year, doy, utc=0):
+    """
+    the fractional year used in the gnssrefl plots and files,
+    i.e. year + (doy + utc/24)/365.25
+
+    Parameters
+    ----------
+    year : numpy array or scalar
+        full year
+    doy : numpy array or scalar
+        day of year
+    utc : numpy array or scalar, optional
+        fractional hours, default is 0
+
+    Returns
+    -------
+    t : numpy array of floats
+
+    """
+    return np.asarray(year) + (np.asarray(doy) + np.asarray(utc)/24)/365.25
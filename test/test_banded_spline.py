@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+import scipy.interpolate as interpolate
+
+from gnssrefl.banded_spline import BandedSpline
+import gnssrefl.subdaily as subdaily
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(7)
+    # three days of RH with a tide, irregular times and some repeated ones
+    x = np.sort(np.r_[rng.uniform(0, 3, 2000), np.repeat(rng.uniform(0, 3, 20), 2)])
+    y = 5 + 0.8*np.sin(2*np.pi*x/0.5175) + 0.05*rng.standard_normal(len(x))
+    knots = np.linspace(x[0], x[-1], 3*8 + 2)[1:-1]
+    return x, y, knots
+
+
+def splrep_values(x, y, knots, tt):
+    t, c, k = interpolate.splrep(x, y, s=0, k=3, t=knots, task=-1)
+    return interpolate.BSpline(t, c, k, extrapolate=False)(tt)
+
+
+def test_fit(series):
+    x, y, knots = series
+    tt = np.linspace(x[0], x[-1], 1000)
+    bs = BandedSpline(x, knots)
+    assert np.allclose(bs.fit(y)(tt), splrep_values(x, y, knots, tt), rtol=0, atol=1e-10)
+    # a new set of values for the same times
+    y2 = y[::-1]
+    assert np.allclose(bs.fit(y2)(tt), splrep_values(x, y2, knots, tt), rtol=0, atol=1e-10)
+
+
+def test_set_times(series):
+    x, y, knots = series
+    tt = np.linspace(x[0], x[-1], 1000)
+    bs = BandedSpline(x, knots)
+    # remove some observations (as the outlier step does), but not the end points
+    rng = np.random.default_rng(8)
+    keep = rng.uniform(size=len(x)) > 0.1
+    keep[0] = True; keep[-1] = True
+    x2 = x[keep]; y2 = y[keep]
+    assert bs.same_knots(x2, knots)
+    bs.set_times(x2)
+    assert np.allclose(bs.fit(y2)(tt), splrep_values(x2, y2, knots, tt), rtol=0, atol=1e-10)
+    # and add new ones, including a repeat of a time that is already there
+    xn = np.r_[rng.uniform(x[0], x[-1], 200), x2[5]]
+    x3 = np.r_[x2, xn]; y3 = np.r_[y2, 5 + 0.8*np.sin(2*np.pi*xn/0.5175)]
+    ii = np.argsort(x3, kind='stable')
+    x3 = x3[ii]; y3 = y3[ii]
+    bs.set_times(x3)
+    assert np.allclose(bs.fit(y3)(tt), splrep_values(x3, y3, knots, tt), rtol=0, atol=1e-10)
+
+
+def test_set_times_too_few_observations(series):
+    x, y, knots = series
+    bs = BandedSpline(x, knots)
+    # no observations left under the B-splines between knots[0] and knots[5]
+    keep = (x < knots[0]) | (x > knots[5])
+    with pytest.raises(ValueError):
+        bs.set_times(x[keep])
+
+
+def old_fill_gaps(th, h, gap, fillgap):
+    # the loop of flipit and flipit2 before fill_gaps
+    tnew = []; ynew = []
+    for i in range(1, len(th)):
+        d = th[i] - th[i-1]
+        if (d > gap):
+            x0 = th[i-1:i+1]; h0 = h[i-1:i+1]
+            f = interpolate.interp1d(x0, h0)
+            ttnew = np.arange(th[i-1]+fillgap, th[i], fillgap)
+            yynew = f(ttnew)
+            tnew = np.append(tnew, ttnew)
+            ynew = np.append(ynew, yynew)
+        else:
+            tnew = np.append(tnew, th[i])
+            ynew = np.append(ynew, h[i])
+    ii = np.argsort(tnew)
+    return tnew[ii], ynew[ii]
+
+
+def test_fill_gaps():
+    rng = np.random.default_rng(9)
+    th = np.sort(rng.uniform(100, 110, 3000))
+    # make some gaps
+    th = th[(th < 101.2) | (th > 101.9)]
+    th = th[(th < 104.0) | (th > 106.5)]
+    th = th[(th < 108.3) | (th > 108.45)]
+    h = 3 + rng.standard_normal(len(th))
+    gap = 5/24; fillgap = 1/24
+    tnew, ynew = subdaily.fill_gaps(th, h, gap, fillgap, False, 'doy')
+    told, yold = old_fill_gaps(th, h, gap, fillgap)
+    assert len(tnew) == len(told)
+    assert np.array_equal(tnew, told)
+    assert np.allclose(ynew, yold, rtol=0, atol=1e-12)
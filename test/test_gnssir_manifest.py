@@ -0,0 +1,75 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+import gnssrefl.gnssir_manifest as manifest
+
+STATION = 'tst1'
+YEAR = 2023
+DOY = 10
+LSP = {'e1': 5.0, 'e2': 25.0, 'freqs': [1, 20, 5], 'minH': 0.5, 'maxH': 8.0, 'screenstats': False}
+
+
+@pytest.fixture
+def snrfile(tmp_path, monkeypatch):
+    monkeypatch.setenv('REFL_CODE', str(tmp_path))
+    snrdir = tmp_path / '2023' / 'snr' / STATION
+    snrdir.mkdir(parents=True)
+    (tmp_path / '2023' / 'results' / STATION).mkdir(parents=True)
+    # the result file of the day
+    (tmp_path / '2023' / 'results' / STATION / '010.txt').write_text('% results\n')
+    fname = snrdir / 'tst10100.23.snr66'
+    fname.write_text(' 1   5.0000 100.0000      0.  0.000100  40.00\n')
+    manifest.record_day(STATION, YEAR, DOY, 66, '', LSP)
+    return str(fname)
+
+
+def test_day_is_current_unchanged(snrfile):
+    assert manifest.day_is_current(STATION, YEAR, DOY, 66, '', LSP)
+    # settings that do not change the results
+    assert manifest.day_is_current(STATION, YEAR, DOY, 66, '', dict(LSP, screenstats=True))
+
+
+def test_day_is_current_lsp_change(snrfile):
+    assert not manifest.day_is_current(STATION, YEAR, DOY, 66, '', dict(LSP, e2=20.0))
+    assert not manifest.day_is_current(STATION, YEAR, DOY, 88, '', LSP)
+
+
+def test_day_is_current_snr_change(snrfile):
+    # new contents, so a new size
+    with open(snrfile, 'a') as fid:
+        fid.write(' 1   5.1000 100.0000     15.  0.000100  41.00\n')
+    assert not manifest.day_is_current(STATION, YEAR, DOY, 66, '', LSP)
+
+
+def test_day_is_current_mtime_change(snrfile):
+    # same size but edited contents and a new modification time
+    with open(snrfile, 'r') as fid:
+        text = fid.read()
+    with open(snrfile, 'w') as fid:
+        fid.write(text.replace('40.00', '41.00'))
+    st = os.stat(snrfile)
+    os.utime(snrfile, (st.st_atime, st.st_mtime + 10))
+    assert not manifest.day_is_current(STATION, YEAR, DOY, 66, '', LSP)
+
+
+def test_day_is_current_gzipped(snrfile):
+    with open(snrfile, 'rb') as fin, gzip.open(snrfile + '.gz', 'wb') as fout:
+        shutil.copyfileobj(fin, fout)
+    os.remove(snrfile)
+    assert manifest.day_is_current(STATION, YEAR, DOY, 66, '', LSP)
+    # the gzip file is now recorded, so the content is not hashed again
+    conn = manifest.open_manifest(STATION, '')
+    row = conn.execute('SELECT snr_file FROM days WHERE year=? AND doy=?', (YEAR, DOY)).fetchone()
+    conn.close()
+    assert row[0] == snrfile + '.gz'
+
+
+def test_record_day_reuses_hash(snrfile, monkeypatch):
+    def no_hash(fname):
+        raise AssertionError('content hash computed for an unchanged SNR file')
+    monkeypatch.setattr(manifest, 'content_hash', no_hash)
+    manifest.record_day(STATION, YEAR, DOY, 66, '', LSP)
+    assert manifest.day_is_current(STATION, YEAR, DOY, 66, '', LSP)
@@ -1,11 +1,14 @@
+import datetime
 import subprocess
 from unittest import mock
 
 import os
 import urllib.error
+import pytest
 import wget
 
 from gnssrefl.gps import *
+from gnssrefl.gps import _fixed_field, _fixed_width
 
 
 def test_get_sopac_navfile_working(mocker):
@@ -46,3 +49,261 @@ def test_get_sopac_navfile_error(mocker):
         mock.call(["rm", "-f", "p1031050.20.snr66.Z"]),
         mock.call(["rm", "-f", "p1031050.20.snr66"]),
     ]
+
+
+def test_batch_strip_compute_matches_strip_compute():
+    rng = np.random.default_rng(42)
+    xlist = []; ylist = []; cflist = []
+    for i in range(6):
+        e = np.linspace(5, 25, 200 + 50*i)
+        if i % 2:
+            e = e[::-1]
+        cf = arc_scaleF(1, 1)
+        y = np.cos(2*np.pi*(2 + i)*np.sin(e*np.pi/180)/cf) + 0.2*rng.normal(size=len(e))
+        xlist.append(e); ylist.append(y); cflist.append(cf)
+    results = batch_strip_compute(xlist, ylist, cflist, 20, 0.01, 0.5, [0.5, 8])
+    for x, y, cf, r in zip(xlist, ylist, cflist, results):
+        maxF, maxAmp, eminObs, emaxObs, riseSet, px, pz = strip_compute(x, y, cf, 20, 0.01, 2, 0.5)
+        assert r[0] == maxF
+        assert np.isclose(r[1], maxAmp, rtol=1e-10)
+        assert riseSet == r[4]
+        assert np.allclose(r[6], pz, rtol=1e-10, atol=1e-12)
+
+
+def test_glonass_channels():
+    # slot 1 is frequency channel +1, slot 2 is channel -4
+    c = 299792458
+    assert glonass_channels(101, 101) == pytest.approx(c/(1602e6 + 0.5625e6))
+    assert glonass_channels(102, 101) == pytest.approx(c/(1246e6 + 0.4375e6))
+    assert glonass_channels(101, 102) == pytest.approx(c/(1602e6 - 4*0.5625e6))
+
+
+def old_read_sp3file(file_path):
+    # read_sp3file before read_sp3_records, one line at a time
+    ignorePoint = False
+    sp3 = np.empty(shape=[0, 6])
+    firstEpochFound = False
+    with open(file_path, 'r') as f:
+        for line in f.readlines():
+            if line[0] == '*':
+                year, month, day, hour, minute, second = line.split()[1:]
+                wk, swk = kgpsweek(int(year), int(month), int(day), int(hour), int(minute), float(second))
+                wk = int(wk); swk = float(swk)
+                if not firstEpochFound:
+                    firstWeek = wk
+                    firstEpochFound = True
+                if wk != firstWeek:
+                    ignorePoint = True
+            if (line[0] == 'P') and (not ignorePoint):
+                satNu = int(line[2:4]) + findConstell(line[1])
+                xs = line.split()
+                if satNu < 400:
+                    sp3 = np.vstack((sp3, [satNu, wk, swk, float(xs[1])*1000.0, float(xs[2])*1000.0, float(xs[3])*1000.0]))
+    return sp3
+
+
+def old_read_sp3(file):
+    # read_sp3 before read_sp3_records, for a file with nprn satellites in every epoch
+    with open(file) as f:
+        raw = f.read()
+    lines = raw.splitlines()
+    nprn = int(lines[2].split()[1])
+    lines = raw.splitlines()[22:-1]
+    epochs = lines[::(nprn+1)]
+    nepoch = len(epochs)
+    week, tow, x, y, z, clock, prn = np.zeros((nepoch*nprn, 7)).T
+    for i in range(nepoch):
+        year, month, day, hour, minute, second = np.array(epochs[i].split()[1:], dtype=float)
+        week[i*nprn:(i+1)*nprn], tow[i*nprn:(i+1)*nprn] = kgpsweek(year, month, day, hour, minute, second)
+        for j in range(nprn):
+            line = lines[i*(nprn+1)+j+1]
+            prn[i*nprn+j] = int(line[2:4])
+            x[i*nprn+j] = float(line[4:18])
+            y[i*nprn+j] = float(line[18:32])
+            z[i*nprn+j] = float(line[32:46])
+            clock[i*nprn+j] = float(line[46:60])
+    return week, tow, prn, x, y, z, clock
+
+
+def old_myreadnav(file):
+    # myreadnav before it was vectorized, RINEX 2 only
+    with open(file, 'r') as f:
+        nav = f.read()
+    nephem = int((len(nav.split('END OF HEADER')[1].splitlines())-1)/8)
+    lines = nav.split('END OF HEADER')[1].splitlines()[1:]
+    table = np.zeros((nephem, 32))
+    for i in range(nephem):
+        for j in range(8):
+            if j == 0:
+                prn = int(lines[i*8+j][:2])
+                year = int(lines[i*8+j].split()[1])
+                year += 1900 if year > 76 else 2000
+                month, day, hour, minute = [int(v) for v in lines[i*8+j].split()[2:6]]
+                second = float(lines[i*8+j][17:22])
+                table[i, 0] = prn
+                table[i, 1], table[i, 2] = kgpsweek(year, month, day, hour, minute, second)
+                first = lines[i*8].replace('D', 'E')
+                table[i, 3:6] = float(first[-3*19:-2*19]), float(first[-2*19:-1*19]), float(first[-19:])
+            elif j != 7:
+                for k in range(4):
+                    table[i, 2+4*j+k] = float(lines[i*8+j][19*k+3:19*(k+1)+3].replace('D', 'E'))
+            else:
+                table[i, -2] = float(lines[i*8+j][3:19+3].replace('D', 'E'))
+    return table
+
+
+def sp3_header(sats):
+    # the 22 lines of a sp3c header
+    lines = ['#cP2023  1 14  0  0  0.00000000      97 ORBIT IGS20 FIT  TST',
+             '## 2244 518400.00000000   900.00000000 59958 0.0000000000000',
+             '+ {0:4d}   '.format(len(sats)) + ''.join(sats[0:17])]
+    for k in range(17, 85, 17):
+        lines.append('+        ' + ''.join(sats[k:k+17]))
+    lines += ['++         0  0  0']*5 + ['%c M  cc GPS ccc cccc cccc cccc cccc ccccc ccccc ccccc ccccc']*2
+    lines += ['%f  1.2500000  1.025000000  0.00000000000  0.000000000000000']*2
+    lines += ['%i    0    0    0    0      0      0      0      0         0']*2 + ['/* synthetic']*4
+    return [line + '\n' for line in lines]
+
+
+def write_sp3(fname, sats, rng, sow0=518400.0, nepochs=97):
+    # a day of 15 minute orbits. The last epoch is in the next GPS week, as in JAXA files
+    with open(fname, 'w') as f:
+        f.writelines(sp3_header(sats))
+        for i in range(nepochs):
+            t = datetime.datetime(1980, 1, 6) + datetime.timedelta(weeks=2244, seconds=sow0 + 900*i)
+            f.write('*  {0:4d} {1:2d} {2:2d} {3:2d} {4:2d} {5:11.8f}\n'.format(t.year, t.month, t.day, t.hour, t.minute, 0.0))
+            for sat in sats:
+                x, y, z = rng.uniform(-27000, 27000, 3)
+                clock = 999999.999999 if rng.uniform() < 0.05 else rng.uniform(-500, 500)
+                f.write('P{0:s}{1:14.6f}{2:14.6f}{3:14.6f}{4:14.6f}\n'.format(sat, x, y, z, clock))
+        f.write('EOF\n')
+
+
+def nav_value(v):
+    # D19.12
+    return '{0:19.12E}'.format(v).replace('E', 'D')
+
+
+def nav_message(rng):
+    # the 29 values of a GPS message, the GPS week is the 24th
+    values = rng.uniform(-1, 1, 29)*10.0**rng.integers(-12, 8, 29)
+    values[23] = 2244
+    return values
+
+
+def write_nav(fname, messages, version):
+    with open(fname, 'w') as f:
+        if version == 2:
+            f.write('{0:<60s}{1:<20s}\n'.format('     2.11           N: GPS NAV DATA', 'RINEX VERSION / TYPE'))
+        else:
+            f.write('{0:<60s}{1:<20s}\n'.format('     3.04           N: GNSS NAV DATA    M: MIXED', 'RINEX VERSION / TYPE'))
+        f.write('{0:<60s}{1:<20s}\n'.format('', 'END OF HEADER'))
+        for prn, t, values in messages:
+            if version == 2:
+                f.write('{0:2d} {1:02d} {2:2d} {3:2d} {4:2d} {5:2d}{6:5.1f}'.format(prn, t.year % 100, t.month, t.day, t.hour, t.minute, float(t.second)))
+                indent = '   '
+            else:
+                f.write('G{0:02d} {1:4d} {2:02d} {3:02d} {4:02d} {5:02d} {6:02d}'.format(prn, t.year, t.month, t.day, t.hour, t.minute, t.second))
+                indent = '    '
+            f.write(''.join(nav_value(v) for v in values[0:3]) + '\n')
+            for j in range(6):
+                f.write(indent + ''.join(nav_value(v) for v in values[3+4*j:7+4*j]) + '\n')
+            f.write(indent + nav_value(values[27]) + nav_value(values[28]) + '\n')
+            if version == 3:
+                # a GLONASS message, which is not kept
+                f.write('R05 2023 01 10 00 15 00' + ''.join(nav_value(v) for v in values[0:3]) + '\n')
+                for j in range(3):
+                    f.write(indent + ''.join(nav_value(v) for v in values[3:7]) + '\n')
+
+
+@pytest.fixture
+def nav_messages():
+    rng = np.random.default_rng(18)
+    messages = []
+    for k in range(60):
+        t = datetime.datetime(2023, 1, 10) + datetime.timedelta(hours=2*(k // 5))
+        messages.append((int(rng.integers(1, 33)), t, nav_message(rng)))
+    return messages
+
+
+def test_fixed_width():
+    lines = [b'PG07 12.5', b'', b'PE11  3.25 and more than the width']
+    u = _fixed_width(lines, 20)
+    assert u.shape == (3, 20) and u.dtype == np.uint8
+    assert u[1].sum() == 0
+    assert u[2].tobytes() == lines[2][0:20]
+    assert np.array_equal(_fixed_field(u[[0, 2]], 2, 4, int), [7, 11])
+    # the short line is padded with zeros, which are not part of the field
+    assert np.array_equal(_fixed_field(u[[0, 2]], 4, 10), [12.5, 3.25])
+    assert _fixed_width([], 80).shape == (0, 80)
+
+
+def test_read_sp3_records(tmp_path):
+    sats = ['G{0:02d}'.format(k) for k in range(1, 33)] + ['R{0:02d}'.format(k) for k in range(1, 25)] + \
+           ['E{0:02d}'.format(k) for k in range(1, 10)] + ['C{0:02d}'.format(k) for k in range(1, 10)] + ['J01', 'S20']
+    fname = str(tmp_path / 'tst22440.sp3')
+    write_sp3(fname, sats, np.random.default_rng(19))
+    con, prn, week, sow, x, y, z, clock = read_sp3_records(fname)
+    old = old_read_sp3(fname)
+    for new, expected in zip([week, sow, prn, x, y, z, clock], old):
+        assert np.array_equal(new, expected)
+    assert list(con) == [sat[0] for sat in sats]*97
+    assert np.array_equal(np.column_stack(read_sp3(fname)), np.column_stack(old))
+    # read_sp3file leaves out the epoch in the next week and the satellites above 400
+    assert np.array_equal(read_sp3file(fname, usecache=False), old_read_sp3file(fname))
+
+
+def test_myreadnav(tmp_path, nav_messages):
+    fname = str(tmp_path / 'tst10100.23n')
+    write_nav(fname, nav_messages, 2)
+    ephem = myreadnav(fname, usecache=False)
+    assert ephem.shape == (60, 32)
+    assert np.array_equal(ephem, old_myreadnav(fname))
+    # the GPS messages of a RINEX 3 file are the same
+    fname3 = str(tmp_path / 'TST100XXX_R_20230100000_01D_MN.rnx')
+    write_nav(fname3, nav_messages, 3)
+    assert np.array_equal(myreadnav(fname3, usecache=False), ephem)
+    assert len(myreadnav(str(tmp_path / 'missing.23n'), usecache=False)) == 0
+
+
+def test_orbit_cache(tmp_path, nav_messages):
+    fname = str(tmp_path / 'tst10100.23n')
+    write_nav(fname, nav_messages, 2)
+    ephem = myreadnav(fname)
+    cachefile = orbit_cache_name(fname)
+    assert os.path.isfile(cachefile)
+    assert np.array_equal(read_orbit_cache(fname, 32), ephem)
+    assert np.array_equal(myreadnav(fname), ephem)
+    # wrong number of columns
+    assert read_orbit_cache(fname, 6) is None
+
+    # an edited orbit file (different size) is parsed again and the cache is rewritten
+    write_nav(fname, nav_messages[0:30], 2)
+    assert read_orbit_cache(fname, 32) is None
+    ephem = myreadnav(fname)
+    assert ephem.shape == (30, 32)
+    assert np.array_equal(read_orbit_cache(fname, 32), ephem)
+    # the same size but a new modification time
+    st = os.stat(fname)
+    os.utime(fname, (st.st_atime, st.st_mtime + 10))
+    assert read_orbit_cache(fname, 32) is None
+    # a cache of another version
+    write_orbit_cache(fname, ephem)
+    a = np.load(cachefile)
+    a[0, 0] = -(ORBIT_CACHE_VERSION + 1)
+    np.save(cachefile, a)
+    assert read_orbit_cache(fname, 32) is None
+    # a broken cache file
+    with open(cachefile, 'wb') as f:
+        f.write(b'not a numpy file')
+    assert read_orbit_cache(fname, 32) is None
+    assert np.array_equal(myreadnav(fname), ephem)
+
+    # the sp3 table is cached the same way
+    sp3file = str(tmp_path / 'tst22440.sp3')
+    write_sp3(sp3file, ['G01', 'G02', 'E11'], np.random.default_rng(20))
+    sp3 = read_sp3file(sp3file)
+    assert np.array_equal(read_orbit_cache(sp3file, 6), sp3)
+    write_sp3(sp3file, ['G01', 'G02', 'E11'], np.random.default_rng(21))
+    assert read_orbit_cache(sp3file, 6) is None
+    assert np.array_equal(read_sp3file(sp3file), old_read_sp3file(sp3file))
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+import gnssrefl.gps as g
+import gnssrefl.orbit_catalog as orbit_catalog
+
+ORBTYPES = ['nav', 'nav-sopac', 'test', 'gbm', 'wum', 'grg', 'jax', 'gfr', 'rapid', 'gnss3', 'gnss-gfz', 'sp3',
+            'gfz', 'igr', 'igs', 'esa', 'wum2', 'ultra']
+
+
+@pytest.fixture
+def orbits(tmp_path, monkeypatch):
+    monkeypatch.setenv('ORBITS', str(tmp_path))
+    monkeypatch.setattr(orbit_catalog, '_catalog', None)
+    os.makedirs(str(tmp_path / '2023' / 'nav'))
+    os.makedirs(str(tmp_path / '2023' / 'sp3'))
+    return str(tmp_path)
+
+
+def test_local_names():
+    assert orbit_catalog.local_names('nav', 2023, 10) == [('2023/nav', 'auto0100.23n')]
+    # the long MGEX name first, as getsp3file_mgex
+    assert orbit_catalog.local_names('gbm', 2023, 10) == [('2023/sp3', 'GFZ0MGXRAP_20230100000_01D_05M_ORB.SP3'),
+                                                          ('2023/sp3', g.sp3_name(2023, 1, 10, 'gbm')[0])]
+    assert orbit_catalog.local_names('wum2', 2024, 366) == [('2024/sp3', 'WUM0MGXULT_20243660000_01D_05M_ORB.SP3')]
+    assert orbit_catalog.local_names('ultra', 2023, 10) == [('2023/sp3', g.sp3_name(2023, 1, 10, 'gfu')[0][:-4] + '_00.sp3')]
+    # the GFZ rapid orbits start on 2021:137
+    assert orbit_catalog.local_names('rapid', 2021, 136) == []
+    assert orbit_catalog.local_names('rapid', 2021, 137) == [('2021/sp3', g.sp3_name(2021, 5, 17, 'gfz')[0])]
+    assert orbit_catalog.local_names('nosuchorbit', 2023, 10) is None
+
+
+@pytest.mark.parametrize('orbtype', ORBTYPES)
+def test_local_names_parse(orbtype):
+    # every name is one the catalog knows, for the day it was made for
+    for year, doy in [(2022, 1), (2023, 200), (2024, 366)]:
+        for key, name in orbit_catalog.local_names(orbtype, year, doy):
+            assert key == '{0:d}/{1:s}'.format(year, 'nav' if name.endswith('n') else 'sp3')
+            entry = orbit_catalog.parse_orbit_name(name)
+            assert entry is not None
+            assert entry[2:4] == [year, doy]
+
+
+def test_get_orbits_setexe_catalog(orbits, monkeypatch):
+    # a file that is already there is found in the catalog, without the usual search
+    navdir = orbits + '/2023/nav'
+    with open(navdir + '/auto0100.23n', 'w') as f:
+        f.write('nav\n')
+    def search(*args):
+        raise AssertionError('gps.get_orbits_setexe should not be called')
+    monkeypatch.setattr(g, 'get_orbits_setexe', search)
+    foundit, f, orbdir, snrexe = orbit_catalog.get_orbits_setexe(2023, 1, 10, 'nav', False)
+    assert (foundit, f, orbdir) == (True, 'auto0100.23n', navdir)
+    assert snrexe == g.gpsSNR_version()
+    assert os.path.isfile(orbit_catalog.catalog_name())
+
+
+def test_get_orbits_setexe_fallback(orbits, monkeypatch):
+    sp3dir = orbits + '/2023/sp3'
+    name = g.sp3_name(2023, 1, 10, 'igs')[0]
+    calls = []
+    def search(year, month, day, orbtype, fortran):
+        # the usual search, which downloads the file
+        calls.append((year, month, day, orbtype))
+        with open(sp3dir + '/' + name, 'w') as f:
+            f.write('sp3\n')
+        return True, name, sp3dir, g.gnssSNR_version()
+    monkeypatch.setattr(g, 'get_orbits_setexe', search)
+
+    # only a compressed file is there, which the usual search uncompresses
+    with open(sp3dir + '/' + name + '.xz', 'w') as f:
+        f.write('xz\n')
+    assert orbit_catalog.get_orbits_setexe(2023, 1, 10, 'igs', False)[0:3] == (True, name, sp3dir)
+    assert len(calls) == 1
+    # the downloaded file was added to the catalog, so it is not searched for again
+    assert orbit_catalog.get_orbits_setexe(2023, 1, 10, 'igs', False)[0:3] == (True, name, sp3dir)
+    assert len(calls) == 1
+    assert orbit_catalog.find_orbit('igs', 2023, 10, orbit_catalog.read_catalog()) == (name, sp3dir)
+
+    # a file in the catalog that has been removed since
+    os.remove(sp3dir + '/' + name)
+    assert orbit_catalog.get_orbits_setexe(2023, 1, 10, 'igs', False)[0:3] == (True, name, sp3dir)
+    assert len(calls) == 2
+
+    # an orbit type the catalog does not know
+    assert orbit_catalog.get_orbits_setexe(2023, 1, 10, 'nosuchorbit', False)[0:3] == (True, name, sp3dir)
+    assert calls[-1] == (2023, 1, 10, 'nosuchorbit')
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+
+import gnssrefl.read_snr_files as snr
+
+
+def test_snr_index():
+    rng = np.random.default_rng(5)
+    n = 200
+    snrD = np.zeros((n, 10))
+    snrD[:,0] = rng.choice([3, 12, 205], n)
+    snrD[:,1] = rng.uniform(5, 30, n)
+    snrD[:,3] = rng.choice(np.arange(0, 86400, 30), n)
+    snrD[:,6] = rng.uniform(30, 50, n)
+    # zeros and garbage negative values in the L1 column
+    snrD[rng.uniform(size=n) < 0.2, 6] = 0
+    snrD[rng.uniform(size=n) < 0.1, 6] = -5
+    snrI = snr.SNRIndex(snrD)
+    for sat in [3, 12, 205]:
+        thissat, validbits = snrI.satellite(sat)
+        ii = snrD[:,0] == sat
+        assert len(thissat) == ii.sum()
+        assert np.all(np.diff(thissat[:,3]) >= 0)
+        # the rows window_new keeps, datatest > 0
+        assert np.array_equal(snr.valid_column(validbits, 6), thissat[:,6] > 0)
+    thissat, validbits = snrI.satellite(7)
+    assert len(thissat) == 0
+
+
+def write_snr_file(fname, rng, n=500):
+    with open(fname, 'w') as f:
+        for i in range(n):
+            f.write('%3d %10.4f %10.4f %7.0f %10.6f %7.2f %7.2f %7.2f %7.2f %7.2f\n' % (
+                rng.choice([1, 12, 104, 205]), rng.uniform(5, 30), rng.uniform(0, 360), 30*i,
+                rng.uniform(-0.01, 0.01), 0, 0, rng.uniform(30, 50), rng.uniform(30, 50), 0))
+
+
+def test_snr_cache_exact(tmp_path):
+    rng = np.random.default_rng(6)
+    obsfile = str(tmp_path / 'tst10150.21.snr66')
+    write_snr_file(obsfile, rng)
+    text = snr.read_snr_text(obsfile)
+    # the first read parses the text and writes the cache, the second one maps it
+    assert np.array_equal(snr.load_snr(obsfile, usecache=True), text)
+    assert os.path.isfile(snr.snr_cache_name(obsfile))
+    cached = snr.read_snr_cache(obsfile)
+    assert isinstance(cached, np.memmap)
+    assert cached.dtype == np.float64
+    assert np.array_equal(cached, text)
+    assert np.array_equal(snr.load_snr(obsfile, usecache=True), text)
+
+    # the cache moves to the compressed file, with the same contents
+    snr.compress_snr_file(obsfile, 'gzip')
+    assert not os.path.isfile(snr.snr_cache_name(obsfile))
+    assert np.array_equal(snr.read_snr_cache(obsfile + '.gz'), text)
+    assert np.array_equal(snr.read_snr_text(obsfile + '.gz'), text)
+
+
+def test_snr_cache_invalidated(tmp_path):
+    rng = np.random.default_rng(7)
+    obsfile = str(tmp_path / 'tst10150.21.snr66')
+    write_snr_file(obsfile, rng)
+    snr.load_snr(obsfile, usecache=True)
+    # an edited file with a new modification time
+    write_snr_file(obsfile, rng)
+    st = os.stat(obsfile)
+    os.utime(obsfile, (st.st_atime, st.st_mtime + 10))
+    assert snr.read_snr_cache(obsfile) is None
+    assert np.array_equal(snr.load_snr(obsfile, usecache=True), snr.read_snr_text(obsfile))
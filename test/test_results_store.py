@@ -0,0 +1,137 @@
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+import gnssrefl.results_store as results_store
+
+STATION = 'tst1'
+
+
+@pytest.fixture
+def refl_code(tmp_path, monkeypatch):
+    monkeypatch.setenv('REFL_CODE', str(tmp_path))
+    return tmp_path
+
+
+def result_lines(rng, n):
+    lines = []
+    for i in range(n):
+        lines.append(' %4d %3d %6.3f %3d %6.3f %6.2f %6.2f %6.2f %6.2f %4d %3d %2d %8.5f %6.2f %7.2f %12.6f %1d\n' % (
+            2023, 10, rng.uniform(5, 8), rng.integers(1, 32), rng.uniform(0, 24), rng.uniform(0, 360), 20, 5, 25,
+            100, 1, 1, 0.001, 4.0, 30, 60000 + rng.uniform(), 1))
+    return lines
+
+
+def write_day(root, year, doy, lines, extension=''):
+    d = results_store.results_dir(STATION, year, extension)
+    os.makedirs(d, exist_ok=True)
+    fname = d + '{0:03d}.txt'.format(doy)
+    with open(fname, 'w') as f:
+        f.write('% header\n')
+        f.writelines(lines)
+    return fname
+
+
+def stored_rows(extension=''):
+    conn = sqlite3.connect(results_store.store_name(STATION, extension))
+    rows = conn.execute('SELECT year, doy, fsize, fmtime, nrows, ncols, data FROM days ORDER BY year, doy').fetchall()
+    conn.close()
+    return rows
+
+
+def same_days(days1, days2):
+    assert [d[0:2] for d in days1] == [d[0:2] for d in days2]
+    for d1, d2 in zip(days1, days2):
+        if d1[2] is None:
+            assert d2[2] is None
+        else:
+            assert d1[2].shape == d2[2].shape
+            assert np.array_equal(d1[2], d2[2])
+
+
+@pytest.mark.parametrize('extension', ['', 'ext'])
+def test_store_day(refl_code, extension):
+    rng = np.random.default_rng(21)
+    lines = result_lines(rng, 40)
+    fname = write_day(refl_code, 2023, 10, lines, extension)
+    results_store.store_day(STATION, 2023, 10, extension)
+    # and from the lines gnssir wrote, without reading the file again
+    fname2 = write_day(refl_code, 2023, 11, lines, extension)
+    results_store.store_day(STATION, 2023, 11, extension, fname2, lines)
+
+    rows = stored_rows(extension)
+    assert [row[0:2] for row in rows] == [(2023, 10), (2023, 11)]
+    for row, f in zip(rows, [fname, fname2]):
+        st = os.stat(f)
+        assert row[2:4] == (st.st_size, st.st_mtime)
+        a = np.frombuffer(row[6], dtype=float).reshape(row[4], row[5])
+        assert np.array_equal(a, np.loadtxt(f, comments='%'))
+
+    days = results_store.load_results(STATION, extension, 2023, usestore=True)
+    assert [d[0:2] for d in days] == [('010.txt', fname), ('011.txt', fname2)]
+    for d in days:
+        assert np.array_equal(d[2], np.loadtxt(d[1], comments='%'))
+
+
+def test_store_invalidation(refl_code):
+    rng = np.random.default_rng(22)
+    fname = write_day(refl_code, 2023, 10, result_lines(rng, 30))
+    results_store.store_day(STATION, 2023, 10, '')
+    parsed = np.loadtxt(fname, comments='%')
+    st = os.stat(fname)
+
+    # with the size and modification time unchanged, the stored contents are used
+    conn = sqlite3.connect(results_store.store_name(STATION, ''))
+    conn.execute('UPDATE days SET data=? WHERE year=2023 AND doy=10', (np.zeros(parsed.shape).tobytes(),))
+    conn.commit()
+    conn.close()
+    a = results_store.load_results(STATION, '', 2023, usestore=True)[0][2]
+    assert np.array_equal(a, np.zeros(parsed.shape))
+
+    # a new modification time, the file is parsed and the store is updated
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    a = results_store.load_results(STATION, '', 2023, usestore=True)[0][2]
+    assert np.array_equal(a, parsed)
+    row = stored_rows()[0]
+    assert row[3] == os.stat(fname).st_mtime
+    assert np.array_equal(np.frombuffer(row[6], dtype=float).reshape(row[4], row[5]), parsed)
+
+    # a new size with the same modification time
+    st = os.stat(fname)
+    write_day(refl_code, 2023, 10, result_lines(rng, 31))
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert os.stat(fname).st_size != st.st_size
+    a = results_store.load_results(STATION, '', 2023, usestore=True)[0][2]
+    assert a.shape == (31, parsed.shape[1])
+    assert np.array_equal(a, np.loadtxt(fname, comments='%'))
+    assert stored_rows()[0][2] == os.stat(fname).st_size
+
+
+def test_load_results_usestore(refl_code):
+    rng = np.random.default_rng(23)
+    for doy in range(1, 30):
+        write_day(refl_code, 2023, doy, result_lines(rng, rng.integers(2, 60)))
+    # a day with one result, one with none and one that cannot be read
+    write_day(refl_code, 2023, 30, result_lines(rng, 1))
+    write_day(refl_code, 2023, 31, [])
+    write_day(refl_code, 2023, 32, ['not a result\n'])
+    # names that are not daily result files
+    write_day(refl_code, 2023, 33, result_lines(rng, 5))
+    os.rename(results_store.results_dir(STATION, 2023, '') + '033.txt',
+              results_store.results_dir(STATION, 2023, '') + '033.txt.bak')
+    # some days already in the store
+    for doy in range(1, 30, 3):
+        results_store.store_day(STATION, 2023, doy, '')
+
+    for doy1, doy2 in [(1, 366), (5, 31)]:
+        days = results_store.load_results(STATION, '', 2023, doy1, doy2, usestore=False)
+        assert [d[0] for d in days] == ['{0:03d}.txt'.format(doy) for doy in range(doy1, 33) if doy <= doy2]
+        assert days[-1][2] is None if doy2 == 366 else days[-1][2].shape == (0, 0)
+        # the first time the rest of the days are parsed and stored, the second time they are all read from the store
+        same_days(days, results_store.load_results(STATION, '', 2023, doy1, doy2, usestore=True))
+        same_days(days, results_store.load_results(STATION, '', 2023, doy1, doy2, usestore=True))
+    # the day that cannot be read is not stored
+    assert [row[1] for row in stored_rows()] == list(range(1, 32))
+    assert results_store.load_results(STATION, '', 2024, usestore=True) == []
@@ -1,5 +1,12 @@
 from gnssrefl.rinex2snr import *
 from gnssrefl.gps import *
+from gnssrefl.rinex2snr import _test_sp3
+import datetime
+import gzip
+import shutil
+
+import gnssrefl.karnak_libraries as k
+import gnssrefl.orbit_catalog as orbit_catalog
 
 
 REFL_CODE = os.environ["REFL_CODE"]
@@ -18,3 +25,350 @@ def test_quickname():
 #    )
 
 
+
+
+def test_test_sp3_missing_observables(tmp_path):
+    # a GPS satellite with only S1 data. The missing S2 ... S8 are written as zeros
+    year, month, day = 2023, 1, 10
+    week, sow0 = kgpsweek(year, month, day, 0, 0, 0)
+    n = 5
+    gpstime = np.column_stack((np.full(n, week), sow0 + 30*np.arange(n)))
+    # receiver on the equator at longitude 0, satellite 10 degrees above the northern horizon
+    recv = np.array([6378137.0, 0, 0])
+    up = np.array([1.0, 0, 0]); East = np.array([0, 1.0, 0]); North = np.array([0, 0, 1.0])
+    el = np.radians(10)
+    sat = recv + 2e7*(np.cos(el)*North + np.sin(el)*up)
+    t = sow0 + 900*np.arange(-2, 3)
+    sp3 = np.column_stack((np.ones(5), np.full(5, week), t, np.tile(sat, (5, 1))))
+    obsdata = {'G': {'S1': np.full((n, 1), 45.0)}}
+    outputfile = str(tmp_path / 'test.snr66')
+    with open(str(tmp_path / 'log.txt'), 'w') as log:
+        _test_sp3(gpstime, sp3, {'G': [1]}, obsdata, {'G': ['S1']}, {'G': {1: 0}}, year, month, day,
+                  0, 30, outputfile, up, East, North, recv, 0, log)
+    snr = np.loadtxt(outputfile)
+    assert snr.shape == (n, 11)
+    assert np.allclose(snr[:, 1], 10, atol=0.1)
+    assert np.all(snr[:, 6] == 45)
+    assert np.all(snr[:, [5, 7, 8, 9, 10]] == 0)
+
+
+def synthetic_ephemeris(week, sats, rng):
+    # broadcast ephemerides every two hours, in the columns of myreadnav
+    rows = []
+    for sat in sats:
+        for toe in np.arange(0, 86400 + 7200, 7200):
+            e = np.zeros(32)
+            e[0] = sat; e[1] = week; e[7] = rng.uniform(-100, 100); e[8] = 4.5e-9; e[9] = rng.uniform(-np.pi, np.pi)
+            e[10] = 1e-6; e[11] = rng.uniform(0.001, 0.02); e[12] = 5e-6; e[13] = 5153.6
+            e[14] = 2*86400 + toe; e[15] = 1e-7; e[16] = sat*0.5; e[17] = -1e-7; e[18] = 0.96
+            e[19] = 250; e[20] = rng.uniform(-np.pi, np.pi); e[21] = -8e-9; e[22] = 1e-10; e[24] = week
+            rows.append(e)
+    return np.array(rows)
+
+
+def test_nav_snr_rows_match_scalar():
+    import datetime
+    import io
+    rng = np.random.default_rng(4)
+    year, month, day = 2023, 1, 10
+    week, sow0 = kgpsweek(year, month, day, 0, 0, 0)
+    sats = [2, 5, 9, 14, 21, 30]
+    ephemdata = synthetic_ephemeris(week, sats, rng)
+    # one satellite has no ephemeris at all
+    gpssatlist = sats + [17]
+    prntoidx = {'G': {sat: i for i, sat in enumerate(gpssatlist)}}
+    obstimes = [datetime.datetime(year, month, day) + datetime.timedelta(seconds=int(s)) for s in np.arange(0, 86400, 150)]
+    K = len(obstimes)
+    obs = {}
+    for o in ['S1', 'S2', 'S5']:
+        a = rng.uniform(30, 50, (K, len(gpssatlist)))
+        a[rng.uniform(size=a.shape) < 0.1] = np.nan
+        obs[o] = a
+    obs['S1'][rng.uniform(size=(K, len(gpssatlist))) < 0.05] = 0
+    lat, lon = 40.0, -105.0
+    up, East, North = g.up(lat, lon)
+    recv = 6371000*np.array(up)
+    fmt = '%3.0f %10.4f %10.4f %10.0f %7.2f %7.2f %7.2f %7.2f %7.2f '
+    for dec_rate, emin, emax in [(0, 0, 90), (300, 5, 30)]:
+        # the epoch by epoch loop navorbits used before
+        lines = []
+        for i in range(K):
+            a = obstimes[i]
+            sod = 3600*a.hour + 60*a.minute + a.second
+            if (dec_rate > 0) and (sod % dec_rate != 0):
+                continue
+            gweek, gpss = kgpsweek(a.year, a.month, a.day, a.hour, a.minute, a.second)
+            for sat in gpssatlist:
+                s = [obs[o][i, prntoidx['G'][sat]] for o in ['S1', 'S2', 'S5']]
+                s1, s2, s5 = [0 if np.isnan(v) else v for v in s]
+                if s1 > 0:
+                    closest = myfindephem(gweek, gpss, ephemdata, sat)
+                    if len(closest) > 0:
+                        satv = satorb_prop(gweek, gpss, sat, recv, closest)
+                        r = np.subtract(satv, recv)
+                        eleA = elev_angle(up, r)*180/np.pi
+                        azimA = azimuth_angle(r, East, North)
+                        if (eleA >= emin) and (eleA <= emax):
+                            lines.append("{0:3.0f} {1:10.4f} {2:10.4f} {3:10.0f} {4:7.2f} {5:7.2f} {6:7.2f} {7:7.2f} {8:7.2f} \n".format(
+                                sat, eleA, azimA, sod, 0, 0, s1, s2, s5))
+        saveit = nav_snr_rows(ephemdata, obstimes, {'G': obs}, ['S1', 'S2', 'S5'], prntoidx, gpssatlist,
+                              True, True, True, up, East, North, emin, emax, recv, dec_rate, io.StringIO())
+        fout = io.StringIO()
+        np.savetxt(fout, saveit, fmt=fmt)
+        assert len(lines) > 100
+        assert fout.getvalue() == ''.join(lines)
+
+
+def circular_orbit(t, node):
+    # Earth fixed coordinates of a satellite in a circular, 55 degree inclined orbit
+    a = 26560e3; n = 2*np.pi/43082.0; inc = np.radians(55)
+    u = n*t + node
+    xo = a*np.cos(u); yo = a*np.sin(u)*np.cos(inc); zo = a*np.sin(u)*np.sin(inc)
+    th = node - 7.2921151467e-5*t
+    return np.column_stack((xo*np.cos(th) - yo*np.sin(th), xo*np.sin(th) + yo*np.cos(th), zo))
+
+
+def synthetic_sp3(week, sow0, sats):
+    # 15 minute orbits from two hours before the day to two hours after
+    t = sow0 + np.arange(-7200, 86400 + 7200 + 1, 900.0)
+    rows = []
+    for k, sat in enumerate(sats):
+        xyz = circular_orbit(t, 0.9*k)
+        rows.append(np.column_stack((np.full(len(t), sat), np.full(len(t), week), t, xyz)))
+    return np.vstack(rows)
+
+
+def test_sp3_snr_rows_match_scalar(tmp_path):
+    import io
+    rng = np.random.default_rng(12)
+    year, month, day = 2023, 1, 10
+    week, sow0 = kgpsweek(year, month, day, 0, 0, 0)
+    systemsatlists = {'G': [1, 2, 3], 'E': [4, 5]}
+    sp3 = synthetic_sp3(week, sow0, [1, 2, 3, 204, 205])
+    n = 2880
+    gpstime = np.column_stack((np.full(n, week), sow0 + 30*np.arange(n)))
+    obstypes = {'G': ['S1', 'S2', 'S5'], 'E': ['S1', 'S5', 'S7', 'S8']}
+    prntoidx = {con: {prn: i for i, prn in enumerate(systemsatlists[con])} for con in systemsatlists}
+    obsdata = {}
+    for con in obstypes:
+        obsdata[con] = {}
+        for o in obstypes[con]:
+            a = np.round(rng.uniform(30, 50, (n, len(systemsatlists[con]))), 2)
+            a[rng.uniform(size=a.shape) < 0.1] = np.nan
+            obsdata[con][o] = a
+    lat, lon = 40.0, -105.0
+    up, East, North = g.up(lat, lon)
+    recv = 6371000*np.array(up)
+    for dec_rate in [0, 300]:
+        # the satellite by satellite, epoch by epoch translator
+        outputfile = str(tmp_path / 'scalar.snr66')
+        with open(str(tmp_path / 'log.txt'), 'w') as log:
+            _test_sp3(gpstime, sp3, systemsatlists, obsdata, obstypes, prntoidx, year, month, day,
+                      5, 30, outputfile, up, East, North, recv, dec_rate, log)
+        with open(outputfile) as f:
+            lines = f.readlines()
+        saveit = sp3_snr_rows(gpstime, sp3, systemsatlists, obsdata, obstypes, prntoidx, year, month, day,
+                              5, 30, up, East, North, recv, dec_rate, io.StringIO())
+        # the rows are sorted by time and then satellite
+        assert np.all(np.diff(saveit[:,3]) >= 0)
+        same = np.diff(saveit[:,3]) == 0
+        assert np.all(np.diff(saveit[:,0])[same] > 0)
+        fout = io.StringIO()
+        np.savetxt(fout, saveit, fmt='%3.0f %10.4f %10.4f %10.0f %7.2f %7.2f %7.2f %7.2f %7.2f %7.2f %7.2f ')
+        assert len(lines) > 100
+        key = lambda line: (float(line.split()[3]), float(line.split()[0]))
+        assert fout.getvalue() == ''.join(sorted(lines, key=key))
+
+
+def test_sp3_lagrange_interpolation():
+    from scipy.interpolate import BarycentricInterpolator
+    year, month, day = 2023, 1, 10
+    week, sow0 = kgpsweek(year, month, day, 0, 0, 0)
+    sp3 = synthetic_sp3(week, sow0, [1])
+    t = sp3[:,2]
+    orbit = sp3_interpolant(t, sp3[:,3], sp3[:,4], sp3[:,5], 'lagrange')
+    rng = np.random.default_rng(13)
+    Tp = np.sort(sow0 + rng.uniform(0, 86400, 500))
+    tq = Tp - 0.075
+    xyz = orbit(tq, Tp)
+    # the nine points of pick_9points: the epoch at or before the receive time is the fifth one
+    for i in range(len(Tp)):
+        j = np.searchsorted(t, Tp[i], side='right') - 1
+        first = min(max(j - 4, 0), len(t) - 9)
+        expected = BarycentricInterpolator(t[first:first+9], sp3[first:first+9, 3:6])(tq[i])
+        assert np.allclose(xyz[i], expected, rtol=0, atol=1e-4)
+    # a nine point polynomial is good to a few millimeters for 15 minute orbits,
+    # the quadratic interpolation is not
+    truth = circular_orbit(tq, 0)
+    assert np.max(np.abs(xyz - truth)) < 5e-3
+    quadratic = sp3_interpolant(t, sp3[:,3], sp3[:,4], sp3[:,5], 'quadratic')(tq)
+    assert np.max(np.abs(quadratic - truth)) > 1
+
+
+def sp3_name(sat):
+    return 'GREC'[int(sat) // 100] + '{0:02d}'.format(int(sat) % 100)
+
+
+def write_sp3_file(fname, sp3):
+    # a sp3c file, with the header read by the fortran translators. Coordinates in km
+    week = int(sp3[0,1])
+    epochs = np.unique(sp3[:,2])
+    names = [sp3_name(sat) for sat in np.unique(sp3[:,0])] + ['  0']*85
+    times = [datetime.datetime(1980, 1, 6) + datetime.timedelta(weeks=week, seconds=t) for t in epochs]
+    with open(fname, 'w') as f:
+        t = times[0]
+        f.write('#dP{0:4d} {1:2d} {2:2d} {3:2d} {4:2d} {5:11.8f} {6:7d} ORBIT IGS20 FIT  TST\n'.format(
+                t.year, t.month, t.day, t.hour, t.minute, 0.0, len(epochs)))
+        f.write('## {0:4d} {1:15.8f}   900.00000000 59954 0.0000000000000\n'.format(week, epochs[0]))
+        f.write('+ {0:4d}   '.format(len(np.unique(sp3[:,0]))) + ''.join(names[0:17]) + '\n')
+        for k in range(17, 85, 17):
+            f.write('+        ' + ''.join(names[k:k+17]) + '\n')
+        f.write('++         0  0  0\n'*5 + '%c M  cc GPS ccc cccc\n'*2 + '%f  1.2500000  1.025000000\n'*2)
+        f.write('%i    0    0    0    0\n'*2 + '/* synthetic\n'*4)
+        for t, tt in zip(epochs, times):
+            f.write('*  {0:4d} {1:2d} {2:2d} {3:2d} {4:2d} {5:11.8f}\n'.format(tt.year, tt.month, tt.day, tt.hour, tt.minute, 0.0))
+            for row in sp3[sp3[:,2] == t]:
+                f.write('P{0:s}{1:14.6f}{2:14.6f}{3:14.6f}{4:14.6f}\n'.format(sp3_name(row[0]), row[3]/1000, row[4]/1000, row[5]/1000, 0.0))
+        f.write('EOF\n')
+
+
+def write_obs_file(fname, year, month, day, recv, sats, rng):
+    # a RINEX 2.11 file with S1 and S2, sampled every two minutes
+    def header_line(text, label):
+        return '{0:<60s}{1:<20s}\n'.format(text, label)
+    with open(fname, 'w') as f:
+        f.write(header_line('     2.11           OBSERVATION DATA    G (GPS)', 'RINEX VERSION / TYPE'))
+        f.write(header_line('{0:14.4f}{1:14.4f}{2:14.4f}'.format(*recv), 'APPROX POSITION XYZ'))
+        f.write(header_line('     2    S1    S2', '# / TYPES OF OBSERV'))
+        f.write(header_line('{0:6d}{1:6d}{2:6d}     0     0    0.0000000     GPS'.format(year, month, day), 'TIME OF FIRST OBS'))
+        f.write(header_line('', 'END OF HEADER'))
+        for i in range(720):
+            hh, mi = i*120 // 3600, (i*120 // 60) % 60
+            f.write(' {0:2d} {1:2d} {2:2d} {3:2d} {4:2d}{5:11.7f}  0{6:3d}'.format(year % 100, month, day, hh, mi, 0.0, len(sats)))
+            f.write(''.join('G{0:02d}'.format(sat) for sat in sats) + '\n')
+            for sat in sats:
+                f.write('{0:14.3f}  {1:14.3f}  \n'.format(*np.round(rng.uniform(30, 50, 2), 2)))
+
+
+def test_pipeline_matches_serial(tmp_path, monkeypatch):
+    # the SNR files made by the pipelined parallel run and by the day by day run are the same
+    monkeypatch.chdir(tmp_path)
+    station = 'tst1'
+    sats = [1, 2, 3, 4, 5]
+    lat, lon = np.radians(40.0), np.radians(-105.0)
+    up, East, North = g.up(lat, lon)
+    recv = 6371000*np.array(up)
+    days = [(2023, 10), (2023, 11), (2023, 12)]
+    orbdir = str(tmp_path / 'orbits')
+    os.makedirs(orbdir)
+    rinexdir = str(tmp_path / 'prepared')
+    os.makedirs(rinexdir)
+    for year, doy in days:
+        d = g.doy2ymd(year, doy)
+        week, sow0 = kgpsweek(year, d.month, d.day, 0, 0, 0)
+        write_sp3_file(orbdir + '/syn{0:03d}.sp3'.format(doy), synthetic_sp3(week, sow0, sats))
+        write_obs_file(rinexdir + '/{0:s}{1:03d}0.23o'.format(station, doy), year, d.month, d.day, recv, sats,
+                       np.random.default_rng(doy))
+
+    def get_orbits_setexe(year, month, day, orbtype, fortran):
+        doy = g.ymd2doy(year, month, day)[0]
+        return True, 'syn{0:03d}.sp3'.format(doy), orbdir, ''
+
+    def universal_rinex2(station, year, doy, archive, screenstats):
+        # the translator removes the RINEX file, so each run gets a copy
+        name = '{0:s}{1:03d}0.23o'.format(station, doy)
+        shutil.copy(rinexdir + '/' + name, name)
+        return name, True
+
+    monkeypatch.setattr(orbit_catalog, 'get_orbits_setexe', get_orbits_setexe)
+    monkeypatch.setattr(k, 'universal_rinex2', universal_rinex2)
+    monkeypatch.setattr(k, 'make_rinex2_ofiles', lambda name: (name, True))
+    opts = {'station': station, 'station9ch': station.upper() + '00XXX', 'version': 2, 'isnr': 66, 'orbtype': 'gnss',
+            'rate': 'low', 'dec_rate': 0, 'archive': 'unavco', 'fortran': False, 'nol': False,
+            'overwrite': False, 'translator': 'python', 'srate': 30, 'mk': False, 'stream': 'R',
+            'strip': False, 'bkg': 'IGS', 'screenstats': False, 'sp3_interp': 'quadratic',
+            'rinex_cache': 0, 'snr_cache': 0}
+
+    contents = {}
+    for run in ['serial', 'pipeline']:
+        refl_code = str(tmp_path / run)
+        monkeypatch.setenv('REFL_CODE', refl_code)
+        if run == 'serial':
+            for year, doy in days:
+                rinex2snr_day(year, doy, opts)
+        else:
+            run_rinex2snr_pipeline(days, opts, 2, prefetch=1)
+        contents[run] = []
+        for year, doy in days:
+            fname = refl_code + '/2023/snr/{0:s}/{0:s}{1:03d}0.23.snr66.gz'.format(station, doy)
+            with gzip.open(fname, 'rt') as f:
+                contents[run].append(f.read())
+    assert all(len(text.splitlines()) > 100 for text in contents['serial'])
+    assert contents['pipeline'] == contents['serial']
+    # and the RINEX files were removed
+    assert not any(name.endswith('o') for name in os.listdir(str(tmp_path)))
+
+
+def test_translate_day_keeps_orbit_file(tmp_path, monkeypatch):
+    # other stations or days translated at the same time can still need the orbit file
+    monkeypatch.chdir(tmp_path)
+    orbfile = str(tmp_path / 'syn010.sp3')
+    with open(orbfile, 'w') as f:
+        f.write('EOF\n')
+    with open('tst10100.23o', 'w') as f:
+        f.write('\n')
+    os.makedirs('logs')
+    job = {'year': 2023, 'doy': 10, 'month': 1, 'day': 10, 'station': 'tst1', 'option': 66,
+           'orbtype': 'gnss', 'dec_rate': 0, 'translator': 'fortran', 'sp3_interp': 'quadratic',
+           'rinex_cache': 0, 'rinexfile': 'tst10100.23o', 'orbfile': orbfile, 'snrexe': shutil.which('true'),
+           'snrname': 'tst10100.23.snr66', 'snrname_full': 'tst10100.23.snr66', 'logname': 'logs/tst1.txt',
+           'snr_cache': 0, 'times': {}}
+    assert translate_day(job) is None
+    assert os.path.isfile(orbfile)
+    assert not os.path.isfile('tst10100.23o')
+
+
+def write_nav_file(fname, ephem):
+    # a RINEX 2 navigation file of the rows of synthetic_ephemeris, the clock epoch is Toe
+    def d19(values):
+        return ''.join('{0:19.12E}'.format(v).replace('E', 'D') for v in values)
+    with open(fname, 'w') as f:
+        f.write('{0:<60s}{1:<20s}\n'.format('     2.11           N: GPS NAV DATA', 'RINEX VERSION / TYPE'))
+        f.write('{0:<60s}{1:<20s}\n'.format('', 'END OF HEADER'))
+        for e in ephem:
+            t = datetime.datetime(1980, 1, 6) + datetime.timedelta(weeks=int(e[1]), seconds=e[14])
+            f.write('{0:2d} {1:02d} {2:2d} {3:2d} {4:2d} {5:2d}{6:5.1f}'.format(int(e[0]), t.year % 100, t.month, t.day,
+                    t.hour, t.minute, float(t.second)) + d19(e[3:6]) + '\n')
+            for j in range(6):
+                f.write('   ' + d19(e[6+4*j:10+4*j]) + '\n')
+            f.write('   ' + d19(e[30:32]) + '\n')
+
+
+def test_hybrid_snr_rows_match_file(tmp_path, monkeypatch):
+    # the rows returned by the fortran translators are those of the SNR file they write
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('logs')
+    year, month, day = 2023, 1, 10
+    week, sow0 = kgpsweek(year, month, day, 0, 0, 0)
+    sats = [1, 2, 3, 4, 5]
+    lat, lon = np.radians(40.0), np.radians(-105.0)
+    up, East, North = g.up(lat, lon)
+    recv = 6371000*np.array(up)
+    write_obs_file('tst10100.23o', year, month, day, recv, sats, np.random.default_rng(19))
+    write_nav_file('auto0100.23n', synthetic_ephemeris(week, sats, np.random.default_rng(20)))
+    write_sp3_file('tst10100.sp3', synthetic_sp3(week, sow0, sats))
+    errorlog = 'logs/tst1_hybrid_error.txt'
+    for orbtype, orbfile, options in [('nav', 'auto0100.23n', [66, 88, 50]), ('gnss', 'tst10100.sp3', [66, 88])]:
+        for option in options:
+            snrname = 'tst10100.23.snr{0:d}'.format(option)
+            data = hybrid_snr('tst10100.23o', snrname, orbfile, orbtype, option, '0', errorlog)
+            expected = np.loadtxt(snrname)
+            assert len(expected) > 100
+            assert np.array_equal(data, expected)
+            # without the rows only the file is written
+            os.remove(snrname)
+            assert hybrid_snr('tst10100.23o', snrname, orbfile, orbtype, option, '0', errorlog, keeprows=False) is None
+            assert np.array_equal(np.loadtxt(snrname), expected)
+            # the log is that of the last translation
+            with open(errorlog) as f:
+                assert f.read().count('RINEX file:') == 1
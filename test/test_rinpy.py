@@ -0,0 +1,285 @@
+import os
+
+import numpy as np
+import pytest
+
+import gnssrefl.rinpy as rinpy
+
+GOBS = ['C1C', 'L1C', 'D1C', 'S1C', 'C1W', 'S1W', 'C2W', 'L2W', 'D2W', 'S2W', 'C5Q', 'L5Q', 'D5Q', 'S5Q', 'C2L']
+EOBS = ['C1X', 'L1X', 'S1X', 'C5X', 'S5X']
+
+
+def header_line(text, label):
+    return '{0:<60s}{1:<20s}\n'.format(text, label)
+
+
+def obs_field(obs, rng):
+    """
+    one F14.3 observation with its LLI and signal strength flags, sometimes blank
+    """
+    u = rng.uniform()
+    if u < 0.1:
+        return ' '*16
+    if obs[0] == 'S':
+        value = rng.uniform(20, 55)
+    elif obs[0] == 'D':
+        value = rng.uniform(-4000, 4000)
+    elif obs[0] == 'L':
+        value = rng.uniform(-1e8, 1e9)
+    else:
+        value = rng.uniform(2e7, 2.6e7)
+    if u < 0.11:
+        # not quite F14.3
+        field = '{0:14.2f}'.format(value)
+    else:
+        field = '{0:14.3f}'.format(value)
+    lli = ' ' if rng.uniform() < 0.8 else str(rng.integers(0, 8))
+    return field + lli + str(rng.integers(1, 10))
+
+
+def write_rinex3(fname, nepochs, rng, strip=True):
+    """
+    a GPS and Galileo RINEX 3 file, 30 second sampling. D5Q and S5X are never observed.
+    With strip the trailing blanks of the observation lines are left out
+    """
+    with open(fname, 'w') as f:
+        f.write(header_line('     3.04           OBSERVATION DATA    M', 'RINEX VERSION / TYPE'))
+        f.write(header_line('G {0:4d} '.format(len(GOBS)) + ' '.join(GOBS[0:13]), 'SYS / # / OBS TYPES'))
+        f.write(header_line('       ' + ' '.join(GOBS[13:]), 'SYS / # / OBS TYPES'))
+        f.write(header_line('E {0:4d} '.format(len(EOBS)) + ' '.join(EOBS), 'SYS / # / OBS TYPES'))
+        f.write(header_line('  2020    01    01    00    00    0.0000000     GPS', 'TIME OF FIRST OBS'))
+        f.write(header_line('', 'END OF HEADER'))
+        for i in range(nepochs):
+            sats = ['G{0:02d}'.format(prn) for prn in sorted(rng.choice(np.arange(1, 33), rng.integers(5, 12), replace=False))]
+            sats += ['E{0:02d}'.format(prn) for prn in sorted(rng.choice(np.arange(1, 37), rng.integers(0, 8), replace=False))]
+            f.write('> 2020 01 01 {0:02d} {1:02d}{2:11.7f}  0{3:3d}\n'.format(i*30 // 3600, (i*30 // 60) % 60, float(i*30 % 60), len(sats)))
+            for sat in sats:
+                obstypes = GOBS if sat[0] == 'G' else EOBS
+                fields = [' '*16 if o in ('D5Q', 'S5X') else obs_field(o, rng) for o in obstypes]
+                line = sat + ''.join(fields)
+                f.write((line.rstrip() if strip else line) + '\n')
+
+
+def write_rinex2(fname, nepochs, rng):
+    """
+    a GPS and GLONASS RINEX 2.11 file, 30 second sampling, with an event record
+    """
+    obstypes = ['C1', 'L1', 'L2', 'P2', 'S1', 'S2', 'C5']
+    with open(fname, 'w') as f:
+        f.write(header_line('     2.11           OBSERVATION DATA    M (MIXED)', 'RINEX VERSION / TYPE'))
+        f.write(header_line('{0:6d}'.format(len(obstypes)) + ''.join('{0:>6s}'.format(o) for o in obstypes), '# / TYPES OF OBSERV'))
+        f.write(header_line('  2020     1     1     0     0    0.0000000     GPS', 'TIME OF FIRST OBS'))
+        f.write(header_line('', 'END OF HEADER'))
+        for i in range(nepochs):
+            hh, mi, ss = i*30 // 3600, (i*30 // 60) % 60, float(i*30 % 60)
+            if i == nepochs // 3:
+                f.write(' 20  1  1 {0:2d} {1:2d}{2:11.7f}  4  2\n'.format(hh, mi, ss))
+                f.write(header_line('ANTENNA CHANGED', 'COMMENT'))
+                f.write(header_line('AND CHANGED BACK', 'COMMENT'))
+            sats = ['G{0:02d}'.format(prn) for prn in sorted(rng.choice(np.arange(1, 33), rng.integers(5, 11), replace=False))]
+            sats += ['R{0:02d}'.format(prn) for prn in sorted(rng.choice(np.arange(1, 25), rng.integers(0, 6), replace=False))]
+            f.write(' 20  1  1 {0:2d} {1:2d}{2:11.7f}  0{3:3d}'.format(hh, mi, ss, len(sats)))
+            for k, sat in enumerate(sats):
+                if k > 0 and k % 12 == 0:
+                    f.write('\n' + ' '*32)
+                f.write(sat)
+            f.write('\n')
+            for sat in sats:
+                fields = [obs_field(o, rng) for o in obstypes]
+                for k in range(0, len(fields), 5):
+                    f.write(''.join(fields[k:k+5]).rstrip() + '\n')
+
+
+@pytest.fixture
+def rinex3(tmp_path):
+    fname = str(tmp_path / 'test00xxx_R_20200010000_01D_30S_MO.rnx')
+    write_rinex3(fname, 240, np.random.default_rng(3))
+    return fname
+
+
+@pytest.fixture
+def rinex3_padded(tmp_path):
+    # the same observations, every line as long as the header says
+    fname = str(tmp_path / 'test00xxx_R_20200010000_01D_30S_MO.padded.rnx')
+    write_rinex3(fname, 240, np.random.default_rng(3), strip=False)
+    return fname
+
+
+def test_fieldstofloat():
+    rng = np.random.default_rng(13)
+    strings = ['{0:14.3f}'.format(v) for v in rng.uniform(-1e9, 1e9, 2000)]
+    strings += ['{0:14.3f}'.format(v) for v in rng.uniform(-10, 60, 2000)]
+    strings += [' '*14, '         0.000', '        -0.001', '9999999999.999', '    1234.5    ',
+                '      12345.67', '  1.2345e+03  ', '      .500    ', '       garbage']
+    fields = np.array([s.encode('ascii') for s in strings], dtype='S14').view(np.uint8).reshape(len(strings), 14)
+    expected = np.array([rinpy._converttofloat(s) for s in strings])
+    assert np.array_equal(rinpy._fieldstofloat(fields), expected, equal_nan=True)
+    # the last field of a line without its flags, and a field past the end of the line
+    fields = np.array([b'        45.250', b''], dtype='S14').view(np.uint8).reshape(2, 14)
+    assert np.array_equal(rinpy._fieldstofloat(fields), [45.25, np.nan], equal_nan=True)
+
+
+@pytest.mark.parametrize('obscodes', [['S'], ['S1', 'C5'], ['L2W', 'S5X', 'X']])
+def test_readcolumns_v3(rinex3, rinex3_padded, obscodes):
+    # the column selective read keeps the same values as the full parse. The full parse
+    # loses the satellites whose line is cut short, so it reads the padded file
+    data, satlists, prntoidx, obstypes, header, obstimes, gpstime = rinpy.processrinexfile(rinex3_padded)
+    sdata, ssatlists, sprntoidx, sobstypes, sheader, sobstimes, sgpstime = rinpy.processrinexfile(rinex3, obscodes=obscodes)
+    assert ssatlists == satlists
+    assert sprntoidx == prntoidx
+    assert sobstimes == obstimes
+    assert np.array_equal(sgpstime, gpstime)
+    for letter in data:
+        keep = [k for k, o in enumerate(obstypes[letter]) if any(o.startswith(c) for c in obscodes)]
+        assert sobstypes[letter] == [obstypes[letter][k] for k in keep]
+        assert np.array_equal(sdata[letter], data[letter][:, :, keep], equal_nan=True)
+    # the never observed S5X is dropped, as in the full parse
+    assert 'S5X' not in sobstypes['E']
+
+    # padding makes no difference to it
+    pdata = rinpy.processrinexfile(rinex3_padded, obscodes=obscodes)[0]
+    for letter in sdata:
+        assert np.array_equal(pdata[letter], sdata[letter], equal_nan=True)
+
+    # and the same a few lines at a time
+    with open(rinex3, 'r') as f:
+        lines = f.read().splitlines(True)
+    header, headerlines, headerlengths, obstimes, epochsatlists, satset, gpstime = rinpy._readheader(lines, '3.04')
+    cdata, csatlists, cprntoidx, cobstypes = rinpy._readcolumns_v3(lines, header, headerlines, epochsatlists,
+                                                                   satset, obscodes, chunksize=7)
+    assert cobstypes == sobstypes
+    for letter in sdata:
+        assert np.array_equal(cdata[letter], sdata[letter], equal_nan=True)
+
+
+@pytest.fixture
+def rinex2(tmp_path):
+    fname = str(tmp_path / 'test0010.20o')
+    write_rinex2(fname, 240, np.random.default_rng(4))
+    return fname
+
+
+def flatten(chunks):
+    """
+    the observations of a list of processrinexfile results, one series per
+    system, satellite and observable over all epochs
+    """
+    total = sum(len(chunk[5]) for chunk in chunks)
+    series = {}
+    obstimes = []
+    gpstime = []
+    for data, satlists, prntoidx, obstypes, header, times, gps in chunks:
+        n = len(obstimes)
+        for letter in data:
+            for prn in satlists[letter]:
+                for k, o in enumerate(obstypes[letter]):
+                    s = series.setdefault((letter, prn, o), np.full(total, np.nan))
+                    s[n:n+len(times)] = data[letter][:, prntoidx[letter][prn], k]
+        obstimes.extend(times)
+        gpstime.append(gps)
+    series = {key: s for key, s in series.items() if not np.isnan(s).all()}
+    return series, obstimes, np.vstack(gpstime)
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 100, 3600])
+@pytest.mark.parametrize('rinex, obscodes', [('rinex3_padded', None), ('rinex3', ['S']),
+                                             ('rinex2', None), ('rinex2', ['S', 'L2'])])
+def test_readrinexchunks(request, rinex, obscodes, chunksize):
+    fname = request.getfixturevalue(rinex)
+    series, obstimes, gpstime = flatten([rinpy.processrinexfile(fname, obscodes=obscodes)])
+    chunks = list(rinpy.readrinexchunks(fname, chunksize, obscodes))
+    assert len(chunks) == -(-len(obstimes) // chunksize)
+    assert all(len(chunk[5]) == chunksize for chunk in chunks[:-1])
+    cseries, cobstimes, cgpstime = flatten(chunks)
+    assert cobstimes == obstimes
+    assert np.array_equal(cgpstime, gpstime)
+    assert cseries.keys() == series.keys()
+    for key in series:
+        assert np.array_equal(cseries[key], series[key], equal_nan=True)
+
+
+def test_epochrecords(rinex2):
+    # the event record and the satellite continuation lines stay with their epoch
+    rinexversion = rinpy.getrinexversion(rinex2)
+    with open(rinex2, 'r') as f:
+        for line in f:
+            if 'END OF HEADER' in line:
+                break
+        header = {'# / TYPES OF OBSERV': '     7    C1    L1    L2    P2    S1    S2    C5'}
+        records = list(rinpy._epochrecords(f, rinexversion, header))
+    assert len(records) == 241
+    for record in records:
+        if record[0][28] == '4':
+            assert len(record) == 3 and 'COMMENT' in record[2]
+        else:
+            numsats = int(record[0][29:32])
+            assert len(record) == 1 + (numsats-1)//12 + 2*numsats
+
+
+def same_chunks(chunks1, chunks2):
+    assert len(chunks1) == len(chunks2)
+    for c1, c2 in zip(chunks1, chunks2):
+        data1, satlists1, prntoidx1, obstypes1, header1, obstimes1, gpstime1 = c1
+        data2, satlists2, prntoidx2, obstypes2, header2, obstimes2, gpstime2 = c2
+        assert data1.keys() == data2.keys()
+        for letter in data1:
+            assert np.array_equal(data1[letter], data2[letter], equal_nan=True)
+        assert satlists1 == satlists2
+        assert prntoidx1 == prntoidx2
+        assert obstypes1 == obstypes2
+        assert header1 == header2
+        assert obstimes1 == obstimes2
+        assert np.array_equal(gpstime1, gpstime2)
+
+
+@pytest.mark.parametrize('rinex, obscodes', [('rinex3', ['S']), ('rinex2', None)])
+def test_cachedrinexchunks(request, tmp_path, monkeypatch, rinex, obscodes):
+    monkeypatch.setenv('REFL_CODE', str(tmp_path))
+    fname = request.getfixturevalue(rinex)
+    fresh = list(rinpy.readrinexchunks(fname, 50, obscodes))
+    cachefile = rinpy.rinex_cache_name(fname, obscodes)
+    assert not os.path.isfile(cachefile)
+    # the first read parses the file and writes the cache, the second one reads the cache
+    same_chunks(list(rinpy.cachedrinexchunks(fname, 50, obscodes)), fresh)
+    assert os.path.isfile(cachefile)
+    assert os.listdir(os.path.dirname(cachefile)) == [os.path.basename(cachefile)]
+    same_chunks(list(rinpy.cachedrinexchunks(fname, 50, obscodes)), fresh)
+
+    # another choice of observables is another cache file
+    assert rinpy.rinex_cache_name(fname, ['S1']) != cachefile
+    # an unreadable cache file is parsed again and replaced
+    with open(cachefile, 'wb') as f:
+        f.write(b'not a zip file')
+    same_chunks(list(rinpy.cachedrinexchunks(fname, 50, obscodes)), fresh)
+    assert rinpy._opencache(cachefile) is not None
+
+
+def test_cachedrinexchunks_stopped_early(rinex3, tmp_path, monkeypatch):
+    # a caller that stops reading leaves no cache file behind
+    monkeypatch.setenv('REFL_CODE', str(tmp_path))
+    chunks = rinpy.cachedrinexchunks(rinex3, 50, ['S'])
+    next(chunks)
+    chunks.close()
+    assert os.listdir(str(tmp_path / 'rinex_cache')) == []
+
+
+def test_evict_rinex_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('REFL_CODE', str(tmp_path))
+    rng = np.random.default_rng(5)
+    cachefiles = []
+    for k in range(3):
+        fname = str(tmp_path / 'test{0:d}.rnx'.format(k))
+        write_rinex3(fname, 60, rng)
+        list(rinpy.cachedrinexchunks(fname, 3600, ['S']))
+        cachefiles.append(rinpy.rinex_cache_name(fname, ['S']))
+        os.utime(cachefiles[-1], (1000 + k, 1000 + k))
+    sizes = [os.path.getsize(cachefile) for cachefile in cachefiles]
+
+    # reading the oldest one makes it the most recently used
+    list(rinpy.cachedrinexchunks(str(tmp_path / 'test0.rnx'), 3600, ['S']))
+    rinpy.evict_rinex_cache((sizes[0] + sizes[2])/1e6)
+    assert [os.path.isfile(cachefile) for cachefile in cachefiles] == [True, False, True]
+
+    # the one to keep stays, even if it is the oldest
+    rinpy.evict_rinex_cache(0, keep=cachefiles[2])
+    assert [os.path.isfile(cachefile) for cachefile in cachefiles] == [False, False, True]
@@ -0,0 +1,87 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import gnssrefl.gps as g
+import gnssrefl.subdaily_incremental as si
+
+STATION = 'tst1'
+SETTINGS = {'knots': 8, 'knots2': None, 'sigma': 2.5, 'alt_sigma': False,
+            'spline_outlier1': None, 'spline_outlier2': None, 'apply_rhdot': True,
+            'ampl': 0, 'azim1': 0, 'azim2': 360, 'h1': 0.4, 'h2': 300.0, 'peak2noise': 0,
+            'delta_out': 1800, 'gap_min_val': 6.0}
+
+
+@pytest.fixture
+def refl_code(tmp_path, monkeypatch):
+    monkeypatch.setenv('REFL_CODE', str(tmp_path))
+    # the spline file header has the installed gnssrefl version, which a source tree does not have
+    monkeypatch.setattr(g, 'version', lambda package: '0.0.0')
+    (tmp_path / 'input').mkdir()
+    with open(tmp_path / 'input' / (STATION + '.json'), 'w') as f:
+        json.dump({'station': STATION, 'lat': 45, 'lon': -120, 'ht': 10, 'Hortho': 12.0,
+                   'freqs': [1, 20, 5], 'reqAmp': [5, 5, 5]}, f)
+    txtdir = tmp_path / 'Files' / STATION
+    txtdir.mkdir(parents=True)
+    return tmp_path
+
+
+def write_day(root, year, doy, rng):
+    """
+    gnssir results of a day with a tide in them
+    """
+    d = root / str(year) / 'results' / STATION
+    d.mkdir(parents=True, exist_ok=True)
+    n = 250
+    utc = np.sort(rng.uniform(0, 24, n))
+    mjd = g.fdoy2mjd(year, doy) + utc/24
+    rh = 8 - 1.2*np.sin(2*np.pi*mjd/0.5175) + 0.03*rng.standard_normal(n)
+    freqs = rng.choice([1, 20, 5], n)
+    with open(d / '{0:03d}.txt'.format(doy), 'w') as f:
+        f.write('% header\n')
+        for i in range(n):
+            f.write(' %4d %3d %6.3f %3d %6.3f %6.2f %6.2f %6.2f %6.2f %4d %3d %2d %8.5f %6.2f %7.2f %12.6f %1d\n' % (
+                year, doy, rh[i], 5, utc[i], rng.uniform(0, 360), 20, 5, 25, 100, freqs[i], 1, 0.001, 4.0, 30, mjd[i], 1))
+
+
+def read_rows(fname):
+    with open(fname, 'r') as f:
+        text = f.read()
+    return text, [line for line in text.splitlines() if not line.startswith('%')]
+
+
+def test_run_incremental_year_rollover(refl_code):
+    rng = np.random.default_rng(11)
+    txtdir = str(refl_code / 'Files' / STATION)
+    for doy in range(355, 366):
+        write_day(refl_code, 2025, doy, rng)
+    fname = si.run_incremental(STATION, '', txtdir, int(g.fdoy2mjd(2025, 355)), int(g.fdoy2mjd(2025, 365)), SETTINGS)
+    text1, rows1 = read_rows(fname)
+
+    # the next hourly run asks for the new year
+    for doy in [1, 2]:
+        write_day(refl_code, 2026, doy, rng)
+    fname = si.run_incremental(STATION, '', txtdir, int(g.fdoy2mjd(2026, 1)), int(g.fdoy2mjd(2026, 2)), SETTINGS)
+    text2, rows2 = read_rows(fname)
+
+    assert '\x00' not in text2
+    assert text2.startswith('%')
+    mjd = np.array([float(row.split()[0]) for row in rows2])
+    assert np.all(np.diff(mjd) > 0)
+    assert mjd[0] == float(rows1[0].split()[0])
+    assert mjd[-1] == g.fdoy2mjd(2026, 3)
+    # the last day of the year before is refit, the days before it are left as they were
+    kept = [row for row in rows1 if float(row.split()[0]) < g.fdoy2mjd(2025, 365)]
+    assert rows2[0:len(kept)] == kept
+
+    # and the hour after, with one more day
+    write_day(refl_code, 2026, 3, rng)
+    fname = si.run_incremental(STATION, '', txtdir, int(g.fdoy2mjd(2026, 1)), int(g.fdoy2mjd(2026, 3)), SETTINGS)
+    text3, rows3 = read_rows(fname)
+
+    assert '\x00' not in text3
+    assert np.all(np.diff([float(row.split()[0]) for row in rows3]) > 0)
+    kept = [row for row in rows2 if float(row.split()[0]) < g.fdoy2mjd(2026, 1)]
+    assert rows3[0:len(kept)] == kept
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import gnssrefl.gps as g
+import gnssrefl.time_arrays as ta
+
+
+@pytest.fixture
+def rows():
+    rng = np.random.default_rng(42)
+    n = 1000
+    year = rng.integers(2000, 2030, n)
+    doy = np.array([rng.integers(1, g.dec31(y) + 1) for y in year])
+    utc = rng.uniform(0, 23.99, n)
+    # times within a second of the hour and minute boundaries, where the
+    # seconds round up into the next minute or hour
+    h = rng.integers(1, 24, 100)
+    m = rng.integers(0, 60, 100)
+    near = np.r_[h - 0.4/3600, h - 0.5/3600, h - 0.6/3600, h + 0.4/3600,
+                 h + m/60 - 0.4/3600, h + m/60 + 29.5/3600, h - 1e-9]
+    near = near[(near > 0) & (near < 23.99)]
+    utc[0:len(near)] = near
+    # floats, like the columns of the result files
+    return year.astype(float), doy.astype(float), utc
+
+
+def test_obstimes(rows):
+    year, doy, utc = rows
+    expected = [g.ymd_hhmmss(y, d, u, True)[0] for y, d, u in zip(year, doy, utc)]
+    assert ta.obstimes(year, doy, utc) == expected
+
+
+def test_ymd_hhmmss(rows):
+    year, doy, utc = rows
+    expected = np.array([g.ymd_hhmmss(y, d, u, False)[1:] for y, d, u in zip(year, doy, utc)])
+    assert np.array_equal(np.column_stack(ta.ymd_hhmmss(year, doy, utc)), expected)
+
+
+def test_ydoy_mjd(rows):
+    year, doy, utc = rows
+    expected = []
+    for y, d, u in zip(year, doy, utc):
+        bigT, yy, mm, dd, hh, mi, ss = g.ymd_hhmmss(y, d, u, False)
+        m, f = g.mjd(yy, mm, dd, hh, mi, ss)
+        expected.append(m + f)
+    assert np.allclose(ta.ydoy_mjd(year, doy, utc), expected, rtol=0, atol=1e-9)
+
+
+def test_mjd(rows):
+    year, doy, utc = rows
+    yy, mm, dd, hh, mi, ss = ta.ymd_hhmmss(year, doy, utc)
+    expected = [sum(g.mjd(*r)) for r in zip(yy, mm, dd, hh, mi, ss)]
+    assert np.allclose(ta.mjd(yy, mm, dd, hh, mi, ss), expected, rtol=0, atol=1e-9)
+
+
+def test_fdoy2mjd(rows):
+    year, doy, utc = rows
+    fdoy = doy + utc/24
+    expected = [g.fdoy2mjd(int(y), f) for y, f in zip(year, fdoy)]
+    assert np.allclose(ta.fdoy2mjd(year, fdoy), expected, rtol=0, atol=1e-9)